@@ -10,12 +10,9 @@ import logging
 import sys
 from typing import Optional
 
-# 配置日志
 from mcp.server import McpServer # Added import
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from mcp.structured_log import configure_logging
+
 logger = logging.getLogger(__name__)
 
 def parse_args() -> argparse.Namespace:
@@ -28,6 +25,28 @@ def parse_args() -> argparse.Namespace:
                         help='HTTP端口号 (仅用于SSE传输)')
     parser.add_argument('--debug', action='store_true', 
                         help='启用调试模式')
+    parser.add_argument('--body-cache-mb', type=int, default=32,
+                        help='文档正文页缓存的内存预算 (MB)；0 表示正文保留在内存中')
+    parser.add_argument('--search-shards', type=int, default=0,
+                        help='document_search 使用的搜索分片进程数；0 表示在服务器进程内搜索')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='SSE 预派生工作进程数 (SO_REUSEPORT 共享端口，写入由单独的写入进程处理)；0 表示单进程')
+    parser.add_argument('--peer', action='append', default=[], metavar='URL[,URL...]',
+                        help='联邦搜索的对等节点 (可重复)；逗号分隔同一分区的多个副本，例如 http://10.0.0.2:3000')
+    parser.add_argument('--peer-timeout', type=float, default=2.0,
+                        help='每个对等节点的搜索超时 (秒)')
+    parser.add_argument('--replicate-from', type=str, default=None, metavar='URL',
+                        help='以只读副本模式运行，跟随该主服务器的变更流 (例如 http://10.0.0.1:3000)')
+    parser.add_argument('--rate-limit', type=float, default=0, metavar='TOKENS_PER_SEC',
+                        help='每个客户端 (SSE 会话或 IP) 每秒补充的命令令牌数；0 表示不限速')
+    parser.add_argument('--rate-burst', type=float, default=None,
+                        help='每个客户端令牌桶的容量 (默认与 --rate-limit 相同，至少为 1)')
+    parser.add_argument('--no-stream-compression', action='store_true',
+                        help='不压缩 SSE 事件流 (默认对接受 gzip/deflate 的客户端压缩)')
+    parser.add_argument('--log-format', type=str, default='text', choices=['text', 'json'],
+                        help='日志格式：text 或 json (每行一个 JSON 对象)')
+    parser.add_argument('--log-sample', type=int, default=1, metavar='N',
+                        help='高频日志事件 (每个命令、每次工具调用) 只记录每 N 条中的 1 条')
     return parser.parse_args()
 
 def init_mcp_server(transport_type: str, port: Optional[int] = None) -> None:
@@ -51,12 +70,30 @@ def init_mcp_server(transport_type: str, port: Optional[int] = None) -> None:
 def main() -> None:
     """主函数"""
     args = parse_args()
-    
+    # 配置日志：记录经由有界队列交给后台线程输出，不阻塞请求线程
+    configure_logging(logging.DEBUG if args.debug else logging.INFO, json_format=args.log_format == 'json',
+                      sample_every=args.log_sample)
     if args.debug:
-        logging.getLogger().setLevel(logging.DEBUG)
         logger.debug("已启用调试模式")
     
-    server_instance = McpServer(name="Academic RAG Server", version="0.1.0")
+    body_cache_bytes = args.body_cache_mb * 1024 * 1024 if args.body_cache_mb > 0 else None
+    server_kwargs = dict(name="Academic RAG Server", version="0.1.0", body_cache_bytes=body_cache_bytes,
+                         search_shards=args.search_shards,
+                         federation_peers=[peer.split(',') for peer in args.peer],
+                         federation_timeout=args.peer_timeout,
+                         replicate_from=args.replicate_from,
+                         rate_limit=args.rate_limit or None, rate_limit_burst=args.rate_burst,
+                         compress_streams=not args.no_stream_compression)
+
+    if args.workers > 0 and args.transport == 'sse':
+        # Pre-fork mode: the supervisor only manages the writer and worker processes
+        from mcp.prefork import run_prefork
+        logger.info("Starting pre-fork SSE server with %s workers on port %s", args.workers, args.port)
+        sys.exit(run_prefork(args.workers, args.port, server_kwargs))
+    elif args.workers > 0:
+        logger.warning("--workers only applies to the SSE transport; running a single process.")
+
+    server_instance = McpServer(**server_kwargs)
 
     try:
         # init_mcp_server(args.transport, args.port) # Old call
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文档内存占用基准测试
+
+Measures resident bytes per document with tracemalloc for the plain-dict
+representation produced by ``json.loads`` (before) and for the compact
+``Document`` store (after, optionally with compressed abstracts).
+
+    python benchmarks/bench_document_memory.py --docs 20000 --abstract-chars 1500
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mcp.document_store import DocumentStore  # noqa: E402
+
+KEYWORD_POOL = [
+    "ai", "machine learning", "deep learning", "nlp", "transformers", "healthcare", "diagnostics",
+    "renewable energy", "solar", "wind", "quantum computing", "qubits", "cryptography", "algorithms",
+    "sustainability", "computer vision", "reinforcement learning", "graph neural networks",
+]
+WORDS = ["model", "data", "analysis", "method", "result", "system", "learning", "network", "study", "approach"]
+
+
+def make_corpus_json(num_docs: int, abstract_chars: int, seed: int = 42) -> str:
+    rng = random.Random(seed)
+    docs = []
+    for i in range(num_docs):
+        words = []
+        while sum(len(w) + 1 for w in words) < abstract_chars:
+            words.append(rng.choice(WORDS))
+        docs.append({
+            "id": f"doc{i}",
+            "title": " ".join(rng.choice(WORDS).capitalize() for _ in range(6)),
+            "abstract": " ".join(words),
+            "keywords": rng.sample(KEYWORD_POOL, rng.randint(3, 6)),
+        })
+    return json.dumps(docs)
+
+
+def _measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return after - before
+
+
+def run(num_docs: int, abstract_chars: int, compress_over: int) -> dict:
+    corpus_json = make_corpus_json(num_docs, abstract_chars)
+    dict_bytes = _measure(lambda: json.loads(corpus_json))
+    slots_bytes = _measure(lambda: DocumentStore(documents=json.loads(corpus_json)))
+    compressed_bytes = _measure(lambda: DocumentStore(documents=json.loads(corpus_json),
+                                                      compress_abstracts_over=compress_over))
+    return {
+        "documents": num_docs,
+        "abstract_chars": abstract_chars,
+        "bytes_per_document": {
+            "dict": dict_bytes / num_docs,
+            "document_slots": slots_bytes / num_docs,
+            "document_slots_compressed": compressed_bytes / num_docs,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bytes-per-document benchmark for the document store")
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--abstract-chars", type=int, default=1000)
+    parser.add_argument("--compress-over", type=int, default=512,
+                        help="compress abstracts longer than this many characters")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON only")
+    args = parser.parse_args()
+
+    results = run(args.docs, args.abstract_chars, args.compress_over)
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{results['documents']} documents, ~{results['abstract_chars']} char abstracts")
+    for name, value in results["bytes_per_document"].items():
+        print(f"  {name:<28} {value:>10.0f} bytes/doc")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+搜索索引基准测试 - 并发写入与查询下的刷写/合并
+
+Loads a corpus into a :class:`~mcp.search_index.SearchIndex`, then runs
+ingest threads (adding documents one at a time, as ``add_document_to_store``
+does) concurrently with query threads. Reports ingest throughput, query
+latency percentiles and the time spent in background flushes and merges.
+
+    python benchmarks/bench_index.py --docs 20000 --ingest 5000 --query-threads 4
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.bench_document_memory import make_corpus_json  # noqa: E402
+from mcp.search_index import SearchIndex  # noqa: E402
+
+QUERIES = ["learning", "quantum", "network model", "solar", "data analysis", "vision", "graph", "study"]
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(num_docs: int, num_ingest: int, ingest_threads: int, query_threads: int,
+        flush_threshold: int, merge_factor: int, abstract_chars: int) -> dict:
+    corpus = json.loads(make_corpus_json(num_docs + num_ingest, abstract_chars))
+    index = SearchIndex(flush_threshold=flush_threshold, merge_factor=merge_factor)
+
+    started = time.perf_counter()
+    index.bulk_load(enumerate(corpus[:num_docs]))
+    index.wait_idle()
+    bulk_seconds = time.perf_counter() - started
+
+    next_ordinal = iter(range(num_docs, num_docs + num_ingest))
+    ordinal_lock = threading.Lock()
+    ingest_done = threading.Event()
+    latencies = []
+    latency_lock = threading.Lock()
+
+    def ingest():
+        while True:
+            with ordinal_lock:
+                ordinal = next(next_ordinal, None)
+            if ordinal is None:
+                return
+            index.add(ordinal, corpus[ordinal])
+
+    def query(seed):
+        rng = random.Random(seed)
+        local = []
+        while not ingest_done.is_set():
+            q = rng.choice(QUERIES)
+            t0 = time.perf_counter()
+            for count, _ in enumerate(index.search(q), start=1):
+                if count >= 10:
+                    break
+            local.append(time.perf_counter() - t0)
+        with latency_lock:
+            latencies.extend(local)
+
+    queriers = [threading.Thread(target=query, args=(n,)) for n in range(query_threads)]
+    ingesters = [threading.Thread(target=ingest) for _ in range(ingest_threads)]
+    for thread in queriers:
+        thread.start()
+    started = time.perf_counter()
+    for thread in ingesters:
+        thread.start()
+    for thread in ingesters:
+        thread.join()
+    ingest_seconds = time.perf_counter() - started
+    ingest_done.set()
+    for thread in queriers:
+        thread.join()
+    index.wait_idle()
+    stats = index.stats()
+    index.close()
+
+    return {
+        "documents": num_docs, "ingested": num_ingest,
+        "bulk_load_seconds": round(bulk_seconds, 4),
+        "ingest_docs_per_second": round(num_ingest / ingest_seconds, 1) if ingest_seconds else None,
+        "queries": len(latencies),
+        "query_latency_ms": {
+            "p50": round(_percentile(latencies, 0.50) * 1000, 3),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 3),
+        },
+        "index": stats,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Flush/merge benchmark for the segmented search index")
+    parser.add_argument("--docs", type=int, default=20000, help="documents bulk-loaded before the run")
+    parser.add_argument("--ingest", type=int, default=5000, help="documents added during the run")
+    parser.add_argument("--ingest-threads", type=int, default=2)
+    parser.add_argument("--query-threads", type=int, default=4)
+    parser.add_argument("--flush-threshold", type=int, default=1024)
+    parser.add_argument("--merge-factor", type=int, default=4)
+    parser.add_argument("--abstract-chars", type=int, default=600)
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON only")
+    args = parser.parse_args()
+
+    results = run(args.docs, args.ingest, args.ingest_threads, args.query_threads,
+                  args.flush_threshold, args.merge_factor, args.abstract_chars)
+    if args.json:
+        print(json.dumps(results))
+        return
+    index = results["index"]
+    print(f"{results['documents']} documents bulk-loaded in {results['bulk_load_seconds']}s; "
+          f"{results['ingested']} ingested at {results['ingest_docs_per_second']} docs/s")
+    print(f"  {results['queries']} queries: p50 {results['query_latency_ms']['p50']} ms, "
+          f"p99 {results['query_latency_ms']['p99']} ms")
+    print(f"  {index['flushes']} flushes ({index['flush_seconds']}s), {index['merges']} merges "
+          f"({index['merge_seconds']}s), segments per tier {index['segments_per_tier']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+分片搜索吞吐量基准测试 - 单进程与多进程 scatter-gather 对比
+
+Runs ``document_search`` from several client threads against one corpus,
+first with the in-process index and then with ``--shards`` search worker
+processes, and reports queries per second for each.
+
+    python benchmarks/bench_sharded_search.py --docs 50000 --shards 8 --clients 16
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.bench_document_memory import make_corpus_json  # noqa: E402
+from mcp.server import McpServer  # noqa: E402
+
+QUERIES = ["learning", "quantum", "network model", "solar", "data analysis", "vision", "graph", "study", "method"]
+
+
+def _throughput(server: McpServer, clients: int, duration: float, max_results: int) -> float:
+    stop = threading.Event()
+    counts = [0] * clients
+
+    def client(n):
+        rng = random.Random(n)
+        while not stop.is_set():
+            server._execute_document_search_impl({"query": rng.choice(QUERIES), "max_results": max_results})
+            counts[n] += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+
+def run(num_docs: int, shards: int, clients: int, duration: float, max_results: int, abstract_chars: int) -> dict:
+    results = {"documents": num_docs, "shards": shards, "clients": clients, "max_results": max_results}
+    with tempfile.TemporaryDirectory() as tmp:
+        store_file = os.path.join(tmp, "documents.json")
+        with open(store_file, 'w', encoding='utf-8') as f:
+            f.write(make_corpus_json(num_docs, abstract_chars))
+        for label, num_shards in (("single_process", 0), ("sharded", shards)):
+            server = McpServer("bench", "0", document_store_file=store_file, search_shards=num_shards)
+            try:
+                server._search_index_ready.wait()
+                server.search_index.wait_idle()
+                results[f"{label}_qps"] = round(_throughput(server, clients, duration, max_results), 1)
+            finally:
+                server.stop()
+    results["speedup"] = round(results["sharded_qps"] / results["single_process_qps"], 2)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Throughput of sharded vs single-process document_search")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent query threads")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per configuration")
+    parser.add_argument("--max-results", type=int, default=10)
+    parser.add_argument("--abstract-chars", type=int, default=600)
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON only")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run(args.docs, args.shards, args.clients, args.duration, args.max_results, args.abstract_chars)
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{results['documents']} documents, {results['clients']} clients, top {results['max_results']}")
+    print(f"  single process     {results['single_process_qps']:>10.1f} queries/s")
+    print(f"  {results['shards']:>2} shards          {results['sharded_qps']:>10.1f} queries/s  (x{results['speedup']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+合成学术语料生成器 - 可复现的标题、摘要、关键词与文档大小分布
+
+Documents look like the store's own: an id, a title built from templates, an
+abstract of sentences drawn from the vocabulary of one research field, and
+keywords drawn from that field with a Zipf distribution (a few keywords are
+very common, most are rare). Encoded sizes follow a log-normal distribution
+clipped to [1 KB, 1 MB], so most documents are short abstracts and a few are
+full-text sized.
+
+The same seed always yields the same corpus, so results can be compared
+across commits.
+
+    python benchmarks/corpus.py --docs 10000 --output /tmp/corpus.json
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+from typing import Any, Dict, Iterator, List
+
+MIN_DOCUMENT_BYTES = 1024
+MAX_DOCUMENT_BYTES = 1024 * 1024
+DEFAULT_MEDIAN_BYTES = 2048
+DEFAULT_SIGMA = 1.0  # Of the log-normal size distribution; the mean is about 1.6x the median
+ZIPF_EXPONENT = 1.1
+
+FIELDS = {
+    "machine learning": {
+        "keywords": ["machine learning", "deep learning", "neural networks", "transformers", "reinforcement learning",
+                     "graph neural networks", "representation learning", "optimization", "generalization",
+                     "self-supervised learning", "federated learning", "interpretability", "few-shot learning",
+                     "contrastive learning", "diffusion models", "meta-learning"],
+        "objects": ["language models", "image classifiers", "policy networks", "embedding spaces", "attention heads",
+                    "training dynamics", "loss landscapes", "benchmark suites"],
+        "methods": ["gradient descent", "knowledge distillation", "data augmentation", "sparse attention",
+                    "curriculum learning", "low-rank adaptation", "ensembling"],
+    },
+    "healthcare": {
+        "keywords": ["healthcare", "diagnostics", "medical imaging", "clinical trials", "electronic health records",
+                     "epidemiology", "genomics", "drug discovery", "radiology", "patient outcomes", "telemedicine",
+                     "precision medicine", "public health", "oncology"],
+        "objects": ["patient cohorts", "radiology reports", "biomarkers", "treatment plans", "hospital readmissions",
+                    "screening programs", "clinical notes"],
+        "methods": ["survival analysis", "randomized controlled trials", "cohort studies", "segmentation networks",
+                    "propensity score matching", "meta-analysis"],
+    },
+    "energy": {
+        "keywords": ["renewable energy", "solar", "wind", "geothermal", "energy storage", "smart grids",
+                     "sustainability", "photovoltaics", "battery chemistry", "demand response", "carbon capture",
+                     "hydrogen", "power electronics"],
+        "objects": ["solar farms", "wind turbines", "lithium-ion cells", "distribution networks", "microgrids",
+                    "load profiles", "heat pumps"],
+        "methods": ["life-cycle assessment", "load forecasting", "model predictive control", "techno-economic analysis",
+                    "field measurements", "finite element simulation"],
+    },
+    "quantum": {
+        "keywords": ["quantum computing", "qubits", "quantum error correction", "entanglement", "quantum algorithms",
+                     "superconducting circuits", "trapped ions", "quantum cryptography", "variational algorithms",
+                     "decoherence", "quantum simulation"],
+        "objects": ["logical qubits", "surface codes", "gate fidelities", "noisy intermediate-scale devices",
+                    "photonic circuits", "Hamiltonians"],
+        "methods": ["randomized benchmarking", "tomography", "variational eigensolvers", "error mitigation",
+                    "pulse-level control", "tensor network simulation"],
+    },
+    "systems": {
+        "keywords": ["distributed systems", "algorithms", "cryptography", "databases", "compilers", "operating systems",
+                     "networking", "cloud computing", "consensus", "storage", "security", "concurrency",
+                     "performance"],
+        "objects": ["key-value stores", "consensus protocols", "query planners", "garbage collectors",
+                    "network stacks", "scheduling policies", "write-ahead logs"],
+        "methods": ["formal verification", "trace-driven simulation", "fuzzing", "static analysis",
+                    "microbenchmarks", "chaos experiments"],
+    },
+}
+
+TITLE_TEMPLATES = [
+    "{Method} for {Object}: A {Adjective} Study",
+    "Towards {Adjective} {Object} with {Method}",
+    "On the Role of {Keyword} in {Object}",
+    "{Keyword} Meets {Keyword2}: Lessons from {Object}",
+    "A Survey of {Keyword} and {Keyword2}",
+    "Scaling {Object} through {Method}",
+    "Revisiting {Keyword}: {Adjective} Evidence from {Object}",
+]
+SENTENCE_TEMPLATES = [
+    "We study {object} through the lens of {keyword}.",
+    "Prior work on {keyword} has largely ignored {object}.",
+    "We propose a new, {adjective} approach that combines {method} with {keyword2}.",
+    "Experiments on {object} show that {method} improves {keyword} by {number} percent.",
+    "Our analysis reveals a {adjective} trade-off between {keyword} and {keyword2}.",
+    "We release {object} annotated for {keyword} to support future research.",
+    "Compared with {method}, our approach reduces cost by a factor of {small}.",
+    "These results suggest that {keyword} remains an open problem for {object}.",
+    "We evaluate {number} configurations of {object} under {method}.",
+    "Ablations attribute most of the gain to {method}.",
+]
+ADJECTIVES = ["scalable", "robust", "efficient", "principled", "empirical", "unified", "practical", "systematic",
+              "lightweight", "large-scale"]
+
+
+def _zipf_weights(count: int) -> List[float]:
+    return [1.0 / (rank ** ZIPF_EXPONENT) for rank in range(1, count + 1)]
+
+
+def document_size(rng: random.Random, median_bytes: int = DEFAULT_MEDIAN_BYTES, sigma: float = DEFAULT_SIGMA,
+                  min_bytes: int = MIN_DOCUMENT_BYTES, max_bytes: int = MAX_DOCUMENT_BYTES) -> int:
+    """A target encoded size drawn from the clipped log-normal distribution."""
+    return int(min(max_bytes, max(min_bytes, rng.lognormvariate(math.log(median_bytes), sigma))))
+
+
+class CorpusGenerator:
+    """Seeded generator of synthetic academic documents."""
+
+    def __init__(self, seed: int = 42, median_bytes: int = DEFAULT_MEDIAN_BYTES, sigma: float = DEFAULT_SIGMA,
+                 min_bytes: int = MIN_DOCUMENT_BYTES, max_bytes: int = MAX_DOCUMENT_BYTES):
+        if not 0 < min_bytes <= max_bytes:
+            raise ValueError("expected 0 < min_bytes <= max_bytes")
+        self.seed = seed
+        self.median_bytes = median_bytes
+        self.sigma = sigma
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self._fields = sorted(FIELDS)
+        self._field_weights = _zipf_weights(len(self._fields))
+        self._keyword_weights = {name: _zipf_weights(len(FIELDS[name]["keywords"])) for name in self._fields}
+
+    def _keywords(self, rng: random.Random, field: str, count: int) -> List[str]:
+        pool, weights = FIELDS[field]["keywords"], self._keyword_weights[field]
+        chosen: List[str] = []
+        while len(chosen) < count:
+            keyword = rng.choices(pool, weights)[0]
+            if keyword not in chosen:
+                chosen.append(keyword)
+        return chosen
+
+    def _fill(self, rng: random.Random, template: str, field: str, keywords: List[str]) -> str:
+        vocabulary = FIELDS[field]
+        keyword, keyword2 = rng.sample(keywords, 2) if len(keywords) > 1 else (keywords[0], keywords[0])
+        return template.format(
+            keyword=keyword, keyword2=keyword2, Keyword=keyword.title(), Keyword2=keyword2.title(),
+            object=rng.choice(vocabulary["objects"]), Object=rng.choice(vocabulary["objects"]).title(),
+            method=rng.choice(vocabulary["methods"]), Method=rng.choice(vocabulary["methods"]).title(),
+            adjective=rng.choice(ADJECTIVES), Adjective=rng.choice(ADJECTIVES).title(),
+            number=rng.randint(2, 95), small=rng.randint(2, 12),
+        )
+
+    def document(self, rng: random.Random, doc_id: str) -> Dict[str, Any]:
+        """One document whose JSON encoding is close to (and at least) a drawn target size."""
+        field = rng.choices(self._fields, self._field_weights)[0]
+        keywords = self._keywords(rng, field, rng.randint(3, 8))
+        title = self._fill(rng, rng.choice(TITLE_TEMPLATES), field, keywords)
+        target = document_size(rng, self.median_bytes, self.sigma, self.min_bytes, self.max_bytes)
+        overhead = len(json.dumps({"id": doc_id, "title": title, "abstract": "", "keywords": keywords}).encode('utf-8'))
+        sentences, length = [], 0
+        while length < target - overhead:
+            sentence = self._fill(rng, rng.choice(SENTENCE_TEMPLATES), field, keywords)
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        abstract = " ".join(sentences)[:max(0, target - overhead)]
+        return {"id": doc_id, "title": title, "abstract": abstract, "keywords": keywords}
+
+    def documents(self, num_docs: int, start: int = 0) -> Iterator[Dict[str, Any]]:
+        """Documents ``start`` .. ``start + num_docs - 1``; each depends only on the seed and its number."""
+        for i in range(start, start + num_docs):
+            yield self.document(random.Random(f"{self.seed}:{i}"), f"doc{i}")
+
+    def queries(self, count: int, miss_fraction: float = 0.1) -> List[str]:
+        """Search queries: keywords in their corpus frequencies, plus some that match nothing."""
+        rng = random.Random(f"{self.seed}:queries")
+        queries = []
+        for _ in range(count):
+            if rng.random() < miss_fraction:
+                queries.append(f"zz{rng.randint(0, 10 ** 6)}")
+            else:
+                field = rng.choices(self._fields, self._field_weights)[0]
+                queries.append(self._keywords(rng, field, 1)[0])
+        return queries
+
+    def write(self, path: str, num_docs: int) -> Dict[str, Any]:
+        """Streams ``num_docs`` documents to ``path`` as a JSON array (the store's file format)."""
+        total_bytes, largest = 0, 0
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("[")
+            for n, document in enumerate(self.documents(num_docs)):
+                encoded = json.dumps(document)
+                total_bytes += len(encoded.encode('utf-8'))
+                largest = max(largest, len(encoded))
+                f.write(",\n" if n else "\n")
+                f.write(encoded)
+            f.write("\n]\n")
+        return {"documents": num_docs, "bytes": os.path.getsize(path), "document_bytes": total_bytes,
+                "mean_document_bytes": round(total_bytes / num_docs, 1) if num_docs else 0,
+                "largest_document_bytes": largest}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Writes a seeded synthetic academic corpus")
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--median-bytes", type=int, default=DEFAULT_MEDIAN_BYTES)
+    parser.add_argument("--sigma", type=float, default=DEFAULT_SIGMA, help="spread of the log-normal size distribution")
+    parser.add_argument("--min-bytes", type=int, default=MIN_DOCUMENT_BYTES)
+    parser.add_argument("--max-bytes", type=int, default=MAX_DOCUMENT_BYTES)
+    parser.add_argument("--output", default="-", help="file to write, or - for stdout")
+    args = parser.parse_args()
+
+    generator = CorpusGenerator(args.seed, args.median_bytes, args.sigma, args.min_bytes, args.max_bytes)
+    if args.output == "-":
+        json.dump(list(generator.documents(args.docs)), sys.stdout)
+        return
+    summary = generator.write(args.output, args.docs)
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
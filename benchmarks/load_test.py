@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+负载测试工具 - SSE 订阅者、/mcp_command 混合请求与 stdio 流水线
+
+Starts an ``McpServer`` in a child process (or targets ``--url``) and drives
+it the way production clients would:
+
+* ``--subscribers`` SSE connections to ``/mcp_sse``, all read by a single
+  selector thread, so thousands of them cost the load generator one thread;
+* ``--post-clients`` threads posting a weighted ``--mix`` of tools and
+  commands to ``/mcp_command`` for ``--duration`` seconds, optionally paced
+  to ``--rate`` posts per second in total;
+* ``--stdio-requests`` requests written to a stdio server with up to
+  ``--stdio-pipeline`` of them in flight.
+
+Each ``execute_tool`` POST carries a ``request_id`` chosen by the load
+generator. The broadcast event with that id gives the end-to-end latency
+from the POST to its delivery on every subscriber. An accepted call that
+a connected subscriber has not received when ``--drain`` runs out is counted
+as a dropped event.
+
+    python benchmarks/load_test.py --subscribers 2000 --post-clients 16 --duration 30 \\
+        --mix echo=60,document_search=35,add_document_to_store=5 --output load.json
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import selectors
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.corpus import CorpusGenerator  # noqa: E402
+from mcp.server import COMMAND_PATH, SSE_PATH  # noqa: E402
+
+DEFAULT_MIX = "echo=60,document_search=35,add_document_to_store=5"
+# Tools whose calls are answered with a broadcast SSE event; everything else in a mix is sent as a command
+EVENT_TOOLS = ("echo", "document_search", "add_document_to_store", "update_document", "delete_document")
+MAX_SAMPLES = 200000
+# Tool responses carry "request_id" before "result", so it is found without decoding the payload
+REQUEST_ID_PATTERN = re.compile(rb'"request_id": "([^"]+)"')
+
+logger = logging.getLogger(__name__)
+
+
+class _Samples:
+    """Reservoir of at most ``limit`` latency samples (seconds), so long runs use bounded memory."""
+
+    def __init__(self, limit: int = MAX_SAMPLES, seed: int = 0):
+        self.limit = limit
+        self.count = 0
+        self.values: List[float] = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def add(self, value: float) -> None:
+        with self._lock:
+            self.count += 1
+            if len(self.values) < self.limit:
+                self.values.append(value)
+            else:
+                slot = self._rng.randrange(self.count)
+                if slot < self.limit:
+                    self.values[slot] = value
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.values)
+        if not ordered:
+            return {"count": self.count}
+
+        def at(fraction):
+            return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+        return {"count": self.count, "p50_ms": at(0.50), "p90_ms": at(0.90), "p99_ms": at(0.99),
+                "p999_ms": at(0.999), "max_ms": round(ordered[-1] * 1000, 3),
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3)}
+
+
+def _raise_fd_limit(needed: int) -> None:
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def parse_mix(text: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if not name.strip():
+            continue
+        mix.append((name.strip(), float(weight) if weight else 1.0))
+    if not mix or any(weight < 0 for _, weight in mix) or not sum(weight for _, weight in mix):
+        raise ValueError(f"invalid mix: {text!r}")
+    return mix
+
+
+class RequestFactory:
+    """Builds the command bodies of a mix, with parameters from the synthetic corpus."""
+
+    def __init__(self, mix: List[Tuple[str, float]], seed: int = 42):
+        self.names = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.generator = CorpusGenerator(seed=seed)
+        self.queries = self.generator.queries(1000)
+        self._documents = self.generator.documents(10 ** 9, start=10 ** 6)  # Ids that do not clash with the store
+        self._lock = threading.Lock()
+
+    def tool_params(self, name: str, rng: random.Random) -> Dict[str, Any]:
+        if name == "echo":
+            return {"message": f"load {rng.random()}"}
+        if name == "document_search":
+            return {"query": rng.choice(self.queries), "max_results": 5}
+        if name == "add_document_to_store":
+            with self._lock:
+                document = next(self._documents)
+            return {"document_text": f"{document['title']}\n{document['abstract']}",
+                    "keywords": ", ".join(document["keywords"]), "durability": "enqueue"}
+        return {}
+
+    def next(self, rng: random.Random) -> Tuple[str, Dict[str, Any], Optional[str]]:
+        """(mix entry, request body, request id or None if no SSE event will answer it)."""
+        name = rng.choices(self.names, self.weights)[0]
+        if name in EVENT_TOOLS:
+            request_id = uuid.uuid4().hex
+            return name, {"command": "execute_tool", "tool_name": name, "tool_params": self.tool_params(name, rng),
+                          "request_id": request_id}, request_id
+        return name, {"command": name}, None
+
+
+class SubscriberPool:
+    """Many SSE connections read by one selector thread; records when each tool event arrives."""
+
+    def __init__(self, host: str, port: int, sent_at: Dict[str, float], samples: _Samples):
+        self.host = host
+        self.port = port
+        self.sent_at = sent_at  # request id -> time of its POST (perf_counter)
+        self.samples = samples
+        self.selector = selectors.DefaultSelector()
+        self.connected = 0
+        self.failed = 0
+        self.disconnected = 0
+        self.events = 0
+        self.unmatched_events = 0
+        self.received: Dict[int, int] = {}  # subscriber -> matched tool events received
+        self.first_delivery: Dict[str, float] = {}
+        self.last_delivery: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def connect(self, count: int) -> float:
+        """Opens ``count`` subscriptions; returns the seconds it took."""
+        started = time.perf_counter()
+        request = f"GET {SSE_PATH} HTTP/1.1\r\nHost: {self.host}\r\nAccept: text/event-stream\r\n\r\n".encode()
+        for n in range(count):
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=10)
+                sock.sendall(request)
+                sock.setblocking(False)
+            except OSError as e:
+                self.failed += 1
+                logger.warning(f"Subscriber {n} could not connect: {e}")
+                continue
+            self.received[n] = 0
+            self.selector.register(sock, selectors.EVENT_READ, {"id": n, "buffer": b"", "headers": False})
+            self.connected += 1
+        return time.perf_counter() - started
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sse-subscribers", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+        self.selector.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            for key, _ in self.selector.select(timeout=0.1):
+                try:
+                    chunk = key.fileobj.recv(65536)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except OSError:
+                    chunk = b""
+                if not chunk:
+                    self.selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    self.disconnected += 1
+                    continue
+                self._feed(key.data, chunk, time.perf_counter())
+
+    def _feed(self, state: Dict[str, Any], chunk: bytes, now: float) -> None:
+        buffer = state["buffer"] + chunk
+        if not state["headers"]:
+            head, separator, rest = buffer.partition(b"\r\n\r\n")
+            if not separator:
+                state["buffer"] = buffer
+                return
+            if b" 200 " not in head.split(b"\r\n", 1)[0]:
+                logger.warning(f"Subscriber {state['id']} was refused: {head.splitlines()[0]!r}")
+            state["headers"] = True
+            buffer = rest
+        *blocks, state["buffer"] = buffer.split(b"\n\n")
+        for block in blocks:
+            event, data = None, []
+            for line in block.split(b"\n"):
+                if line.startswith(b"event:"):
+                    event = line[6:].strip()
+                elif line.startswith(b"data:"):
+                    data.append(line[5:].lstrip())
+            if event not in (b"tool_result", b"tool_error"):
+                continue
+            self.events += 1
+            match = REQUEST_ID_PATTERN.search(data[0]) if data else None
+            request_id = match.group(1).decode() if match else None
+            sent = self.sent_at.get(request_id)
+            if sent is None:
+                self.unmatched_events += 1
+                continue
+            self.received[state["id"]] += 1
+            self.samples.add(now - sent)
+            self.first_delivery.setdefault(request_id, now - sent)
+            self.last_delivery[request_id] = now - sent
+
+    def live_subscribers(self) -> List[int]:
+        return [key.data["id"] for key in self.selector.get_map().values()]
+
+
+def run_sse(host: str, port: int, factory: RequestFactory, subscribers: int, post_clients: int, duration: float,
+            rate: Optional[float], drain: float, seed: int) -> Dict[str, Any]:
+    sent_at: Dict[str, float] = {}
+    accepted: List[str] = []
+    delivery_samples = _Samples(seed=seed)
+    post_samples = _Samples(seed=seed + 1)
+    pool = SubscriberPool(host, port, sent_at, delivery_samples)
+    connect_seconds = pool.connect(subscribers)
+    pool.start()
+    time.sleep(0.5)  # Let the server register the subscriptions before the first broadcast
+
+    by_status: Dict[str, int] = {}
+    by_entry: Dict[str, int] = {}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+    interval = post_clients / rate if rate else 0.0
+
+    def client(n: int) -> None:
+        rng = random.Random(seed * 1000 + n)
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        next_send = time.perf_counter()
+        while time.perf_counter() < stop_at:
+            if interval:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_send += interval
+            name, body, request_id = factory.next(rng)
+            encoded = json.dumps(body).encode('utf-8')
+            started = time.perf_counter()
+            if request_id is not None:
+                sent_at[request_id] = started
+            try:
+                connection.request("POST", COMMAND_PATH, encoded, {"Content-Type": "application/json"})
+                response = connection.getresponse()
+                response.read()
+                status = str(response.status)
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                status = type(e).__name__
+            post_samples.add(time.perf_counter() - started)
+            with lock:
+                by_status[status] = by_status.get(status, 0) + 1
+                by_entry[name] = by_entry.get(name, 0) + 1
+                if request_id is not None and status == "202":
+                    accepted.append(request_id)
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(n,), name=f"poster-{n}") for n in range(post_clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    posting_seconds = time.perf_counter() - started
+
+    live = pool.live_subscribers()
+    expected = len(accepted) * len(live)
+    deadline = time.perf_counter() + drain
+    while time.perf_counter() < deadline and sum(pool.received[n] for n in live) < expected:
+        time.sleep(0.05)
+    pool.stop()
+    delivered = sum(pool.received[n] for n in live)
+
+    sent = sum(by_status.values())
+    return {
+        "subscribers": {"requested": subscribers, "connected": pool.connected, "failed": pool.failed,
+                        "disconnected": pool.disconnected, "connect_seconds": round(connect_seconds, 3)},
+        "posts": {"sent": sent, "seconds": round(posting_seconds, 3),
+                  "per_second": round(sent / posting_seconds, 1) if posting_seconds else None,
+                  "by_status": by_status, "by_entry": by_entry, "latency": post_samples.summary()},
+        "events": {
+            "accepted_calls": len(accepted), "expected_deliveries": expected, "delivered": delivered,
+            "dropped": expected - delivered, "unmatched": pool.unmatched_events,
+            "per_second": round(delivered / posting_seconds, 1) if posting_seconds else None,
+            "post_to_event_latency": delivery_samples.summary(),
+            "first_subscriber_latency": _summary_of(pool.first_delivery.values(), seed),
+            "last_subscriber_latency": _summary_of(pool.last_delivery.values(), seed),
+        },
+    }
+
+
+def _summary_of(values, seed: int) -> Dict[str, Any]:
+    samples = _Samples(seed=seed)
+    for value in values:
+        samples.add(value)
+    return samples.summary()
+
+
+def run_stdio(store_file: str, factory: RequestFactory, requests: int, pipeline: int, seed: int) -> Dict[str, Any]:
+    """Writes ``requests`` lines to a stdio server, keeping up to ``pipeline`` unanswered."""
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", "stdio", "--store", store_file],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+    try:
+        process.stdin.write(b'{"command": "stats"}\n')  # Wait until the server answers before timing
+        process.stdout.readline()
+        rng = random.Random(seed)
+        in_flight = threading.Semaphore(pipeline)
+        pending: deque = deque()  # Send times; responses come back in order
+        samples = _Samples(seed=seed)
+        statuses: Dict[str, int] = {}
+
+        def read_responses() -> None:
+            for _ in range(requests):
+                line = process.stdout.readline()
+                now = time.perf_counter()
+                if not line:
+                    return
+                samples.add(now - pending.popleft())
+                in_flight.release()
+                try:
+                    status = json.loads(line).get("status", "unknown")
+                except ValueError:
+                    status = "invalid"
+                statuses[status] = statuses.get(status, 0) + 1
+
+        reader = threading.Thread(target=read_responses, name="stdio-reader")
+        reader.start()
+        started = time.perf_counter()
+        for _ in range(requests):
+            _, body, _ = factory.next(rng)
+            line = json.dumps(body).encode('utf-8') + b"\n"
+            in_flight.acquire()
+            pending.append(time.perf_counter())
+            process.stdin.write(line)
+        reader.join()
+        elapsed = time.perf_counter() - started
+        answered = sum(statuses.values())
+        return {"requests": requests, "answered": answered, "pipeline": pipeline, "seconds": round(elapsed, 3),
+                "per_second": round(answered / elapsed, 1) if elapsed else None, "by_status": statuses,
+                "latency": samples.summary()}
+    finally:
+        try:
+            process.stdin.write(b"quit\n")
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _wait_for_port(host: str, port: int, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not listen on {host}:{port} within {timeout}s")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(transport: str, store_file: str, port: Optional[int], subscribers: int) -> None:
+    """Child process mode: runs a server on ``store_file`` until stdin closes (SSE) or "quit" (stdio)."""
+    from mcp.server import McpServer
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    _raise_fd_limit(subscribers + 1024)
+    server = McpServer("load-test", "0", document_store_file=store_file)
+    try:
+        if transport == "stdio":
+            server.start(transport_type="stdio")
+        else:
+            server.start(transport_type="sse", port=port)
+            sys.stdin.read()
+    finally:
+        server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load generator for the SSE and stdio transports")
+    parser.add_argument("--transports", default="sse,stdio", help="comma-separated: sse, stdio")
+    parser.add_argument("--url", help="drive an already running SSE server instead of starting one")
+    parser.add_argument("--docs", type=int, default=2000, help="documents in the started server's store")
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--post-clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of POST traffic")
+    parser.add_argument("--rate", type=float, default=None, help="total POSTs per second (default: as fast as possible)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted tools and commands, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--drain", type=float, default=10.0, help="seconds to wait for outstanding events")
+    parser.add_argument("--stdio-requests", type=int, default=5000)
+    parser.add_argument("--stdio-pipeline", type=int, default=64, help="stdio requests in flight")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the report JSON to this file")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON only")
+    parser.add_argument("--serve", choices=("sse", "stdio"), help=argparse.SUPPRESS)
+    parser.add_argument("--store", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.store, args.port, args.subscribers)
+        return
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        factory = RequestFactory(parse_mix(args.mix), args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    transports = [t for t in args.transports.split(",") if t]
+    _raise_fd_limit(args.subscribers + 1024)
+    report: Dict[str, Any] = {"config": {k: v for k, v in vars(args).items() if k not in ("serve", "store", "port")}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store_file = os.path.join(tmp, "documents.json")
+        if args.url is None or "stdio" in transports:
+            CorpusGenerator(seed=args.seed).write(store_file, args.docs)
+        if "sse" in transports:
+            server = None
+            if args.url:
+                parsed = urllib.parse.urlparse(args.url)
+                host, port = parsed.hostname, parsed.port or 80
+            else:
+                host, port = "127.0.0.1", _free_port()
+                server = subprocess.Popen(
+                    [sys.executable, os.path.abspath(__file__), "--serve", "sse", "--store", store_file,
+                     "--port", str(port), "--subscribers", str(args.subscribers)],
+                    stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            try:
+                if server is not None:
+                    _wait_for_port(host, port, server)
+                report["sse"] = run_sse(host, port, factory, args.subscribers, args.post_clients, args.duration,
+                                        args.rate, args.drain, args.seed)
+            finally:
+                if server is not None:
+                    server.stdin.close()
+                    try:
+                        server.wait(timeout=30)
+                    except subprocess.TimeoutExpired:
+                        server.kill()
+        if "stdio" in transports:
+            report["stdio"] = run_stdio(store_file, factory, args.stdio_requests, args.stdio_pipeline, args.seed)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report))
+        return
+    if "sse" in report:
+        sse = report["sse"]
+        subs, posts, events = sse["subscribers"], sse["posts"], sse["events"]
+        latency = events["post_to_event_latency"]
+        print(f"SSE: {subs['connected']}/{subs['requested']} subscribers connected in {subs['connect_seconds']}s "
+              f"({subs['disconnected']} disconnected)")
+        print(f"  {posts['sent']} POSTs at {posts['per_second']}/s, statuses {posts['by_status']}, "
+              f"p99 {posts['latency'].get('p99_ms')} ms")
+        print(f"  {events['delivered']}/{events['expected_deliveries']} events delivered "
+              f"({events['dropped']} dropped) at {events['per_second']}/s")
+        print(f"  POST -> event p50 {latency.get('p50_ms')} ms, p99 {latency.get('p99_ms')} ms, "
+              f"max {latency.get('max_ms')} ms; last subscriber p99 {events['last_subscriber_latency'].get('p99_ms')} ms")
+    if "stdio" in report:
+        stdio = report["stdio"]
+        print(f"stdio: {stdio['answered']}/{stdio['requests']} answered at {stdio['per_second']}/s "
+              f"(pipeline {stdio['pipeline']}), p50 {stdio['latency'].get('p50_ms')} ms, "
+              f"p99 {stdio['latency'].get('p99_ms')} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基准测试套件 - 搜索延迟、写入吞吐量、启动时间与每文档内存
+
+Runs on corpora from :mod:`benchmarks.corpus` (the same seed gives the same
+documents on every commit) and measures:
+
+* ``document_search`` latency percentiles for each corpus size;
+* startup time: constructing ``McpServer`` on the corpus, and until the
+  search index is built;
+* traced memory per document once the server is ready;
+* ``add_document_to_store`` throughput for each durability mode, from
+  concurrent clients.
+
+Results are written as JSON. Every comparable number also appears under
+``metrics`` with its unit and whether lower or higher is better, and
+``--compare`` checks a run against an earlier results file and exits with
+status 1 when a metric got worse by more than ``--tolerance``.
+
+    python benchmarks/run_suite.py --sizes 1000,10000 --output bench-results.json
+    python benchmarks/run_suite.py --sizes 1000,10000 --compare bench-results.json
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.corpus import DEFAULT_MEDIAN_BYTES, CorpusGenerator  # noqa: E402
+from mcp.persistence import DURABILITY_MODES  # noqa: E402
+from mcp.server import McpServer  # noqa: E402
+
+LOWER = "lower"
+HIGHER = "higher"
+DEFAULT_TOLERANCE = 0.15
+
+
+def _percentiles_ms(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def at(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+    return {"p50": at(0.50), "p90": at(0.90), "p99": at(0.99), "max": round(ordered[-1] * 1000, 3),
+            "mean": round(sum(ordered) / len(ordered) * 1000, 3)}
+
+
+def _start_server(store_file: str) -> McpServer:
+    server = McpServer("bench", "0", document_store_file=store_file)
+    server._search_index_ready.wait()
+    server.search_index.wait_idle()
+    return server
+
+
+def bench_corpus(generator: CorpusGenerator, num_docs: int, queries: List[str], max_results: int) -> Dict[str, Any]:
+    """Startup time, memory per document and search latency on a ``num_docs`` corpus."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store_file = os.path.join(tmp, "documents.json")
+        corpus = generator.write(store_file, num_docs)
+
+        started = time.perf_counter()
+        server = McpServer("bench", "0", document_store_file=store_file)
+        constructed = time.perf_counter() - started
+        server._search_index_ready.wait()
+        server.search_index.wait_idle()
+        ready = time.perf_counter() - started
+        try:
+            for query in queries[:20]:  # Warm-up, not measured
+                server._execute_document_search_impl({"query": query, "max_results": max_results})
+            latencies = []
+            for query in queries:
+                t0 = time.perf_counter()
+                server._execute_document_search_impl({"query": query, "max_results": max_results})
+                latencies.append(time.perf_counter() - t0)
+        finally:
+            server.stop()
+
+        # Measured on a second start, since tracing allocations slows the startup measured above
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        server = _start_server(store_file)
+        gc.collect()
+        traced = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        server.stop()
+
+    return {
+        "corpus": corpus,
+        "startup_seconds": {"constructor": round(constructed, 4), "search_ready": round(ready, 4)},
+        "memory": {"traced_bytes": traced, "bytes_per_document": round(traced / num_docs, 1)},
+        "search": {"queries": len(queries), "max_results": max_results,
+                   "queries_per_second": round(len(latencies) / sum(latencies), 1) if latencies else None,
+                   "latency_ms": _percentiles_ms(latencies)},
+    }
+
+
+def bench_ingest(generator: CorpusGenerator, num_docs: int, durability: str, clients: int) -> Dict[str, Any]:
+    """``add_document_to_store`` throughput into an empty store from ``clients`` threads."""
+    documents = list(generator.documents(num_docs))
+    params = [{"document_text": f"{d['title']}\n{d['abstract']}", "keywords": ", ".join(d["keywords"]),
+               "durability": durability} for d in documents]
+    payload_bytes = sum(len(p["document_text"].encode('utf-8')) for p in params)
+    errors = []
+    with tempfile.TemporaryDirectory() as tmp:
+        store_file = os.path.join(tmp, "documents.json")
+        with open(store_file, 'w', encoding='utf-8') as f:
+            json.dump([], f)
+        server = _start_server(store_file)
+        try:
+            remaining = iter(params)
+            lock = threading.Lock()
+
+            def client():
+                while True:
+                    with lock:
+                        item = next(remaining, None)
+                    if item is None:
+                        return
+                    response = server.execute_tool("add_document_to_store", item)
+                    if response["status"] != "success":
+                        errors.append(response.get("error"))
+
+            threads = [threading.Thread(target=client) for _ in range(clients)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            server.store_writer.flush()  # Include the writes still queued with "enqueue" durability
+            elapsed = time.perf_counter() - started
+        finally:
+            server.stop()
+    return {
+        "documents": num_docs, "clients": clients, "durability": durability, "errors": len(errors),
+        "seconds": round(elapsed, 4), "docs_per_second": round(num_docs / elapsed, 1),
+        "megabytes_per_second": round(payload_bytes / elapsed / 1e6, 3),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(sizes: List[int], ingest_docs: int, ingest_modes: List[str], ingest_clients: int, num_queries: int,
+        max_results: int, seed: int, median_bytes: int) -> Dict[str, Any]:
+    generator = CorpusGenerator(seed=seed, median_bytes=median_bytes)
+    queries = generator.queries(num_queries)
+    results: Dict[str, Any] = {
+        "metadata": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "commit": _git_commit(),
+            "python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "seed": seed, "median_document_bytes": median_bytes,
+        },
+        "corpus_sizes": {}, "ingest": {}, "metrics": {},
+    }
+    metrics = results["metrics"]
+    for size in sizes:
+        logging.getLogger(__name__).info(f"Benchmarking a corpus of {size} documents")
+        corpus = results["corpus_sizes"][str(size)] = bench_corpus(generator, size, queries, max_results)
+        for name, value in corpus["search"]["latency_ms"].items():
+            if name == "max":
+                continue  # A single sample, too noisy to compare
+            metrics[f"search[{size}].latency_{name}_ms"] = {"value": value, "unit": "ms", "better": LOWER}
+        metrics[f"startup[{size}].search_ready_seconds"] = {
+            "value": corpus["startup_seconds"]["search_ready"], "unit": "s", "better": LOWER}
+        metrics[f"memory[{size}].bytes_per_document"] = {
+            "value": corpus["memory"]["bytes_per_document"], "unit": "bytes", "better": LOWER}
+    for mode in ingest_modes:
+        ingest = results["ingest"][mode] = bench_ingest(generator, ingest_docs, mode, ingest_clients)
+        metrics[f"ingest[{mode}].docs_per_second"] = {"value": ingest["docs_per_second"], "unit": "docs/s",
+                                                      "better": HIGHER}
+    return results
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> List[Dict[str, Any]]:
+    """Metrics present in both runs, with their relative change; ``regression`` marks those worse than ``tolerance``."""
+    rows = []
+    for name, metric in current["metrics"].items():
+        before = baseline.get("metrics", {}).get(name)
+        if before is None or not before["value"] or metric["value"] is None:
+            continue
+        change = (metric["value"] - before["value"]) / before["value"]
+        worse = change if metric["better"] == LOWER else -change
+        rows.append({"metric": name, "baseline": before["value"], "current": metric["value"],
+                     "change": round(change, 4), "regression": worse > tolerance})
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search, ingest, startup and memory benchmarks on a synthetic corpus")
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated corpus sizes (documents)")
+    parser.add_argument("--queries", type=int, default=200, help="document_search calls per corpus size")
+    parser.add_argument("--max-results", type=int, default=10)
+    parser.add_argument("--ingest", type=int, default=500, help="documents added per ingest run")
+    parser.add_argument("--ingest-modes", default=",".join(DURABILITY_MODES), help="comma-separated durability modes")
+    parser.add_argument("--ingest-clients", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--median-bytes", type=int, default=DEFAULT_MEDIAN_BYTES)
+    parser.add_argument("--output", help="write the results JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="relative change counted as a regression (default 0.15)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON only")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    modes = [mode for mode in args.ingest_modes.split(",") if mode]
+    unknown = [mode for mode in modes if mode not in DURABILITY_MODES]
+    if unknown:
+        parser.error(f"unknown durability modes: {', '.join(unknown)}")
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    results = run(sizes, args.ingest, modes, args.ingest_clients, args.queries, args.max_results, args.seed,
+                  args.median_bytes)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    comparison = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            comparison = compare(json.load(f), results, args.tolerance)
+    if args.json:
+        print(json.dumps({**results, "comparison": comparison} if comparison is not None else results))
+    else:
+        for size, corpus in results["corpus_sizes"].items():
+            latency = corpus["search"]["latency_ms"]
+            print(f"{size} documents ({corpus['corpus']['mean_document_bytes']:.0f} bytes mean): "
+                  f"ready in {corpus['startup_seconds']['search_ready']}s, "
+                  f"{corpus['memory']['bytes_per_document']:.0f} bytes/doc traced, "
+                  f"search p50 {latency['p50']} ms / p99 {latency['p99']} ms")
+        for mode, ingest in results["ingest"].items():
+            print(f"ingest ({mode}, {ingest['clients']} clients): {ingest['docs_per_second']} docs/s, "
+                  f"{ingest['megabytes_per_second']} MB/s, {ingest['errors']} errors")
+        for row in comparison or []:
+            flag = "REGRESSION" if row["regression"] else ""
+            print(f"  {row['metric']:<40} {row['baseline']:>12} -> {row['current']:>12} ({row['change']:+.1%}) {flag}")
+    if comparison and any(row["regression"] for row in comparison):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
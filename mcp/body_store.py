@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+分层存储 - 文档正文存放在磁盘段文件中，经由有界LRU页缓存读取
+
+Titles, ids and keywords stay in memory on each :class:`~mcp.document.Document`;
+the (potentially large) abstract/body text is appended to a segment file and
+the document only keeps a small :class:`BodyRef`. Reads go through a
+:class:`PageCache` with a fixed memory budget. Segments are append-only;
+:meth:`~mcp.document_store.DocumentStore.compact_bodies` reclaims the space
+of deleted and replaced bodies by copying the live ones into a fresh segment.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 16 * 1024
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+
+
+class PageCache:
+    """Bounded LRU cache of fixed-size pages of a file, keyed by page number.
+
+    ``budget_bytes`` caps the bytes of page data held in memory. Thread-safe.
+    """
+
+    def __init__(self, fd: int, page_size: int = DEFAULT_PAGE_SIZE, budget_bytes: int = DEFAULT_CACHE_BYTES):
+        self._fd = fd
+        self.page_size = page_size
+        self.budget_bytes = max(page_size, int(budget_bytes))
+        self._pages: "OrderedDict[int, bytes]" = OrderedDict()
+        self._resident_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def read(self, offset: int, length: int) -> bytes:
+        """Reads ``length`` bytes at ``offset``, loading missing pages from the file."""
+        if length <= 0:
+            return b""
+        first_page = offset // self.page_size
+        last_page = (offset + length - 1) // self.page_size
+        chunks = [self._page(page_no) for page_no in range(first_page, last_page + 1)]
+        start = offset - first_page * self.page_size
+        return b"".join(chunks)[start:start + length]
+
+    def _page(self, page_no: int) -> bytes:
+        with self._lock:
+            page = self._pages.get(page_no)
+            if page is not None:
+                self._pages.move_to_end(page_no)
+                self.hits += 1
+                return page
+            self.misses += 1
+        page = os.pread(self._fd, self.page_size, page_no * self.page_size)
+        if len(page) < self.page_size:
+            # Tail page of a growing file: caching it would hide later appends
+            return page
+        with self._lock:
+            if page_no not in self._pages:
+                self._pages[page_no] = page
+                self._resident_bytes += len(page)
+                while self._resident_bytes > self.budget_bytes and self._pages:
+                    _, evicted = self._pages.popitem(last=False)
+                    self._resident_bytes -= len(evicted)
+                    self.evictions += 1
+        return page
+
+    def clear(self) -> None:
+        """Drops every cached page."""
+        with self._lock:
+            self._pages.clear()
+            self._resident_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pages": len(self._pages), "resident_bytes": self._resident_bytes,
+                "budget_bytes": self.budget_bytes, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions,
+            }
+
+
+class BodyRef:
+    """Location of a document body in a :class:`BodyTier` segment file."""
+
+    __slots__ = ("tier", "offset", "length")
+
+    def __init__(self, tier: "BodyTier", offset: int, length: int):
+        self.tier = tier
+        self.offset = offset
+        self.length = length
+
+    def read(self, cached: bool = True) -> str:
+        return self.tier.read(self.offset, self.length, cached)
+
+
+class BodyTier:
+    """Append-only segment file of UTF-8 document bodies fronted by a :class:`PageCache`.
+
+    The segment only backs documents held by this process (everything durable
+    lives in ``documents.json`` and its snapshot), so it is an unlinked
+    temporary file in ``directory`` that disappears when the process exits
+    (or once no :class:`BodyRef` points into it any more).
+    """
+
+    def __init__(self, directory: Optional[str] = None, cache_bytes: int = DEFAULT_CACHE_BYTES,
+                 page_size: int = DEFAULT_PAGE_SIZE):
+        self.directory = directory
+        self._file = tempfile.TemporaryFile(prefix="mcp-bodies-", dir=directory)
+        self._fd = self._file.fileno()
+        self._size = 0
+        self._append_lock = threading.Lock()
+        self.cache = PageCache(self._fd, page_size=page_size, budget_bytes=cache_bytes)
+        logger.info("Opened body segment in %s (page cache budget %s bytes)",
+                    directory or tempfile.gettempdir(), self.cache.budget_bytes)
+
+    def sibling(self) -> "BodyTier":
+        """Opens a new, empty segment with this one's directory and cache settings."""
+        return BodyTier(self.directory, cache_bytes=self.cache.budget_bytes, page_size=self.cache.page_size)
+
+    def append(self, text: str) -> BodyRef:
+        return self._append_bytes(text.encode('utf-8'))
+
+    def copy(self, ref: BodyRef) -> BodyRef:
+        """Appends the body ``ref`` points to (in any segment) without going through a page cache."""
+        return self._append_bytes(os.pread(ref.tier._fd, ref.length, ref.offset))
+
+    def _append_bytes(self, data: bytes) -> BodyRef:
+        with self._append_lock:
+            offset = self._size
+            os.pwrite(self._fd, data, offset)
+            self._size += len(data)
+        return BodyRef(self, offset, len(data))
+
+    def read(self, offset: int, length: int, cached: bool = True) -> str:
+        """Reads a body; ``cached=False`` bypasses the page cache (for one-off scans such as saving the store)."""
+        if not cached:
+            return os.pread(self._fd, length, offset).decode('utf-8')
+        return self.cache.read(offset, length).decode('utf-8')
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def stats(self) -> Dict[str, int]:
+        return {"segment_bytes": self._size, **self.cache.stats()}
+
+    def close(self) -> None:
+        self._file.close()
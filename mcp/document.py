@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+紧凑的文档对象模型
+
+``Document`` replaces the per-document dict in the store. It uses
+``__slots__`` instead of an instance dict, interns keywords so that terms
+shared across the corpus ("ai", "machine learning") are stored once, and can
+keep large abstracts zlib-compressed until they are read.
+
+It implements the read-only ``Mapping`` protocol, so existing code that does
+``doc.get("title")`` or ``doc["id"]`` keeps working, and ``dict(doc)`` yields
+exactly the JSON shape stored in ``documents.json``. With a
+:class:`~mcp.body_store.BodyTier` the abstract is moved to disk and read back
+through its page cache.
+"""
+
+import sys
+import zlib
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from .body_store import BodyRef, BodyTier
+
+# Marks a standard field that is absent from the source document
+_MISSING = object()
+
+_STANDARD_FIELDS = ("id", "title", "abstract", "keywords")
+
+
+def intern_keywords(keywords: Iterable[str]) -> tuple:
+    """Returns keywords as a tuple of interned strings."""
+    return tuple(sys.intern(keyword) for keyword in keywords)
+
+
+class Document(Mapping):
+    """A stored document with a fixed, slot-based layout."""
+
+    __slots__ = ("id", "title", "keywords", "extra", "_abstract")
+
+    def __init__(self, id: Any = _MISSING, title: Any = _MISSING, abstract: Any = _MISSING,
+                 keywords: Any = _MISSING, extra: Optional[Dict[str, Any]] = None,
+                 compress_abstract_over: Optional[int] = None):
+        self.id = id
+        self.title = title
+        if isinstance(keywords, (list, tuple)) and all(isinstance(k, str) for k in keywords):
+            keywords = intern_keywords(keywords)
+        self.keywords = keywords
+        self.extra = extra or None
+        if (compress_abstract_over is not None and isinstance(abstract, str)
+                and len(abstract) > compress_abstract_over):
+            abstract = zlib.compress(abstract.encode('utf-8'))
+        self._abstract = abstract
+
+    @classmethod
+    def from_dict(cls, data: Mapping, compress_abstract_over: Optional[int] = None) -> "Document":
+        if isinstance(data, Document) and compress_abstract_over is None:
+            return data
+        extra = {k: v for k, v in data.items() if k not in _STANDARD_FIELDS}
+        return cls(
+            id=data.get("id", _MISSING), title=data.get("title", _MISSING),
+            abstract=data.get("abstract", _MISSING), keywords=data.get("keywords", _MISSING),
+            extra=extra, compress_abstract_over=compress_abstract_over
+        )
+
+    @property
+    def abstract(self) -> Any:
+        """The abstract text, read from the body tier or decompressed on access as needed."""
+        value = self._abstract
+        if isinstance(value, BodyRef):
+            return value.read()
+        if isinstance(value, bytes):
+            return zlib.decompress(value).decode('utf-8')
+        return value
+
+    def move_abstract_to(self, tier: BodyTier) -> None:
+        """Moves an in-memory abstract to ``tier``, keeping only its location."""
+        if isinstance(self._abstract, (str, bytes)):
+            self._abstract = tier.append(self.abstract)
+
+    @property
+    def body_ref(self) -> Optional[BodyRef]:
+        """Where the abstract lives in a body tier, or None if it is held in memory."""
+        return self._abstract if isinstance(self._abstract, BodyRef) else None
+
+    def rebase_abstract(self, ref: BodyRef) -> None:
+        """Points the abstract at ``ref``, a copy of the same body in another segment."""
+        self._abstract = ref
+
+    @property
+    def abstract_is_compressed(self) -> bool:
+        return isinstance(self._abstract, bytes)
+
+    # --- Mapping protocol (JSON shape of the document) ---
+    def __getitem__(self, key: str) -> Any:
+        if key == "id":
+            value = self.id
+        elif key == "title":
+            value = self.title
+        elif key == "abstract":
+            value = self.abstract
+        elif key == "keywords":
+            value = list(self.keywords) if isinstance(self.keywords, tuple) else self.keywords
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        else:
+            raise KeyError(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        if self.id is not _MISSING:
+            yield "id"
+        if self.title is not _MISSING:
+            yield "title"
+        if self._abstract is not _MISSING:
+            yield "abstract"
+        if self.keywords is not _MISSING:
+            yield "keywords"
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def copy(self, cached: bool = True) -> Dict[str, Any]:
+        """Returns the document as a plain (JSON-serializable) dict.
+
+        With ``cached=False`` an abstract in the body tier is read without
+        going through (and evicting from) its page cache.
+        """
+        if cached or not isinstance(self._abstract, BodyRef):
+            return dict(self)
+        return {key: self._abstract.read(cached=False) if key == "abstract" else self[key] for key in self}
+
+    to_dict = copy
+
+    def __repr__(self) -> str:
+        return f"Document(id={self.id!r}, title={self.title!r})"
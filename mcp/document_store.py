@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文档库 - 由内存映射快照支持、多版本并发控制 (MVCC) 的文档序列
+
+Readers work on an immutable :class:`StoreSnapshot` and never take a lock.
+Writers commit through one serialized path that builds the next version from
+copy-on-write segments and publishes it with a single reference assignment.
+
+Every document occupies a stable *ordinal* (its position in the base
+snapshot followed by the appended segments). Updates and deletes never move
+other documents: a delete records the ordinal as a tombstone, and an update
+tombstones the old ordinal and appends the new version. :meth:`DocumentStore.compact`
+later releases tombstoned appended documents; tombstoned base documents
+are dropped from disk by the next save and from memory at the next restart.
+:meth:`DocumentStore.compact_bodies` then copies the live appended bodies
+into a fresh body segment so the space of released ones is reclaimed too.
+
+Tombstones are kept in immutable chunks of :data:`TOMBSTONE_CHUNK` ordinals,
+so a delete copies one chunk rather than every tombstone recorded so far.
+"""
+
+import logging
+import threading
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+from .body_store import BodyRef, BodyTier
+from .document import Document
+from .snapshot import SnapshotReader
+
+logger = logging.getLogger(__name__)
+
+# Appended documents are kept in immutable tuples of this many documents, so
+# a commit copies at most one segment plus the (short) tuple of segments.
+SEGMENT_SIZE = 256
+# Tombstoned ordinals are grouped into frozensets per this many ordinals
+TOMBSTONE_CHUNK = 4096
+# compact_bodies() rewrites the body segment once at least this share of it is dead
+BODY_REWRITE_DEAD_FRACTION = 0.5
+
+# chunk index -> tombstoned ordinals in that chunk; never modified once published
+Tombstones = Dict[int, FrozenSet[int]]
+
+
+def _with_tombstone(tombstones: Tombstones, ordinal: int) -> Tombstones:
+    """A copy of ``tombstones`` that also holds ``ordinal``, sharing every other chunk."""
+    chunk = ordinal // TOMBSTONE_CHUNK
+    result = dict(tombstones)
+    result[chunk] = tombstones.get(chunk, frozenset()) | {ordinal}
+    return result
+
+
+class StoreSnapshot:
+    """An immutable, versioned view of a :class:`DocumentStore`.
+
+    Nothing a snapshot references is modified after it is published, so it
+    can be read from any thread without locking. ``len``, iteration and
+    indexing cover live documents only; :meth:`document_at` addresses
+    documents by ordinal.
+    """
+
+    __slots__ = ("version", "_base", "_base_len", "_segments", "_appended_len", "_appended_by_id",
+                 "_tombstones", "_tombstone_count", "_dead_count", "_deleted_since_compaction")
+
+    def __init__(self, version: int, base: Optional[SnapshotReader], segments: Tuple[tuple, ...],
+                 appended_len: int, appended_by_id: Dict[str, List[int]],
+                 tombstones: Optional[Tombstones] = None, tombstone_count: int = 0, dead_count: int = 0,
+                 deleted_since_compaction: int = 0):
+        self.version = version
+        self._base = base
+        self._base_len = len(base) if base is not None else 0
+        self._segments = segments
+        self._appended_len = appended_len
+        # Shared by all versions and only ever added to; positions at or past
+        # ``appended_len`` belong to newer versions and are ignored.
+        self._appended_by_id = appended_by_id
+        # Deleted ordinals whose documents are still held (compaction empties
+        # the appended ones); ``dead_count`` counts all deleted ordinals.
+        self._tombstones = tombstones if tombstones is not None else {}
+        self._tombstone_count = tombstone_count
+        self._dead_count = dead_count
+        self._deleted_since_compaction = deleted_since_compaction
+
+    @property
+    def ordinal_count(self) -> int:
+        return self._base_len + self._appended_len
+
+    @property
+    def tombstone_count(self) -> int:
+        return self._tombstone_count
+
+    @property
+    def deleted_since_compaction(self) -> int:
+        """Deletes and updates committed since the last :meth:`DocumentStore.compact`."""
+        return self._deleted_since_compaction
+
+    def _tombstoned(self, ordinal: int) -> bool:
+        chunk = self._tombstones.get(ordinal // TOMBSTONE_CHUNK)
+        return chunk is not None and ordinal in chunk
+
+    def __len__(self) -> int:
+        return self.ordinal_count - self._dead_count
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def _appended(self, position: int) -> Optional[Document]:
+        return self._segments[position // SEGMENT_SIZE][position % SEGMENT_SIZE]
+
+    def is_deleted(self, ordinal: int) -> bool:
+        if self._tombstoned(ordinal):
+            return True
+        return ordinal >= self._base_len and self._appended(ordinal - self._base_len) is None
+
+    def document_at(self, ordinal: int) -> Optional[Document]:
+        """Returns the live document at ``ordinal``, or None if it was deleted."""
+        if not 0 <= ordinal < self.ordinal_count:
+            raise IndexError("document store ordinal out of range")
+        if self._tombstoned(ordinal):
+            return None
+        if ordinal < self._base_len:
+            return Document.from_dict(self._base.document(ordinal))
+        return self._appended(ordinal - self._base_len)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("document store index out of range")
+        if not self._dead_count:
+            return self.document_at(index)
+        for position, document in enumerate(self):
+            if position == index:
+                return document
+        raise IndexError("document store index out of range")
+
+    def live_ordinals(self, start: int = 0) -> Iterator[int]:
+        """Yields the ordinals of live documents from ``start`` in store order."""
+        for ordinal in range(start, self.ordinal_count):
+            if not self.is_deleted(ordinal):
+                yield ordinal
+
+    def __iter__(self) -> Iterator[Document]:
+        tombstoned = self._tombstoned
+        for ordinal in range(self._base_len):
+            if not tombstoned(ordinal):
+                yield Document.from_dict(self._base.document(ordinal))
+        ordinal = self._base_len
+        for segment in self._segments:
+            for document in segment:
+                if document is not None and not tombstoned(ordinal):
+                    yield document
+                ordinal += 1
+
+    def find_ordinal(self, doc_id: str) -> Optional[int]:
+        """Returns the ordinal of the live document with ``doc_id``."""
+        positions = self._appended_by_id.get(doc_id, ())
+        for position in reversed(positions):
+            if position < self._appended_len:
+                ordinal = self._base_len + position
+                return None if self.is_deleted(ordinal) else ordinal
+        if self._base is not None:
+            ordinal = self._base.find(doc_id)
+            if ordinal is not None and not self._tombstoned(ordinal):
+                return ordinal
+        return None
+
+    def find_by_id(self, doc_id: str) -> Optional[Document]:
+        """Looks up a live document by id via the snapshot's id index or the appended-id map."""
+        ordinal = self.find_ordinal(doc_id)
+        return self.document_at(ordinal) if ordinal is not None else None
+
+
+class DocumentStore:
+    """List-like document store: a memory-mapped snapshot plus appended documents.
+
+    Documents from the snapshot are materialized on access, so opening a store
+    costs the same for ten documents or ten million. Documents appended after
+    startup are held as compact :class:`Document` objects. Their abstracts
+    are written to ``body_tier`` (on disk, behind a bounded page cache) when
+    one is given; otherwise abstracts longer than ``compress_abstracts_over``
+    characters are kept zlib-compressed in memory.
+
+    Each read (``len``, iteration, indexing, :meth:`find_by_id`) uses the
+    version current when it starts; call :meth:`snapshot` to run several reads
+    against one consistent version.
+    """
+
+    def __init__(self, snapshot: Optional[SnapshotReader] = None, documents: Optional[Iterable[dict]] = None,
+                 compress_abstracts_over: Optional[int] = None, body_tier: Optional[BodyTier] = None):
+        self._base = snapshot
+        self.compress_abstracts_over = compress_abstracts_over
+        self.body_tier = body_tier
+        self._write_lock = threading.Lock()
+        self._appended_by_id: Dict[str, List[int]] = {}
+        self._current = StoreSnapshot(0, snapshot, (), 0, self._appended_by_id)
+        if documents:
+            self.extend(documents)
+
+    def snapshot(self) -> StoreSnapshot:
+        """Returns the current immutable version without locking."""
+        return self._current
+
+    @property
+    def version(self) -> int:
+        return self._current.version
+
+    @property
+    def base(self) -> Optional[SnapshotReader]:
+        """The memory-mapped snapshot holding the documents present at startup."""
+        return self._base
+
+    def __len__(self) -> int:
+        return len(self._current)
+
+    def __bool__(self) -> bool:
+        return len(self._current) > 0
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        return self._current[index]
+
+    def __iter__(self) -> Iterator[Document]:
+        return iter(self._current)
+
+    def find_by_id(self, doc_id: str) -> Optional[Document]:
+        return self._current.find_by_id(doc_id)
+
+    def _prepare(self, document: Mapping) -> Document:
+        if self.body_tier is not None:
+            document = Document.from_dict(document)
+            document.move_abstract_to(self.body_tier)
+            return document
+        return Document.from_dict(document, compress_abstract_over=self.compress_abstracts_over)
+
+    def _publish(self, current: StoreSnapshot, prepared: List[Document],
+                 deleted: Optional[int] = None) -> StoreSnapshot:
+        """Builds and publishes the next version, tombstoning ``deleted`` if given. Must hold the write lock."""
+        segments: List[tuple] = list(current._segments)
+        tail: List[Optional[Document]] = []
+        if prepared and segments and len(segments[-1]) < SEGMENT_SIZE:
+            tail = list(segments.pop())  # Copy-on-write of the partial last segment
+        position = current._appended_len
+        for document in prepared:
+            tail.append(document)
+            if len(tail) == SEGMENT_SIZE:
+                segments.append(tuple(tail))
+                tail = []
+            doc_id = document.get("id")
+            if isinstance(doc_id, str):
+                self._appended_by_id.setdefault(doc_id, []).append(position)
+            position += 1
+        if tail:
+            segments.append(tuple(tail))
+        tombstones, tombstone_count = current._tombstones, current._tombstone_count
+        dead_count, deleted_since_compaction = current._dead_count, current._deleted_since_compaction
+        if deleted is not None:
+            tombstones = _with_tombstone(tombstones, deleted)
+            tombstone_count += 1
+            dead_count += 1
+            deleted_since_compaction += 1
+        self._current = StoreSnapshot(current.version + 1, self._base, tuple(segments), position,
+                                      self._appended_by_id, tombstones, tombstone_count, dead_count,
+                                      deleted_since_compaction)
+        return self._current
+
+    def append(self, document: dict) -> StoreSnapshot:
+        """Commits a single document and returns the new version."""
+        return self.extend([document])
+
+    def extend(self, documents: Iterable[dict]) -> StoreSnapshot:
+        """Commits ``documents`` as one new version and returns it.
+
+        Writes are serialized by a lock, and each new version becomes visible
+        to readers atomically.
+        """
+        # Compression and body-tier writes happen before taking the lock
+        prepared = [self._prepare(doc) for doc in documents]
+        with self._write_lock:
+            return self._publish(self._current, prepared)
+
+    def update(self, doc_id: str, changes: Mapping[str, Any]) -> Optional[Tuple[int, int, StoreSnapshot]]:
+        """Replaces the document ``doc_id`` with a copy that has ``changes`` applied.
+
+        Returns ``(old_ordinal, new_ordinal, version)``, or None if no live
+        document has that id. The id itself cannot be changed.
+        """
+        with self._write_lock:
+            current = self._current
+            old_ordinal = current.find_ordinal(doc_id)
+            if old_ordinal is None:
+                return None
+            document = dict(current.document_at(old_ordinal))
+            document.update(changes)
+            document["id"] = doc_id
+            new_version = self._publish(current, [self._prepare(document)], old_ordinal)
+            return old_ordinal, new_version.ordinal_count - 1, new_version
+
+    def delete(self, doc_id: str) -> Optional[Tuple[int, StoreSnapshot]]:
+        """Tombstones the document ``doc_id``. Returns ``(ordinal, version)`` or None if absent."""
+        with self._write_lock:
+            current = self._current
+            ordinal = current.find_ordinal(doc_id)
+            if ordinal is None:
+                return None
+            return ordinal, self._publish(current, [], ordinal)
+
+    def compact(self) -> int:
+        """Releases tombstoned appended documents; returns how many were released.
+
+        Their slots are emptied in new copies of the affected segments, so
+        ordinals stay stable and only base-snapshot tombstones remain in the
+        tombstone set. Resets :attr:`StoreSnapshot.deleted_since_compaction`.
+        """
+        with self._write_lock:
+            current = self._current
+            base_len = current._base_len
+            tombstones: Tombstones = {}
+            by_segment: Dict[int, List[int]] = {}
+            for chunk, ordinals in current._tombstones.items():
+                if (chunk + 1) * TOMBSTONE_CHUNK <= base_len:
+                    tombstones[chunk] = ordinals  # Only base documents, which stay tombstoned
+                    continue
+                kept = frozenset(o for o in ordinals if o < base_len)
+                if kept:
+                    tombstones[chunk] = kept
+                for ordinal in ordinals:
+                    if ordinal >= base_len:
+                        position = ordinal - base_len
+                        by_segment.setdefault(position // SEGMENT_SIZE, []).append(position % SEGMENT_SIZE)
+            segments = list(current._segments)
+            for index, slots in by_segment.items():
+                segment = list(segments[index])
+                for slot in slots:
+                    segment[slot] = None
+                segments[index] = tuple(segment)
+            released = sum(len(slots) for slots in by_segment.values())
+            self._current = StoreSnapshot(
+                current.version + 1, self._base, tuple(segments), current._appended_len, self._appended_by_id,
+                tombstones, current._tombstone_count - released, current._dead_count
+            )
+        if released:
+            logger.info("Compacted document store: released %d deleted documents", released)
+        return released
+
+    @staticmethod
+    def _bodies_outside(tier: Optional[BodyTier], version: StoreSnapshot,
+                        start: int = 0) -> List[Tuple[Document, BodyRef]]:
+        """Live appended documents of ``version``, from position ``start``, whose abstract is not in ``tier``.
+
+        With ``tier`` None every document whose abstract is in a body segment is returned.
+        """
+        found = []
+        for ordinal in version.live_ordinals(version._base_len + start):
+            document = version.document_at(ordinal)
+            ref = document.body_ref
+            if ref is not None and ref.tier is not tier:
+                found.append((document, ref))
+        return found
+
+    def compact_bodies(self, min_dead_fraction: float = BODY_REWRITE_DEAD_FRACTION) -> int:
+        """Reclaims the body-segment space of deleted and replaced documents; returns the bytes freed.
+
+        Once at least ``min_dead_fraction`` of the segment is dead, the live
+        bodies are copied into a new segment that takes over for appends, and
+        each document is repointed at its copy. The bulk copy runs without the
+        write lock; only bodies committed meanwhile are copied under it.
+        Readers of older versions keep reading the old segment, which is
+        closed and removed once no document refers to it.
+        """
+        old = self.body_tier
+        if old is None or not old.size_bytes:
+            return 0
+        version = self._current
+        live = self._bodies_outside(None, version)
+        dead = old.size_bytes - sum(ref.length for _, ref in live if ref.tier is old)
+        if dead < min_dead_fraction * old.size_bytes:
+            return 0
+        tier = old.sibling()
+        moved = [(document, tier.copy(ref)) for document, ref in live]
+        with self._write_lock:
+            moved += [(document, tier.copy(ref))
+                      for document, ref in self._bodies_outside(tier, self._current, version._appended_len)]
+            self.body_tier = tier
+            freed = old.size_bytes - tier.size_bytes
+        for document, ref in moved:
+            document.rebase_abstract(ref)
+        old.cache.clear()
+        logger.info("Compacted body segment: %d live bodies copied, %d bytes reclaimed", len(moved), freed)
+        return freed
+
+    def close(self) -> None:
+        if self._base is not None:
+            self._base.close()
+        if self.body_tier is not None:
+            self.body_tier.close()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+联邦搜索 - 跨多个服务器节点的 scatter-gather 文档检索
+
+A coordinator :class:`~mcp.server.McpServer` forwards ``document_search`` to
+its peer nodes over the ordinary ``/mcp_command`` HTTP protocol (as a
+synchronous ``execute_tool`` call with ``wait`` set) and merges their ranked
+results with its own.
+
+Each peer is one partition of the corpus, served by one or more replica URLs:
+
+* Every peer has its own timeout. A peer that does not answer in time, or
+  fails on every replica, is left out and the response is marked partial.
+* Requests are hedged: if a replica has not answered after ``hedge_after``
+  seconds, the same request is sent to the next replica (or again to the
+  only one), and the first successful answer wins.
+
+Results carry no scores, so lists are merged by rank: the first result of
+every node, then the second, and so on (the coordinator's own results first
+at each rank), skipping documents already taken by id.
+"""
+
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PEER_TIMEOUT = 2.0  # seconds
+DEFAULT_HEDGE_AFTER = 0.3  # seconds
+
+
+class PeerError(Exception):
+    """Raised when a peer node returns an error or an unusable response."""
+
+
+def merge_ranked(result_lists: Iterable[Sequence[dict]], max_results: int) -> List[dict]:
+    """Interleaves ranked result lists by rank, dropping repeated document ids."""
+    lists = [list(results) for results in result_lists]
+    merged, seen = [], set()
+    for rank in range(max((len(results) for results in lists), default=0)):
+        for results in lists:
+            if rank >= len(results):
+                continue
+            document = results[rank]
+            key = document.get("id") if isinstance(document, dict) else None
+            if key is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+            merged.append(document)
+            if 0 < max_results <= len(merged):
+                return merged
+    return merged
+
+
+class _Peer:
+    """One corpus partition and the replica URLs that serve it."""
+
+    def __init__(self, replicas: Sequence[str], command_path: str):
+        self.replicas = [self._command_url(url, command_path) for url in replicas]
+        self.name = replicas[0]
+
+    @staticmethod
+    def _command_url(url: str, command_path: str) -> str:
+        parsed = urllib.parse.urlsplit(url if "://" in url else f"http://{url}")
+        if parsed.path in ("", "/"):
+            parsed = parsed._replace(path=command_path)
+        return urllib.parse.urlunsplit(parsed)
+
+
+class FederatedSearch:
+    """Scatters ``document_search`` to peer nodes and gathers their results.
+
+    ``peers`` lists one entry per partition: a base URL such as
+    ``http://10.0.0.2:3000``, or a list of replica URLs for that partition.
+    """
+
+    def __init__(self, peers: Sequence[Union[str, Sequence[str]]], command_path: str,
+                 timeout: float = DEFAULT_PEER_TIMEOUT, hedge_after: Optional[float] = DEFAULT_HEDGE_AFTER):
+        self.peers = [_Peer([entry] if isinstance(entry, str) else list(entry), command_path)
+                      for entry in peers if entry]
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        # Per-peer coordination and the HTTP requests themselves run in separate
+        # pools, so waiting coordinators can never starve the requests they wait for
+        self._peer_executor = ThreadPoolExecutor(max_workers=max(4, 4 * len(self.peers)),
+                                                 thread_name_prefix="federation-peer")
+        self._request_executor = ThreadPoolExecutor(max_workers=max(8, 8 * len(self.peers)),
+                                                    thread_name_prefix="federation-request")
+        self._stats_lock = threading.Lock()
+        self._stats = {"queries": 0, "peer_failures": 0, "peer_timeouts": 0, "hedges": 0, "hedge_wins": 0}
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _query(self, url: str, query: str, max_results: int) -> List[dict]:
+        payload = {"command": "execute_tool", "tool_name": "document_search", "wait": True,
+                   "tool_params": {"query": query, "max_results": max_results, "local_only": True}}
+        request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            raise PeerError(f"{url} answered HTTP {e.code}") from e
+        except (OSError, ValueError) as e:  # URLError and timeouts are OSErrors
+            raise PeerError(f"{url}: {e}") from e
+        if body.get("status") != "success":
+            raise PeerError(f"{url}: {body.get('error', 'search failed')}")
+        results = body.get("result", {}).get("search_results")
+        if not isinstance(results, list):
+            raise PeerError(f"{url}: response has no search_results")
+        return results
+
+    def _search_peer(self, peer: _Peer, query: str, max_results: int, deadline: float) -> List[dict]:
+        """Queries one partition, hedging to further replicas while it is slow."""
+        pending: Dict[Future, int] = {}
+        attempts = 0
+        last_error: Optional[Exception] = None
+
+        def launch() -> None:
+            nonlocal attempts
+            url = peer.replicas[attempts % len(peer.replicas)]
+            pending[self._request_executor.submit(self._query, url, query, max_results)] = attempts
+            attempts += 1
+
+        launch()
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            can_hedge = self.hedge_after is not None and attempts < max(2, len(peer.replicas))
+            done, _ = wait(list(pending), timeout=min(remaining, self.hedge_after) if can_hedge else remaining,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                if can_hedge:
+                    self._count("hedges")
+                    launch()
+                continue
+            for future in done:
+                attempt = pending.pop(future)
+                try:
+                    results = future.result()
+                except PeerError as e:
+                    last_error = e
+                    continue
+                if attempt > 0:
+                    self._count("hedge_wins")
+                return results
+            if not pending and attempts < len(peer.replicas):
+                launch()  # Failed fast; try the next replica right away
+        if pending:
+            raise TimeoutError(f"no answer within {self.timeout}s")
+        raise last_error or PeerError("no replica answered")
+
+    def search(self, query: str, max_results: int) -> Dict[str, Any]:
+        """Queries every peer in parallel.
+
+        Returns ``{"results": [...one ranked list per answering peer...],
+        "responded": [...], "failed": [{"peer": ..., "error": ...}]}``.
+        """
+        self._count("queries")
+        deadline = time.monotonic() + self.timeout
+        futures = [(peer, self._peer_executor.submit(self._search_peer, peer, query, max_results, deadline))
+                   for peer in self.peers]
+        results, responded, failed = [], [], []
+        for peer, future in futures:
+            try:
+                results.append(future.result())
+                responded.append(peer.name)
+            except TimeoutError as e:
+                self._count("peer_timeouts")
+                failed.append({"peer": peer.name, "error": str(e)})
+            except Exception as e:
+                self._count("peer_failures")
+                failed.append({"peer": peer.name, "error": str(e)})
+        if failed:
+            logger.warning("Federated search for %r is partial: %s of %s peers failed",
+                           query, len(failed), len(self.peers))
+        return {"results": results, "responded": responded, "failed": failed}
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def close(self) -> None:
+        self._peer_executor.shutdown(wait=False)
+        self._request_executor.shutdown(wait=False)
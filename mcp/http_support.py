@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HTTP 辅助 - 内容编码协商、流式压缩与静态资源缓存
+
+* :func:`negotiate_encoding` picks ``gzip`` or ``deflate`` from a request's
+  ``Accept-Encoding`` header. :func:`compress` encodes a whole response
+  body. Bodies under :data:`COMPRESS_MIN_BYTES` are sent as they are, since
+  compressing them saves less than it costs.
+* :class:`StreamEncoder` and :class:`CompressingWriter` encode an event
+  stream. They flush the compressor after every piece, so each event
+  reaches the client at once.
+  The compressor's window spans the whole stream, so the JSON keys that
+  every event repeats take only a few bytes.
+* :class:`StaticAssets` serves the web UI's files from memory. Each file is
+  read again only when its size or modification time changes, and is kept
+  with a precompressed copy and an ``ETag`` for ``If-None-Match``
+  revalidation.
+* :func:`decoded_lines` reads the lines of a possibly compressed stream
+  (read replicas following a primary's change stream).
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import zlib
+from typing import Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS = ("gzip", "deflate")  # In order of preference
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 6
+# Event streams compress every event for every subscriber, so they trade ratio for speed
+STREAM_COMPRESS_LEVEL = 1
+STATIC_MAX_AGE = 300  # seconds browsers use a static file before revalidating it
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The preferred encoding in ENCODINGS that ``accept_encoding`` allows, or None for identity."""
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str, level: int = COMPRESS_LEVEL) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    if encoding == "deflate":
+        return zlib.compress(body, level)  # HTTP "deflate" is the zlib format
+    raise ValueError(f"unsupported encoding: {encoding}")
+
+
+def _compressor(encoding: str, level: int):
+    wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+class StreamEncoder:
+    """Compresses a stream piece by piece; the client can decode each piece as soon as it arrives."""
+
+    def __init__(self, encoding: str, level: int = STREAM_COMPRESS_LEVEL):
+        self.encoding = encoding
+        self._compressor = _compressor(encoding, level)
+
+    def encode(self, data: bytes) -> bytes:
+        # Callers serialise the pieces of a stream (see mcp.sse.SseSubscriber)
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class CompressingWriter:
+    """Wraps a stream's ``wfile``; every write is compressed and flushed to the client."""
+
+    def __init__(self, wfile, encoding: str, level: int = STREAM_COMPRESS_LEVEL):
+        self.wfile = wfile
+        self.encoding = encoding
+        self._encoder = StreamEncoder(encoding, level)
+
+    def write(self, data: bytes) -> int:
+        self.wfile.write(self._encoder.encode(data))
+        return len(data)
+
+    def flush(self) -> None:
+        self.wfile.flush()
+
+    @property
+    def closed(self) -> bool:
+        return self.wfile.closed
+
+
+def decoded_lines(response, chunk_size: int = 65536) -> Iterator[bytes]:
+    """The lines of an HTTP response body, decompressed according to its Content-Encoding."""
+    encoding = (response.headers.get("Content-Encoding") or "").strip().lower()
+    if encoding not in ENCODINGS:
+        yield from response
+        return
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS)
+    pending = b""
+    while True:
+        chunk = response.read1(chunk_size)
+        if not chunk:
+            break
+        pending += decompressor.decompress(chunk)
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line + b"\n"
+    pending += decompressor.flush()
+    if pending:
+        yield pending
+
+
+class StaticAsset:
+    __slots__ = ("body", "gzip_body", "etag", "content_type", "stat_key")
+
+    def __init__(self, body: bytes, content_type: str, stat_key: Tuple[int, int]):
+        self.body = body
+        self.gzip_body = compress(body, "gzip", 9) if len(body) >= COMPRESS_MIN_BYTES else None
+        self.etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+        self.content_type = content_type
+        self.stat_key = stat_key
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """True if an ``If-None-Match`` header names this version (weak comparison, as for GET)."""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == self.etag:
+                return True
+        return False
+
+
+class StaticAssets:
+    """Files of a directory, cached in memory until they change on disk."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._assets: Dict[str, StaticAsset] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, content_type: str) -> Optional[StaticAsset]:
+        """The current version of ``name``, or None if the file does not exist."""
+        path = os.path.join(self.directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        asset = self._assets.get(name)
+        if asset is not None and asset.stat_key == stat_key:
+            return asset
+        with open(path, 'rb') as f:
+            body = f.read()
+        asset = StaticAsset(body, content_type, stat_key)
+        with self._lock:
+            self._assets[name] = asset
+        logger.debug("Cached static asset %s (%s bytes, ETag %s)", name, len(body), asset.etag)
+        return asset
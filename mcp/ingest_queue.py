@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文档导入任务队列 - 基于SQLite的持久化后台导入队列
+
+Large ingest tool calls are recorded as jobs in a local SQLite database and
+executed by a fixed pool of worker threads, so request threads return
+immediately and clients poll the job status instead of holding a connection.
+
+Jobs interrupted by a shutdown run again on the next start; handlers can
+tell such re-runs apart with :meth:`IngestJobQueue.current_job_attempt`.
+Finished jobs are pruned once they are older than ``retention`` seconds or
+more than ``max_finished`` of them are kept.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_STATUSES = (JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED, JOB_FAILED)
+
+DEFAULT_RETENTION = 7 * 24 * 3600.0  # seconds a finished job stays queryable
+DEFAULT_MAX_FINISHED = 10000
+PRUNE_INTERVAL = 60.0  # seconds between pruning passes
+
+# Parameters that carry the document payload. They are dropped from the
+# database once a job finishes so the queue file does not grow with the corpus.
+_PAYLOAD_PARAMS = ("file_content_base64", "document_text")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT UNIQUE NOT NULL,
+    tool_name TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ingest_jobs_status ON ingest_jobs (status, seq);
+"""
+
+
+class IngestJobQueue:
+    """Persistent FIFO queue of ingest jobs served by a fixed pool of workers.
+
+    ``handler`` is called as ``handler(tool_name, params)`` on a worker thread
+    and must return the tool result dict. A result containing an ``error`` key
+    marks the job as failed. ``on_complete`` (optional) is called with the
+    final job record after every job, e.g. to broadcast the result.
+    ``retention`` and ``max_finished`` bound the finished jobs kept (None
+    keeps them regardless of age or number).
+    """
+
+    def __init__(self, db_path: str, handler: Callable[[str, dict], dict],
+                 num_workers: int = 2,
+                 on_complete: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 poll_interval: float = 1.0,
+                 retention: Optional[float] = DEFAULT_RETENTION,
+                 max_finished: Optional[int] = DEFAULT_MAX_FINISHED):
+        self.db_path = db_path
+        self.handler = handler
+        self.num_workers = max(1, int(num_workers))
+        self.on_complete = on_complete
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.max_finished = max_finished
+        self._last_prune = 0.0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._running = False
+        self._local = threading.local()  # The job each worker thread is running
+
+    # --- Database helpers ---
+    def _connection(self) -> sqlite3.Connection:
+        """Opens the database lazily; callers must hold ``_db_lock``."""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(ingest_jobs)")}
+            if "attempts" not in columns:  # Queue files created before jobs counted their attempts
+                self._conn.execute("ALTER TABLE ingest_jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            logger.info("Opened ingest job queue at %s", self.db_path)
+        return self._conn
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "job_id": row["job_id"],
+            "tool_name": row["tool_name"],
+            "status": row["status"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "submitted_at": row["submitted_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "attempts": row["attempts"],
+        }
+
+    # --- Public API ---
+    def submit(self, tool_name: str, params: dict) -> Dict[str, Any]:
+        """Persists a new job and wakes one worker. Returns the job record as submitted."""
+        job_id = uuid.uuid4().hex
+        submitted_at = time.time()
+        with self._db_lock:
+            conn = self._connection()
+            seq = conn.execute(
+                "INSERT INTO ingest_jobs (job_id, tool_name, params, status, submitted_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, tool_name, json.dumps(params), JOB_QUEUED, submitted_at)
+            ).lastrowid
+            ahead = conn.execute(
+                "SELECT COUNT(*) FROM ingest_jobs WHERE status = ? AND seq < ?", (JOB_QUEUED, seq)
+            ).fetchone()[0]
+        # Built before a worker is woken, which may claim the job at once
+        job = {"job_id": job_id, "tool_name": tool_name, "status": JOB_QUEUED, "result": None, "error": None,
+               "submitted_at": submitted_at, "started_at": None, "finished_at": None, "attempts": 0,
+               "queue_position": ahead + 1}
+        with self._wakeup:
+            self._wakeup.notify()
+        logger.info("Queued ingest job %s for tool '%s'", job_id, tool_name)
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Fails a job that has not started yet; returns False if there is no such queued job.
+
+        Running jobs are cancelled by the handler, which can look up their id with :meth:`current_job_id`.
+        """
+        with self._db_lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT * FROM ingest_jobs WHERE job_id = ? AND status = ?", (job_id, JOB_QUEUED)
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute(
+                "UPDATE ingest_jobs SET status = ?, error = ?, params = ?, finished_at = ? WHERE seq = ?",
+                (JOB_FAILED, "cancelled by client", json.dumps(self._without_payload(row)), time.time(), row["seq"])
+            )
+        logger.info("Cancelled queued ingest job %s", job_id)
+        if self.on_complete:
+            try:
+                self.on_complete(self.get(job_id))
+            except Exception as e:
+                logger.error("Ingest completion callback failed for job %s: %s", job_id, e, exc_info=True)
+        return True
+
+    def current_job_id(self) -> Optional[str]:
+        """The id of the job being run by the calling worker thread (None elsewhere)."""
+        return getattr(self._local, "job_id", None)
+
+    def current_job_attempt(self) -> int:
+        """How many times the calling worker's job has been started, this run included.
+
+        Above 1 the job was interrupted before, possibly after its handler took effect.
+        """
+        return getattr(self._local, "attempt", 0)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the job record, including its queue position while queued."""
+        with self._db_lock:
+            conn = self._connection()
+            row = conn.execute("SELECT * FROM ingest_jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = self._row_to_job(row)
+            if row["status"] == JOB_QUEUED:
+                ahead = conn.execute(
+                    "SELECT COUNT(*) FROM ingest_jobs WHERE status = ? AND seq < ?", (JOB_QUEUED, row["seq"])
+                ).fetchone()[0]
+                job["queue_position"] = ahead + 1
+        return job
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+        """Lists jobs (newest first) with per-status counts for progress reporting."""
+        if status is not None and status not in JOB_STATUSES:
+            raise ValueError(f"Unknown job status '{status}'. Expected one of: {', '.join(JOB_STATUSES)}")
+        limit = max(0, int(limit))
+        offset = max(0, int(offset))
+        with self._db_lock:
+            conn = self._connection()
+            if status:
+                rows = conn.execute(
+                    "SELECT * FROM ingest_jobs WHERE status = ? ORDER BY seq DESC LIMIT ? OFFSET ?", (status, limit, offset)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM ingest_jobs ORDER BY seq DESC LIMIT ? OFFSET ?", (limit, offset)).fetchall()
+            counts = {s: 0 for s in JOB_STATUSES}
+            for count_row in conn.execute("SELECT status, COUNT(*) FROM ingest_jobs GROUP BY status"):
+                counts[count_row[0]] = count_row[1]
+        total = counts[status] if status else sum(counts.values())
+        return {
+            "jobs": [self._row_to_job(row) for row in rows],
+            "counts": counts,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+        }
+
+    def start(self) -> None:
+        """Re-queues jobs interrupted by a previous shutdown and starts the workers."""
+        if self._running:
+            return
+        with self._db_lock:
+            # MAX() marks jobs from queue files that did not count attempts yet as started once
+            recovered = self._connection().execute(
+                "UPDATE ingest_jobs SET status = ?, started_at = NULL, attempts = MAX(attempts, 1) WHERE status = ?",
+                (JOB_QUEUED, JOB_RUNNING)
+            ).rowcount
+        if recovered:
+            logger.warning("Re-queued %d ingest job(s) interrupted by a previous shutdown.", recovered)
+        self.prune()
+        self._running = True
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"ingest-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info("Started %s ingest worker(s).", self.num_workers)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stops the workers. Jobs still queued stay in the database for the next start."""
+        if not self._running:
+            return
+        self._running = False
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        self._workers.clear()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        logger.info("Ingest workers stopped.")
+
+    # --- Worker side ---
+    def _claim_next_job(self) -> Optional[sqlite3.Row]:
+        with self._db_lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT * FROM ingest_jobs WHERE status = ? ORDER BY seq LIMIT 1", (JOB_QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE ingest_jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE seq = ?",
+                (JOB_RUNNING, time.time(), row["seq"])
+            )
+        return row
+
+    @staticmethod
+    def _without_payload(row: sqlite3.Row) -> dict:
+        params = json.loads(row["params"])
+        for key in _PAYLOAD_PARAMS:
+            params.pop(key, None)
+        return params
+
+    def _finish_job(self, row: sqlite3.Row, result: Optional[dict], error: Optional[str]) -> None:
+        params = self._without_payload(row)
+        status = JOB_FAILED if error else JOB_COMPLETED
+        with self._db_lock:
+            self._connection().execute(
+                "UPDATE ingest_jobs SET status = ?, result = ?, error = ?, params = ?, finished_at = ? WHERE seq = ?",
+                (status, json.dumps(result) if result is not None else None, error, json.dumps(params), time.time(), row["seq"])
+            )
+        if time.monotonic() - self._last_prune >= PRUNE_INTERVAL:
+            self.prune()
+
+    def prune(self) -> int:
+        """Deletes finished jobs past the retention limits; returns how many were deleted."""
+        self._last_prune = time.monotonic()
+        finished = (JOB_COMPLETED, JOB_FAILED)
+        deleted = 0
+        with self._db_lock:
+            conn = self._connection()
+            if self.retention is not None:
+                deleted += conn.execute(
+                    "DELETE FROM ingest_jobs WHERE status IN (?, ?) AND finished_at < ?",
+                    (*finished, time.time() - self.retention)
+                ).rowcount
+            if self.max_finished is not None:
+                deleted += conn.execute(
+                    "DELETE FROM ingest_jobs WHERE seq IN (SELECT seq FROM ingest_jobs WHERE status IN (?, ?) "
+                    "ORDER BY finished_at DESC, seq DESC LIMIT -1 OFFSET ?)",
+                    (*finished, max(0, int(self.max_finished)))
+                ).rowcount
+        if deleted:
+            logger.info("Pruned %d finished ingest job(s).", deleted)
+        return deleted
+
+    def _worker_loop(self) -> None:
+        while self._running:
+            try:
+                row = self._claim_next_job()
+            except sqlite3.Error as e:
+                logger.error("Ingest worker could not claim a job: %s", e, exc_info=True)
+                row = None
+            if row is None:
+                with self._wakeup:
+                    if self._running:
+                        self._wakeup.wait(self.poll_interval)
+                continue
+
+            job_id = row["job_id"]
+            logger.info("Ingest worker running job %s (%s)", job_id, row['tool_name'])
+            result, error = None, None
+            self._local.job_id = job_id
+            self._local.attempt = row["attempts"] + 1
+            try:
+                result = self.handler(row["tool_name"], json.loads(row["params"]))
+                if isinstance(result, dict) and result.get("error"):
+                    error = str(result["error"])
+            except Exception as e:
+                logger.exception("Ingest job %s failed: %s", job_id, e)
+                error = str(e)
+            finally:
+                self._local.job_id = None
+                self._local.attempt = 0
+            self._finish_job(row, result, error)
+
+            if self.on_complete:
+                try:
+                    self.on_complete(self.get(job_id))
+                except Exception as e:
+                    logger.error("Ingest completion callback failed for job %s: %s", job_id, e, exc_info=True)
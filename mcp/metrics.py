@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+运行指标 - 无锁的计数器、直方图与 Prometheus 文本格式导出
+
+Recording never takes a lock. Each thread updates its own shard of every
+metric, and only a scrape (:meth:`MetricsRegistry.collect`) sums the shards.
+The shards of threads that have exited are folded into one retired shard, so
+thread-per-connection servers do not accumulate them.
+
+A scrape may see a histogram's count and buckets one observation apart while
+another thread is recording; every value is exact once recording stops.
+
+Values that already live elsewhere (queue depths, connected clients, cache
+counters) are read at scrape time through callbacks registered with
+:meth:`MetricsRegistry.register_collector`.
+"""
+
+import bisect
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# (metric name, type, help, {label values: value}) as returned by collectors;
+# label values are tuples matching the metric's label names
+Family = Tuple[str, str, str, Sequence[str], Dict[Tuple[str, ...], float]]
+
+
+class _Metric:
+    __slots__ = ("registry", "name", "kind", "help", "labelnames", "buckets")
+
+    def __init__(self, registry: "MetricsRegistry", name: str, kind: str, help_text: str,
+                 labelnames: Sequence[str], buckets: Sequence[float] = ()):
+        self.registry = registry
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+
+class Counter(_Metric):
+    """A monotonically increasing value."""
+
+    __slots__ = ()
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        self.registry._cell(self, labels)[0] += amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, such as the number of calls in flight."""
+
+    __slots__ = ()
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        self.registry._cell(self, labels)[0] += amount
+
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        self.registry._cell(self, labels)[0] -= amount
+
+
+class Histogram(_Metric):
+    """Observations counted in cumulative buckets, with their sum and count."""
+
+    __slots__ = ()
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        cell = self.registry._cell(self, labels)
+        cell[bisect.bisect_left(self.buckets, value)] += 1  # The last slot is the +Inf bucket
+        cell[-2] += value
+        cell[-1] += 1
+
+
+class MetricsRegistry:
+    """The metrics of one server."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()  # Guards the shard list, never taken while recording
+        self._shards: List[Tuple[weakref.ref, Dict[Tuple[str, Tuple[str, ...]], List[float]]]] = []
+        self._retired: Dict[Tuple[str, Tuple[str, ...]], List[float]] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def _register(self, metric: _Metric) -> Any:
+        existing = self._metrics.setdefault(metric.name, metric)
+        if existing.kind != metric.kind:
+            raise ValueError(f"metric {metric.name} is already registered as a {existing.kind}")
+        return existing
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, COUNTER, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self, name, GAUGE, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, HISTOGRAM, help_text, labelnames, sorted(buckets)))
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """Adds a callback returning metric families read at scrape time."""
+        self._collectors.append(collector)
+
+    @contextmanager
+    def track(self, histogram: Histogram, labels: Tuple[str, ...] = (), in_flight: Gauge = None,
+              in_flight_labels: Tuple[str, ...] = ()) -> Iterator[None]:
+        """Times the block into ``histogram``, counting it in ``in_flight`` while it runs."""
+        if in_flight is not None:
+            in_flight.inc(in_flight_labels)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - started, labels)
+            if in_flight is not None:
+                in_flight.dec(in_flight_labels)
+
+    def _cell(self, metric: _Metric, labels: Tuple[str, ...]) -> List[float]:
+        """This thread's slots for one labelled series; only the owning thread writes them."""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+        key = (metric.name, labels)
+        cell = shard.get(key)
+        if cell is None:
+            cell = shard[key] = [0] * (len(metric.buckets) + 3 if metric.kind == HISTOGRAM else 1)
+        return cell
+
+    @staticmethod
+    def _add_into(totals: Dict, shard: Dict) -> None:
+        for key, cell in list(shard.items()):
+            total = totals.get(key)
+            if total is None:
+                totals[key] = list(cell)
+            else:
+                for i, value in enumerate(cell):
+                    total[i] += value
+
+    def collect(self) -> List[Family]:
+        """Sums every thread's shard; histogram values are [per-bucket counts..., +Inf count, sum, count]."""
+        with self._lock:
+            live = []
+            for thread_ref, shard in self._shards:
+                thread = thread_ref()
+                if thread is None or not thread.is_alive():
+                    self._add_into(self._retired, shard)  # Its thread no longer writes it
+                else:
+                    live.append((thread_ref, shard))
+            self._shards = live
+            totals: Dict[Tuple[str, Tuple[str, ...]], List[float]] = {}
+            self._add_into(totals, self._retired)
+            for _, shard in live:
+                self._add_into(totals, shard)
+        families: Dict[str, Dict[Tuple[str, ...], Any]] = {name: {} for name in self._metrics}
+        for (name, labels), values in totals.items():
+            families[name][labels] = values if self._metrics[name].kind == HISTOGRAM else values[0]
+        collected: List[Family] = [(m.name, m.kind, m.help, m.labelnames, families[m.name]) for m in self._metrics.values()]
+        for collector in self._collectors:
+            collected.extend(collector())
+        return collected
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The collected metrics as JSON-friendly data (for the ``stats`` command)."""
+        result: Dict[str, Any] = {}
+        for name, kind, _, labelnames, series in self.collect():
+            entries = []
+            for labels, value in sorted(series.items()):
+                entry: Dict[str, Any] = dict(zip(labelnames, labels))
+                if kind == HISTOGRAM:
+                    count = value[-1]
+                    entry.update(count=count, sum=round(value[-2], 6),
+                                 avg=round(value[-2] / count, 6) if count else None,
+                                 p50=self._quantile(self._metrics[name].buckets, value, 0.5),
+                                 p99=self._quantile(self._metrics[name].buckets, value, 0.99))
+                else:
+                    entry["value"] = value
+                entries.append(entry)
+            result[name] = entries
+        return result
+
+    @staticmethod
+    def _quantile(buckets: Sequence[float], value: List[float], q: float):
+        """Upper bound of the bucket holding quantile ``q`` (None if empty, "+Inf" past the last bucket)."""
+        count = value[-1]
+        if not count:
+            return None
+        rank, seen = q * count, 0
+        for i, bound in enumerate(buckets):
+            seen += value[i]
+            if seen >= rank:
+                return bound
+        return "+Inf"
+
+    def render_prometheus(self) -> str:
+        """The collected metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for name, kind, help_text, labelnames, series in self.collect():
+            lines.append(f"# HELP {name} {_escape_help(help_text)}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series.items()):
+                pairs = list(zip(labelnames, labels))
+                if kind != HISTOGRAM:
+                    lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(self._metrics[name].buckets + ("+Inf",), value[:-2]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _number(bound)
+                    lines.append(f"{name}_bucket{_labels(pairs + [('le', le)])} {_number(cumulative)}")
+                lines.append(f"{name}_sum{_labels(pairs)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(pairs)} {_number(value[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _labels(pairs: List[Tuple[str, Any]]) -> str:
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文档库持久化 - 组提交后台写入线程
+
+Mutations request a commit instead of writing the store themselves. A single
+writer thread coalesces all requests that arrive within a short window into
+one atomic write, and resolves a durability future for each request once the
+data is on disk.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_FSYNC = "fsync"
+DURABILITY_ENQUEUE = "enqueue"
+DURABILITY_MODES = (DURABILITY_FSYNC, DURABILITY_ENQUEUE)
+
+DEFAULT_COMMIT_WINDOW = 0.02  # seconds
+
+
+def atomic_write(path: str, write: Callable[[Any], None], binary: bool = False) -> None:
+    """Calls ``write`` with a file (text, or bytes if ``binary``) that replaces ``path`` once written and fsynced."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with (os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', encoding='utf-8')) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    # Persist the rename itself
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def atomic_write_json(path: str, data: Any, **dump_kwargs: Any) -> None:
+    """Writes ``data`` as JSON to ``path`` via temp file + fsync + rename."""
+    atomic_write(path, lambda f: json.dump(data, f, **dump_kwargs))
+
+
+def atomic_write_json_array(path: str, items: Iterable[Any], indent: Optional[int] = None, **dump_kwargs: Any) -> int:
+    """Like :func:`atomic_write_json` for a list, but encodes one item at a time.
+
+    ``items`` may be a generator, so a large store is never held in memory as
+    a whole. The output is the same as ``json.dump(list(items), ...)``.
+    Returns the number of items written.
+    """
+    count = 0
+
+    def write(f) -> None:
+        nonlocal count
+        if indent is None:
+            separator, prefix, end = ", ", "", "]"
+        else:
+            newline = "\n" + " " * indent
+            separator, prefix, end = ",", newline, "\n]"
+        for item in items:
+            encoded = json.dumps(item, indent=indent, **dump_kwargs)
+            if indent is not None:
+                encoded = encoded.replace("\n", newline)  # Strings are escaped, so every newline is layout
+            f.write(("[" if count == 0 else separator) + prefix + encoded)
+            count += 1
+        f.write(end if count else "[]")
+
+    atomic_write(path, write)
+    return count
+
+
+class GroupCommitWriter:
+    """Background thread that turns many commit requests into few writes.
+
+    ``commit_fn`` must capture the current state and write it durably; it runs
+    only on the writer thread. Every :meth:`submit` returns a
+    :class:`concurrent.futures.Future` that resolves (to the commit sequence
+    number) after a ``commit_fn`` call that started after the request, or
+    fails with that call's exception.
+    """
+
+    def __init__(self, commit_fn: Callable[[], None], window: float = DEFAULT_COMMIT_WINDOW,
+                 name: str = "store-writer"):
+        self.commit_fn = commit_fn
+        self.window = window
+        self.name = name
+        self._pending: List[Future] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._last_future: Optional[Future] = None
+        self.commits = 0
+        self.requests = 0
+
+    def submit(self) -> Future:
+        """Requests a commit of the current state and returns its durability future."""
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("GroupCommitWriter is closing")
+            self._pending.append(future)
+            self._last_future = future
+            self.requests += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Commits the current state and waits for it to be durable."""
+        self.submit().result(timeout=timeout)
+
+    def drain(self, timeout: Optional[float] = None) -> None:
+        """Waits until every request submitted so far has been committed (or failed)."""
+        with self._cond:
+            last = self._last_future
+        if last is not None:
+            try:
+                last.result(timeout=timeout)
+            except Exception:
+                pass  # Already logged by the writer thread
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Drains outstanding requests and stops the writer thread.
+
+        A later :meth:`submit` starts a new writer thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=timeout)
+        with self._cond:
+            self._thread = None
+            self._closed = False
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"commits": self.commits, "requests": self.requests, "pending": len(self._pending)}
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+            # Let concurrent mutations pile up behind the first request
+            if self.window > 0 and not self._closed:
+                time.sleep(self.window)
+            with self._cond:
+                batch, self._pending = self._pending, []
+            try:
+                self.commit_fn()
+            except Exception as e:
+                logger.error("Group commit of %s request(s) failed: %s", len(batch), e, exc_info=True)
+                for future in batch:
+                    future.set_exception(e)
+                continue
+            with self._cond:
+                self.commits += 1
+                sequence = self.commits
+            logger.debug("Group commit #%s covered %s request(s)", sequence, len(batch))
+            for future in batch:
+                future.set_result(sequence)
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+预派生多进程 SSE 服务器 - SO_REUSEPORT 工作进程 + 单一写入进程
+
+``app.py --transport sse --workers N`` forks N worker processes that all bind
+the SSE port with ``SO_REUSEPORT``, so the kernel spreads connections across
+them. Each worker maps the same binary snapshot of the corpus
+(:mod:`mcp.snapshot`), so the read-only documents are shared through the OS
+page cache rather than copied N times. Reads (search, resources, listings)
+are answered by whichever worker accepted the connection.
+
+All writes go to one writer process that owns ``documents.json``, the ingest
+job queue and the id counter:
+
+* Workers forward the mutating tools (:data:`mcp.server.MUTATING_TOOLS`) and
+  ingest job calls to the writer's :class:`WriterHub`.
+* The hub numbers every committed store change and streams it to all workers,
+  which apply it to their own store and search index. A forwarded call
+  returns only after the calling worker has applied the changes it made, so a
+  client always reads its own writes.
+* SSE events are relayed through the hub to the clients of every worker.
+  The hub numbers them, so a client that reconnects to another worker can
+  still resume with its ``Last-Event-ID``.
+* A ``cancel`` for a request the receiving worker does not know is sent to
+  the writer, which cancels its ingest job or relays it to every worker.
+
+Workers that exit are not restarted: the supervisor keeps serving with the
+remaining workers and shuts everything down if the writer exits. It tells
+the writer about each worker that exits, so writes are admitted once the
+workers still alive have subscribed.
+
+Search shards (:mod:`mcp.sharding`) are not available in this mode.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener, wait
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+WRITER_START_TIMEOUT = 60.0  # seconds
+DEFAULT_CALL_TIMEOUT = 60.0  # seconds
+# Writes forwarded before the live workers have all subscribed wait at most this long
+SUBSCRIBE_TIMEOUT = 60.0  # seconds
+
+
+def prefork_supported() -> bool:
+    """Pre-fork mode needs ``fork`` and ``SO_REUSEPORT`` (Linux, BSD, macOS)."""
+    return hasattr(socket, "SO_REUSEPORT") and "fork" in multiprocessing.get_all_start_methods()
+
+
+class WriterError(Exception):
+    """Raised in a worker when the writer process fails a forwarded call or is unavailable."""
+
+
+# --- Writer process ---
+
+class _Subscriber:
+    """A worker's change/event stream. Messages are sent by a dedicated thread in commit order."""
+
+    def __init__(self, worker_id: int, conn):
+        self.worker_id = worker_id
+        self.conn = conn
+        self.queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.thread = threading.Thread(target=self._send_loop, name=f"writer-hub-push-{worker_id}", daemon=True)
+
+    def _send_loop(self) -> None:
+        while True:
+            message = self.queue.get()
+            if message is None:
+                break
+            try:
+                self.conn.send(message)
+            except (OSError, ValueError) as e:
+                logger.warning("Lost change stream of worker %s: %s", self.worker_id, e)
+                break
+        self.conn.close()
+
+
+class WriterHub:
+    """Serves the pre-fork workers from the writer process.
+
+    Mutations are accepted only once every live worker has subscribed to
+    the change stream, so no worker can miss a change made after it loaded
+    the store. The supervisor reports workers that exit before subscribing
+    (:meth:`worker_exited`), and writes that wait longer than
+    ``subscribe_timeout`` fail instead of blocking a hub thread.
+    """
+
+    def __init__(self, server, address: str, authkey: bytes, num_workers: int, max_concurrent_calls: int = 32,
+                 subscribe_timeout: float = SUBSCRIBE_TIMEOUT):
+        self.server = server
+        self.num_workers = num_workers
+        self.subscribe_timeout = subscribe_timeout
+        self._listener = Listener(address, family="AF_UNIX", authkey=authkey)
+        self._subscribers: List[_Subscriber] = []
+        self._subscribers_lock = threading.Lock()
+        self._awaited = set(range(num_workers))  # Live workers that have not subscribed yet
+        self._all_subscribed = threading.Event()
+        self._seq = 0
+        # SSE event numbering shared by all workers (see mcp.sse.EventBuffer)
+        self._event_epoch = uuid.uuid4().hex[:8]
+        self._event_seq = 0
+        self._event_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_calls, thread_name_prefix="writer-hub-call")
+        self._closed = False
+        # First, so workers apply a change before its resource_updated event arrives
+        server.add_mutation_listener(self._on_mutation, first=True)
+        server.broadcast_relay = self.publish_event
+        self._accept_thread = threading.Thread(target=self._accept_loop, name="writer-hub-accept", daemon=True)
+
+    def start(self) -> None:
+        self._accept_thread.start()
+
+    def _push(self, message: tuple) -> None:
+        with self._subscribers_lock:
+            for subscriber in self._subscribers:
+                subscriber.queue.put(message)
+
+    def _on_mutation(self, change: str, doc_id: Any, document: Optional[dict]) -> None:
+        # Runs under the server's mutation lock, so sequence numbers follow commit order
+        self._seq += 1
+        self._push(("change", self._seq, change, doc_id, dict(document) if document is not None else None))
+
+    def publish_event(self, event_name: str, data: dict) -> None:
+        with self._event_lock:  # Numbered and queued in the same order for every worker
+            self._event_seq += 1
+            self._push(("event", event_name, data, self._event_seq))
+
+    def _accept_loop(self) -> None:
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError) as e:
+                if not self._closed:
+                    logger.warning("Writer hub rejected a connection: %s", e)
+                continue
+            threading.Thread(target=self._serve, args=(conn,), name="writer-hub-conn", daemon=True).start()
+
+    def _serve(self, conn) -> None:
+        try:
+            hello = conn.recv()
+        except (EOFError, OSError):
+            conn.close()
+            return
+        if hello[0] == "subscribe":
+            self._subscribe(hello[1], conn)
+            return
+        send_lock = threading.Lock()
+        while True:
+            try:
+                request_id, op, args = conn.recv()
+            except (EOFError, OSError):
+                break
+            self._executor.submit(self._handle, conn, send_lock, request_id, op, args)
+        conn.close()
+
+    def _subscribe(self, worker_id: int, conn) -> None:
+        subscriber = _Subscriber(worker_id, conn)
+        # Event lock first, as in publish_event: the worker's numbering starts right before its first event
+        with self._event_lock, self._subscribers_lock:
+            # Taken before any mutation is allowed, so ``seq`` is the worker's starting point
+            subscriber.queue.put(("ready", self._seq, self._event_epoch, self._event_seq))
+            self._subscribers.append(subscriber)
+            subscribed = len(self._subscribers)
+            self._awaited.discard(worker_id)
+        subscriber.thread.start()
+        logger.info("Worker %s subscribed to store changes (%s/%s)", worker_id, subscribed, self.num_workers)
+        self._open_writes_if_ready()
+
+    def worker_exited(self, worker_id: int) -> None:
+        """Stops waiting for a worker that exited (before subscribing, or it would not be awaited)."""
+        with self._subscribers_lock:
+            if worker_id not in self._awaited:
+                return
+            self._awaited.discard(worker_id)
+        logger.warning("Worker %s exited before subscribing; no longer waiting for it", worker_id)
+        self._open_writes_if_ready()
+
+    def _open_writes_if_ready(self) -> None:
+        with self._subscribers_lock:
+            if self._awaited or self._all_subscribed.is_set():
+                return
+            self._all_subscribed.set()
+        self.server.ingest_queue.start()
+        logger.info("All live workers subscribed; accepting writes")
+
+    def _handle(self, conn, send_lock: threading.Lock, request_id: int, op: str, args: tuple) -> None:
+        try:
+            if op == "broadcast":
+                result = self.publish_event(*args)
+            else:
+                if not self._all_subscribed.wait(self.subscribe_timeout):
+                    with self._subscribers_lock:
+                        awaited = sorted(self._awaited)
+                    raise WriterError(f"writes are not accepted yet: waiting for workers {awaited} to subscribe")
+                if op == "call_tool":
+                    result = self._call_tool(*args)
+                elif op == "submit_ingest_job":
+                    result = self.server.submit_ingest_job(*args)
+                elif op == "get_ingest_status":
+                    result = self.server.get_ingest_status(*args)
+                elif op == "list_ingest_jobs":
+                    result = self.server.list_ingest_jobs(*args)
+                elif op == "cancel_request":
+                    result = self._cancel_request(*args)
+                else:
+                    raise ValueError(f"unknown writer operation {op!r}")
+            reply = (request_id, "ok", result)
+        except Exception as e:
+            logger.exception("Writer operation %s failed: %s", op, e)
+            reply = (request_id, "error", str(e))
+        with send_lock:
+            try:
+                conn.send(reply)
+            except (OSError, ValueError) as e:
+                logger.warning("Could not reply to a worker: %s", e)
+
+    def _cancel_request(self, request_id: str) -> dict:
+        """Cancels an ingest job of the writer, or else asks every worker to cancel the call."""
+        response = self.server.cancel_request(request_id)
+        if response["status"] == "success":
+            return response
+        self._push(("cancel", request_id))
+        return {"mcp_protocol_version": "1.0", "status": "success", "request_id": request_id,
+                "message": "Cancellation sent to all workers"}
+
+    def _call_tool(self, tool_name: str, tool_params: dict) -> tuple:
+        tool_definition = self.server.tools.get(tool_name)
+        if not tool_definition or not callable(tool_definition.get('callback')):
+            raise ValueError(f"Tool '{tool_name}' not found")
+        result = self.server.tool_runtime.call_blocking(tool_definition['callback'], tool_params, tool_definition.get('timeout'))
+        # Every change the call made has a sequence number no greater than this
+        return result, self._seq
+
+    def close(self) -> None:
+        self._closed = True
+        self._listener.close()
+        self._executor.shutdown(wait=True)
+        with self._subscribers_lock:
+            for subscriber in self._subscribers:
+                subscriber.queue.put(None)
+
+
+# --- Worker side ---
+
+class WriterLink:
+    """A worker's connection to the :class:`WriterHub`.
+
+    Requests are pipelined over one connection; a second connection carries
+    the change stream, which a follower thread applies to ``server``.
+    """
+
+    def __init__(self, address: str, authkey: bytes, server, worker_id: int,
+                 timeout: float = DEFAULT_CALL_TIMEOUT):
+        self.server = server
+        self.worker_id = worker_id
+        self.timeout = timeout
+        self._applied = 0
+        self._applied_cond = threading.Condition()
+        self.connected = True
+
+        self._stream = Client(address, family="AF_UNIX", authkey=authkey)
+        self._stream.send(("subscribe", worker_id))
+        _, self._applied, event_epoch, event_seq = self._stream.recv()
+        server.sse_events.reset(event_epoch, event_seq)
+        self._conn = Client(address, family="AF_UNIX", authkey=authkey)
+        self._conn.send(("requests", worker_id))
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._ids = itertools.count()
+        threading.Thread(target=self._follow, name="writer-link-follower", daemon=True).start()
+        threading.Thread(target=self._read_replies, name="writer-link-reader", daemon=True).start()
+
+    def _follow(self) -> None:
+        while True:
+            try:
+                message = self._stream.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                if message[0] == "change":
+                    _, seq, change, doc_id, document = message
+                    self.server.apply_replicated_change(change, doc_id, document)
+                    with self._applied_cond:
+                        self._applied = seq
+                        self._applied_cond.notify_all()
+                elif message[0] == "event":
+                    self.server._broadcast_to_clients(message[1], message[2], event_seq=message[3])
+                elif message[0] == "cancel":
+                    self.server._cancel_active(message[1], "cancelled by client")
+            except Exception as e:
+                logger.error("Worker %s could not apply %s from the writer: %s",
+                             self.worker_id, message[0], e, exc_info=True)
+        logger.warning("Worker %s lost the writer's change stream", self.worker_id)
+        self.connected = False
+        with self._applied_cond:
+            self._applied_cond.notify_all()
+
+    def _read_replies(self) -> None:
+        while True:
+            try:
+                request_id, status, payload = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if status == "ok":
+                future.set_result(payload)
+            else:
+                future.set_exception(WriterError(payload))
+        self.connected = False
+        for future in list(self._pending.values()):
+            future.set_exception(WriterError("writer process is unavailable"))
+        self._pending.clear()
+
+    def _request(self, op: str, *args: Any) -> Future:
+        future: Future = Future()
+        with self._send_lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                self._conn.send((request_id, op, args))
+            except (OSError, ValueError) as e:
+                self._pending.pop(request_id, None)
+                future.set_exception(WriterError(f"writer process is unavailable: {e}"))
+        return future
+
+    def _wait_applied(self, seq: int) -> None:
+        with self._applied_cond:
+            if not self._applied_cond.wait_for(lambda: self._applied >= seq or not self.connected, self.timeout):
+                raise WriterError(f"timed out waiting for store change {seq} from the writer")
+
+    def call_tool(self, tool_name: str, tool_params: dict) -> Any:
+        """Runs a mutating tool in the writer; returns once its changes are visible in this worker."""
+        result, seq = self._request("call_tool", tool_name, tool_params).result(timeout=self.timeout)
+        self._wait_applied(seq)
+        return result
+
+    def submit_ingest_job(self, tool_name: str, tool_params: dict) -> dict:
+        return self._request("submit_ingest_job", tool_name, tool_params).result(timeout=self.timeout)
+
+    def get_ingest_status(self, job_id: Optional[str]) -> dict:
+        return self._request("get_ingest_status", job_id).result(timeout=self.timeout)
+
+    def list_ingest_jobs(self, status: Optional[str], limit: Any, offset: Any) -> dict:
+        return self._request("list_ingest_jobs", status, limit, offset).result(timeout=self.timeout)
+
+    def cancel_request(self, request_id: str) -> dict:
+        return self._request("cancel_request", request_id).result(timeout=self.timeout)
+
+    def publish_event(self, event_name: str, data: dict) -> None:
+        """Sends an SSE event to the clients of every worker (fire and forget)."""
+        self._request("broadcast", event_name, data)
+
+    def close(self) -> None:
+        for conn in (self._conn, self._stream):
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+# --- Processes ---
+
+def _install_stop_handlers(stop: threading.Event) -> None:
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+
+
+def _follow_supervisor(control_conn, hub: WriterHub) -> None:
+    """Relays the supervisor's reports of exited workers to the hub."""
+    while True:
+        try:
+            message = control_conn.recv()
+        except (EOFError, OSError):
+            break
+        if message[0] == "worker_exited":
+            hub.worker_exited(message[1])
+
+
+def _writer_main(address: str, authkey: bytes, num_workers: int, server_kwargs: dict, ready_conn,
+                 control_conn) -> None:
+    from .server import McpServer
+
+    stop = threading.Event()
+    _install_stop_handlers(stop)
+    try:
+        server = McpServer(**server_kwargs)
+        hub = WriterHub(server, address, authkey, num_workers)
+        hub.start()
+    except Exception as e:
+        logger.exception("Writer process failed to start: %s", e)
+        ready_conn.send(("error", str(e)))
+        return
+    ready_conn.send(("ready", os.getpid()))
+    ready_conn.close()
+    threading.Thread(target=_follow_supervisor, args=(control_conn, hub), name="writer-supervisor",
+                     daemon=True).start()
+    logger.info("Writer process %s ready for %s workers", os.getpid(), num_workers)
+    stop.wait()
+    hub.close()
+    server.stop()  # Drains pending store writes
+
+
+def _worker_main(worker_id: int, address: str, authkey: bytes, port: int, server_kwargs: dict) -> None:
+    from .server import McpServer
+
+    stop = threading.Event()
+    _install_stop_handlers(stop)
+    server = McpServer(**server_kwargs)
+    link = WriterLink(address, authkey, server, worker_id)
+    server.attach_writer(link)
+    server.start(transport_type='sse', port=port, reuse_port=True)
+    logger.info("Worker %s (pid %s) serving on port %s", worker_id, os.getpid(), port)
+    while not stop.wait(1.0):
+        if not server.running or not link.connected:
+            break
+    server.stop()
+    link.close()
+
+
+def run_prefork(num_workers: int, port: int, server_kwargs: Dict[str, Any]) -> int:
+    """Runs the writer and ``num_workers`` SSE workers until interrupted; returns an exit code.
+
+    Search shards are refused: every process would start its own set of
+    shard processes, and the workers already spread searches across cores.
+    """
+    if server_kwargs.get("search_shards"):
+        logger.error("--search-shards cannot be combined with --workers: every worker would start its own shards")
+        return 1
+    if not prefork_supported():
+        logger.error("Pre-fork mode needs fork() and SO_REUSEPORT, which this platform does not provide")
+        return 1
+    context = multiprocessing.get_context("fork")
+    run_dir = tempfile.mkdtemp(prefix="mcp-prefork-")
+    address = os.path.join(run_dir, "writer.sock")
+    authkey = os.urandom(32)
+
+    ready_recv, ready_send = context.Pipe(duplex=False)
+    control_recv, control_send = context.Pipe(duplex=False)
+    writer = context.Process(target=_writer_main, name="mcp-writer",
+                             args=(address, authkey, num_workers, server_kwargs, ready_send, control_recv))
+    writer.start()
+    ready_send.close()
+    control_recv.close()
+    workers: List[multiprocessing.process.BaseProcess] = []
+    stop = threading.Event()
+    _install_stop_handlers(stop)
+    try:
+        if not ready_recv.poll(WRITER_START_TIMEOUT):
+            logger.error("Writer process did not start within %ss", WRITER_START_TIMEOUT)
+            return 1
+        try:
+            status, detail = ready_recv.recv()
+        except EOFError:
+            status, detail = "error", "writer process exited"
+        if status != "ready":
+            logger.error("Writer process failed: %s", detail)
+            return 1
+        for worker_id in range(num_workers):
+            process = context.Process(target=_worker_main, name=f"mcp-worker-{worker_id}",
+                                      args=(worker_id, address, authkey, port, server_kwargs))
+            process.start()
+            workers.append(process)
+        logger.info("Pre-fork server: writer pid %s, %s workers on port %s", writer.pid, num_workers, port)
+
+        while not stop.is_set():
+            live = [p for p in workers if p.is_alive()]
+            if not writer.is_alive():
+                logger.error("Writer process exited; shutting down workers")
+                return 1
+            if not live:
+                logger.error("All worker processes exited")
+                return 1
+            wait([writer.sentinel] + [p.sentinel for p in live], timeout=1.0)
+            for process in live:
+                if not process.is_alive():
+                    logger.warning("%s exited with code %s; not restarted", process.name, process.exitcode)
+                    try:  # The writer stops waiting for it, if it never subscribed
+                        control_send.send(("worker_exited", workers.index(process)))
+                    except (OSError, ValueError):
+                        pass
+        return 0
+    finally:
+        for process in workers + [writer]:  # Writer last, so forwarded writes can finish
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=10)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        control_send.close()
+        shutil.rmtree(run_dir, ignore_errors=True)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按需性能剖析 - 采样的 cProfile 与 tracemalloc 快照对比
+
+Admin commands switch these on while the server runs:
+
+* ``profile_start`` profiles the callbacks of the next N tool calls, a
+  sampled fraction of them, or both, optionally only for some tools.
+  ``profile_report`` returns the accumulated pstats summary and
+  ``profile_stop`` ends profiling early.
+* ``memory_start`` starts tracemalloc; every ``memory_snapshot`` returns the
+  allocation growth since the previous one, grouped by line (or file or
+  traceback) and optionally limited to matching files, such as the store or
+  the caches. ``memory_stop`` ends tracing.
+
+While profiling is off, the dispatch path only reads :attr:`Profiler.active`.
+Coroutine callbacks are profiled only while they run, so time spent in other
+tasks on the shared event loop is not attributed to them.
+
+Only one cProfile profiler can be active in a process at a time; Python
+3.12 and later refuse a second one. Selected calls therefore take turns: a
+call (or coroutine step) that starts while another is being profiled runs
+unprofiled and is counted in ``busy_skipped``.
+"""
+
+import asyncio
+import cProfile
+import functools
+import io
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .tool_runtime import is_async_callback
+
+PSTATS_SORT_KEYS = ("cumulative", "tottime", "calls", "ncalls", "time", "name", "filename")
+SNAPSHOT_KEY_TYPES = ("lineno", "filename", "traceback")
+
+
+class Profiler:
+    """Selects tool calls for cProfile and accumulates their statistics."""
+
+    def __init__(self):
+        self.active = False  # The only attribute the dispatch path reads while profiling is off
+        self._lock = threading.Lock()
+        self._remaining: Optional[int] = None
+        self._sample_rate: Optional[float] = None
+        self._tools: Optional[frozenset] = None
+        self._stats: Optional[pstats.Stats] = None
+        self._profiled = 0
+        self._busy_skipped = 0
+        self._profiling = threading.Lock()  # Held while a profiler is enabled
+        self._started_at: Optional[float] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+
+    # --- cProfile ---
+    def start(self, requests: Optional[int] = None, sample_rate: Optional[float] = None,
+              tools: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Profiles the next ``requests`` selected calls (unbounded if None), selecting each with ``sample_rate``.
+
+        Statistics from an earlier run are discarded. Raises ValueError for invalid arguments.
+        """
+        if requests is not None and (isinstance(requests, bool) or not isinstance(requests, int) or requests <= 0):
+            raise ValueError("requests must be a positive integer")
+        if sample_rate is not None and (isinstance(sample_rate, bool) or not isinstance(sample_rate, (int, float))
+                                        or not 0 < sample_rate <= 1):
+            raise ValueError("sample_rate must be in (0, 1]")
+        if requests is None and sample_rate is None:
+            raise ValueError("give requests, sample_rate or both")
+        with self._lock:
+            self._remaining = requests
+            self._sample_rate = sample_rate
+            self._tools = frozenset(tools) if tools else None
+            self._stats = None
+            self._profiled = 0
+            self._busy_skipped = 0
+            self._started_at = time.time()
+            self.active = True
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            self.active = False
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"active": self.active, "remaining": self._remaining, "sample_rate": self._sample_rate,
+                    "tools": sorted(self._tools) if self._tools else None, "profiled_calls": self._profiled,
+                    "busy_skipped": self._busy_skipped, "started_at": self._started_at}
+
+    def select(self, tool_name: str) -> bool:
+        """Decides whether to profile a call; turns profiling off after the last requested call."""
+        with self._lock:
+            if not self.active or (self._tools is not None and tool_name not in self._tools):
+                return False
+            if self._sample_rate is not None and random.random() >= self._sample_rate:
+                return False
+            if self._remaining is not None:
+                self._remaining -= 1
+                if self._remaining <= 0:
+                    self.active = False
+            return True
+
+    def wrap(self, callback: Callable[[dict], Any]) -> Callable[[dict], Any]:
+        """Returns ``callback`` running under a profiler whose results are added to the report."""
+        if is_async_callback(callback):
+            async def profiled_coroutine(params: dict) -> Any:
+                return await self._profile_coroutine(callback(params))
+            return profiled_coroutine
+
+        @functools.wraps(callback)
+        def profiled(params: dict) -> Any:
+            profile = cProfile.Profile()
+            if not self._enable(profile):
+                return callback(params)
+            try:
+                return callback(params)
+            finally:
+                self._disable(profile)
+                self._add(profile)
+        return profiled
+
+    def _enable(self, profile: cProfile.Profile) -> bool:
+        """Enables ``profile`` unless another profiler is active; False if the caller must run unprofiled."""
+        if self._profiling.acquire(blocking=False):
+            try:
+                profile.enable()
+                return True
+            except ValueError:  # Another profiling tool (a debugger, coverage) is active
+                self._profiling.release()
+        with self._lock:
+            self._busy_skipped += 1
+        return False
+
+    def _disable(self, profile: cProfile.Profile) -> None:
+        profile.disable()
+        self._profiling.release()
+
+    async def _profile_coroutine(self, coroutine) -> Any:
+        """Drives ``coroutine`` step by step, profiling only its own steps."""
+        profile = cProfile.Profile()
+        send_value, error = None, None
+        try:
+            while True:
+                enabled = self._enable(profile)
+                try:
+                    yielded = coroutine.throw(error) if error is not None else coroutine.send(send_value)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    if enabled:
+                        self._disable(profile)
+                send_value, error = None, None
+                try:
+                    if yielded is None:
+                        await asyncio.sleep(0)  # A bare yield
+                    else:
+                        # Like asyncio.Task, clear the flag the coroutine's await set before waiting on the future
+                        yielded._asyncio_future_blocking = False
+                        send_value = await yielded
+                except BaseException as e:  # Including cancellation: pass it into the coroutine
+                    error = e
+        finally:
+            coroutine.close()
+            self._add(profile)
+
+    def _add(self, profile: cProfile.Profile) -> None:
+        with self._lock:
+            try:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+            except TypeError:
+                return  # The call raised before anything was profiled
+            self._profiled += 1
+
+    def report(self, sort: str = "cumulative", limit: int = 30) -> Dict[str, Any]:
+        """The accumulated statistics: the top ``limit`` functions and the pstats text."""
+        if sort not in PSTATS_SORT_KEYS:
+            raise ValueError(f"sort must be one of: {', '.join(PSTATS_SORT_KEYS)}")
+        limit = int(limit)
+        with self._lock:
+            status_profiled = self._profiled
+            if self._stats is None:
+                return {"profiled_calls": 0, "functions": [], "text": ""}
+            stream = io.StringIO()
+            self._stats.stream = stream
+            self._stats.sort_stats(sort)
+            self._stats.print_stats(limit)
+            functions = []
+            for func in self._stats.fcn_list[:limit]:
+                primitive_calls, calls, total_time, cumulative_time, _ = self._stats.stats[func]
+                functions.append({
+                    "function": pstats.func_std_string(func), "calls": calls, "primitive_calls": primitive_calls,
+                    "tottime": round(total_time, 6), "cumtime": round(cumulative_time, 6),
+                })
+        return {"profiled_calls": status_profiled, "sort": sort, "functions": functions, "text": stream.getvalue()}
+
+    # --- tracemalloc ---
+    def memory_start(self, frames: int = 1) -> Dict[str, Any]:
+        """Starts tracing allocations and takes the baseline snapshot."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, int(frames)))
+        with self._lock:
+            self._snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        return {"tracing": True, "traced_bytes": current, "peak_bytes": peak}
+
+    def memory_snapshot(self, limit: int = 20, key_type: str = "lineno", match: Optional[str] = None) -> Dict[str, Any]:
+        """Returns the allocation growth since the previous snapshot, largest first.
+
+        ``match`` keeps only allocations in files whose path contains it (e.g. ``"mcp/"``).
+        """
+        if key_type not in SNAPSHOT_KEY_TYPES:
+            raise ValueError(f"key_type must be one of: {', '.join(SNAPSHOT_KEY_TYPES)}")
+        if not tracemalloc.is_tracing():
+            raise ValueError("tracemalloc is not running; send memory_start first")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        if match:
+            snapshot = snapshot.filter_traces((tracemalloc.Filter(True, f"*{match}*"),))
+        with self._lock:
+            previous, self._snapshot = self._snapshot, snapshot
+        if previous is not None and match:
+            previous = previous.filter_traces((tracemalloc.Filter(True, f"*{match}*"),))
+        if previous is None:
+            stats = snapshot.statistics(key_type)
+            entries = [{"location": self._location(s.traceback, key_type), "size_bytes": s.size, "count": s.count,
+                        "size_diff_bytes": s.size, "count_diff": s.count} for s in stats[:int(limit)]]
+        else:
+            stats = snapshot.compare_to(previous, key_type)
+            entries = [{"location": self._location(s.traceback, key_type), "size_bytes": s.size, "count": s.count,
+                        "size_diff_bytes": s.size_diff, "count_diff": s.count_diff} for s in stats[:int(limit)]]
+        current, peak = tracemalloc.get_traced_memory()
+        return {"traced_bytes": current, "peak_bytes": peak, "compared_to_previous": previous is not None,
+                "top": entries}
+
+    @staticmethod
+    def _location(traceback: tracemalloc.Traceback, key_type: str) -> Any:
+        if key_type == "traceback":
+            return [f"{frame.filename}:{frame.lineno}" for frame in traceback]
+        frame = traceback[0]
+        return frame.filename if key_type == "filename" else f"{frame.filename}:{frame.lineno}"
+
+    def memory_stop(self) -> Dict[str, Any]:
+        with self._lock:
+            self._snapshot = None
+        tracemalloc.stop()
+        return {"tracing": False}
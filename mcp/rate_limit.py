@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+速率限制 - 按客户端的令牌桶准入控制
+
+Each client (an SSE session id, or else the client's IP address) has a token
+bucket that refills at ``rate`` tokens per second, up to ``burst`` tokens.
+Every command costs some tokens, so heavy commands (ingest) drain a bucket
+faster than cheap ones (echo, status polls). A command that finds too few
+tokens is rejected without doing any work, together with the number of
+seconds after which it would be admitted.
+
+Buckets of idle clients are evicted least recently used first once more than
+``max_clients`` are tracked; an evicted client starts again with a full
+bucket.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+DEFAULT_MAX_CLIENTS = 10000
+
+
+class RateLimiter:
+    """Per-client token buckets, refilled lazily when a client is seen."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None, max_clients: int = DEFAULT_MAX_CLIENTS):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst) if burst is not None else max(1.0, self.rate)
+        self.max_clients = max_clients
+        # client -> [tokens, last refill (monotonic), rejected requests]
+        self._buckets: "OrderedDict[Hashable, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.evictions = 0
+        self._rejected_by_command: Dict[str, int] = {}
+
+    def acquire(self, client: Hashable, cost: float = 1.0, command: str = "") -> Optional[float]:
+        """Takes ``cost`` tokens from ``client``'s bucket.
+
+        Returns None if the request is admitted, otherwise the seconds until it would be.
+        A cost above ``burst`` is capped to it, so every command can eventually pass.
+        """
+        cost = min(float(cost), self.burst)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [self.burst, now, 0]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                self.allowed += 1
+                return None
+            bucket[2] += 1
+            self.rejected += 1
+            self._rejected_by_command[command] = self._rejected_by_command.get(command, 0) + 1
+            return (cost - bucket[0]) / self.rate
+
+    def stats(self, top: int = 5) -> Dict[str, Any]:
+        """Counters, plus the clients with the most rejected requests."""
+        with self._lock:
+            offenders = sorted(((bucket[2], client) for client, bucket in self._buckets.items() if bucket[2]),
+                               reverse=True)[:top]
+            return {
+                "rate": self.rate, "burst": self.burst, "clients": len(self._buckets),
+                "allowed": self.allowed, "rejected": self.rejected, "evictions": self.evictions,
+                "rejected_by_command": dict(self._rejected_by_command),
+                "top_rejected_clients": [{"client": str(client), "rejected": int(count)} for count, client in offenders],
+            }
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+只读副本 - 跟随主服务器变更流的读扩展
+
+Every server keeps a bounded, in-memory :class:`ChangeLog` of its store
+mutations and serves it as an SSE stream on ``/mcp_changes``:
+
+* ``event: snapshot`` carries the whole store and the sequence number it
+  corresponds to. It is sent first, unless the client resumes with
+  ``?since=<epoch>-<seq>`` and the log still holds every later change.
+* ``event: change`` carries one committed mutation (``seq``, ``ts``,
+  ``change``, ``document_id``, ``document``).
+* ``event: heartbeat`` carries the current ``seq`` and ``ts`` whenever
+  nothing changed for :data:`HEARTBEAT_INTERVAL` seconds.
+
+Every event also carries the log's ``epoch``, chosen afresh by each server
+run. Sequence numbers restart when the server does, so a position from
+another run (or another pre-fork worker) is never resumed; the client gets a
+new snapshot instead.
+
+A server started with ``replicate_from`` runs a :class:`ReplicaFollower`
+that applies this stream to its own store and search index. The replica
+rejects writes, and reports its replication lag alongside the reads it
+serves. Failover is out of scope: a replica never becomes a primary.
+"""
+
+import itertools
+import json
+import logging
+import threading
+import time
+import urllib.request
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from .http_support import decoded_lines
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_CAPACITY = 4096  # changes kept for resuming replicas
+HEARTBEAT_INTERVAL = 1.0  # seconds
+RECONNECT_DELAY = 1.0  # seconds
+
+
+class ChangeLog:
+    """The most recent store mutations, numbered in commit order.
+
+    :meth:`append` is registered as a mutation listener, so it runs under
+    the server's mutation lock.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_LOG_CAPACITY, epoch: Optional[str] = None):
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self._cond = threading.Condition()
+        self.epoch = epoch or uuid.uuid4().hex[:8]
+        self.seq = 0
+
+    def append(self, change: str, doc_id: Any, document: Optional[dict]) -> None:
+        with self._cond:
+            self.seq += 1
+            self._entries.append({
+                "epoch": self.epoch, "seq": self.seq, "ts": time.time(), "change": change, "document_id": doc_id,
+                "document": dict(document) if document is not None else None,
+            })
+            self._cond.notify_all()
+
+    def position(self, seq: Optional[int] = None) -> str:
+        """``<epoch>-<seq>`` for ``seq`` (by default the latest change), as sent in ``?since=``."""
+        return f"{self.epoch}-{self.seq if seq is None else seq}"
+
+    def parse(self, position: str) -> Optional[int]:
+        """The sequence number of ``position`` if it belongs to this run, else None."""
+        epoch, _, seq = position.strip().rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def covers(self, since: int) -> bool:
+        """True if every change after ``since`` is still in the log."""
+        with self._cond:
+            if not 0 <= since <= self.seq:
+                return False
+            return since == self.seq or self._entries[0]["seq"] <= since + 1
+
+    def wait_after(self, since: int, timeout: float) -> Optional[List[Dict[str, Any]]]:
+        """Returns the changes after ``since``, waiting up to ``timeout`` for one.
+
+        Returns an empty list on timeout, and None once the log no longer
+        holds every change after ``since``.
+        """
+        with self._cond:
+            if self.seq <= since:
+                self._cond.wait(timeout)
+            if not self.covers(since):
+                return None
+            if self.seq <= since:
+                return []
+            first = self._entries[0]["seq"]
+            return list(itertools.islice(self._entries, since + 1 - first, None))
+
+
+class ReplicaFollower:
+    """Follows a primary's ``/mcp_changes`` stream and applies it to ``server``.
+
+    Reconnects after errors, resuming from the last applied change when the
+    primary still has it and re-reading the full snapshot otherwise.
+    """
+
+    def __init__(self, server, primary_url: str, changes_path: str, read_timeout: float = 5 * HEARTBEAT_INTERVAL):
+        self.server = server
+        self.primary_url = primary_url.rstrip('/')
+        if "://" not in self.primary_url:
+            self.primary_url = f"http://{self.primary_url}"
+        self.changes_url = self.primary_url + changes_path
+        self.read_timeout = read_timeout
+        self.connected = False
+        self.epoch: Optional[str] = None  # The primary run that applied_seq counts in
+        self.applied_seq = 0
+        self.primary_seq = 0
+        self.snapshots = 0
+        self.synced = threading.Event()  # Set once the first snapshot is applied
+        self._applied_ts = 0.0  # Primary commit time of the newest applied data
+        self._contact_ts = 0.0  # Primary clock at the last message
+        self._contact_at: Optional[float] = None  # Local clock at the last message
+        self._stopped = threading.Event()
+        self._response = None
+        self._thread = threading.Thread(target=self._run, name="replica-follower", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self._follow()
+            except Exception as e:
+                if not self._stopped.is_set():
+                    logger.warning("Replication stream from %s failed: %s", self.primary_url, e)
+            self.connected = False
+            self._stopped.wait(RECONNECT_DELAY)
+
+    def _follow(self) -> None:
+        url = self.changes_url + (f"?since={self.epoch}-{self.applied_seq}" if self.epoch is not None else "")
+        request = urllib.request.Request(url, headers={"Accept-Encoding": "gzip"})
+        with urllib.request.urlopen(request, timeout=self.read_timeout) as response:
+            self._response = response
+            self.connected = True
+            logger.info("Following changes from %s", url)
+            event, data = None, []
+            for raw_line in decoded_lines(response):
+                if self._stopped.is_set():
+                    return
+                line = raw_line.decode('utf-8').rstrip('\r\n')
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data.append(line[len("data:"):].strip())
+                elif not line and event is not None:
+                    self._dispatch(event, json.loads("\n".join(data)))
+                    event, data = None, []
+
+    def _dispatch(self, event: str, payload: Dict[str, Any]) -> None:
+        self._contact_at = time.monotonic()
+        self._contact_ts = payload.get("ts", self._contact_ts)
+        if event != "snapshot" and payload.get("epoch") != self.epoch:
+            # Sequence numbers from another primary run say nothing about what was applied
+            self.epoch = None
+            raise ValueError(f"primary changed epoch to {payload.get('epoch')}; reloading the snapshot")
+        if event == "snapshot":
+            self.server._reset_store(payload["documents"])
+            self.epoch = payload.get("epoch")
+            self.applied_seq = self.primary_seq = payload["seq"]
+            self._applied_ts = self._contact_ts
+            self.snapshots += 1
+            self.synced.set()
+            logger.info("Replica loaded %s documents at change %s", len(payload['documents']), payload['seq'])
+        elif event == "change":
+            if payload["seq"] != self.applied_seq + 1:
+                raise ValueError(f"expected change {self.applied_seq + 1}, got {payload['seq']}")
+            self.server.apply_replicated_change(payload["change"], payload["document_id"], payload["document"])
+            self.applied_seq = payload["seq"]
+            self.primary_seq = max(self.primary_seq, self.applied_seq)
+            self._applied_ts = payload["ts"]
+        elif event == "heartbeat":
+            self.primary_seq = payload["seq"]
+            if self.applied_seq >= self.primary_seq:
+                self._applied_ts = payload["ts"]
+
+    def status(self) -> Dict[str, Any]:
+        """Replication state; ``lag_seconds`` bounds how stale the replica's data may be."""
+        since_contact = None if self._contact_at is None else time.monotonic() - self._contact_at
+        lag = None
+        if since_contact is not None:
+            lag = round(since_contact + max(0.0, self._contact_ts - self._applied_ts), 3)
+        return {
+            "primary": self.primary_url, "connected": self.connected, "synced": self.synced.is_set(),
+            "epoch": self.epoch, "applied_seq": self.applied_seq, "primary_seq": self.primary_seq,
+            "lag_changes": max(0, self.primary_seq - self.applied_seq), "lag_seconds": lag,
+        }
+
+    def stop(self) -> None:
+        self._stopped.set()
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+        self._thread.join(timeout=2 * RECONNECT_DELAY)
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文档搜索索引 - 分段、可合并的倒排索引 (LSM 风格)
+
+New documents go into a small in-memory write buffer (:class:`MemTable`).
+Full buffers are frozen and flushed by a background thread into immutable
+:class:`Segment` objects, which are merged under a tiered policy: once
+``merge_factor`` segments share a tier they are merged into one segment of
+the next tier. Queries fan out over the buffer and every segment and merge
+the per-segment candidate lists in document order, so the caller can stop
+after the first ``k`` verified matches.
+
+The index maps lower-cased word tokens to document ordinals (store
+positions). ``document_search`` matches substrings, so the index only
+narrows the scan: it returns every document that has, for each word of the
+query, some token containing that word. Callers verify candidates against
+the real predicate.
+
+Deleted documents are recorded as tombstoned ordinals and filtered out of
+query results with a set lookup. Merges drop tombstoned postings, and
+:meth:`SearchIndex.request_compaction` merges every segment so the
+tombstones themselves can be forgotten.
+"""
+
+import heapq
+import logging
+import re
+import threading
+import time
+from array import array
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_THRESHOLD = 1024  # documents per write buffer
+DEFAULT_MERGE_FACTOR = 4  # segments per tier before they are merged
+
+_TOKEN_RE = re.compile(r"\w+")
+_INDEXED_FIELDS = ("title", "abstract")
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits ``text`` into lower-cased word tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def document_terms(document: Mapping[str, Any]) -> Set[str]:
+    """Returns the distinct tokens of a document's title, abstract and keywords."""
+    terms: Set[str] = set()
+    for field in _INDEXED_FIELDS:
+        value = document.get(field)
+        if isinstance(value, str):
+            terms.update(tokenize(value))
+    keywords = document.get("keywords")
+    if isinstance(keywords, (list, tuple)):
+        for keyword in keywords:
+            if isinstance(keyword, str):
+                terms.update(tokenize(keyword))
+    return terms
+
+
+def document_matches(document: Mapping[str, Any], query: str) -> bool:
+    """The ``document_search`` predicate: ``query`` (lower-cased) is a case-insensitive
+    substring of the title, the abstract or a keyword."""
+    if query in document.get("title", "").lower():
+        return True
+    if query in document.get("abstract", "").lower():
+        return True
+    return any(query in keyword.lower() for keyword in document.get("keywords", []))
+
+
+def _candidates(terms: Sequence[str], postings_for: Dict[str, Sequence[int]], query_terms: Sequence[str]) -> List[int]:
+    """Ordinals whose terms contain every query term as a substring, ascending."""
+    result: Optional[Set[int]] = None
+    for query_term in query_terms:
+        matched: Set[int] = set()
+        for term in terms:
+            if query_term in term:
+                matched.update(postings_for[term])
+        result = matched if result is None else result & matched
+        if not result:
+            return []
+    return sorted(result) if result else []
+
+
+class Segment:
+    """An immutable inverted index over a set of document ordinals."""
+
+    __slots__ = ("terms", "postings", "ordinals", "tier")
+
+    def __init__(self, postings: Dict[str, Sequence[int]], ordinals: Iterable[int], tier: int = 0):
+        self.terms: Tuple[str, ...] = tuple(sorted(postings))
+        self.postings: Dict[str, array] = {term: array('I', sorted(postings[term])) for term in self.terms}
+        self.ordinals = array('I', sorted(ordinals))
+        self.tier = tier
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.ordinals)
+
+    def candidates(self, query_terms: Sequence[str]) -> List[int]:
+        return _candidates(self.terms, self.postings, query_terms)
+
+    @classmethod
+    def merge(cls, segments: Sequence["Segment"], tier: int, drop: FrozenSet[int] = frozenset()) -> "Segment":
+        """Merges ``segments`` into one, leaving out the ordinals in ``drop``."""
+        combined: Dict[str, List[int]] = {}
+        for segment in segments:
+            for term, ordinals in segment.postings.items():
+                kept = [o for o in ordinals if o not in drop] if drop else ordinals
+                if kept:
+                    combined.setdefault(term, []).extend(kept)
+        ordinals = [o for segment in segments for o in segment.ordinals if o not in drop]
+        return cls(combined, ordinals, tier)
+
+
+class MemTable:
+    """The mutable write buffer. Guarded by the owning index's lock until frozen."""
+
+    __slots__ = ("postings", "ordinals")
+
+    def __init__(self):
+        self.postings: Dict[str, List[int]] = {}
+        self.ordinals: List[int] = []
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.ordinals)
+
+    def add(self, ordinal: int, terms: Iterable[str]) -> None:
+        for term in terms:
+            self.postings.setdefault(term, []).append(ordinal)
+        self.ordinals.append(ordinal)
+
+    def candidates(self, query_terms: Sequence[str]) -> List[int]:
+        return _candidates(list(self.postings), self.postings, query_terms)
+
+
+class SearchIndex:
+    """Segmented search index with background flush and tiered merges."""
+
+    def __init__(self, flush_threshold: int = DEFAULT_FLUSH_THRESHOLD,
+                 merge_factor: int = DEFAULT_MERGE_FACTOR, name: str = "search-index"):
+        self.flush_threshold = max(1, int(flush_threshold))
+        self.merge_factor = max(2, int(merge_factor))
+        self.name = name
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._memtable = MemTable()
+        self._frozen: Tuple[MemTable, ...] = ()  # Full buffers waiting to be flushed
+        self._segments: Tuple[Segment, ...] = ()
+        self._deleted: FrozenSet[int] = frozenset()  # Tombstoned ordinals (replaced on write)
+        self._compact_requested = False
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._busy = False
+        self.flushes = 0
+        self.merges = 0
+        self.compactions = 0
+        self.flush_seconds = 0.0
+        self.merge_seconds = 0.0
+
+    # --- Writes ---
+    def add(self, ordinal: int, document: Mapping[str, Any]) -> None:
+        """Indexes ``document`` at store position ``ordinal``."""
+        terms = document_terms(document)
+        with self._lock:
+            if ordinal in self._deleted:  # Re-added (e.g. moved back to this shard)
+                self._deleted = self._deleted - {ordinal}
+            self._memtable.add(ordinal, terms)
+            if self._memtable.doc_count >= self.flush_threshold:
+                self._frozen += (self._memtable,)
+                self._memtable = MemTable()
+                self._ensure_worker()
+                self._work.notify()
+
+    def delete(self, ordinal: int) -> None:
+        """Tombstones ``ordinal`` so it is no longer returned by :meth:`search`."""
+        with self._lock:
+            self._deleted = self._deleted | {ordinal}
+
+    def request_compaction(self) -> None:
+        """Asks the background thread to merge all segments and purge tombstones."""
+        with self._lock:
+            self._compact_requested = True
+            self._ensure_worker()
+            self._work.notify()
+
+    def bulk_load(self, documents: Iterable[Tuple[int, Mapping[str, Any]]]) -> int:
+        """Indexes many documents, building full segments directly. Returns the count."""
+        count = 0
+        batch: Dict[str, List[int]] = {}
+        batch_ordinals: List[int] = []
+        for ordinal, document in documents:
+            for term in document_terms(document):
+                batch.setdefault(term, []).append(ordinal)
+            batch_ordinals.append(ordinal)
+            count += 1
+            if len(batch_ordinals) >= self.flush_threshold:
+                self._publish_segment(Segment(batch, batch_ordinals))
+                batch, batch_ordinals = {}, []
+        if batch_ordinals:
+            self._publish_segment(Segment(batch, batch_ordinals))
+        return count
+
+    def _publish_segment(self, segment: Segment) -> None:
+        with self._lock:
+            self._segments += (segment,)
+            self._ensure_worker()
+            self._work.notify()
+
+    # --- Reads ---
+    def search(self, query: str) -> Optional[Iterator[int]]:
+        """Returns candidate ordinals for ``query`` in ascending order.
+
+        Returns ``None`` when the query has no word tokens and therefore
+        cannot be narrowed by the index.
+        """
+        query_terms = sorted(set(tokenize(query)), key=len, reverse=True)  # Most selective first
+        if not query_terms:
+            return None
+        with self._lock:
+            segments, frozen, deleted = self._segments, self._frozen, self._deleted
+            buffered = self._memtable.candidates(query_terms)
+        per_segment = [buffered]
+        per_segment.extend(table.candidates(query_terms) for table in frozen)
+        per_segment.extend(segment.candidates(query_terms) for segment in segments)
+        merged = heapq.merge(*[c for c in per_segment if c])
+        return self._filter(merged, deleted)
+
+    @staticmethod
+    def _filter(ordinals: Iterator[int], deleted: FrozenSet[int]) -> Iterator[int]:
+        previous = None
+        for ordinal in ordinals:
+            # A re-added ordinal can have postings in two segments
+            if ordinal != previous and ordinal not in deleted:
+                yield ordinal
+            previous = ordinal
+
+    # --- Background flush and merge ---
+    def _ensure_worker(self) -> None:
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _merge_candidates(self) -> Optional[List[Segment]]:
+        by_tier: Dict[int, List[Segment]] = {}
+        for segment in self._segments:
+            by_tier.setdefault(segment.tier, []).append(segment)
+        for tier in sorted(by_tier):
+            if len(by_tier[tier]) >= self.merge_factor:
+                return by_tier[tier][:self.merge_factor]
+        return None
+
+    def _run(self) -> None:
+        while True:
+            with self._work:
+                while (not self._closed and not self._frozen and not self._compact_requested
+                       and self._merge_candidates() is None):
+                    self._busy = False
+                    self._work.notify_all()
+                    self._work.wait()
+                if self._closed:
+                    self._busy = False
+                    self._work.notify_all()
+                    return
+                self._busy = True
+                if self._compact_requested and not self._frozen and self._memtable.doc_count:
+                    # Flush the buffer first so its tombstones can be purged too
+                    self._frozen += (self._memtable,)
+                    self._memtable = MemTable()
+                table = self._frozen[0] if self._frozen else None
+                compact = table is None and self._compact_requested
+                if compact:
+                    self._compact_requested = False
+                    to_merge = list(self._segments)
+                    deleted = self._deleted
+                    # Ordinals still buffered may carry tombstones that this pass cannot purge
+                    buffered = set(self._memtable.ordinals)
+                    drop = deleted
+                else:
+                    to_merge = None if table is not None else self._merge_candidates()
+                    drop = self._deleted
+
+            if table is not None:
+                started = time.perf_counter()
+                segment = Segment(table.postings, table.ordinals)
+                with self._lock:
+                    self._segments += (segment,)
+                    self._frozen = self._frozen[1:]
+                    self.flushes += 1
+                    self.flush_seconds += time.perf_counter() - started
+                continue
+
+            if compact and not to_merge:
+                continue
+            started = time.perf_counter()
+            tier = max(s.tier for s in to_merge) if compact else to_merge[0].tier + 1
+            merged = Segment.merge(to_merge, tier, drop)
+            with self._lock:
+                # Only this thread removes segments, so the inputs are all still present
+                self._segments = tuple(s for s in self._segments if not any(s is m for m in to_merge)) + (merged,)
+                if compact:
+                    # Every segment present at the start was rewritten; segments
+                    # published since then were built from already-live documents.
+                    self._deleted = self._deleted - (deleted - buffered)
+                    self.compactions += 1
+                else:
+                    self.merges += 1
+                self.merge_seconds += time.perf_counter() - started
+            logger.debug("Merged %s segments into a tier %s segment of %s documents",
+                         len(to_merge), merged.tier, merged.doc_count)
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until no flush or merge is pending. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._work:
+            while (self._busy or self._frozen or self._compact_requested
+                   or (self._merge_candidates() is not None and self._thread is not None)):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._work.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0) -> None:
+        with self._work:
+            self._closed = True
+            self._work.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tiers: Dict[int, int] = {}
+            for segment in self._segments:
+                tiers[segment.tier] = tiers.get(segment.tier, 0) + 1
+            return {
+                "segments": len(self._segments), "segments_per_tier": tiers,
+                "buffered_documents": self._memtable.doc_count, "pending_flushes": len(self._frozen),
+                "indexed_documents": self._memtable.doc_count + sum(t.doc_count for t in self._frozen)
+                                     + sum(s.doc_count for s in self._segments),
+                "tombstones": len(self._deleted),
+                "flushes": self.flushes, "merges": self.merges, "compactions": self.compactions,
+                "flush_seconds": round(self.flush_seconds, 6), "merge_seconds": round(self.merge_seconds, 6),
+            }
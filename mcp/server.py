@@ -10,15 +10,41 @@ MCP服务器实现 - 骨架代码，开发中
 import logging
 import sys
 import json
-from typing import Any, Dict, List, Optional, Type
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import threading
+import time
+import asyncio
+import concurrent.futures
 import functools # For functools.partial
+import itertools
 import urllib.parse # For parsing URL in handler
 import os # Added for path operations
 import base64 # For decoding file content
+import math
 import binascii # For Base64 error handling
 
+from .body_store import DEFAULT_CACHE_BYTES, BodyTier
+from .document import Document
+from .document_store import DocumentStore
+from .federation import DEFAULT_PEER_TIMEOUT, FederatedSearch, merge_ranked
+from .search_index import SearchIndex, document_matches
+from .sharding import ShardedSearch, ShardError
+from .ingest_queue import IngestJobQueue
+from .tool_cache import CachePolicy, CachedResult, ToolResultCache
+from .tool_runtime import (CHECK_INTERVAL, ToolCancelledError, ToolContext, ToolRuntime, ToolTimeoutError,
+                           accepts_context, new_request_id)
+from .replication import HEARTBEAT_INTERVAL, ChangeLog, ReplicaFollower
+from .rate_limit import RateLimiter
+from .metrics import COUNTER, GAUGE, MetricsRegistry
+from .profiling import Profiler
+from .http_support import (COMPRESS_MIN_BYTES, STATIC_MAX_AGE, CompressingWriter, StaticAssets, compress,
+                           negotiate_encoding)
+from .sse import EventBuffer, KeepaliveScheduler, SseSubscriber
+from .structured_log import Redacted, dropped_records, log_event, redact
+from .persistence import DURABILITY_ENQUEUE, DURABILITY_FSYNC, DURABILITY_MODES, GroupCommitWriter, atomic_write_json, atomic_write_json_array
+from .snapshot import SnapshotError, SnapshotReader, SnapshotWriter, open_snapshot, write_snapshot
+
 # 日志配置
 logger = logging.getLogger(__name__)
 
@@ -26,10 +52,81 @@ logger = logging.getLogger(__name__)
 # Define SSE_PATH and COMMAND_PATH for clarity
 SSE_PATH = "/mcp_sse"
 COMMAND_PATH = "/mcp_command"
+CHANGES_PATH = "/mcp_changes"  # SSE stream of store changes, followed by read replicas
+METRICS_PATH = "/metrics"  # Prometheus text format
+# Carries the SSE session id; commands sent with it are cancelled when that stream closes
+SESSION_HEADER = "Mcp-Session-Id"
+
+# Tools whose SSE and stdio executions go through the persistent ingest job queue
+INGEST_QUEUE_TOOLS = ("add_document_from_file",)
+# Document field naming the ingest job that added it, so a re-run job does not add it twice
+INGEST_JOB_FIELD = "ingest_job_id"
+# Tools that change the document store (run by the writer process in pre-fork mode)
+MUTATING_TOOLS = ("add_document_to_store", "add_document_from_file", "update_document", "delete_document")
+
+# Schema for the optional "durability" parameter of mutating tools
+DURABILITY_SCHEMA = {
+    "type": "string", "enum": list(DURABILITY_MODES), "default": DURABILITY_FSYNC,
+    "description": "'fsync' returns after the change is on disk; 'enqueue' returns once the write is queued."
+}
+
+# Virtual resource namespace resolved on demand from the document store
+DOCUMENT_RESOURCE_PREFIX = "mcp://resources/documents/"
+# Number of resources listed per page (capabilities carry the first page)
+RESOURCE_PAGE_SIZE = 50
+# document_search results are cached until the store changes; the TTL bounds
+# how long federated results can miss changes made on peer nodes
+SEARCH_CACHE_TTL = 10.0  # seconds
+# Compact the store and search index once this many deletes have been committed since the last compaction
+COMPACTION_TOMBSTONES = 128
+# Rate limiter tokens taken by each /mcp_command command; execute_tool costs
+# the tool's registered cost, and unknown commands cost 1
+COMMAND_COSTS = {
+    "get_resource": 1.0, "get_prompt_definition": 0.5, "execute_prompt": 1.0, "list_resources": 1.0,
+    "get_ingest_status": 0.25, "list_ingest_jobs": 0.5, "replication_status": 0.25, "rate_limit_status": 0.25,
+    "stats": 0.25, "cancel": 0.0,
+    "profile_start": 0.25, "profile_stop": 0.25, "profile_report": 1.0, "memory_start": 1.0, "memory_snapshot": 5.0,
+    "memory_stop": 0.25,
+}
+# Admin commands that profile tool calls and trace allocations (see mcp.profiling)
+PROFILE_COMMANDS = ("profile_start", "profile_stop", "profile_report", "memory_start", "memory_snapshot", "memory_stop")
+# Seconds a persistent connection may stay idle between requests
+IDLE_CONNECTION_TIMEOUT = 30.0
+# Commands reported under their own name in the metrics (others as "unknown")
+KNOWN_COMMANDS = frozenset(COMMAND_COSTS) | {"execute_tool"}
+TIMEOUT_ERROR = "'timeout' must be a positive number of seconds"
+
+
+def _valid_timeout(timeout: Any) -> bool:
+    """True if a command's ``timeout`` field is absent or a finite number of seconds above zero."""
+    if timeout is None:
+        return True
+    return not isinstance(timeout, bool) and isinstance(timeout, (int, float)) and 0 < timeout < math.inf
+
+
+class _McpHttpServer(ThreadingHTTPServer):
+    """One thread per connection, so a long-lived SSE stream does not block commands."""
+
+    daemon_threads = True
+    # listen() backlog; the default of 5 makes bursts of new SSE subscribers wait for SYN retransmits
+    request_queue_size = 1024
+
+    def __init__(self, server_address, handler_class, reuse_port: bool = False):
+        # Pre-fork workers bind the same port; the kernel balances connections between them
+        self.allow_reuse_port = reuse_port
+        super().__init__(server_address, handler_class)
 
 
 class _McpSseHandler(BaseHTTPRequestHandler):
-    """Handles HTTP requests for MCP SSE transport."""
+    """Handles HTTP requests for MCP SSE transport.
+
+    HTTP/1.1, so a client can send many commands over one connection; every
+    response that is not an event stream carries a Content-Length.
+    """
+
+    protocol_version = "HTTP/1.1"
+    timeout = IDLE_CONNECTION_TIMEOUT  # Closes connections left idle between requests
+    _post_started: Optional[float] = None  # Set while a POST is in progress and not yet recorded
 
     def __init__(self, mcp_server_instance: 'McpServer', *args, **kwargs):
         self.mcp_server = mcp_server_instance
@@ -38,117 +135,207 @@ class _McpSseHandler(BaseHTTPRequestHandler):
     def do_GET(self):
         """Handles GET requests, for SSE connections and serving index.html."""
         if self.path == SSE_PATH:
+            # Commands posted with this session id are cancelled when the stream closes
+            session_id = new_request_id()
+            encoding = self._accepted_encoding() if self.mcp_server.compress_streams else None
             self.send_response(200)
             self.send_header('Content-Type', 'text/event-stream')
             self.send_header('Cache-Control', 'no-cache')
             self.send_header('Connection', 'keep-alive')
+            self.send_header(SESSION_HEADER, session_id)
+            if encoding is not None:
+                self.send_header('Content-Encoding', encoding)
             self.end_headers()
 
-            logger.info(f"SSE client connected: {self.client_address}")
-            self.mcp_server.sse_clients.append(self.wfile)
+            logger.info("SSE client connected: %s (session %s)", self.client_address, session_id)
+            # Events are queued per client from here on; a client that stops reading delays only itself
+            subscriber = SseSubscriber(self.connection, session_id, encoding)
+            last_event_id = self.headers.get('Last-Event-ID')
+            missed, send_capabilities, position = self.mcp_server.attach_sse_subscriber(subscriber, last_event_id)
+            self.mcp_server.sse_sessions.add(session_id)
 
             try:
-                # Send initial capabilities
-                logger.debug(f"SSE client {self.client_address}: Sending capabilities.")
-                capabilities = {
-                    "mcp_protocol_version": "1.0",
-                    "server_name": self.mcp_server.name,
-                    "server_version": self.mcp_server.version,
-                    "tools": [
-                        {"name": t_name, "description": t_info.get("description"), "schema": t_info.get("schema")}
-                        for t_name, t_info in self.mcp_server.tools.items()
-                    ],
-                    "resources": [ # Exclude 'content' from capabilities
-                        {k: v for k, v in res_info.items() if k != 'content'}
-                        for res_info in self.mcp_server.resources.values()
-                    ],
-                    "prompts": [prompt_info for prompt_info in self.mcp_server.prompts.values()]
-                }
-                capabilities_json = json.dumps(capabilities)
-                self.wfile.write(f"event: capabilities\ndata: {capabilities_json}\n\n".encode('utf-8'))
-                self.wfile.flush()
-                logger.debug(f"SSE client {self.client_address}: Capabilities sent.")
-
-                # Keep the connection alive and send periodic keep-alive comments
-                keep_alive_interval = 15 # seconds
-                while self.mcp_server.running:
-                    if self.wfile.closed:
-                        logger.info(f"SSE client stream closed for {self.client_address} (detected by wfile.closed).")
-                        break
-                    try:
-                        logger.debug(f"SSE client {self.client_address}: Sending keepalive.")
-                        self.wfile.write(": keepalive\n\n".encode('utf-8'))
-                        self.wfile.flush()
-                    except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError) as e:
-                        logger.info(f"SSE client {self.client_address} disconnected during keepalive: {type(e).__name__}.")
-                        break # Client disconnected
-                    except Exception as e:
-                        logger.error(f"Error sending keepalive to SSE client {self.client_address}: {e}", exc_info=True)
-                        break # Unknown error, terminate connection handler for safety
-
-                    # Wait for the next keep-alive or until server stops
-                    for _ in range(int(keep_alive_interval / 0.5)): 
-                        if not self.mcp_server.running: break
-                        threading.Event().wait(0.5)
-                    if not self.mcp_server.running:
-                         logger.info(f"SSE client {self.client_address}: Server stopping, closing connection handler.")
-                         break
-                
+                # Capabilities, unless a resuming client's are still current, then the missed events
+                session = {'session_id': session_id}
+                if last_event_id is not None:
+                    session.update(resumed=missed is not None, replayed=len(missed or ()))
+                    logger.info("SSE client %s resumed after %r: %s missed events", self.client_address, last_event_id,
+                                len(missed) if missed is not None else 'cannot replay')
+                parts = []
+                if send_capabilities:
+                    logger.debug("SSE client %s: Sending capabilities.", self.client_address)
+                    parts.append(b"event: capabilities\ndata: " + self.mcp_server.capabilities_json() + b"\n\n")
+                # A new stream starts at the current event; a resumed one keeps its client's last id
+                event_id = f"id: {position}\n" if missed is None else ""
+                parts.append(f"{event_id}event: session\ndata: {json.dumps(session)}\n\n".encode('utf-8'))
+                parts.extend(missed or ())
+                sent = subscriber.release(b"".join(parts))
+                self.mcp_server.sse_bytes_sent.inc(("events",), sent)
+
+                # Events are written by the broadcasting threads and keepalives by the
+                # scheduler; this thread only waits for the stream to end
+                self.mcp_server.sse_keepalive.add(subscriber)
+                subscriber.wait()
+                if subscriber.too_slow:
+                    self.mcp_server.sse_slow_clients.inc()
+                    logger.info("SSE client %s dropped: it stopped reading its stream.", self.client_address)
+                elif subscriber.disconnected:
+                    logger.info("SSE client %s closed the connection.", self.client_address)
+                else:
+                    logger.info("SSE client %s: Server stopping, closing connection handler.", self.client_address)
+
             except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
-                logger.info(f"SSE client disconnected (pipe error): {self.client_address}")
+                logger.info("SSE client disconnected (pipe error): %s", self.client_address)
             except Exception as e:
-                logger.error(f"Error in SSE connection for {self.client_address}: {e}", exc_info=True)
+                logger.error("Error in SSE connection for %s: %s", self.client_address, e, exc_info=True)
             finally:
-                if self.wfile in self.mcp_server.sse_clients:
-                    self.mcp_server.sse_clients.remove(self.wfile)
-                logger.info(f"SSE client connection closed: {self.client_address}")
+                self.mcp_server.sse_keepalive.remove(subscriber)
+                if subscriber in self.mcp_server.sse_clients:
+                    self.mcp_server.sse_clients.remove(subscriber)
+                self.mcp_server.sse_sessions.discard(session_id)
+                self.mcp_server.cancel_session(session_id)
+                self.close_connection = True  # The stream is over; do not wait for another request on it
+                logger.info("SSE client connection closed: %s", self.client_address)
         
-        elif self.path == '/' or self.path == '/index.html':
+        elif urllib.parse.urlsplit(self.path).path == CHANGES_PATH:
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            since = query["since"][0] if "since" in query else None
+            encoding = self._accepted_encoding() if self.mcp_server.compress_streams else None
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            if encoding is not None:
+                self.send_header('Content-Encoding', encoding)
+            self.end_headers()
+            logger.info("Change stream client connected: %s (since=%s)", self.client_address, since)
+            self.mcp_server.change_subscribers.inc()
             try:
-                script_dir = os.path.dirname(os.path.abspath(__file__)) 
-                file_path = os.path.join(script_dir, '..', 'web', 'index.html') 
-                
-                if not os.path.exists(file_path):
-                    self.send_error(404, "File Not Found: index.html")
-                    logger.warning(f"index.html not found at expected path: {file_path}")
-                    return
+                self.mcp_server.stream_changes(CompressingWriter(self.wfile, encoding) if encoding else self.wfile, since)
+            except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+                logger.info("Change stream client disconnected: %s", self.client_address)
+            finally:
+                self.mcp_server.change_subscribers.dec()
+                self.close_connection = True  # The stream has no length; it ends with the connection
 
-                self.send_response(200)
-                self.send_header('Content-type', 'text/html')
-                self.end_headers()
-                with open(file_path, 'rb') as f:
-                    self.wfile.write(f.read())
-                logger.info(f"Served index.html to {self.client_address}")
-            except Exception as e:
-                self.send_error(500, f"Server error serving index.html: {str(e)}")
-                logger.error(f"Error serving index.html: {e}", exc_info=True)
+        elif self.path == METRICS_PATH:
+            body = self.mcp_server.metrics.render_prometheus().encode('utf-8')
+            self._send_body(200, body, 'text/plain; version=0.0.4; charset=utf-8')
+
+        elif self.path == '/' or self.path == '/index.html':
+            self._send_static('index.html', 'text/html; charset=utf-8')
         elif self.path == '/script.js':
-            try:
-                script_dir = os.path.dirname(os.path.abspath(__file__))
-                file_path = os.path.join(script_dir, '..', 'web', 'script.js')
-                if not os.path.exists(file_path):
-                    self.send_error(404, "File Not Found: script.js")
-                    logger.warning(f"script.js not found at expected path: {file_path}")
-                    return
-                self.send_response(200)
-                self.send_header('Content-type', 'application/javascript')
-                self.end_headers()
-                with open(file_path, 'rb') as f:
-                    self.wfile.write(f.read())
-                logger.info(f"Served script.js to {self.client_address}")
-            except Exception as e:
-                self.send_error(500, f"Server error serving script.js: {str(e)}")
-                logger.error(f"Error serving script.js: {e}", exc_info=True)
+            self._send_static('script.js', 'application/javascript; charset=utf-8')
         else:
             self.send_error(404, 'File Not Found or Invalid Endpoint')
 
+    def _admit(self, request_data: dict) -> bool:
+        """Charges the command to the client's rate limit; answers 429 and returns False when over it."""
+        limiter = self.mcp_server.rate_limiter
+        if limiter is None:
+            return True
+        # Live SSE sessions are limited on their own; anything else by address, so made-up ids do not help
+        session_id = request_data.get("session_id") or self.headers.get(SESSION_HEADER)
+        client = f"session:{session_id}" if session_id in self.mcp_server.sse_sessions else self.client_address[0]
+        # The normalised label, so made-up command names cannot grow the per-command counters
+        command = self._command_label
+        retry_after = limiter.acquire(client, self.mcp_server.command_cost(request_data), command)
+        if retry_after is None:
+            return True
+        logger.debug("Rate limited %s from %s; retry after %.2fs", command, client, retry_after)
+        self._send_json(429, {"error": "Rate limit exceeded", "retry_after": round(retry_after, 3)},
+                        {'Retry-After': str(max(1, math.ceil(retry_after)))})
+        return False
+
+    def _accepted_encoding(self) -> Optional[str]:
+        return negotiate_encoding(self.headers.get('Accept-Encoding'))
+
+    def _send_body(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        """Sends a complete response with its Content-Length, compressed if it is large and the client accepts it."""
+        compressible = len(body) >= COMPRESS_MIN_BYTES
+        encoding = self._accepted_encoding() if compressible else None
+        if encoding is not None:
+            body = compress(body, encoding)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        if compressible:
+            self.send_header('Vary', 'Accept-Encoding')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        # A keep-alive client has the response once the body is written, so it must already be counted
+        self._record_post()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        """Sends ``body`` (JSON-encoded bytes, or a value to encode) as a JSON response."""
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self._send_body(status, body, 'application/json', headers)
+
+    def _send_static(self, name: str, content_type: str) -> None:
+        """Serves a web UI file from the in-memory cache, answering 304 when the client's copy is current."""
+        asset = self.mcp_server.static_assets.get(name, content_type)
+        if asset is None:
+            self.send_error(404, f"File Not Found: {name}")
+            logger.warning("%s not found in %s", name, self.mcp_server.static_assets.directory)
+            return
+        cache_headers = {'ETag': asset.etag, 'Cache-Control': f'public, max-age={STATIC_MAX_AGE}'}
+        if asset.matches(self.headers.get('If-None-Match')):
+            self.send_response(304)
+            for header, value in cache_headers.items():
+                self.send_header(header, value)
+            self.end_headers()
+            return
+        body, encoding = asset.body, None
+        if asset.gzip_body is not None and self._accepted_encoding() == "gzip":
+            body, encoding = asset.gzip_body, "gzip"
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        if asset.gzip_body is not None:
+            self.send_header('Vary', 'Accept-Encoding')
+        for header, value in cache_headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+        logger.info("Served %s to %s", name, self.client_address)
+
+    def send_response(self, code: int, message: Optional[str] = None) -> None:
+        self._response_status = code  # Reported in the command metrics
+        super().send_response(code, message)
+
     def do_POST(self):
+        self._command_label = "unknown"
+        self._response_status = None
+        self.mcp_server.requests_in_flight.inc(("sse",))
+        self._post_started = time.perf_counter()
+        try:
+            self._handle_post()
+        finally:
+            self._record_post()
+
+    def _record_post(self) -> None:
+        """Records the POST in the request metrics, once."""
+        if self._post_started is None:
+            return
+        server = self.mcp_server
+        server.requests_in_flight.dec(("sse",))
+        server.request_latency.observe(time.perf_counter() - self._post_started, ("sse", self._command_label))
+        server.responses.inc(("sse", self._command_label, str(self._response_status)))
+        self._post_started = None
+
+    def _handle_post(self):
         if self.path == COMMAND_PATH:
             content_length_str = self.headers.get('Content-Length')
             if not content_length_str:
-                logger.warning(f"POST request from {self.client_address} to {self.path} missing Content-Length.")
-                self.send_response(411); self.send_header('Content-Type', 'application/json'); self.end_headers()
-                self.wfile.write(json.dumps({"error": "Content-Length required"}).encode('utf-8'))
+                logger.warning("POST request from %s to %s missing Content-Length.", self.client_address, self.path)
+                self.close_connection = True  # The body cannot be told apart from a next request
+                self._send_json(411, {"error": "Content-Length required"})
                 return
 
             content_length = int(content_length_str)
@@ -156,66 +343,110 @@ class _McpSseHandler(BaseHTTPRequestHandler):
             
             try:
                 request_data = json.loads(post_data_bytes.decode('utf-8'))
-                logger.info(f"Received POST on {COMMAND_PATH} from {self.client_address} with JSON data: {request_data}")
+                log_event(logger, logging.INFO, "command_received", sample=True, client=self.client_address[0],
+                          command=request_data.get("command") if isinstance(request_data, dict) else None,
+                          request=Redacted(request_data))
             except json.JSONDecodeError:
-                logger.warning(f"Invalid JSON received in POST from {self.client_address} to {self.path}: {post_data_bytes.decode('utf-8')[:200]}")
-                self.send_response(400); self.send_header('Content-Type', 'application/json'); self.end_headers()
-                self.wfile.write(json.dumps({"error": "Invalid JSON"}).encode('utf-8'))
+                log_event(logger, logging.WARNING, "invalid_json", client=self.client_address[0], path=self.path,
+                          body=Redacted(post_data_bytes[:200].decode('utf-8', 'replace')))
+                self._send_json(400, {"error": "Invalid JSON"})
                 return
 
             command = request_data.get("command")
+            self._command_label = command if command in KNOWN_COMMANDS else "unknown"
+            if not self._admit(request_data):
+                return
+
             response_sent = False 
             
             if command == "execute_tool":
                 tool_name = request_data.get("tool_name")
                 if not tool_name:
-                    self.send_response(400); self.send_header('Content-Type', 'application/json'); self.end_headers()
-                    self.wfile.write(json.dumps({"error": "Missing 'tool_name' for execute_tool command"}).encode('utf-8'))
+                    self._send_json(400, {"error": "Missing 'tool_name' for execute_tool command"})
                     return
                 tool_params = request_data.get("tool_params", {})
-                threading.Thread(target=self.mcp_server.execute_tool_command, args=(tool_name, tool_params), daemon=True).start()
-                self.send_response(202); self.send_header('Content-Type', 'application/json'); self.end_headers()
-                self.wfile.write(json.dumps({"status": "accepted", "message": f"Tool '{tool_name}' execution initiated."}).encode('utf-8'))
+                timeout = request_data.get("timeout")
+                if not _valid_timeout(timeout):
+                    self._send_json(400, {"error": TIMEOUT_ERROR})
+                    return
+                request_id = request_data.get("request_id")
+                session_id = request_data.get("session_id") or self.headers.get(SESSION_HEADER)
+                if request_data.get("wait"):
+                    # Synchronous call (used by federation peers): the result is the HTTP response, not an SSE event
+                    response_data, response_bytes = self.mcp_server.execute_tool_encoded(
+                        tool_name, tool_params, timeout, request_id, session_id)
+                    http_status = 200 if response_data["status"] == "success" else 404 if "not found" in response_data["error"] else 500
+                    self._send_json(http_status, response_bytes)
+                    return
+                if tool_name in INGEST_QUEUE_TOOLS and tool_name in self.mcp_server.tools and self.mcp_server.replica is None:
+                    job = self.mcp_server.submit_ingest_job(tool_name, tool_params)
+                    self._send_json(202, {"status": "accepted", "message": f"Tool '{tool_name}' queued for ingestion.", "job_id": job["job_id"]})
+                    return
+                request_id = request_id or new_request_id()
+                try:
+                    self.mcp_server.submit_tool_command(tool_name, tool_params, timeout, request_id, session_id)
+                except ValueError as e:
+                    self._send_json(409, {"error": str(e)})
+                    return
+                self._send_json(202, {"status": "accepted", "message": f"Tool '{tool_name}' execution initiated.",
+                                      "request_id": request_id})
                 response_sent = True
 
             elif command == "get_resource":
                 resource_uri = request_data.get("uri")
                 if not resource_uri:
-                    self.send_response(400); self.send_header('Content-Type', 'application/json'); self.end_headers()
-                    self.wfile.write(json.dumps({"error": "Missing 'uri' for get_resource command"}).encode('utf-8'))
+                    self._send_json(400, {"error": "Missing 'uri' for get_resource command"})
                     return
                 threading.Thread(target=self.mcp_server.get_resource_command, args=(resource_uri,), daemon=True).start()
-                self.send_response(202); self.send_header('Content-Type', 'application/json'); self.end_headers()
-                self.wfile.write(json.dumps({"status": "accepted", "message": "Get resource request initiated."}).encode('utf-8'))
+                self._send_json(202, {"status": "accepted", "message": "Get resource request initiated."})
                 response_sent = True
             
             elif command == "get_prompt_definition":
                 prompt_name = request_data.get("name")
                 if not prompt_name:
-                    self.send_response(400); self.send_header('Content-Type', 'application/json'); self.end_headers()
-                    self.wfile.write(json.dumps({"error": "Missing name for get_prompt_definition command"}).encode('utf-8'))
+                    self._send_json(400, {"error": "Missing name for get_prompt_definition command"})
                     return
                 threading.Thread(target=self.mcp_server.get_prompt_definition_command, args=(prompt_name,), daemon=True).start()
-                self.send_response(202); self.send_header('Content-Type', 'application/json'); self.end_headers()
-                self.wfile.write(json.dumps({"status": "accepted", "message": "Get prompt definition request initiated."}).encode('utf-8'))
+                self._send_json(202, {"status": "accepted", "message": "Get prompt definition request initiated."})
                 response_sent = True
 
             elif command == "execute_prompt":
                 prompt_name = request_data.get("name")
                 prompt_args = request_data.get("arguments", {})
                 if not prompt_name:
-                    self.send_response(400); self.send_header('Content-Type', 'application/json'); self.end_headers()
-                    self.wfile.write(json.dumps({"error": "Missing name for execute_prompt command"}).encode('utf-8'))
+                    self._send_json(400, {"error": "Missing name for execute_prompt command"})
                     return
                 threading.Thread(target=self.mcp_server.execute_prompt_command, args=(prompt_name, prompt_args), daemon=True).start()
-                self.send_response(202); self.send_header('Content-Type', 'application/json'); self.end_headers()
-                self.wfile.write(json.dumps({"status": "accepted", "message": f"Prompt '{prompt_name}' execution initiated."}).encode('utf-8'))
+                self._send_json(202, {"status": "accepted", "message": f"Prompt '{prompt_name}' execution initiated."})
+                response_sent = True
+
+            elif command in ("get_ingest_status", "list_ingest_jobs", "list_resources", "replication_status", "cancel",
+                             "rate_limit_status", "stats") + PROFILE_COMMANDS:
+                # Status lookups and listings are cheap reads, answered directly so clients can poll without an SSE stream
+                if command == "get_ingest_status":
+                    response_data = self.mcp_server.get_ingest_status(request_data.get("job_id"))
+                elif command == "list_resources":
+                    response_data = self.mcp_server.list_resources(request_data.get("cursor"), request_data.get("limit", RESOURCE_PAGE_SIZE))
+                elif command == "replication_status":
+                    response_data = self.mcp_server.replication_status()
+                elif command == "cancel":
+                    response_data = self.mcp_server.cancel_request(request_data.get("request_id"))
+                elif command == "rate_limit_status":
+                    response_data = self.mcp_server.rate_limit_status()
+                elif command == "stats":
+                    response_data = self.mcp_server.stats()
+                elif command in PROFILE_COMMANDS:
+                    response_data = self.mcp_server.profile_command(command, request_data)
+                else:
+                    response_data = self.mcp_server.list_ingest_jobs(
+                        request_data.get("status"), request_data.get("limit", 50), request_data.get("offset", 0))
+                http_status = 200 if response_data.get("status") == "success" else 404 if "not found" in response_data.get("error", "") else 400
+                self._send_json(http_status, response_data)
                 response_sent = True
 
             if not response_sent: 
-                logger.warning(f"Unknown command '{command}' received in POST from {self.client_address}.")
-                self.send_response(400); self.send_header('Content-Type', 'application/json'); self.end_headers()
-                self.wfile.write(json.dumps({"error": "Unknown command"}).encode('utf-8'))
+                logger.warning("Unknown command '%s' received in POST from %s.", command, self.client_address)
+                self._send_json(400, {"error": "Unknown command"})
         else:
             self.send_error(404, "Not Found")
 
@@ -225,13 +456,18 @@ class _McpSseHandler(BaseHTTPRequestHandler):
            "GET / HTTP" in format or \
            "GET /index.html HTTP" in format or \
            "GET /script.js HTTP" in format:
-             logger.info(f"HTTP: {self.address_string()} - {format % args}")
+             logger.info("HTTP: %s - " + format, self.address_string(), *args)
         else:
-             logger.debug(f"HTTP: {self.address_string()} - {format % args}")
+             logger.debug("HTTP: %s - " + format, self.address_string(), *args)
 
 
 class McpServer:
-    def __init__(self, name: str, version: str):
+    def __init__(self, name: str, version: str, document_store_file: str = "documents.json",
+                 ingest_workers: int = 2, compress_abstracts_over: Optional[int] = None,
+                 body_cache_bytes: Optional[int] = DEFAULT_CACHE_BYTES, search_shards: int = 0,
+                 federation_peers: Optional[List[Any]] = None, federation_timeout: float = DEFAULT_PEER_TIMEOUT,
+                 replicate_from: Optional[str] = None, rate_limit: Optional[float] = None,
+                 rate_limit_burst: Optional[float] = None, compress_streams: bool = True):
         self.name = name
         self.version = version
         self.tools = {}
@@ -239,13 +475,33 @@ class McpServer:
         self.prompts = {}
         self.running = False 
         self.sse_clients = [] 
+        self.sse_sessions = set()  # Session ids of the open SSE streams
+        # Numbered recent events, replayed to clients that reconnect with Last-Event-ID
+        self.sse_events = EventBuffer()
+        # Orders buffering a broadcast event against subscribers attaching and reading the buffer
+        self._sse_lock = threading.Lock()
+        # Bumped whenever the capabilities document may have changed (see capabilities_json)
+        self._capabilities_version = 0
+        self._capabilities_cache: Tuple[int, Optional[bytes]] = (-1, None)
+        # Last event numbered before the capabilities last changed; clients resuming after it keep theirs
+        self._capabilities_changed_at = -1
+        # Keepalives and disconnect detection for all SSE streams (see mcp.sse)
+        self.sse_keepalive = KeepaliveScheduler(on_sent=lambda n: self.sse_bytes_sent.inc(("events",), n))
+        self._init_metrics()
         self.http_server_thread = None
         self.http_server = None
         self.next_doc_id_counter = 200
-        logger.info(f"创建MCP服务器: {name} v{version}")
+        self._doc_id_lock = threading.Lock()
+        logger.info("创建MCP服务器: %s v%s", name, version)
 
         # Load document store first
-        self.document_store_file = "documents.json"
+        self.document_store_file = document_store_file
+        # Memory-mapped binary image of the JSON store, rewritten on every save
+        self.snapshot_file = os.path.splitext(document_store_file)[0] + ".snapshot"
+        # Abstracts longer than this many characters are kept compressed in memory
+        self.compress_abstracts_over = compress_abstracts_over
+        # Page cache budget for document bodies paged from disk (None keeps bodies in memory)
+        self.body_cache_bytes = body_cache_bytes
         default_documents = [
             {
                 "id": "doc101", "title": "Exploring Artificial Intelligence in Modern Healthcare",
@@ -269,31 +525,72 @@ class McpServer:
             }
         ]
 
-        try:
-            with open(self.document_store_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if not content: # Check for empty file
-                    raise ValueError("File is empty")
-                self.document_store = json.loads(content)
-            logger.info(f"Loaded document store from {self.document_store_file}")
-        except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
-            logger.warning(f"{self.document_store_file} not found, empty, or invalid JSON ({e}). Initializing with default documents and creating/overwriting the file.")
-            self.document_store = default_documents
-            try:
-                with open(self.document_store_file, 'w', encoding='utf-8') as f:
-                    json.dump(self.document_store, f, indent=4)
-                logger.info(f"Saved default document store to {self.document_store_file}")
-            except IOError as ioe:
-                logger.error(f"Could not write initial document store to {self.document_store_file}: {ioe}")
-
-        # Register existing documents from the store as resources
-        if self.document_store: # Ensure document_store is not None or empty
-            logger.info(f"Registering {len(self.document_store)} documents from store as MCP resources...")
-            for doc_idx, doc in enumerate(self.document_store):
-                logger.debug(f"Registering document at index {doc_idx}: {doc.get('id')}")
-                self._register_document_as_resource(doc)
-        else:
-            logger.info("Document store is empty. No documents to register as resources initially.")
+        self.document_store = self._load_document_store(default_documents)
+        # Single background writer; concurrent mutations share one atomic write
+        self.store_writer = GroupCommitWriter(self._write_document_store)
+        # Segmented search index; the loaded documents are indexed in the background
+        self.search_index = SearchIndex()
+        self._compaction_lock = threading.Lock()
+        # Orders store commits with their mutation notifications
+        self._mutation_lock = threading.Lock()
+        # Pre-fork mode (see mcp.prefork): workers forward mutations and ingest
+        # jobs to the writer process, and SSE events are relayed through it to
+        # the clients of every worker
+        self.writer_link = None
+        self.broadcast_relay: Optional[Callable[[str, dict], None]] = None
+        self._mutation_listeners: List[Callable[[str, str, Optional[dict]], None]] = []
+        self.add_mutation_listener(self._broadcast_resource_change)
+        # First, so the change is dated before the event that announces it
+        self.add_mutation_listener(self._capabilities_changed, first=True)
+        # Recent changes, served to read replicas on CHANGES_PATH
+        self.change_log = ChangeLog()
+        self.add_mutation_listener(self.change_log.append)
+        # Shared results cache of the tools registered as cacheable
+        self.tool_cache = ToolResultCache()
+        self.add_mutation_listener(self._invalidate_tool_cache)
+        # Event loop for coroutine tool callbacks and thread pool for SSE tool calls (see mcp.tool_runtime)
+        self.tool_runtime = ToolRuntime()
+        # Calls that can be cancelled by request id (see cancel_request)
+        self._active_calls: Dict[str, ToolContext] = {}
+        self._active_calls_lock = threading.Lock()
+        # Off until profile_start; the dispatch path only reads ``profiler.active``
+        self.profiler = Profiler()
+        self._search_index_ready = threading.Event()
+        self._indexed_store = self.document_store
+        threading.Thread(target=self._build_search_index, args=(self._store_view(), self.search_index),
+                         name="search-index-build", daemon=True).start()
+        # Optional multi-process search over the snapshot (see mcp.sharding)
+        self.sharded_search: Optional[ShardedSearch] = None
+        if search_shards and search_shards > 0:
+            self._start_sharded_search(search_shards)
+        # Coordinator mode: document_search is also sent to these peer nodes (see mcp.federation)
+        self.federation: Optional[FederatedSearch] = None
+        if federation_peers:
+            self.federation = FederatedSearch(federation_peers, COMMAND_PATH, timeout=federation_timeout)
+            logger.info("Federating document_search across %s peer nodes", len(self.federation.peers))
+        # Per-client admission control on COMMAND_PATH: ``rate_limit`` tokens per second (see mcp.rate_limit)
+        self.rate_limiter: Optional[RateLimiter] = None
+        if rate_limit:
+            self.rate_limiter = RateLimiter(rate_limit, rate_limit_burst)
+            logger.info("Rate limiting commands to %s tokens/s per client (burst %s)",
+                        self.rate_limiter.rate, self.rate_limiter.burst)
+        # gzip/deflate event streams for clients that accept it; each event is compressed once per subscriber
+        self.compress_streams = compress_streams
+        # Web UI files, served from memory with ETags (see mcp.http_support)
+        self.static_assets = StaticAssets(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web'))
+        # Read replica mode: the store follows the primary at ``replicate_from`` (see mcp.replication)
+        self.replica: Optional[ReplicaFollower] = None
+
+        # Documents are exposed as resources under DOCUMENT_RESOURCE_PREFIX, resolved on demand
+        logger.info("%s documents available as MCP resources under %s{id}",
+                    len(self.document_store), DOCUMENT_RESOURCE_PREFIX)
+
+        # Persistent background queue for large ingest calls (see INGEST_QUEUE_TOOLS)
+        ingest_db_path = os.path.join(os.path.dirname(os.path.abspath(self.document_store_file)), "ingest_jobs.sqlite3")
+        self.ingest_queue = IngestJobQueue(
+            db_path=ingest_db_path, handler=self._run_ingest_job,
+            num_workers=ingest_workers, on_complete=self._on_ingest_job_complete
+        )
 
         self.register_tool(
             name="echo",
@@ -308,11 +605,14 @@ class McpServer:
                 "type": "object",
                 "properties": {
                     "query": {"type": "string", "description": "The search query."},
-                    "max_results": {"type": "integer", "description": "Maximum number of results to return.", "default": 3}
+                    "max_results": {"type": "integer", "description": "Maximum number of results to return.", "default": 3},
+                    "local_only": {"type": "boolean", "description": "Search only this node, not its federation peers.", "default": False}
                 },
                 "required": ["query"]
             },
-            callback=self._execute_document_search_impl 
+            callback=self._execute_document_search_impl,
+            cacheable=True, cache_ttl=SEARCH_CACHE_TTL, cache_max_entries=512, cache_key=self._search_cache_key,
+            cost=2.0
         )
         self.register_tool(
             name="add_document_to_store",
@@ -321,11 +621,13 @@ class McpServer:
                 "type": "object",
                 "properties": {
                     "document_text": {"type": "string", "description": "The full text content of the document."},
-                    "keywords": {"type": "string", "description": "Optional comma-separated list of keywords."}
+                    "keywords": {"type": "string", "description": "Optional comma-separated list of keywords."},
+                    "durability": DURABILITY_SCHEMA
                 },
                 "required": ["document_text"]
             },
-            callback=self._execute_add_document_to_store_impl
+            callback=self._execute_add_document_to_store_impl,
+            cost=5.0
         )
         self.register_tool(
             name="add_document_from_file",
@@ -344,11 +646,44 @@ class McpServer:
                     "keywords": {
                         "type": "string",
                         "description": "Optional comma-separated list of keywords."
-                    }
+                    },
+                    "durability": DURABILITY_SCHEMA
                 },
                 "required": ["file_content_base64", "filename"]
             },
-            callback=self._execute_add_document_from_file_impl
+            callback=self._execute_add_document_from_file_impl,
+            cost=10.0
+        )
+        self.register_tool(
+            name="update_document",
+            description="Updates the title, abstract and/or keywords of a stored document. Its resource URI stays the same.",
+            schema={
+                "type": "object",
+                "properties": {
+                    "document_id": {"type": "string", "description": "ID of the document to update (e.g., \"doc101\")."},
+                    "title": {"type": "string", "description": "New title."},
+                    "abstract": {"type": "string", "description": "New abstract / full text."},
+                    "keywords": {"type": "string", "description": "New comma-separated list of keywords (replaces the old list)."},
+                    "durability": DURABILITY_SCHEMA
+                },
+                "required": ["document_id"]
+            },
+            callback=self._execute_update_document_impl,
+            cost=5.0
+        )
+        self.register_tool(
+            name="delete_document",
+            description="Deletes a document from the store and the search index, and removes its resource.",
+            schema={
+                "type": "object",
+                "properties": {
+                    "document_id": {"type": "string", "description": "ID of the document to delete."},
+                    "durability": DURABILITY_SCHEMA
+                },
+                "required": ["document_id"]
+            },
+            callback=self._execute_delete_document_impl,
+            cost=2.0
         )
         self.register_resource(
             uri="mcp://resources/literature/doc123",
@@ -373,10 +708,130 @@ class McpServer:
                 }
             ]
         )
+        if replicate_from:
+            self._start_replica(replicate_from)
     
-    def register_tool(self, name: str, description: str, schema: Dict[str, Any], callback: callable) -> None:
-        self.tools[name] = {'name': name, 'description': description, 'schema': schema, 'callback': callback}
-        logger.info(f"注册MCP工具: {name}")
+    def _init_metrics(self) -> None:
+        """Creates the server's metrics, served on METRICS_PATH and by the ``stats`` command."""
+        self.metrics = MetricsRegistry()
+        self.request_latency = self.metrics.histogram(
+            "mcp_request_duration_seconds", "Time to answer a command, by transport and command.", ("transport", "command"))
+        self.responses = self.metrics.counter(
+            "mcp_responses_total", "Commands answered, by transport, command and status.", ("transport", "command", "status"))
+        self.requests_in_flight = self.metrics.gauge(
+            "mcp_requests_in_flight", "Commands being answered.", ("transport",))
+        self.tool_latency = self.metrics.histogram(
+            "mcp_tool_duration_seconds", "Tool call duration, by tool and status.", ("tool", "status"))
+        self.tools_in_flight = self.metrics.gauge("mcp_tool_calls_in_flight", "Tool calls running.", ("tool",))
+        self.resource_latency = self.metrics.histogram(
+            "mcp_resource_duration_seconds", "Resource lookup duration, by outcome.", ("outcome",))
+        self.prompt_latency = self.metrics.histogram(
+            "mcp_prompt_duration_seconds", "Prompt execution duration, by prompt.", ("prompt",))
+        self.sse_bytes_sent = self.metrics.counter(
+            "mcp_sse_bytes_sent_total", "Bytes written to SSE streams, by stream.", ("stream",))
+        self.sse_resumes = self.metrics.counter(
+            "mcp_sse_resumes_total", "SSE reconnects with Last-Event-ID, by outcome.", ("outcome",))
+        self.sse_slow_clients = self.metrics.counter(
+            "mcp_sse_slow_clients_dropped_total", "SSE clients dropped for not reading their stream.")
+        self.change_subscribers = self.metrics.gauge(
+            "mcp_change_stream_subscribers", f"Clients following {CHANGES_PATH}.")
+        self.metrics.register_collector(self._collect_state_metrics)
+
+    def _collect_state_metrics(self):
+        """Scrape-time values: connected clients, queue depths, caches and the rate limiter."""
+        yield "mcp_sse_subscribers", GAUGE, "Open SSE event streams.", (), {(): len(self.sse_clients)}
+        keepalive = self.sse_keepalive.stats()
+        replay = self.sse_events.stats()
+        yield "mcp_sse_replay_buffer_events", GAUGE, "Recent SSE events kept for replay.", (), {(): replay["events"]}
+        yield "mcp_sse_replay_buffer_bytes", GAUGE, "Size of the SSE replay buffer.", (), {(): replay["bytes"]}
+        yield "mcp_sse_keepalives_sent_total", COUNTER, "Keepalive comments sent to idle SSE streams.", (), {(): keepalive["keepalives_sent"]}
+        yield ("mcp_sse_keepalives_skipped_total", COUNTER, "Keepalives not needed because the stream carried events.", (),
+               {(): keepalive["keepalives_skipped"]})
+        yield ("mcp_sse_subscribers_writing", GAUGE, "SSE streams with output queued for a slow client.", (),
+               {(): keepalive["writing"]})
+        yield "mcp_documents", GAUGE, "Documents in the store.", (), {(): len(self.document_store)}
+        yield ("mcp_tool_pool_queue_depth", GAUGE, "Synchronous tool calls waiting for a pool thread.", (),
+               {(): self.tool_runtime.queue_depth()})
+        yield ("mcp_store_write_queue_depth", GAUGE, "Store writes waiting for the group commit.", (),
+               {(): self.store_writer.stats()["pending"]})
+        yield ("mcp_log_records_dropped_total", COUNTER, "Log records dropped because the log queue was full.", (),
+               {(): dropped_records()})
+        if self.writer_link is None:
+            try:
+                counts = self.ingest_queue.list_jobs(limit=1)["counts"]
+                yield "mcp_ingest_jobs", GAUGE, "Ingest jobs, by status.", ("status",), {(k,): v for k, v in counts.items()}
+            except Exception as e:
+                logger.debug("Could not read ingest queue metrics: %s", e)
+        cache = self.tool_cache.stats()
+        yield "mcp_tool_cache_entries", GAUGE, "Entries in the tool result cache.", (), {(): cache["entries"]}
+        for key in ("hits", "misses", "evictions", "invalidations"):
+            yield f"mcp_tool_cache_{key}_total", COUNTER, f"Tool result cache {key}.", (), {(): cache[key]}
+        if self.rate_limiter is not None:
+            limits = self.rate_limiter.stats()
+            yield "mcp_rate_limit_clients", GAUGE, "Clients with a rate limit bucket.", (), {(): limits["clients"]}
+            yield "mcp_rate_limit_allowed_total", COUNTER, "Commands admitted by the rate limiter.", (), {(): limits["allowed"]}
+            yield ("mcp_rate_limit_rejected_total", COUNTER, "Commands rejected by the rate limiter, by command.", ("command",),
+                   {(k,): v for k, v in limits["rejected_by_command"].items()})
+        if self.replica is not None:
+            lag = self.replica.status()["lag_seconds"]
+            if lag is not None:
+                yield "mcp_replication_lag_seconds", GAUGE, "Upper bound on how stale the replica is.", (), {(): lag}
+
+    def stats(self) -> dict:
+        """The server's metrics as JSON (histograms with approximate p50/p99 from their buckets)."""
+        return {"mcp_protocol_version": "1.0", "status": "success", "metrics": self.metrics.snapshot()}
+
+    def profile_command(self, command: str, request_data: dict) -> dict:
+        """Handles the admin commands in PROFILE_COMMANDS."""
+        try:
+            if command == "profile_start":
+                tools = request_data.get("tools")
+                if tools is not None and (not isinstance(tools, list) or not all(isinstance(t, str) for t in tools)):
+                    raise ValueError("tools must be a list of tool names")
+                result = self.profiler.start(request_data.get("requests"), request_data.get("sample_rate"), tools)
+                logger.info("Profiling tool calls: %s", result)
+            elif command == "profile_stop":
+                result = self.profiler.stop()
+            elif command == "profile_report":
+                result = self.profiler.report(request_data.get("sort", "cumulative"), request_data.get("limit", 30))
+                result["profiler"] = self.profiler.status()
+            elif command == "memory_start":
+                result = self.profiler.memory_start(request_data.get("frames", 1))
+            elif command == "memory_snapshot":
+                result = self.profiler.memory_snapshot(request_data.get("limit", 20), request_data.get("key_type", "lineno"),
+                                                       request_data.get("match"))
+            else:
+                result = self.profiler.memory_stop()
+        except (TypeError, ValueError) as e:
+            return {"mcp_protocol_version": "1.0", "status": "error", "error": f"Invalid {command} request: {e}"}
+        return {"mcp_protocol_version": "1.0", "status": "success", **result}
+
+    def register_tool(self, name: str, description: str, schema: Dict[str, Any], callback: callable,
+                      cacheable: bool = False, cache_ttl: Optional[float] = None, cache_max_entries: Optional[int] = None,
+                      cache_key: Optional[Callable[[dict], Any]] = None, invalidate_on_mutation: bool = True,
+                      timeout: Optional[float] = None, cost: float = 1.0) -> None:
+        """Registers a tool.
+
+        ``cost`` is the number of rate limiter tokens an ``execute_tool`` call
+        of this tool takes (see COMMAND_COSTS).
+
+        ``callback`` may be a coroutine function; it then runs on the shared
+        event loop of the tool runtime (see mcp.tool_runtime). Calls taking
+        longer than ``timeout`` seconds fail, unless the caller gives its own
+        timeout.
+
+        A ``cacheable`` tool must be idempotent: its results are kept in the
+        shared tool cache (see mcp.tool_cache) for ``cache_ttl`` seconds, at
+        most ``cache_max_entries`` of them, keyed by ``cache_key(params)``
+        (default: the parameters). Unless ``invalidate_on_mutation`` is
+        False, they are dropped whenever the document store changes.
+        """
+        cache = CachePolicy(cache_ttl, cache_max_entries, cache_key, invalidate_on_mutation) if cacheable else None
+        self.tools[name] = {'name': name, 'description': description, 'schema': schema, 'callback': callback, 'cache': cache,
+                            'timeout': timeout, 'cost': cost,
+                            'accepts_context': accepts_context(callback), 'context_checked_for': callback}
+        self._capabilities_changed()
+        logger.info("注册MCP工具: %s", name)
     
     def register_resource(self, uri: str, name: str, description: str, 
                          mime_type: Optional[str] = None, content: Any = None) -> None:
@@ -384,31 +839,51 @@ class McpServer:
             'uri': uri, 'name': name, 'description': description, 
             'mime_type': mime_type, 'content': content
         }
-        logger.info(f"注册MCP资源: {name} ({uri})")
+        self._capabilities_changed()
+        logger.info("注册MCP资源: %s (%s)", name, uri)
     
     def register_prompt(self, name: str, description: str, 
                         arguments: Optional[List[Dict[str, Any]]] = None) -> None:
         self.prompts[name] = {'name': name, 'description': description, 'arguments': arguments or []}
-        logger.info(f"注册MCP提示模板: {name}")
+        self._capabilities_changed()
+        logger.info("注册MCP提示模板: %s", name)
+
+    def broadcast_sse_message(self, event_name: str, data: dict, encoded: Optional[bytes] = None) -> None:
+        """Sends an event to all SSE clients; ``encoded`` is ``data`` already encoded as JSON, if known."""
+        if self.broadcast_relay is not None:
+            self.broadcast_relay(event_name, data)
+            return
+        self._broadcast_to_clients(event_name, data, encoded)
 
-    def broadcast_sse_message(self, event_name: str, data: dict) -> None:
+    def _broadcast_to_clients(self, event_name: str, data: dict, encoded: Optional[bytes] = None,
+                              event_seq: Optional[int] = None) -> None:
+        """Numbers the event (``event_seq`` when the pre-fork writer did), buffers it for replay and writes it.
+
+        Subscribers never block the broadcast: what a client's socket does
+        not take at once is queued for it (see :class:`SseSubscriber`).
+        """
         if not self.running:
             logger.info("Server not running, skipping SSE broadcast.")
             return
-        if not self.sse_clients:
-            logger.debug(f"No SSE clients connected, not broadcasting event: {event_name}")
+        if encoded is None:
+            encoded = json.dumps(data).encode('utf-8')
+        # Buffered even without subscribers: clients that reconnect replay what they missed
+        with self._sse_lock:
+            message_bytes = self.sse_events.append(event_name, encoded, event_seq)
+            clients = list(self.sse_clients)
+        if not clients:
+            logger.debug("No SSE clients connected, not broadcasting event: %s", event_name)
             return
-        message_str = f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
-        message_bytes = message_str.encode('utf-8')
         clients_to_remove = []
-        for client_wfile in list(self.sse_clients): 
+        for client_wfile in clients: 
             try:
                 client_wfile.write(message_bytes); client_wfile.flush()
+                self.sse_bytes_sent.inc(("events",), len(message_bytes))
             except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError) as e:
-                logger.info(f"SSE client disconnected ({type(e).__name__}). Removing client.")
+                logger.info("SSE client disconnected (%s). Removing client.", type(e).__name__)
                 clients_to_remove.append(client_wfile)
             except Exception as e:
-                logger.exception(f"Error writing to SSE client: {e}. Removing client.")
+                logger.exception("Error writing to SSE client: %s. Removing client.", e)
                 clients_to_remove.append(client_wfile)
         for client_wfile in clients_to_remove:
             if client_wfile in self.sse_clients:
@@ -416,16 +891,61 @@ class McpServer:
                 try: client_wfile.close()
                 except Exception: pass
 
+    def attach_sse_subscriber(self, subscriber: SseSubscriber,
+                              last_event_id: Optional[str] = None) -> Tuple[Optional[List[bytes]], bool, str]:
+        """Adds ``subscriber`` to the broadcast list, holding back events until its greeting is written.
+
+        Returns the events missed since ``last_event_id`` (None if they cannot
+        all be replayed), whether capabilities must be sent, and the id of the
+        newest event.
+        """
+        with self._sse_lock:
+            missed = self.sse_events.since(last_event_id) if last_event_id else None
+            resumed_at = self.sse_events.parse(last_event_id) if missed is not None else None
+            send_capabilities = resumed_at is None or self._capabilities_changed_at >= resumed_at
+            subscriber.hold()
+            self.sse_clients.append(subscriber)
+            position = self.sse_events.last_id()
+        if last_event_id is not None:
+            outcome = "expired" if missed is None else "replayed" if send_capabilities else "replayed_capabilities_skipped"
+            self.sse_resumes.inc((outcome,))
+        return missed, send_capabilities, position
+
+    def _capabilities_changed(self, *change: Any) -> None:
+        """Invalidates the cached capabilities; also a mutation listener."""
+        self._capabilities_version += 1
+        if self.running:  # Before the server starts, no client holds capabilities yet
+            self._capabilities_changed_at = self.sse_events.seq
+
+    def capabilities_json(self) -> bytes:
+        """``get_capabilities()`` encoded as JSON, cached until the tools, resources, prompts or documents change."""
+        version, encoded = self._capabilities_cache
+        current = self._capabilities_version
+        if version != current or encoded is None:
+            encoded = json.dumps(self.get_capabilities()).encode('utf-8')
+            self._capabilities_cache = (current, encoded)
+        return encoded
+
     def _generate_next_doc_id(self) -> str:
-        doc_id = f"doc{self.next_doc_id_counter}"
-        self.next_doc_id_counter += 1
+        with self._doc_id_lock:
+            doc_id = f"doc{self.next_doc_id_counter}"
+            self.next_doc_id_counter += 1
         return doc_id
 
-    def _register_document_as_resource(self, document: dict) -> None:
-        """Helper method to register a single document as an MCP resource."""
+    def _store_view(self):
+        """Returns an immutable version of the document store for a multi-step read.
+
+        Tools run concurrently with ingest; reading through one version keeps
+        lengths, indexes and iteration consistent. Plain lists (as assigned by
+        tests) are returned as-is.
+        """
+        snapshot = getattr(self.document_store, 'snapshot', None)
+        return snapshot() if snapshot is not None else self.document_store
+
+    def _document_resource(self, document: dict) -> Optional[dict]:
+        """Builds the resource definition for a stored document (not kept in ``self.resources``)."""
         if not document or 'id' not in document:
-            logger.warning("Attempted to register a document resource without an ID or empty document. Skipping.")
-            return
+            return None
 
         doc_id = document['id']
         # Use a sensible default if title is missing or empty after stripping
@@ -435,40 +955,465 @@ class McpServer:
         else:
             doc_title = doc_title_str
 
-        uri = f"mcp://resources/documents/{doc_id}"
-
-        # Ensure content is a dictionary (it should be if document is from document_store)
-        content_data = document if isinstance(document, dict) else {}
-        
-        resource_definition = {
-            'uri': uri,
+        return {
+            'uri': f"{DOCUMENT_RESOURCE_PREFIX}{doc_id}",
             'name': f"Document: {doc_title}", # Use the processed doc_title
             'description': f"Access to document {doc_id} - '{doc_title}'", # Use processed doc_title
             'mime_type': 'application/json', 
-            'content': content_data 
+            'content': dict(document)
         }
-        self.resources[uri] = resource_definition
-        logger.info(f"Registered document {doc_id} as MCP resource: {uri}")
 
+    def _find_document(self, doc_id: str) -> Optional[dict]:
+        """Finds a document by id through the store's id index (linear scan for plain lists)."""
+        store = self._store_view()
+        find_by_id = getattr(store, 'find_by_id', None)
+        if find_by_id is not None:
+            return find_by_id(doc_id)
+        return next((doc for doc in store if doc.get('id') == doc_id), None)
+
+    def resolve_resource(self, uri: str) -> Optional[dict]:
+        """Returns the resource for ``uri``: a registered resource or a document resolved from the store."""
+        started = time.perf_counter()
+        resource_info = self.resources.get(uri)
+        if resource_info is None and uri.startswith(DOCUMENT_RESOURCE_PREFIX):
+            document = self._find_document(uri[len(DOCUMENT_RESOURCE_PREFIX):])
+            if document is not None:
+                resource_info = self._document_resource(document)
+        self.resource_latency.observe(time.perf_counter() - started, ("found" if resource_info is not None else "missing",))
+        return resource_info
+
+    def list_resources(self, cursor: Optional[str] = None, limit: Any = RESOURCE_PAGE_SIZE) -> dict:
+        """Lists resource descriptors (without content) one page at a time.
+
+        Registered resources come first, followed by the document namespace in
+        store order. ``cursor`` is the opaque ``next_cursor`` of the previous page.
+        """
+        try:
+            start = int(cursor) if cursor else 0
+            limit = int(limit)
+            if start < 0 or limit <= 0:
+                raise ValueError("cursor must be >= 0 and limit must be > 0")
+        except (TypeError, ValueError) as e:
+            return {"mcp_protocol_version": "1.0", "status": "error", "error": f"Invalid list_resources parameters: {e}"}
+
+        static_resources = list(self.resources.values())
+        store = self._store_view()
+        total = len(static_resources) + len(store)
+        # Positions past the registered resources are store ordinals, which stay
+        # stable when documents are deleted
+        entries = itertools.chain(
+            ((position, resource) for position, resource in enumerate(static_resources) if position >= start),
+            ((len(static_resources) + ordinal, document)
+             for ordinal, document in self._documents_from(store, max(0, start - len(static_resources))))
+        )
+        page = []
+        consumed = 0
+        next_cursor = None
+        for position, entry in entries:
+            if consumed == limit:
+                next_cursor = str(position)
+                break
+            consumed += 1
+            resource_info = entry if position < len(static_resources) else self._document_resource(entry)
+            if resource_info:
+                page.append({k: v for k, v in resource_info.items() if k != 'content'})
+        response = {
+            "mcp_protocol_version": "1.0", "status": "success", "resources": page,
+            "next_cursor": next_cursor, "total": total
+        }
+        if self.replica is not None:
+            response["replication"] = self.replica.status()
+        return response
+
+    @staticmethod
+    def _documents_from(store, ordinal: int):
+        """Yields ``(ordinal, document)`` for live documents from ``ordinal`` in store order."""
+        if hasattr(store, 'live_ordinals'):
+            for live_ordinal in store.live_ordinals(ordinal):
+                yield live_ordinal, store.document_at(live_ordinal)
+        else:
+            for position in range(ordinal, len(store)):
+                yield position, store[position]
+
+    def get_capabilities(self) -> dict:
+        """Capabilities document; resources are limited to the first page of ``list_resources``."""
+        first_page = self.list_resources(limit=RESOURCE_PAGE_SIZE)
+        return {
+            "mcp_protocol_version": "1.0", "server_name": self.name, "server_version": self.version,
+            "tools": [{"name": t_name, "description": t_info.get("description"), "schema": t_info.get("schema")} for t_name, t_info in self.tools.items()],
+            "resources": first_page["resources"],
+            "resources_next_cursor": first_page["next_cursor"],
+            "resource_templates": [{
+                "uri_template": f"{DOCUMENT_RESOURCE_PREFIX}{{document_id}}",
+                "name": "Stored document", "mime_type": "application/json"
+            }],
+            "prompts": [prompt_info for prompt_info in self.prompts.values()]
+        }
+
+    def _new_document_store(self, snapshot: Optional[SnapshotReader] = None,
+                            documents: Optional[List[dict]] = None) -> DocumentStore:
+        body_tier = None
+        if self.body_cache_bytes is not None:
+            body_tier = BodyTier(os.path.dirname(os.path.abspath(self.document_store_file)), cache_bytes=self.body_cache_bytes)
+        return DocumentStore(snapshot=snapshot, documents=documents,
+                             compress_abstracts_over=self.compress_abstracts_over, body_tier=body_tier)
+
+    def _load_document_store(self, default_documents: List[dict]) -> DocumentStore:
+        """Opens the document store, preferring an up-to-date snapshot over parsing the JSON file."""
+        try:
+            snapshot = open_snapshot(self.snapshot_file, source_path=self.document_store_file)
+            logger.info("Mapped document store snapshot %s (%s documents)", self.snapshot_file, len(snapshot))
+            return self._new_document_store(snapshot=snapshot)
+        except SnapshotError as e:
+            logger.info("No usable snapshot (%s); loading %s.", e, self.document_store_file)
+
+        try:
+            with open(self.document_store_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+                if not content: # Check for empty file
+                    raise ValueError("File is empty")
+                documents = json.loads(content)
+            logger.info("Loaded document store from %s", self.document_store_file)
+        except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
+            logger.warning("%s not found, empty, or invalid JSON (%s). Initializing with default documents "
+                           "and creating/overwriting the file.", self.document_store_file, e)
+            documents = default_documents
+            try:
+                atomic_write_json(self.document_store_file, documents, indent=4)
+                logger.info("Saved default document store to %s", self.document_store_file)
+            except IOError as ioe:
+                logger.error("Could not write initial document store to %s: %s", self.document_store_file, ioe)
+                return self._new_document_store(documents=documents)
 
-    def _save_document_store_to_file(self) -> None:
-        """Saves the current document store to the JSON file."""
+        # Build the snapshot now so the next startup can map it instead of parsing JSON
         try:
-            logger.debug(f"Attempting to save document store. Full store repr: {repr(self.document_store)}")
-            with open(self.document_store_file, 'w', encoding='utf-8') as f:
-                json.dump(self.document_store, f, indent=4, ensure_ascii=True)
-            logger.info(f"Document store successfully saved to {self.document_store_file}")
-        except IOError as e:
-            logger.error(f"Could not save document store to {self.document_store_file}: {e}")
-        except Exception as e: # Catch any other unexpected errors during saving
-            logger.error(f"An unexpected error occurred while saving document store: {e}", exc_info=True)
+            write_snapshot(self.snapshot_file, documents, source_path=self.document_store_file)
+            snapshot = open_snapshot(self.snapshot_file, source_path=self.document_store_file)
+            return self._new_document_store(snapshot=snapshot)
+        except (OSError, SnapshotError) as e:
+            logger.warning("Could not build document store snapshot %s: %s", self.snapshot_file, e)
+            return self._new_document_store(documents=documents)
+
+    def _write_document_store(self) -> None:
+        """Writes the store atomically (temp file + fsync + rename) and refreshes its snapshot.
+
+        Runs on the store writer thread; raises if the JSON file cannot be written.
+        """
+        try:
+            snapshot: Optional[SnapshotWriter] = SnapshotWriter(self.snapshot_file)
+        except OSError as e:
+            logger.warning("Could not refresh document store snapshot %s: %s", self.snapshot_file, e)
+            snapshot = None
+
+        def documents():
+            # One pass feeds both files, one document at a time, so the store's
+            # bodies are never all in memory (nor pulled through the body cache)
+            nonlocal snapshot
+            for doc in self._store_view():
+                document = doc.copy(cached=False) if isinstance(doc, Document) else dict(doc)
+                if snapshot is not None:
+                    try:
+                        snapshot.add(document)
+                    except OSError as e:
+                        logger.warning("Could not refresh document store snapshot %s: %s", self.snapshot_file, e)
+                        snapshot.abort()
+                        snapshot = None
+                yield document
+
+        try:
+            count = atomic_write_json_array(self.document_store_file, documents(), indent=4, ensure_ascii=True)
+        except BaseException:
+            if snapshot is not None:
+                snapshot.abort()
+            raise
+        logger.info("Document store with %d documents successfully saved to %s", count, self.document_store_file)
+        if snapshot is not None:
+            try:
+                snapshot.finish(source_path=self.document_store_file)
+            except OSError as e:
+                logger.warning("Could not refresh document store snapshot %s: %s", self.snapshot_file, e)
+
+    def _build_search_index(self, view, search_index: SearchIndex) -> None:
+        """Indexes the documents present at startup (runs on a background thread)."""
+        try:
+            count = search_index.bulk_load(enumerate(view))
+            logger.info("Search index built for %s documents", count)
+        except Exception as e:
+            logger.error("Could not build search index; document_search will scan the store: %s", e, exc_info=True)
+            return
+        if search_index is self.search_index:  # Not replaced by a replica resync meanwhile
+            self._search_index_ready.set()
+
+    def _start_sharded_search(self, num_shards: int) -> None:
+        """Starts search shard processes over the mapped snapshot plus any appended documents."""
+        view = self._store_view()
+        base = self.document_store.base
+        try:
+            self.sharded_search = ShardedSearch(base.path if base is not None else None, num_shards)
+        except (ShardError, OSError) as e:
+            logger.error("Could not start %s search shards; searching in-process: %s", num_shards, e)
+            return
+        for ordinal in view.live_ordinals(len(base) if base is not None else 0):
+            self.sharded_search.add(ordinal, view.document_at(ordinal))
+
+    def _index_add(self, ordinal: int, document: dict) -> None:
+        self.search_index.add(ordinal, document)
+        if self.sharded_search is not None:
+            self.sharded_search.add(ordinal, document)
+
+    def _index_delete(self, ordinal: int) -> None:
+        self.search_index.delete(ordinal)
+        if self.sharded_search is not None:
+            self.sharded_search.delete(ordinal)
+
+    def _append_document(self, document: dict) -> None:
+        """Commits a new document to the store and adds it to the search index."""
+        with self._mutation_lock:
+            version = self.document_store.append(document)
+            if version is not None and self.document_store is self._indexed_store:
+                self._index_add(version.ordinal_count - 1, document)
+            self._notify_mutation("created", document.get("id"), document)
+
+    def add_mutation_listener(self, listener: Callable[[str, str, Optional[dict]], None], first: bool = False) -> None:
+        """Registers ``listener(change, document_id, document)`` for store changes.
+
+        ``change`` is ``created``, ``updated`` or ``deleted`` (``document`` is
+        None for deletes). Listeners run on the mutating thread, in commit
+        order, and must be quick; ``first`` runs this one before the others.
+        """
+        if first:
+            self._mutation_listeners.insert(0, listener)
+        else:
+            self._mutation_listeners.append(listener)
+
+    def _notify_mutation(self, change: str, doc_id: Any, document: Optional[dict]) -> None:
+        for listener in list(self._mutation_listeners):
+            try:
+                listener(change, doc_id, document)
+            except Exception as e:
+                logger.error("Mutation listener failed for %s of %s: %s", change, doc_id, e, exc_info=True)
+
+    def _update_document(self, doc_id: str, changes: dict) -> Optional[dict]:
+        """Replaces a stored document with ``changes`` applied; returns the new document or None."""
+        with self._mutation_lock:
+            store = self.document_store
+            if not isinstance(store, DocumentStore):
+                position = next((i for i, doc in enumerate(store) if doc.get('id') == doc_id), None)
+                if position is None:
+                    return None
+                store[position] = {**store[position], **changes, "id": doc_id}
+                document = store[position]
+            else:
+                committed = store.update(doc_id, changes)
+                if committed is None:
+                    return None
+                old_ordinal, new_ordinal, version = committed
+                document = version.document_at(new_ordinal)
+                if store is self._indexed_store:
+                    self._index_delete(old_ordinal)
+                    self._index_add(new_ordinal, document)
+                self._maybe_compact(version)
+            self._notify_mutation("updated", doc_id, document)
+            return document
+
+    def _delete_document(self, doc_id: str) -> bool:
+        """Tombstones a stored document; returns False if there is none with ``doc_id``."""
+        with self._mutation_lock:
+            store = self.document_store
+            if not isinstance(store, DocumentStore):
+                position = next((i for i, doc in enumerate(store) if doc.get('id') == doc_id), None)
+                if position is None:
+                    return False
+                del store[position]
+            else:
+                committed = store.delete(doc_id)
+                if committed is None:
+                    return False
+                ordinal, version = committed
+                if store is self._indexed_store:
+                    self._index_delete(ordinal)
+                self._maybe_compact(version)
+            self._notify_mutation("deleted", doc_id, None)
+            return True
+
+    def apply_replicated_change(self, change: str, doc_id: str, document: Optional[dict]) -> None:
+        """Applies a store change made by another process (without persisting it again)."""
+        if change == "created":
+            self._append_document(document)
+        elif change == "updated":
+            self._update_document(doc_id, document)
+        elif change == "deleted":
+            self._delete_document(doc_id)
+        else:
+            logger.warning("Ignoring unknown replicated change %r for %s", change, doc_id)
+
+    def _start_replica(self, primary_url: str) -> None:
+        """Makes this server a read-only replica that follows ``primary_url``'s change stream."""
+        self.replica = ReplicaFollower(self, primary_url, CHANGES_PATH)
+        # Replica search responses report the current replication lag, so they are not cached
+        self.tools["document_search"]["cache"] = None
+        for tool_name in MUTATING_TOOLS:
+            if tool_name in self.tools:
+                self.tools[tool_name]['callback'] = self._reject_write
+        self.replica.start()
+        logger.info("Running as a read replica of %s", self.replica.primary_url)
+
+    def _reject_write(self, params: dict) -> dict:
+        return {"error": f"This server is a read-only replica; send writes to the primary at {self.replica.primary_url}"}
+
+    def _reset_store(self, documents: List[dict]) -> None:
+        """Replaces the whole store with ``documents`` (a replica loading its primary's snapshot)."""
+        store = self._new_document_store(documents=documents)
+        search_index = SearchIndex()
+        with self._mutation_lock:
+            old_index = self.search_index
+            self._search_index_ready.clear()  # Searches scan the new store until it is indexed
+            self.document_store = store
+            self._indexed_store = store
+            self.search_index = search_index
+            if self.sharded_search is not None:
+                num_shards = self.sharded_search.num_shards
+                self.sharded_search.close()
+                self._start_sharded_search(num_shards)
+        self.tool_cache.invalidate()
+        self._capabilities_changed()
+        # The old store is left to the garbage collector: readers may still hold its versions
+        old_index.close()
+        threading.Thread(target=self._build_search_index, args=(store.snapshot(), search_index),
+                         name="search-index-build", daemon=True).start()
+
+    def stream_changes(self, wfile, since: Optional[str]) -> None:
+        """Writes the change stream (see mcp.replication) to ``wfile`` until the client or server stops.
+
+        Starts with a full snapshot unless ``since`` (``<epoch>-<seq>``) is from this
+        run and every change after it is still in the change log.
+        """
+        epoch = self.change_log.epoch
+        since_seq = self.change_log.parse(since) if since is not None else None
+        with self._mutation_lock:
+            seq = self.change_log.seq
+            resume = since_seq is not None and self.change_log.covers(since_seq)
+            view = None if resume else self._store_view()
+            if isinstance(view, list):
+                view = list(view)
+        if resume:
+            seq = since_seq
+        else:
+            snapshot = {"epoch": epoch, "seq": seq, "ts": time.time(), "documents": [dict(doc) for doc in view]}
+            message = f"event: snapshot\ndata: {json.dumps(snapshot)}\n\n".encode('utf-8')
+            wfile.write(message)
+            wfile.flush()
+            self.sse_bytes_sent.inc(("changes",), len(message))
+        while self.running:
+            changes = self.change_log.wait_after(seq, HEARTBEAT_INTERVAL)
+            if changes is None:
+                logger.info("Change stream client fell behind the change log at %s; closing", seq)
+                return
+            messages = [f"event: change\ndata: {json.dumps(change)}\n\n" for change in changes]
+            if changes:
+                seq = changes[-1]["seq"]
+            else:
+                heartbeat = {"epoch": epoch, "seq": self.change_log.seq, "ts": time.time()}
+                messages.append(f"event: heartbeat\ndata: {json.dumps(heartbeat)}\n\n")
+            message = "".join(messages).encode('utf-8')
+            wfile.write(message)
+            wfile.flush()
+            self.sse_bytes_sent.inc(("changes",), len(message))
+
+    def command_cost(self, request_data: dict) -> float:
+        """Rate limiter tokens taken by a /mcp_command request."""
+        command = request_data.get("command")
+        if command == "execute_tool":
+            tool = self.tools.get(request_data.get("tool_name"))
+            return tool.get('cost', 1.0) if tool else 1.0
+        return COMMAND_COSTS.get(command, 1.0)
+
+    def rate_limit_status(self) -> dict:
+        if self.rate_limiter is None:
+            return {"mcp_protocol_version": "1.0", "status": "success", "enabled": False}
+        return {"mcp_protocol_version": "1.0", "status": "success", "enabled": True, **self.rate_limiter.stats()}
+
+    def replication_status(self) -> dict:
+        if self.replica is None:
+            return {"mcp_protocol_version": "1.0", "status": "success", "role": "primary",
+                    "epoch": self.change_log.epoch, "seq": self.change_log.seq}
+        return {"mcp_protocol_version": "1.0", "status": "success", "role": "replica",
+                "replication": self.replica.status()}
+
+    def attach_writer(self, writer_link) -> None:
+        """Turns this server into a pre-fork worker that forwards writes to ``writer_link``.
+
+        Mutating tools and ingest jobs run in the writer process, SSE
+        broadcasts are fanned out by it, and its store changes arrive through
+        :meth:`apply_replicated_change`.
+        """
+        self.writer_link = writer_link
+        self.broadcast_relay = writer_link.publish_event
+        for tool_name in MUTATING_TOOLS:
+            if tool_name in self.tools:
+                self.tools[tool_name]['callback'] = functools.partial(writer_link.call_tool, tool_name)
+
+    def _invalidate_tool_cache(self, change: str, doc_id: Any, document: Optional[dict]) -> None:
+        """Drops cached results of the tools that read the store (a mutation listener)."""
+        self.tool_cache.invalidate({name for name, tool in self.tools.items()
+                                    if tool.get('cache') is not None and tool['cache'].invalidate_on_mutation})
+
+    def _maybe_compact(self, version) -> None:
+        """Starts a background compaction once enough deletes have been committed since the last one."""
+        if version.deleted_since_compaction < COMPACTION_TOMBSTONES:
+            return
+        if not self._compaction_lock.acquire(blocking=False):
+            return  # Already compacting
+        threading.Thread(target=self._compact_store, name="store-compaction", daemon=True).start()
+
+    def _compact_store(self) -> None:
+        """Releases tombstoned documents from memory, the body segment and the search index."""
+        try:
+            self.document_store.compact()
+            self.document_store.compact_bodies()
+            self.search_index.request_compaction()
+        except Exception as e:
+            logger.error("Document store compaction failed: %s", e, exc_info=True)
+        finally:
+            self._compaction_lock.release()
+
+    def _broadcast_resource_change(self, change: str, doc_id: Any, document: Optional[dict]) -> None:
+        """Tells SSE clients that a document resource was updated or deleted."""
+        if change == "created":
+            return  # Announced by the add tools' own tool_result events
+        if self.writer_link is not None:
+            return  # Replicated change; the writer process already announced it
+        self.broadcast_sse_message(event_name="resource_updated", data={
+            "mcp_protocol_version": "1.0", "uri": f"{DOCUMENT_RESOURCE_PREFIX}{doc_id}",
+            "document_id": doc_id, "change": change
+        })
+
+    def _save_document_store_to_file(self, durability: str = DURABILITY_FSYNC) -> dict:
+        """Requests a group commit of the document store.
+
+        With ``fsync`` durability this waits until the write is on disk;
+        with ``enqueue`` it returns as soon as the commit is queued. Returns
+        the fields reported back to the caller.
+        """
+        future = self.store_writer.submit()
+        if durability == DURABILITY_ENQUEUE:
+            return {"durability": "enqueued"}
+        try:
+            future.result()
+        except Exception as e:
+            logger.error("Could not save document store to %s: %s", self.document_store_file, e)
+            return {"durability": "failed", "persistence_error": str(e)}
+        return {"durability": DURABILITY_FSYNC}
 
     def _execute_add_document_to_store_impl(self, params: dict) -> dict:
         document_text = params.get("document_text")
         keywords_str = params.get("keywords", "")
+        durability = params.get("durability", DURABILITY_FSYNC)
 
         if not document_text or not document_text.strip():
             return {"error": "Missing required parameter: document_text cannot be empty."}
+        if durability not in DURABILITY_MODES:
+            return {"error": f"Invalid durability '{durability}'. Expected one of: {', '.join(DURABILITY_MODES)}."}
 
         stripped_text = document_text.strip()
         lines = stripped_text.split('\n', 1)
@@ -492,21 +1437,22 @@ class McpServer:
             "keywords": keywords
         }
         
-        self.document_store.append(new_document)
-        logger.info(f"Added new document from text: {new_doc_id} - {new_document['title']}")
-        self._save_document_store_to_file() # Persist changes
-        self._register_document_as_resource(new_document) # Register new doc as resource
+        self._append_document(new_document)
+        logger.info("Added new document from text: %s - %s", new_doc_id, new_document['title'])
+        persistence = self._save_document_store_to_file(durability) # Persist changes
         
         return {
             "message": "Document added successfully from text.",
             "document_id": new_doc_id,
-            "derived_title": new_document['title']
+            "derived_title": new_document['title'],
+            **persistence
         }
 
-    def _execute_add_document_from_file_impl(self, params: dict) -> dict:
+    def _execute_add_document_from_file_impl(self, params: dict, context: Optional[ToolContext] = None) -> dict:
         file_content_base64 = params.get("file_content_base64")
         filename_param = params.get("filename")
         keywords_str = params.get("keywords", "")
+        durability = params.get("durability", DURABILITY_FSYNC)
 
         # Sanitize filename to remove any potential null characters if they are somehow introduced.
         filename = ""
@@ -516,17 +1462,21 @@ class McpServer:
         # filename cannot be an empty string. file_content_base64 can be an empty string (for an empty file) but must be present.
         if file_content_base64 is None or not filename.strip():
             return {"error": "Missing required parameter: file_content_base64 must be provided (can be an empty string), and filename must be a non-empty string."}
+        if durability not in DURABILITY_MODES:
+            return {"error": f"Invalid durability '{durability}'. Expected one of: {', '.join(DURABILITY_MODES)}."}
 
         try:
             decoded_bytes = base64.b64decode(file_content_base64)
             decoded_text = decoded_bytes.decode('utf-8')
         except (binascii.Error, UnicodeDecodeError) as e: # Corrected exception handling
-            logger.warning(f"Failed to decode Base64 content for file {filename}: {e}")
+            logger.warning("Failed to decode Base64 content for file %s: %s", filename, e)
             return {"error": "Invalid Base64 content or UTF-8 decoding error."}
         except Exception as e: # Catch any other unexpected error during decoding
-            logger.error(f"Unexpected error decoding file {filename}: {e}", exc_info=True)
+            logger.error("Unexpected error decoding file %s: %s", filename, e, exc_info=True)
             return {"error": "An unexpected error occurred during file decoding."}
 
+        if context is not None:
+            context.check()
         stripped_decoded_text = decoded_text.strip()
         
         # Aggressively sanitize the title derived from filename
@@ -571,74 +1521,502 @@ class McpServer:
             "abstract": abstract_sanitized, 
             "keywords": keywords
         }
-        
-        self.document_store.append(new_document)
-        logger.info(f"Added new document from file {filename}: {new_doc_id} - {derived_title_sanitized}")
-        self._save_document_store_to_file()
-        self._register_document_as_resource(new_document) # Register new doc as resource
+        if context is not None and context.job_id is not None:
+            new_document[INGEST_JOB_FIELD] = context.job_id
+
+        if context is not None:
+            context.check()  # Last chance to cancel: the document is committed below
+        self._append_document(new_document)
+        logger.info("Added new document from file %s: %s - %s", filename, new_doc_id, derived_title_sanitized)
+        persistence = self._save_document_store_to_file(durability)
         
         return {
             "message": "Document added successfully from file.",
             "document_id": new_doc_id,
             "derived_title": derived_title_sanitized,
-            "original_filename": filename
+            "original_filename": filename,
+            **persistence
         }
 
-    def _execute_document_search_impl(self, params: dict) -> dict:
+    def _execute_update_document_impl(self, params: dict) -> dict:
+        doc_id = params.get("document_id")
+        durability = params.get("durability", DURABILITY_FSYNC)
+        if not isinstance(doc_id, str) or not doc_id.strip():
+            return {"error": "Missing required parameter: document_id."}
+        if durability not in DURABILITY_MODES:
+            return {"error": f"Invalid durability '{durability}'. Expected one of: {', '.join(DURABILITY_MODES)}."}
+
+        changes = {}
+        for field in ("title", "abstract"):
+            if field in params:
+                if not isinstance(params[field], str):
+                    return {"error": f"Invalid parameter: {field} must be a string."}
+                changes[field] = params[field]
+        if "keywords" in params:
+            keywords = params["keywords"]
+            if isinstance(keywords, str):
+                keywords = [k.strip() for k in keywords.split(',') if k.strip()]
+            elif not (isinstance(keywords, list) and all(isinstance(k, str) for k in keywords)):
+                return {"error": "Invalid parameter: keywords must be a comma-separated string or a list of strings."}
+            changes["keywords"] = keywords
+        if not changes:
+            return {"error": "Nothing to update: provide at least one of title, abstract or keywords."}
+
+        document = self._update_document(doc_id, changes)
+        if document is None:
+            return {"error": f"Document not found: {doc_id}"}
+        logger.info("Updated document %s: %s", doc_id, ', '.join(sorted(changes)))
+        persistence = self._save_document_store_to_file(durability)
+        return {
+            "message": "Document updated successfully.",
+            "document_id": doc_id,
+            "resource_uri": f"{DOCUMENT_RESOURCE_PREFIX}{doc_id}",
+            "updated_fields": sorted(changes),
+            **persistence
+        }
+
+    def _execute_delete_document_impl(self, params: dict) -> dict:
+        doc_id = params.get("document_id")
+        durability = params.get("durability", DURABILITY_FSYNC)
+        if not isinstance(doc_id, str) or not doc_id.strip():
+            return {"error": "Missing required parameter: document_id."}
+        if durability not in DURABILITY_MODES:
+            return {"error": f"Invalid durability '{durability}'. Expected one of: {', '.join(DURABILITY_MODES)}."}
+
+        if not self._delete_document(doc_id):
+            return {"error": f"Document not found: {doc_id}"}
+        logger.info("Deleted document %s", doc_id)
+        persistence = self._save_document_store_to_file(durability)
+        return {
+            "message": "Document deleted successfully.",
+            "document_id": doc_id,
+            "resource_uri": f"{DOCUMENT_RESOURCE_PREFIX}{doc_id}",
+            **persistence
+        }
+
+    _document_matches = staticmethod(document_matches)
+
+    def _execute_document_search_impl(self, params: dict, context: Optional[ToolContext] = None) -> dict:
         query_str = params.get("query", "").lower()
         try:
             max_results = int(params.get("max_results", 3))
         except ValueError:
-            logger.warning(f"Invalid max_results value '{params.get('max_results')}', defaulting to 3.")
+            logger.warning("Invalid max_results value '%s', defaulting to 3.", params.get('max_results'))
             max_results = 3
 
         if not query_str: 
             return {"search_results": [], "query_received": params.get("query", "")}
 
+        results_to_return = self._search_local(query_str, max_results, context)
+        if self.federation is None or params.get("local_only"):
+            response = {"search_results": results_to_return, "query_received": params.get("query")}
+            if self.replica is not None:
+                response["replication"] = self.replica.status()
+            return response
+
+        if context is not None:
+            context.check()
+        # Peers get the original query; each lower-cases it itself
+        gathered = self.federation.search(params.get("query"), max_results)
+        return {
+            "search_results": merge_ranked([results_to_return] + gathered["results"], max_results),
+            "query_received": params.get("query"),
+            "federation": {
+                "peers": len(self.federation.peers), "responded": gathered["responded"],
+                "failed": gathered["failed"], "partial": bool(gathered["failed"])
+            }
+        }
+
+    def _search_local(self, query_str: str, max_results: int, context: Optional[ToolContext] = None) -> List[dict]:
+        """Returns the first ``max_results`` matches in this node's store, in store order.
+
+        Scans stop early (raising) once ``context`` is cancelled or past its deadline.
+        """
+        if self.sharded_search is not None and self.document_store is self._indexed_store:
+            try:
+                return self.sharded_search.search(query_str, max_results, context)[:max_results]
+            except (ToolCancelledError, ToolTimeoutError):
+                raise
+            except Exception as e:
+                logger.error("Sharded search failed, searching in-process: %s", e)
+
         found_documents = []
-        for doc in self.document_store:
-            match = False
-            if query_str in doc.get("title", "").lower():
-                match = True
-            elif query_str in doc.get("abstract", "").lower():
-                match = True
-            elif any(query_str in keyword.lower() for keyword in doc.get("keywords", [])):
-                match = True
-            
-            if match:
-                found_documents.append(doc.copy()) 
-
-        results_to_return = found_documents[:max_results]
-        return {"search_results": results_to_return, "query_received": params.get("query")}
-
-    def execute_tool_command(self, tool_name: str, tool_params: dict) -> None:
-        logger.info(f"Executing tool command: {tool_name} with params: {tool_params}")
-        if tool_name in self.tools:
-            tool_definition = self.tools[tool_name]
-            callback = tool_definition.get('callback')
-            if callable(callback):
-                try:
-                    result = callback(tool_params)
-                    response_data = {"mcp_protocol_version": "1.0", "status": "success", "tool_name": tool_name, "result": result}
-                    self.broadcast_sse_message(event_name="tool_result", data=response_data)
-                except Exception as e:
-                    logger.exception(f"Error executing tool '{tool_name}': {e}")
-                    error_data = {"mcp_protocol_version": "1.0", "status": "error", "tool_name": tool_name, "error": str(e)}
-                    self.broadcast_sse_message(event_name="tool_error", data=error_data)
-            else:
-                error_data = {"mcp_protocol_version": "1.0", "status": "error", "tool_name": tool_name, "error": "Tool has no callback"}
-                self.broadcast_sse_message(event_name="tool_error", data=error_data)
+        view = self._store_view()
+        candidates = None
+        if self._search_index_ready.is_set() and self.document_store is self._indexed_store:
+            candidates = self.search_index.search(query_str)
+        if candidates is None:
+            documents = iter(view)
         else:
-            error_data = {"mcp_protocol_version": "1.0", "status": "error", "tool_name": tool_name, "error": f"Tool '{tool_name}' not found"}
+            # Ordinals arrive in store order; ones past this version were committed after it
+            documents = (view.document_at(ordinal) for ordinal in candidates if ordinal < view.ordinal_count)
+            documents = (doc for doc in documents if doc is not None)
+        for scanned, doc in enumerate(documents):
+            if context is not None and scanned % CHECK_INTERVAL == 0:
+                context.check()
+            if self._document_matches(doc, query_str):
+                found_documents.append(doc.copy())
+                if 0 < max_results <= len(found_documents):
+                    break
+        return found_documents[:max_results]
+
+    @staticmethod
+    def _search_cache_key(params: dict) -> tuple:
+        return str(params.get("query", "")).lower(), str(params.get("max_results", 3)), bool(params.get("local_only"))
+
+    def _cache_lookup(self, tool_name: str, tool_params: dict) -> Tuple[Optional[CachePolicy], Any, Optional[CachedResult]]:
+        """Returns the tool's cache policy (None if the call is not cached), the call's key and any cached result."""
+        policy = self.tools[tool_name].get('cache')
+        if policy is None:
+            return None, None, None
+        try:
+            key = policy.key(tool_params)
+            hash(key)
+        except Exception as e:
+            logger.debug("Not caching %s call with unhashable parameters: %s", tool_name, e)
+            return None, None, None
+        return policy, key, self.tool_cache.get(tool_name, key)
+
+    def _cache_result(self, tool_name: str, policy: Optional[CachePolicy], key: Any, result: Any,
+                      generation: int) -> Optional[CachedResult]:
+        if policy is None or (isinstance(result, dict) and "error" in result):
+            return None
+        return self.tool_cache.put(tool_name, key, result, policy, generation)
+
+    def _accepts_context(self, tool_name: str, callback: Callable[[dict], Any]) -> bool:
+        """Whether ``callback`` takes a context, remembered in the tool definition (callbacks can be replaced)."""
+        definition = self.tools.get(tool_name)
+        if definition is None:
+            return accepts_context(callback)
+        if definition.get('context_checked_for') is not callback:
+            definition['accepts_context'] = accepts_context(callback)
+            definition['context_checked_for'] = callback
+        return definition['accepts_context']
+
+    def _prepare_callback(self, tool_name: str, callback: Callable[[dict], Any], context: ToolContext) -> Callable[[dict], Any]:
+        """Binds the context if the tool takes one and, if this call is selected for profiling, wraps the callback."""
+        if self._accepts_context(tool_name, callback):
+            callback = functools.partial(callback, context=context)
+        if self.profiler.active and self.profiler.select(tool_name):
+            return self.profiler.wrap(callback)
+        return callback
+
+    def _call_tool(self, tool_name: str, callback: Callable[[dict], Any], tool_params: dict,
+                   context: ToolContext) -> Tuple[Any, Optional[CachedResult]]:
+        """Runs ``callback``, going through the tool cache if the tool is cacheable."""
+        policy, key, cached = self._cache_lookup(tool_name, tool_params)
+        if cached is not None:
+            return cached.result, cached
+        generation = self.tool_cache.generation
+        context.check()
+        result = self.tool_runtime.call_blocking(self._prepare_callback(tool_name, callback, context), tool_params,
+                                                 context.remaining(), context)
+        return result, self._cache_result(tool_name, policy, key, result, generation)
+
+    async def _call_tool_async(self, tool_name: str, callback: Callable[[dict], Any], tool_params: dict,
+                               context: ToolContext) -> Tuple[Any, Optional[CachedResult]]:
+        """:meth:`_call_tool` on the tool runtime's loop; synchronous callbacks run in its thread pool."""
+        policy, key, cached = self._cache_lookup(tool_name, tool_params)
+        if cached is not None:
+            return cached.result, cached
+        generation = self.tool_cache.generation
+        context.check()
+        result = await self.tool_runtime.call(self._prepare_callback(tool_name, callback, context), tool_params,
+                                              context.remaining(), context)
+        return result, self._cache_result(tool_name, policy, key, result, generation)
+
+    def _tool_error(self, tool_name: str, error: str, context: Optional[ToolContext] = None) -> dict:
+        response = {"mcp_protocol_version": "1.0", "status": "error", "tool_name": tool_name}
+        if context is not None and context.request_id is not None:
+            response["request_id"] = context.request_id
+        response["error"] = error
+        return response
+
+    def _tool_success(self, tool_name: str, result: Any, context: ToolContext) -> dict:
+        response = {"mcp_protocol_version": "1.0", "status": "success", "tool_name": tool_name}
+        if context.request_id is not None:
+            response["request_id"] = context.request_id
+        response["result"] = result
+        return response
+
+    def _resolve_tool(self, tool_name: str) -> Tuple[Optional[Callable], Optional[str]]:
+        """Returns the tool's callback, or an error message."""
+        if tool_name not in self.tools:
+            return None, f"Tool '{tool_name}' not found"
+        callback = self.tools[tool_name].get('callback')
+        if not callable(callback):
+            return None, "Tool has no callback"
+        return callback, None
+
+    def _tool_failure(self, tool_name: str, e: Exception, context: ToolContext) -> dict:
+        if isinstance(e, ToolTimeoutError):
+            logger.warning("Tool '%s' %s", tool_name, e)
+            return self._tool_error(tool_name, f"Tool '{tool_name}' {e}", context)
+        if isinstance(e, ToolCancelledError):
+            logger.info("Tool '%s' was cancelled: %s", tool_name, e)
+            return self._tool_error(tool_name, f"Tool '{tool_name}' was cancelled: {e}", context)
+        logger.exception("Error executing tool '%s': %s", tool_name, e)
+        return self._tool_error(tool_name, str(e), context)
+
+    def _tool_label(self, tool_name: str) -> str:
+        return tool_name if tool_name in self.tools else "unknown"
+
+    def _run_tool(self, tool_name: str, tool_params: dict, context: ToolContext) -> Tuple[dict, Optional[CachedResult]]:
+        label = (self._tool_label(tool_name),)
+        self.tools_in_flight.inc(label)
+        started = time.perf_counter()
+        try:
+            response, cached = self._dispatch_tool(tool_name, tool_params, context)
+        finally:
+            self.tools_in_flight.dec(label)
+        self.tool_latency.observe(time.perf_counter() - started, label + (response["status"],))
+        return response, cached
+
+    async def _run_tool_async(self, tool_name: str, tool_params: dict,
+                              context: ToolContext) -> Tuple[dict, Optional[CachedResult]]:
+        label = (self._tool_label(tool_name),)
+        self.tools_in_flight.inc(label)
+        started = time.perf_counter()
+        status = "cancelled"
+        try:
+            response, cached = await self._dispatch_tool_async(tool_name, tool_params, context)
+            status = response["status"]
+        finally:
+            self.tools_in_flight.dec(label)
+            self.tool_latency.observe(time.perf_counter() - started, label + (status,))
+        return response, cached
+
+    def _dispatch_tool(self, tool_name: str, tool_params: dict, context: ToolContext) -> Tuple[dict, Optional[CachedResult]]:
+        callback, error = self._resolve_tool(tool_name)
+        if error is not None:
+            return self._tool_error(tool_name, error, context), None
+        try:
+            result, cached = self._call_tool(tool_name, callback, tool_params, context)
+        except Exception as e:
+            return self._tool_failure(tool_name, e, context), None
+        return self._tool_success(tool_name, result, context), cached
+
+    async def _dispatch_tool_async(self, tool_name: str, tool_params: dict,
+                                   context: ToolContext) -> Tuple[dict, Optional[CachedResult]]:
+        callback, error = self._resolve_tool(tool_name)
+        if error is not None:
+            return self._tool_error(tool_name, error, context), None
+        try:
+            result, cached = await self._call_tool_async(tool_name, callback, tool_params, context)
+        except Exception as e:
+            return self._tool_failure(tool_name, e, context), None
+        return self._tool_success(tool_name, result, context), cached
+
+    @staticmethod
+    def _encode_tool_response(response: dict, cached: Optional[CachedResult]) -> bytes:
+        """Encodes a tool response as UTF-8 JSON, reusing a cache hit's stored encoding of the result."""
+        if cached is None:
+            return json.dumps(response).encode('utf-8')
+        # Same bytes as json.dumps(response): "result" is the last key
+        head = json.dumps({key: value for key, value in response.items() if key != "result"})
+        return head[:-1].encode('utf-8') + b', "result": ' + cached.encoded + b"}"
+
+    # --- Request tracking and cancellation ---
+    def _start_call(self, tool_name: str, timeout: Optional[float], request_id: Optional[str],
+                    session_id: Optional[str]) -> ToolContext:
+        """Creates the context of a call; calls with a request id can be cancelled until :meth:`_finish_call`.
+
+        Raises ValueError if ``request_id`` belongs to a call still running.
+        """
+        if timeout is None and tool_name in self.tools:
+            timeout = self.tools[tool_name].get('timeout')
+        context = ToolContext(request_id, session_id, timeout)
+        if request_id is not None:
+            with self._active_calls_lock:
+                if request_id in self._active_calls:
+                    raise ValueError(f"Request '{request_id}' is already running")
+                self._active_calls[request_id] = context
+        return context
+
+    def _finish_call(self, context: ToolContext) -> None:
+        if context.request_id is not None:
+            with self._active_calls_lock:
+                if self._active_calls.get(context.request_id) is context:
+                    del self._active_calls[context.request_id]
+
+    def _cancel_active(self, request_id: str, reason: str) -> bool:
+        with self._active_calls_lock:
+            context = self._active_calls.get(request_id)
+        if context is None:
+            return False
+        context.cancel(reason)
+        return True
+
+    def cancel_request(self, request_id: Optional[str]) -> dict:
+        """Cancels a running tool call or ingest job (queued or running) by its request or job id."""
+        if not request_id:
+            return {"mcp_protocol_version": "1.0", "status": "error", "error": "Missing request_id for cancel"}
+        if self._cancel_active(request_id, "cancelled by client") or self.ingest_queue.cancel(request_id):
+            logger.info("Cancelled request %s", request_id)
+            return {"mcp_protocol_version": "1.0", "status": "success", "request_id": request_id, "cancelled": True}
+        if self.writer_link is not None:
+            # The call may run in another worker process, or be an ingest job of the writer
+            return self.writer_link.cancel_request(request_id)
+        return {"mcp_protocol_version": "1.0", "status": "error", "request_id": request_id, "error": "Request not found"}
+
+    def cancel_session(self, session_id: str) -> int:
+        """Cancels every call made on behalf of an SSE session; returns how many were running."""
+        with self._active_calls_lock:
+            contexts = [c for c in self._active_calls.values() if c.session_id == session_id]
+        for context in contexts:
+            context.cancel("client disconnected")
+        if contexts:
+            logger.info("Cancelled %s call(s) of disconnected SSE session %s", len(contexts), session_id)
+        return len(contexts)
+
+    def execute_tool(self, tool_name: str, tool_params: dict, timeout: Optional[float] = None,
+                     request_id: Optional[str] = None) -> dict:
+        """Runs a tool and returns the response (the payload of a tool_result or tool_error event).
+
+        With a ``request_id``, the call can be cancelled with :meth:`cancel_request` while it runs.
+        """
+        return self._execute_tool(tool_name, tool_params, timeout, request_id, None)[0]
+
+    def execute_tool_encoded(self, tool_name: str, tool_params: dict, timeout: Optional[float] = None,
+                             request_id: Optional[str] = None, session_id: Optional[str] = None) -> Tuple[dict, bytes]:
+        """Like :meth:`execute_tool`, also returning the response as UTF-8 JSON.
+
+        Cache hits reuse the result's stored encoding instead of serializing it again.
+        """
+        response, cached = self._execute_tool(tool_name, tool_params, timeout, request_id, session_id)
+        return response, self._encode_tool_response(response, cached)
+
+    def _execute_tool(self, tool_name: str, tool_params: dict, timeout: Optional[float], request_id: Optional[str],
+                      session_id: Optional[str]) -> Tuple[dict, Optional[CachedResult]]:
+        try:
+            context = self._start_call(tool_name, timeout, request_id, session_id)
+        except ValueError as e:
+            return self._tool_error(tool_name, str(e)), None
+        try:
+            return self._run_tool(tool_name, tool_params, context)
+        finally:
+            self._finish_call(context)
+
+    def execute_tool_command(self, tool_name: str, tool_params: dict, timeout: Optional[float] = None) -> None:
+        log_event(logger, logging.INFO, "tool_execute", sample=True, tool=tool_name, params=Redacted(tool_params))
+        response_data, encoded = self.execute_tool_encoded(tool_name, tool_params, timeout)
+        self._broadcast_tool_response(response_data, encoded)
+
+    def _broadcast_tool_response(self, response_data: dict, encoded: bytes) -> None:
+        event_name = "tool_result" if response_data["status"] == "success" else "tool_error"
+        self.broadcast_sse_message(event_name=event_name, data=response_data, encoded=encoded)
+
+    def submit_tool_command(self, tool_name: str, tool_params: dict, timeout: Optional[float] = None,
+                            request_id: Optional[str] = None, session_id: Optional[str] = None) -> concurrent.futures.Future:
+        """Schedules a tool call on the tool runtime and broadcasts its outcome to the SSE clients.
+
+        Returns a future. Cancelling it (or the request, or the SSE session
+        disconnecting) cancels the call, and a ``tool_error`` event is sent
+        instead of the result. Raises ValueError if ``request_id`` is in use.
+        """
+        log_event(logger, logging.INFO, "tool_submit", sample=True, tool=tool_name, request_id=request_id,
+                  params=Redacted(tool_params))
+        context = self._start_call(tool_name, timeout, request_id, session_id)
+        return self.tool_runtime.submit(self._execute_tool_command_async(tool_name, tool_params, context))
+
+    async def _execute_tool_command_async(self, tool_name: str, tool_params: dict, context: ToolContext) -> dict:
+        try:
+            response_data, cached = await self._run_tool_async(tool_name, tool_params, context)
+        except asyncio.CancelledError:
+            context.cancel()
+            response_data = self._tool_error(tool_name, f"Tool '{tool_name}' was cancelled: {context.reason}", context)
+            self.tool_runtime.executor.submit(self._broadcast_tool_response, response_data, json.dumps(response_data).encode('utf-8'))
+            raise
+        finally:
+            self._finish_call(context)
+        # Broadcasting writes to client sockets, so it must not block the loop
+        self.tool_runtime.executor.submit(self._broadcast_tool_response, response_data,
+                                          self._encode_tool_response(response_data, cached))
+        return response_data
+
+    def submit_ingest_job(self, tool_name: str, tool_params: dict) -> dict:
+        """Queues a tool call for a background ingest worker and returns the job record."""
+        logger.info("Submitting ingest job for tool: %s", tool_name)
+        if self.writer_link is not None:
+            return self.writer_link.submit_ingest_job(tool_name, tool_params)
+        return self.ingest_queue.submit(tool_name, tool_params)
+
+    def get_ingest_status(self, job_id: Optional[str]) -> dict:
+        if self.writer_link is not None:
+            return self.writer_link.get_ingest_status(job_id)
+        if not job_id:
+            return {"mcp_protocol_version": "1.0", "status": "error", "error": "Missing job_id for get_ingest_status"}
+        job = self.ingest_queue.get(job_id)
+        if job is None:
+            return {"mcp_protocol_version": "1.0", "status": "error", "job_id": job_id, "error": "Ingest job not found"}
+        return {"mcp_protocol_version": "1.0", "status": "success", "job": job}
+
+    def list_ingest_jobs(self, status: Optional[str] = None, limit: Any = 50, offset: Any = 0) -> dict:
+        if self.writer_link is not None:
+            return self.writer_link.list_ingest_jobs(status, limit, offset)
+        try:
+            listing = self.ingest_queue.list_jobs(status=status, limit=int(limit), offset=int(offset))
+        except (TypeError, ValueError) as e:
+            return {"mcp_protocol_version": "1.0", "status": "error", "error": f"Invalid list_ingest_jobs parameters: {e}"}
+        return {"mcp_protocol_version": "1.0", "status": "success", **listing}
+
+    def _run_ingest_job(self, tool_name: str, tool_params: dict) -> dict:
+        """Ingest queue handler: runs the queued tool callback on a worker thread.
+
+        The job id doubles as the call's request id, so ``cancel`` stops running jobs too.
+        """
+        tool_definition = self.tools.get(tool_name)
+        if not tool_definition or not callable(tool_definition.get('callback')):
+            raise ValueError(f"Tool '{tool_name}' not found")
+        job_id = self.ingest_queue.current_job_id()
+        if self.ingest_queue.current_job_attempt() > 1:
+            # Interrupted before: the document may have been committed before the job was marked finished
+            document = self._find_ingested_document(job_id)
+            if document is not None:
+                logger.warning("Ingest job %s had already added %s; not adding it again", job_id, document["id"])
+                return {"message": "Document added successfully from file.", "document_id": document["id"],
+                        "derived_title": document.get("title"), "recovered": True}
+        context = self._start_call(tool_name, None, job_id, None)
+        context.job_id = job_id
+        try:
+            return self.tool_runtime.call_blocking(self._prepare_callback(tool_name, tool_definition['callback'], context),
+                                                   tool_params, context.remaining(), context)
+        finally:
+            self._finish_call(context)
+
+    def _find_ingested_document(self, job_id: str) -> Optional[dict]:
+        """The live document added by ingest job ``job_id``, if any.
+
+        Scans newest first, since an interrupted job's document is among the last added.
+        """
+        view = self._store_view()
+        if isinstance(view, list):
+            candidates = reversed(view)
+        else:
+            candidates = (view.document_at(ordinal) for ordinal in range(view.ordinal_count - 1, -1, -1))
+        for document in candidates:
+            if document is not None and document.get(INGEST_JOB_FIELD) == job_id:
+                return document
+        return None
+
+    def _on_ingest_job_complete(self, job: dict) -> None:
+        """Broadcasts the outcome of a finished ingest job, tagged with its job_id."""
+        if job.get("result") is not None:
+            response_data = {"mcp_protocol_version": "1.0", "status": "success", "tool_name": job["tool_name"],
+                             "job_id": job["job_id"], "result": job["result"]}
+            self.broadcast_sse_message(event_name="tool_result", data=response_data)
+        else:
+            error_data = {"mcp_protocol_version": "1.0", "status": "error", "tool_name": job["tool_name"],
+                          "job_id": job["job_id"], "error": job.get("error")}
             self.broadcast_sse_message(event_name="tool_error", data=error_data)
 
     def get_resource_command(self, resource_uri: str) -> None:
-        logger.info(f"Handling get_resource command for URI: {resource_uri}")
+        logger.info("Handling get_resource command for URI: %s", resource_uri)
         if not resource_uri:
             error_data = {"mcp_protocol_version": "1.0", "status": "error", "error": "Missing URI for get_resource"}
             self.broadcast_sse_message(event_name="resource_error", data=error_data)
             return
-        resource_info = self.resources.get(resource_uri)
+        resource_info = self.resolve_resource(resource_uri)
         if resource_info:
             response_data = {"mcp_protocol_version": "1.0", "status": "success", "uri": resource_uri, "resource_data": resource_info}
             self.broadcast_sse_message(event_name="resource_data", data=response_data)
@@ -647,7 +2025,7 @@ class McpServer:
             self.broadcast_sse_message(event_name="resource_error", data=error_data)
 
     def get_prompt_definition_command(self, prompt_name: str) -> None:
-        logger.info(f"Handling get_prompt_definition command for: {prompt_name}")
+        logger.info("Handling get_prompt_definition command for: %s", prompt_name)
         if not prompt_name:
             error_data = {"mcp_protocol_version": "1.0", "status": "error", "error": "Missing name for get_prompt_definition"}
             self.broadcast_sse_message(event_name="prompt_definition_error", data=error_data)
@@ -661,7 +2039,15 @@ class McpServer:
             self.broadcast_sse_message(event_name="prompt_definition_error", data=error_data)
 
     def execute_prompt_command(self, prompt_name: str, prompt_args: dict) -> None:
-        logger.info(f"Executing prompt command: {prompt_name} with args: {prompt_args}")
+        started = time.perf_counter()
+        try:
+            self._execute_prompt_command(prompt_name, prompt_args)
+        finally:
+            label = prompt_name if prompt_name in self.prompts else "unknown"
+            self.prompt_latency.observe(time.perf_counter() - started, (label,))
+
+    def _execute_prompt_command(self, prompt_name: str, prompt_args: dict) -> None:
+        log_event(logger, logging.INFO, "prompt_execute", sample=True, prompt=prompt_name, args=Redacted(prompt_args))
         
         if not prompt_name:
             error_data = {"mcp_protocol_version": "1.0", "status": "error", "error": "Missing prompt name for execute_prompt"}
@@ -681,7 +2067,7 @@ class McpServer:
                 self.broadcast_sse_message(event_name="prompt_error", data=error_data)
                 return
             
-            resource = self.resources.get(document_uri)
+            resource = self.resolve_resource(document_uri)
             if not resource:
                 error_data = {"mcp_protocol_version": "1.0", "status": "error", "name": prompt_name, "error": f"Resource not found: {document_uri}"}
                 self.broadcast_sse_message(event_name="prompt_error", data=error_data)
@@ -698,14 +2084,16 @@ class McpServer:
             response_data = {"mcp_protocol_version": "1.0", "status": "success", "prompt_name": prompt_name, "result": result_data}
             self.broadcast_sse_message(event_name="prompt_result", data=response_data)
         else:
-            logger.warning(f"Execution for prompt '{prompt_name}' is not implemented yet.")
+            logger.warning("Execution for prompt '%s' is not implemented yet.", prompt_name)
             error_data = {"mcp_protocol_version": "1.0", "status": "error", "name": prompt_name, "error": "Prompt execution not implemented yet"}
             self.broadcast_sse_message(event_name="prompt_error", data=error_data)
 
 
     def start(self, transport_type: str, **kwargs) -> None:
-        logger.info(f"启动MCP服务器 (传输类型: {transport_type})")
+        logger.info("启动MCP服务器 (传输类型: %s)", transport_type)
         self.running = True
+        if self.writer_link is None and self.replica is None:  # Ingest jobs run in the writer / on the primary
+            self.ingest_queue.start()
 
         if transport_type == 'stdio':
             logger.info("Starting McpServer in STDIO mode.")
@@ -719,36 +2107,33 @@ class McpServer:
                     
                     if line == "discover":
                         logger.info("Received capabilities discovery request.")
-                        capabilities = {
-                            "mcp_protocol_version": "1.0", "server_name": self.name, "server_version": self.version,
-                            "tools": [{"name": t_name, "description": t_info.get("description"), "schema": t_info.get("schema")} for t_name, t_info in self.tools.items()],
-                            "resources": [{k: v for k, v in res_info.items() if k != 'content'} for res_info in self.resources.values()],
-                            "prompts": [prompt_info for prompt_info in self.prompts.values()]
-                        }
-                        print(json.dumps(capabilities))
+                        print(self.capabilities_json().decode('utf-8'))
                         sys.stdout.flush()
                     else:
+                        started = time.perf_counter()
+                        self.requests_in_flight.inc(("stdio",))
                         try:
                             request_data = json.loads(line)
-                            logger.debug(f"Received MCP JSON message: {request_data}")
+                            log_event(logger, logging.DEBUG, "stdio_message", request=Redacted(request_data))
                             response = {}
+                            response_bytes = None  # Pre-encoded response, when available
                             command = request_data.get("command")
+                            command_label = command if command in KNOWN_COMMANDS else "unknown"
 
                             if command == "execute_tool":
                                 logger.info("Received execute_tool request.")
                                 tool_name = request_data.get("tool_name")
                                 tool_params = request_data.get("tool_params", {})
-                                if tool_name in self.tools:
-                                    callback = self.tools[tool_name].get('callback')
-                                    if callable(callback):
-                                        try:
-                                            result = callback(tool_params)
-                                            response = {"mcp_protocol_version": "1.0", "status": "success", "tool_name": tool_name, "result": result}
-                                        except Exception as e:
-                                            logger.exception(f"Error executing tool '{tool_name}': {e}")
-                                            response = {"mcp_protocol_version": "1.0", "status": "error", "tool_name": tool_name, "error": str(e)}
-                                    else:
-                                        response = {"mcp_protocol_version": "1.0", "status": "error", "tool_name": tool_name, "error": "Tool has no callback"}
+                                timeout = request_data.get("timeout")
+                                if not _valid_timeout(timeout):
+                                    response = {"mcp_protocol_version": "1.0", "status": "error", "error": TIMEOUT_ERROR}
+                                elif tool_name in INGEST_QUEUE_TOOLS and tool_name in self.tools and self.replica is None:
+                                    job = self.submit_ingest_job(tool_name, tool_params)
+                                    response = {"mcp_protocol_version": "1.0", "status": "accepted",
+                                                "message": f"Tool '{tool_name}' queued for ingestion.", "job_id": job["job_id"]}
+                                elif tool_name in self.tools:
+                                    response, response_bytes = self.execute_tool_encoded(
+                                        tool_name, tool_params, timeout, request_data.get("request_id"))
                                 else:
                                     response = {"mcp_protocol_version": "1.0", "status": "error", "error": f"Tool '{tool_name}' not found"}
                             
@@ -758,7 +2143,7 @@ class McpServer:
                                 if not resource_uri:
                                     response = {"mcp_protocol_version": "1.0", "status": "error", "error": "Missing URI for get_resource"}
                                 else:
-                                    resource_info = self.resources.get(resource_uri)
+                                    resource_info = self.resolve_resource(resource_uri)
                                     if resource_info:
                                         response = {"mcp_protocol_version": "1.0", "status": "success", "uri": resource_uri, "resource_data": resource_info}
                                     else:
@@ -778,6 +2163,7 @@ class McpServer:
                             
                             elif command == "execute_prompt":
                                 logger.info("Received execute_prompt request.")
+                                prompt_started = time.perf_counter()
                                 prompt_name = request_data.get("name")
                                 prompt_args = request_data.get("arguments", {})
                                 if not prompt_name:
@@ -792,7 +2178,7 @@ class McpServer:
                                             if not document_uri:
                                                 response = {"mcp_protocol_version": "1.0", "status": "error", "name": prompt_name, "error": "Missing document_uri argument"}
                                             else:
-                                                resource = self.resources.get(document_uri)
+                                                resource = self.resolve_resource(document_uri)
                                                 if not resource:
                                                     response = {"mcp_protocol_version": "1.0", "status": "error", "name": prompt_name, "error": "Resource not found"}
                                                 else:
@@ -804,20 +2190,61 @@ class McpServer:
                                                         response = {"mcp_protocol_version": "1.0", "status": "success", "prompt_name": prompt_name, "result": {"summary": summary}}
                                         else:
                                             response = {"mcp_protocol_version": "1.0", "status": "error", "name": prompt_name, "error": "Prompt execution not implemented yet"}
+                                self.prompt_latency.observe(time.perf_counter() - prompt_started,
+                                                            (prompt_name if prompt_name in self.prompts else "unknown",))
+                            elif command == "get_ingest_status":
+                                logger.info("Received get_ingest_status request.")
+                                response = self.get_ingest_status(request_data.get("job_id"))
+
+                            elif command == "list_resources":
+                                logger.info("Received list_resources request.")
+                                response = self.list_resources(request_data.get("cursor"), request_data.get("limit", RESOURCE_PAGE_SIZE))
+
+                            elif command == "replication_status":
+                                logger.info("Received replication_status request.")
+                                response = self.replication_status()
+
+                            elif command == "rate_limit_status":
+                                logger.info("Received rate_limit_status request.")
+                                response = self.rate_limit_status()
+
+                            elif command == "stats":
+                                response = self.stats()
+
+                            elif command in PROFILE_COMMANDS:
+                                logger.info("Received %s request.", command)
+                                response = self.profile_command(command, request_data)
+
+                            elif command == "cancel":
+                                # Lines are handled one at a time, so this reaches ingest jobs and calls made over HTTP
+                                logger.info("Received cancel request.")
+                                response = self.cancel_request(request_data.get("request_id"))
+
+                            elif command == "list_ingest_jobs":
+                                logger.info("Received list_ingest_jobs request.")
+                                response = self.list_ingest_jobs(
+                                    request_data.get("status"), request_data.get("limit", 50), request_data.get("offset", 0))
                             else:
-                                logger.warning(f"Unknown command or malformed request: {request_data}")
+                                log_event(logger, logging.WARNING, "unknown_command", request=Redacted(request_data))
                                 response = {"mcp_protocol_version": "1.0", "status": "error", "error": "Unknown command or malformed request"}
                             
-                            print(json.dumps(response))
+                            print(response_bytes.decode('utf-8') if response_bytes is not None else json.dumps(response))
                             sys.stdout.flush()
+                            self.responses.inc(("stdio", command_label, response.get("status", "error")))
+                            self.request_latency.observe(time.perf_counter() - started, ("stdio", command_label))
 
                         except json.JSONDecodeError:
-                            logger.warning(f"Received non-JSON message or unknown simple command: {line}")
+                            logger.warning("Received non-JSON message or unknown simple command: %s", redact(line))
                             print(json.dumps({"mcp_protocol_version": "1.0", "status": "error", "error": "Invalid JSON message"}))
                             sys.stdout.flush()
+                            self.responses.inc(("stdio", "unknown", "error"))
+                        finally:
+                            self.requests_in_flight.dec(("stdio",))
             except KeyboardInterrupt:
                 logger.info("STDIO listener interrupted by user.")
             finally:
+                self.ingest_queue.stop()
+                self.store_writer.drain()
                 logger.info("STDIO listener stopped.")
         elif transport_type == 'sse':
             port = kwargs.get('port')
@@ -825,15 +2252,19 @@ class McpServer:
                 logger.error("SSE transport requires a port to be specified.")
                 self.running = False 
                 return
-            logger.info(f"Initializing SSE transport on port {port}")
+            logger.info("Initializing SSE transport on port %s", port)
+            self.sse_keepalive.start()
             handler_class_with_instance = functools.partial(_McpSseHandler, self)
-            self.http_server = HTTPServer(('', port), handler_class_with_instance)
+            self.http_server = _McpHttpServer(('', port), handler_class_with_instance,
+                                              reuse_port=kwargs.get('reuse_port', False))
             self.http_server_thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
             self.http_server_thread.start()
-            logger.info(f"SSE HTTP server started on port {port}. Listening on {SSE_PATH} for SSE and {COMMAND_PATH} for commands.")
+            logger.info("SSE HTTP server started on port %s. Listening on %s for SSE and %s for commands.",
+                        port, SSE_PATH, COMMAND_PATH)
         else:
-            logger.error(f"Unsupported transport type: {transport_type}")
+            logger.error("Unsupported transport type: %s", transport_type)
             self.running = False 
+            self.ingest_queue.stop()
             return
         
         if transport_type == 'stdio':
@@ -842,6 +2273,18 @@ class McpServer:
     def stop(self) -> None:
         logger.info("McpServer stopping...") 
         self.running = False 
+        self.ingest_queue.stop()
+        self.store_writer.close()
+        self.search_index.close()
+        if self.sharded_search is not None:
+            self.sharded_search.close()
+            self.sharded_search = None
+        if self.federation is not None:
+            self.federation.close()
+        if self.replica is not None:
+            self.replica.stop()
+        self.tool_runtime.close()
+        self.sse_keepalive.close()  # Wakes the SSE handlers
         if self.http_server:
             logger.info("Stopping SSE HTTP server...")
             self.http_server.shutdown() 
@@ -853,7 +2296,7 @@ class McpServer:
         
         for client_wfile in self.sse_clients[:]:
              try: client_wfile.close()
-             except Exception as e: logger.debug(f"Error closing an SSE client stream: {e}")
+             except Exception as e: logger.debug("Error closing an SSE client stream: %s", e)
         self.sse_clients.clear()
         logger.info("McpServer stopped.")
 
@@ -862,7 +2305,7 @@ def _execute_document_search(params: dict) -> dict: # This is the old one, now u
     query = params.get("query")
     max_results_str = params.get("max_results", "3")
     try: max_results = int(max_results_str)
-    except ValueError: max_results = 3; logger.warning(f"Invalid max_results '{max_results_str}', using 3.")
+    except ValueError: max_results = 3; logger.warning("Invalid max_results '%s', using 3.", max_results_str)
     if not query or not query.strip(): return {"error": "Missing or empty query parameter"} # Should be handled by schema or new logic
     results = [{"id": f"doc_{i}", "title": f"Dummy Document {i} about '{query}'", 
                 "snippet": f"Snippet for doc {i} on '{query}'.", "score": round(1.0/i, 2)} 
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+分片搜索 - 多进程 scatter-gather 文档检索
+
+The corpus is partitioned across worker processes so ``document_search``
+can use more than one core. Every worker maps the same binary snapshot
+(:mod:`mcp.snapshot`), so the corpus is shared through the OS page cache.
+Each worker builds a :class:`~mcp.search_index.SearchIndex` over the
+documents it owns. A query is sent to all shards (scatter). Each shard
+returns its first ``k`` verified matches, and the coordinator merges them in
+store order (gather).
+
+Ownership is by store ordinal. Snapshot documents start out assigned round
+robin (``ordinal % num_shards``). Documents added later go to the least
+loaded shard. When deletes leave the shards uneven, a background thread
+runs :meth:`ShardedSearch.rebalance`, which moves documents from the fullest
+to the emptiest shard. Adds and deletes never wait for a move.
+
+A search takes the deadline and cancellation of its tool call
+(:class:`~mcp.tool_runtime.ToolContext`). The coordinator stops waiting for
+the shards as soon as the call is cancelled or times out. Each shard stops
+scanning at the deadline. A shard cannot be interrupted mid-scan, so on
+cancellation it finishes its current scan and the result is discarded.
+"""
+
+import heapq
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import CancelledError, Future, InvalidStateError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .search_index import SearchIndex, document_matches
+from .snapshot import SnapshotReader
+from .tool_runtime import CHECK_INTERVAL, ToolContext
+
+logger = logging.getLogger(__name__)
+
+# Rebalance when the fullest and emptiest shards differ by more than this
+# fraction of the average shard size (and by more than one document).
+DEFAULT_REBALANCE_TOLERANCE = 0.1
+
+
+# --- Worker process ---
+
+class _Shard:
+    """State of one shard, living in a worker process."""
+
+    def __init__(self, shard_id: int, num_shards: int, snapshot_path: Optional[str]):
+        self.reader = SnapshotReader(snapshot_path) if snapshot_path else None
+        self.index = SearchIndex(name=f"shard-{shard_id}-index")
+        self.base_owned = set(range(shard_id, len(self.reader), num_shards)) if self.reader else set()
+        self.appended: Dict[int, dict] = {}  # Documents added after the snapshot, by ordinal
+        if self.reader is not None:
+            self.index.bulk_load((o, self.reader.document(o)) for o in sorted(self.base_owned))
+
+    def document(self, ordinal: int) -> Optional[dict]:
+        document = self.appended.get(ordinal)
+        if document is None and ordinal in self.base_owned:
+            document = self.reader.document(ordinal)
+        return document
+
+    def owned(self) -> List[int]:
+        return sorted(itertools.chain(self.base_owned, self.appended))
+
+    def search(self, query: str, k: int, budget: Optional[float] = None) -> List[Tuple[int, dict]]:
+        """The first ``k`` owned matches; raises TimeoutError once ``budget`` seconds have passed."""
+        deadline = time.monotonic() + budget if budget is not None else None
+        candidates = self.index.search(query)
+        ordinals = self.owned() if candidates is None else candidates
+        results = []
+        for scanned, ordinal in enumerate(ordinals):
+            if deadline is not None and scanned % CHECK_INTERVAL == 0 and time.monotonic() >= deadline:
+                raise TimeoutError(f"search deadline passed after {scanned} documents")
+            document = self.document(ordinal)
+            if document is not None and document_matches(document, query):
+                results.append((ordinal, document))
+                if 0 < k <= len(results):
+                    break
+        return results
+
+    def add(self, ordinal: int, document: Optional[dict]) -> None:
+        if document is None:  # Adopting a snapshot document
+            self.base_owned.add(ordinal)
+            document = self.reader.document(ordinal)
+        else:
+            self.appended[ordinal] = document
+        self.index.add(ordinal, document)
+
+    def delete(self, ordinal: int) -> None:
+        self.base_owned.discard(ordinal)
+        self.appended.pop(ordinal, None)
+        self.index.delete(ordinal)
+
+    def export(self, count: int) -> List[Tuple[int, Optional[dict]]]:
+        """Picks ``count`` owned documents to move; snapshot documents are sent by ordinal only."""
+        chosen = self.owned()[-count:] if count > 0 else []
+        return [(o, self.appended.get(o)) for o in chosen]
+
+
+def _shard_main(shard_id: int, num_shards: int, snapshot_path: Optional[str], conn) -> None:
+    """Entry point of a shard worker process: serves requests from ``conn`` until ``stop``."""
+    try:
+        shard = _Shard(shard_id, num_shards, snapshot_path)
+        conn.send((None, "ready", len(shard.base_owned)))
+    except Exception as e:
+        conn.send((None, "error", f"shard {shard_id} failed to load: {e}"))
+        return
+    while True:
+        try:
+            request_id, op, args = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            if op == "search":
+                result = shard.search(*args)
+            elif op == "add":
+                result = shard.add(*args)
+            elif op == "adopt":
+                result = [shard.add(ordinal, document) for ordinal, document in args[0]]
+            elif op == "delete":
+                result = [shard.delete(ordinal) for ordinal in args[0]]
+            elif op == "export":
+                result = shard.export(*args)
+            elif op == "stats":
+                result = {"documents": len(shard.base_owned) + len(shard.appended), **shard.index.stats()}
+            elif op == "stop":
+                conn.send((request_id, "ok", None))
+                break
+            else:
+                raise ValueError(f"unknown shard operation {op!r}")
+            conn.send((request_id, "ok", result))
+        except Exception as e:
+            conn.send((request_id, "error", str(e)))
+    shard.index.close()
+
+
+# --- Coordinator ---
+
+class ShardError(Exception):
+    """Raised when a shard worker fails or is unavailable."""
+
+
+class _ShardClient:
+    """Pipe to one shard worker. Requests are pipelined; a reader thread resolves their futures."""
+
+    def __init__(self, shard_id: int, conn, process):
+        self.shard_id = shard_id
+        self.conn = conn
+        self.process = process
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._ids = itertools.count()
+        self._reader = threading.Thread(target=self._read_loop, name=f"shard-{shard_id}-reader", daemon=True)
+
+    def start_reader(self) -> None:
+        self._reader.start()
+
+    def call(self, op: str, *args: Any) -> Future:
+        future: Future = Future()
+        with self._send_lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                self.conn.send((request_id, op, args))
+            except (OSError, ValueError) as e:
+                self._pending.pop(request_id, None)
+                future.set_exception(ShardError(f"shard {self.shard_id} is unavailable: {e}"))
+        return future
+
+    def _read_loop(self) -> None:
+        while True:
+            try:
+                request_id, status, payload = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            try:
+                if status == "ok":
+                    future.set_result(payload)
+                else:
+                    future.set_exception(ShardError(f"shard {self.shard_id}: {payload}"))
+            except InvalidStateError:
+                pass  # The search was cancelled and no longer waits for this reply
+        for future in list(self._pending.values()):
+            try:
+                future.set_exception(ShardError(f"shard {self.shard_id} exited"))
+            except InvalidStateError:
+                pass
+        self._pending.clear()
+
+
+class ShardedSearch:
+    """Coordinates ``num_shards`` search worker processes over a snapshot file.
+
+    Ordinals and documents must follow the owning :class:`~mcp.document_store.DocumentStore`:
+    the caller reports every add and delete via :meth:`add` and :meth:`delete`.
+    """
+
+    def __init__(self, snapshot_path: Optional[str], num_shards: int, timeout: float = 30.0,
+                 rebalance_tolerance: float = DEFAULT_REBALANCE_TOLERANCE):
+        self.snapshot_path = snapshot_path
+        self.num_shards = max(1, int(num_shards))
+        self.timeout = timeout
+        self.rebalance_tolerance = rebalance_tolerance
+        self._route_lock = threading.Lock()
+        self._owner: Dict[int, int] = {}  # Ordinals not owned by their round-robin shard
+        self._loads: List[int] = []
+        self._clients: List[_ShardClient] = []
+        self.moves = 0
+        # Rebalancing, in the background; guarded by _route_lock unless noted
+        self._rebalance_lock = threading.Lock()  # One move at a time
+        self._rebalancing = False
+        self._balanced = threading.Event()
+        self._balanced.set()
+        self._exporting: Optional[Set[int]] = None  # Deleted while a move's export is in flight
+        self._moving: Dict[int, int] = {}  # Ordinals being adopted by their new shard, to their old one
+
+        # Spawned (not forked) so workers do not inherit the server's threads and locks
+        context = multiprocessing.get_context("spawn")
+        for shard_id in range(self.num_shards):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_shard_main, name=f"search-shard-{shard_id}",
+                                      args=(shard_id, self.num_shards, snapshot_path, child_conn), daemon=True)
+            process.start()
+            child_conn.close()
+            self._clients.append(_ShardClient(shard_id, parent_conn, process))
+        for client in self._clients:
+            if not client.conn.poll(timeout):
+                self.close()
+                raise ShardError(f"shard {client.shard_id} did not start within {timeout}s")
+            _, status, payload = client.conn.recv()
+            if status != "ready":
+                self.close()
+                raise ShardError(payload)
+            self._loads.append(payload)
+            client.start_reader()
+        logger.info("Started %s search shards over %s (documents per shard: %s)",
+                    self.num_shards, snapshot_path, self._loads)
+
+    def _owner_of(self, ordinal: int) -> int:
+        return self._owner.get(ordinal, ordinal % self.num_shards)
+
+    def search(self, query: str, k: int, context: Optional[ToolContext] = None) -> List[dict]:
+        """Scatters ``query`` to every shard and merges their first ``k`` matches in store order.
+
+        Raises the errors of :meth:`ToolContext.check` once ``context`` is
+        cancelled or past its deadline, without waiting for the shards.
+        """
+        timeout = self.timeout
+        if context is not None:
+            context.check()
+            remaining = context.remaining()
+            if remaining is not None:
+                timeout = min(timeout, remaining)
+        futures = [client.call("search", query, k, timeout) for client in self._clients]
+
+        def abandon() -> None:  # The call was cancelled: stop waiting for the shards
+            for future in futures:
+                future.cancel()
+
+        if context is not None:
+            context.add_cancel_callback(abandon)
+        deadline = time.monotonic() + timeout
+        try:
+            per_shard = [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+        except (CancelledError, FutureTimeoutError, ShardError):
+            if context is not None:
+                context.check()  # Raises if the call was cancelled or timed out
+            raise
+        finally:
+            if context is not None:
+                context.remove_cancel_callback(abandon)
+        results, seen = [], set()
+        # A document being moved between shards can briefly be returned by both
+        for ordinal, document in heapq.merge(*per_shard, key=lambda item: item[0]):
+            if ordinal in seen:
+                continue
+            seen.add(ordinal)
+            results.append(document)
+            if 0 < k <= len(results):
+                break
+        return results
+
+    def add(self, ordinal: int, document: dict) -> None:
+        """Assigns a newly stored document to the least loaded shard."""
+        with self._route_lock:
+            shard_id = min(range(self.num_shards), key=self._loads.__getitem__)
+            if shard_id != ordinal % self.num_shards:
+                self._owner[ordinal] = shard_id
+            self._loads[shard_id] += 1
+            self._clients[shard_id].call("add", ordinal, dict(document))
+
+    def delete(self, ordinal: int) -> None:
+        """Drops a deleted document; if the shards become uneven, starts a background rebalance."""
+        with self._route_lock:
+            shard_id = self._owner.pop(ordinal, ordinal % self.num_shards)
+            self._loads[shard_id] -= 1
+            self._clients[shard_id].call("delete", [ordinal])
+            if self._exporting is not None:
+                self._exporting.add(ordinal)
+            previous = self._moving.get(ordinal)
+            if previous is not None:
+                self._clients[previous].call("delete", [ordinal])  # Its old shard still holds it
+            start = not self._rebalancing and self._imbalanced()
+            if start:
+                self._rebalancing = True
+                self._balanced.clear()
+        if start:
+            threading.Thread(target=self._rebalance_in_background, name="shard-rebalance", daemon=True).start()
+
+    def wait_for_rebalance(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until no background rebalance is running; True if none is."""
+        return self._balanced.wait(timeout)
+
+    def _rebalance_in_background(self) -> None:
+        while True:
+            failed = False
+            try:
+                self.rebalance()
+            except Exception as e:
+                failed = True
+                if self._clients:  # Not stopped meanwhile
+                    logger.error("Rebalancing search shards failed: %s", e)
+            with self._route_lock:
+                # Deletes that arrived after the last move saw a rebalance running and left it to this one
+                if failed or not self._clients or not self._imbalanced():
+                    self._rebalancing = False
+                    self._balanced.set()
+                    return
+
+    def _imbalanced(self) -> bool:
+        spread = max(self._loads) - min(self._loads)
+        average = sum(self._loads) / self.num_shards
+        return spread > max(1, self.rebalance_tolerance * average)
+
+    def rebalance(self) -> int:
+        """Moves documents from the fullest to the emptiest shard until loads are even.
+
+        The routing lock is held only between the shard round trips, so adds
+        and deletes proceed while documents move. The target adopts the
+        documents before the source drops them, so searches running
+        meanwhile never miss them. Returns how many moved.
+        """
+        moved = 0
+        with self._rebalance_lock:
+            while True:
+                with self._route_lock:
+                    if not self._imbalanced():
+                        break
+                    source = max(range(self.num_shards), key=self._loads.__getitem__)
+                    target = min(range(self.num_shards), key=self._loads.__getitem__)
+                    count = (self._loads[source] - self._loads[target]) // 2
+                    self._exporting = set()
+                    exported = self._clients[source].call("export", count)
+                try:
+                    items = exported.result(timeout=self.timeout)
+                finally:
+                    with self._route_lock:
+                        deleted, self._exporting = self._exporting, None
+                items = [(ordinal, document) for ordinal, document in items if ordinal not in deleted]
+                if not items:
+                    break
+                ordinals = [ordinal for ordinal, _ in items]
+                with self._route_lock:
+                    # From here on, adds and deletes of these documents go to the target
+                    for ordinal in ordinals:
+                        if target == ordinal % self.num_shards:
+                            self._owner.pop(ordinal, None)
+                        else:
+                            self._owner[ordinal] = target
+                        self._moving[ordinal] = source
+                    self._loads[source] -= len(items)
+                    self._loads[target] += len(items)
+                    adopted = self._clients[target].call("adopt", items)
+                try:
+                    adopted.result(timeout=self.timeout)
+                finally:
+                    with self._route_lock:
+                        for ordinal in ordinals:
+                            self._moving.pop(ordinal, None)
+                with self._route_lock:
+                    dropped = self._clients[source].call("delete", ordinals)
+                dropped.result(timeout=self.timeout)
+                moved += len(items)
+            self.moves += moved
+        if moved:
+            logger.info("Rebalanced search shards: moved %s documents (documents per shard: %s)", moved, self._loads)
+        return moved
+
+    def stats(self) -> List[Dict[str, Any]]:
+        futures = [client.call("stats") for client in self._clients]
+        return [future.result(timeout=self.timeout) for future in futures]
+
+    def close(self, timeout: float = 5.0) -> None:
+        for client in self._clients:
+            try:
+                client.call("stop")
+            except Exception:
+                pass
+        for client in self._clients:
+            client.process.join(timeout=timeout)
+            if client.process.is_alive():
+                client.process.terminate()
+            client.conn.close()
+        self._clients = []
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文档库二进制快照 - 内存映射的紧凑存储格式
+
+The snapshot is a derived, read-only image of ``documents.json`` that can be
+memory-mapped at startup instead of parsing the whole JSON file. Documents are
+materialized lazily from the map; the id lookup index is stored in the file so
+it never has to be rebuilt.
+
+Layout (all integers little-endian)::
+
+    header      magic, version, counts, section offsets, source file stat
+    records     one fixed-size record per document (string refs + keyword range)
+    kw_refs     keyword string refs, referenced by records as [start, start+count)
+    id_index    document ordinals sorted by document id (binary searchable)
+    heap        UTF-8 string heap; identical short strings (e.g. keywords) are stored once
+"""
+
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from .persistence import atomic_write
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"MCPSNAP1"
+SNAPSHOT_VERSION = 1
+
+# magic, version, doc_count, kw_ref_count, id_count, records_off, kw_refs_off, id_index_off, heap_off, source_mtime_ns, source_size
+_HEADER = struct.Struct("<8sIIIIQQQQqq")
+# (offset, length) for id, title, abstract, extra JSON; kw_start, kw_count, field flags
+_RECORD = struct.Struct("<QIQIQIQIIII")
+_STRING_REF = struct.Struct("<QI")
+_ORDINAL = struct.Struct("<I")
+
+# Field presence flags, so documents missing a field round-trip exactly
+_HAS_ID = 1
+_HAS_TITLE = 2
+_HAS_ABSTRACT = 4
+_HAS_KEYWORDS = 8
+
+_STANDARD_FIELDS = ("id", "title", "abstract", "keywords")
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing, stale, or malformed."""
+
+
+# Longer strings (abstracts, mostly) are rarely repeated, so the heap does not remember them
+_DEDUP_MAX_BYTES = 256
+
+
+class _StringHeap:
+    """Spills the string heap to ``file``, storing each distinct short string once."""
+
+    def __init__(self, file):
+        self._file = file
+        self._size = 0
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, value: str) -> Tuple[int, int]:
+        ref = self._offsets.get(value)
+        if ref is None:
+            encoded = value.encode('utf-8')
+            ref = (self._size, len(encoded))
+            self._file.write(encoded)
+            self._size += len(encoded)
+            if len(encoded) <= _DEDUP_MAX_BYTES:
+                self._offsets[value] = ref
+        return ref
+
+
+def _source_stat(source_path: Optional[str]) -> Tuple[int, int]:
+    if not source_path:
+        return 0, 0
+    st = os.stat(source_path)
+    return st.st_mtime_ns, st.st_size
+
+
+class SnapshotWriter:
+    """Builds a snapshot one document at a time.
+
+    Only the fixed-size records stay in memory; strings go to a temporary
+    heap file next to ``path``, so writing a large store does not hold its
+    text in memory. :meth:`finish` writes the snapshot and renames it into
+    place; :meth:`abort` discards it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._heap_file = tempfile.TemporaryFile(prefix=".snapshot-heap-", dir=os.path.dirname(os.path.abspath(path)))
+        self._heap = _StringHeap(self._heap_file)
+        self._records: List[bytes] = []
+        self._kw_refs: List[bytes] = []
+        self._ids: List[Tuple[str, int]] = []
+
+    def add(self, doc: Mapping[str, Any]) -> None:
+        heap = self._heap
+        ordinal = len(self._records)
+        empty_ref = (0, 0)
+        flags = 0
+        extra = {k: v for k, v in doc.items() if k not in _STANDARD_FIELDS}
+
+        doc_id = doc.get("id")
+        if isinstance(doc_id, str):
+            flags |= _HAS_ID
+            id_ref = heap.add(doc_id)
+            self._ids.append((doc_id, ordinal))
+        else:
+            id_ref = empty_ref
+            if "id" in doc:
+                extra["id"] = doc_id
+
+        refs = []
+        for field, flag in (("title", _HAS_TITLE), ("abstract", _HAS_ABSTRACT)):
+            value = doc.get(field)
+            if isinstance(value, str):
+                flags |= flag
+                refs.append(heap.add(value))
+            else:
+                refs.append(empty_ref)
+                if field in doc:
+                    extra[field] = value
+
+        keywords = doc.get("keywords")
+        kw_refs = self._kw_refs
+        kw_start = len(kw_refs)
+        if isinstance(keywords, list) and all(isinstance(k, str) for k in keywords):
+            flags |= _HAS_KEYWORDS
+            for keyword in keywords:
+                kw_refs.append(_STRING_REF.pack(*heap.add(keyword)))
+        elif "keywords" in doc:
+            extra["keywords"] = keywords
+        kw_count = len(kw_refs) - kw_start
+
+        extra_ref = heap.add(json.dumps(extra)) if extra else empty_ref
+        self._records.append(_RECORD.pack(*id_ref, *refs[0], *refs[1], *extra_ref, kw_start, kw_count, flags))
+
+    def finish(self, source_path: Optional[str] = None) -> int:
+        """Writes the snapshot to ``path`` and returns its document count.
+
+        ``source_path`` is the JSON file the snapshot is derived from; its stat
+        is recorded so :func:`open_snapshot` can detect a stale snapshot.
+        """
+        try:
+            records, kw_refs = self._records, self._kw_refs
+            self._ids.sort()
+            id_index = b"".join(_ORDINAL.pack(ordinal) for _, ordinal in self._ids)
+
+            records_off = _HEADER.size
+            kw_refs_off = records_off + len(records) * _RECORD.size
+            id_index_off = kw_refs_off + len(kw_refs) * _STRING_REF.size
+            heap_off = id_index_off + len(id_index)
+            mtime_ns, size = _source_stat(source_path)
+            header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(records), len(kw_refs), len(self._ids),
+                                  records_off, kw_refs_off, id_index_off, heap_off, mtime_ns, size)
+
+            def write(f) -> None:
+                f.write(header)
+                f.write(b"".join(records))
+                f.write(b"".join(kw_refs))
+                f.write(id_index)
+                self._heap_file.seek(0)
+                shutil.copyfileobj(self._heap_file, f)
+
+            atomic_write(self.path, write, binary=True)
+        finally:
+            self.abort()
+        logger.info("Wrote document snapshot with %d documents to %s", len(records), self.path)
+        return len(records)
+
+    def abort(self) -> None:
+        self._heap_file.close()
+
+
+def write_snapshot(path: str, documents: Iterable[dict], source_path: Optional[str] = None) -> int:
+    """Writes ``documents`` to a snapshot file at ``path`` and returns the document count.
+
+    ``source_path`` is the JSON file the snapshot is derived from; its stat is
+    recorded so :func:`open_snapshot` can detect a stale snapshot. The file is
+    written to a temporary path and renamed into place, so existing readers
+    keep their (still valid) mapping of the previous version.
+    """
+    writer = SnapshotWriter(path)
+    try:
+        for doc in documents:
+            writer.add(doc)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.finish(source_path)
+
+
+class SnapshotReader:
+    """Read-only, memory-mapped view of a snapshot file.
+
+    Nothing is decoded up front: :meth:`document` materializes a single
+    document dict from the map and :meth:`find` binary-searches the persisted
+    id index.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:  # Empty file cannot be mapped
+                raise SnapshotError(f"Cannot map snapshot {path}: {e}")
+        if len(self._map) < _HEADER.size:
+            self.close()
+            raise SnapshotError(f"Snapshot {path} is truncated")
+        (magic, version, self._count, self._kw_ref_count, self._id_count, self._records_off, self._kw_refs_off,
+         self._id_index_off, self._heap_off, self.source_mtime_ns, self.source_size) = _HEADER.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self.close()
+            raise SnapshotError(f"Snapshot {path} has an unsupported format")
+        if self._heap_off > len(self._map) or self._id_index_off + self._id_count * _ORDINAL.size != self._heap_off:
+            self.close()
+            raise SnapshotError(f"Snapshot {path} is corrupt")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._heap_off + offset
+        return self._map[start:start + length].decode('utf-8')
+
+    def document_id(self, ordinal: int) -> Optional[str]:
+        fields = _RECORD.unpack_from(self._map, self._records_off + ordinal * _RECORD.size)
+        return self._string(fields[0], fields[1]) if fields[10] & _HAS_ID else None
+
+    def document(self, ordinal: int) -> Dict[str, Any]:
+        """Materializes the document at ``ordinal`` as a new dict."""
+        if not 0 <= ordinal < self._count:
+            raise IndexError("snapshot document index out of range")
+        (id_off, id_len, title_off, title_len, abstract_off, abstract_len,
+         extra_off, extra_len, kw_start, kw_count, flags) = _RECORD.unpack_from(self._map, self._records_off + ordinal * _RECORD.size)
+        doc: Dict[str, Any] = {}
+        if flags & _HAS_ID:
+            doc["id"] = self._string(id_off, id_len)
+        if flags & _HAS_TITLE:
+            doc["title"] = self._string(title_off, title_len)
+        if flags & _HAS_ABSTRACT:
+            doc["abstract"] = self._string(abstract_off, abstract_len)
+        if flags & _HAS_KEYWORDS:
+            base = self._kw_refs_off
+            doc["keywords"] = [
+                self._string(*_STRING_REF.unpack_from(self._map, base + i * _STRING_REF.size))
+                for i in range(kw_start, kw_start + kw_count)
+            ]
+        if extra_len:
+            doc.update(json.loads(self._string(extra_off, extra_len)))
+        return doc
+
+    def find(self, doc_id: str) -> Optional[int]:
+        """Returns the ordinal of the document with ``doc_id`` using the mapped id index."""
+        lo, hi = 0, self._id_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            ordinal = _ORDINAL.unpack_from(self._map, self._id_index_off + mid * _ORDINAL.size)[0]
+            candidate = self.document_id(ordinal)
+            if candidate == doc_id:
+                return ordinal
+            if candidate < doc_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for ordinal in range(self._count):
+            yield self.document(ordinal)
+
+    def close(self) -> None:
+        if getattr(self, "_map", None) is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Still referenced by an exported buffer; released with the object.
+                pass
+            self._map = None
+
+
+def open_snapshot(path: str, source_path: Optional[str] = None) -> SnapshotReader:
+    """Opens the snapshot at ``path``, verifying it is up to date with ``source_path``.
+
+    Raises :class:`SnapshotError` if the snapshot is missing, malformed, or was
+    derived from a different version of the source file.
+    """
+    if not os.path.exists(path):
+        raise SnapshotError(f"Snapshot {path} does not exist")
+    reader = SnapshotReader(path)
+    if source_path is not None:
+        try:
+            mtime_ns, size = _source_stat(source_path)
+        except OSError as e:
+            reader.close()
+            raise SnapshotError(f"Cannot stat snapshot source {source_path}: {e}")
+        if (mtime_ns, size) != (reader.source_mtime_ns, reader.source_size):
+            reader.close()
+            raise SnapshotError(f"Snapshot {path} is stale relative to {source_path}")
+    return reader
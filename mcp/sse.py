@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SSE 连接管理 - 集中的保活调度与断开检测
+
+Every open ``/mcp_sse`` stream is an :class:`SseSubscriber`. Its handler
+thread blocks in :meth:`SseSubscriber.wait` and wakes only when the stream
+ends: the client disconnected, a write to it failed, or the server is
+stopping.
+
+One :class:`KeepaliveScheduler` thread serves all subscribers:
+
+* it watches their connections with a selector, so a client that closes
+  its side is noticed at once, without polling;
+* it sends the ``: keepalive`` comments from a timer wheel with one slot
+  per :data:`TICK` seconds. A subscriber is due :data:`KEEPALIVE_INTERVAL`
+  seconds after its last write. When its slot comes up, the subscriber
+  gets a keepalive only if nothing was written to it since. Otherwise it
+  moves to the slot of its new deadline, so busy streams never carry
+  keepalives.
+
+Writes to a subscriber are serialised, so a keepalive never splits an
+event written by a broadcasting thread, and they never block: output a
+client has not read yet is queued per subscriber and sent by the scheduler
+thread when the socket becomes writable. A client that stops reading only
+delays itself; once its queue exceeds :data:`MAX_PENDING_BYTES`, or it
+reads nothing for :data:`SEND_TIMEOUT`, it is dropped.
+
+Broadcast events carry ids ``<epoch>-<seq>``, numbered by an
+:class:`EventBuffer` that keeps the most recent encoded events. A client
+that reconnects with a ``Last-Event-ID`` the buffer still covers is sent
+only the events it missed. The epoch changes when the server restarts, so
+an id from an earlier run is never resumed.
+"""
+
+import itertools
+import logging
+import selectors
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from .http_support import StreamEncoder
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE = b": keepalive\n\n"
+KEEPALIVE_INTERVAL = 15.0  # seconds without a write before a keepalive is sent
+TICK = 1.0  # seconds per timer wheel slot
+# A client whose queued output is not read for this long is dropped
+SEND_TIMEOUT = 10.0  # seconds
+# Output queued for a client that is not reading before it is dropped
+MAX_PENDING_BYTES = 1024 * 1024
+# Recent events kept for clients that reconnect, bounded by count and size
+REPLAY_EVENTS = 1024
+REPLAY_BYTES = 8 * 1024 * 1024
+
+
+class SseSubscriber:
+    """One open event stream; ``write`` and ``close`` can be called from any thread.
+
+    Writes never wait for the client. The socket is non-blocking, and what
+    it does not take at once is queued, up to ``max_pending`` bytes, for the
+    scheduler thread to send as the client reads. A client that overflows
+    its queue, or reads nothing for :data:`SEND_TIMEOUT` while output is
+    queued, is dropped (:attr:`too_slow`).
+    """
+
+    __slots__ = ("connection", "session_id", "max_pending", "last_write", "last_progress", "disconnected",
+                 "too_slow", "_lock", "_ended", "_held", "_encoder", "_pending", "_pending_bytes", "_on_blocked")
+
+    def __init__(self, connection: socket.socket, session_id: Optional[str] = None, encoding: Optional[str] = None,
+                 max_pending: int = MAX_PENDING_BYTES):
+        self.connection = connection
+        self.session_id = session_id
+        self.max_pending = max_pending
+        self.last_write = time.monotonic()
+        self.last_progress = self.last_write  # When the client last took queued output
+        self.disconnected = False  # The client closed the stream or a write to it failed
+        self.too_slow = False  # Dropped for not reading its stream
+        self._lock = threading.Lock()
+        self._ended = threading.Event()
+        self._held: Optional[List[bytes]] = None  # Events held back until the replay is written
+        self._encoder = StreamEncoder(encoding) if encoding is not None else None
+        self._pending: Deque[memoryview] = deque()  # Output the socket has not taken yet
+        self._pending_bytes = 0
+        # Set by the scheduler watching this stream; told when output starts to queue
+        self._on_blocked: Optional[Callable[["SseSubscriber"], None]] = None
+        connection.setblocking(False)
+
+    @property
+    def closed(self) -> bool:
+        return self._ended.is_set()
+
+    @property
+    def pending_bytes(self) -> int:
+        return self._pending_bytes
+
+    def write(self, data: bytes) -> None:
+        with self._lock:
+            if self._held is not None:
+                self._held.append(data)
+                return
+            blocked = self._send(data)
+        if blocked:
+            self._blocked()
+
+    def flush(self) -> None:
+        pass  # Output the socket does not take is sent by the scheduler
+
+    def hold(self) -> None:
+        """Queues the events written from now on, until :meth:`release`."""
+        with self._lock:
+            self._held = []
+
+    def release(self, first: bytes) -> int:
+        """Writes ``first`` (greeting and replayed events), then the held events; returns the bytes written."""
+        with self._lock:
+            data = first + b"".join(self._held or ())
+            self._held = None
+            blocked = self._send(data)
+        if blocked:
+            self._blocked()
+        return len(data)
+
+    def try_keepalive(self) -> bool:
+        """Sends a keepalive unless the stream is busy; True if it was sent."""
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self._held is not None or self._pending:
+                return False
+            blocked = self._send(KEEPALIVE)
+        finally:
+            self._lock.release()
+        if blocked:
+            self._blocked()
+        return True
+
+    def send_pending(self) -> bool:
+        """Sends what the socket takes of the queued output; True once nothing is left."""
+        with self._lock:
+            while self._pending:
+                chunk = self._pending[0]
+                try:
+                    sent = self.connection.send(chunk)
+                except (BlockingIOError, InterruptedError):
+                    break
+                self._pending_bytes -= sent
+                self.last_progress = time.monotonic()
+                if sent < len(chunk):
+                    self._pending[0] = chunk[sent:]
+                    break
+                self._pending.popleft()
+            return not self._pending
+
+    def stalled(self, now: float, timeout: float = SEND_TIMEOUT) -> bool:
+        """True if output has been queued for ``timeout`` seconds without the client taking any."""
+        return bool(self._pending) and now - self.last_progress > timeout
+
+    def drop(self) -> None:
+        """Ends the stream of a client that stopped reading it."""
+        self.too_slow = True
+        self.close()
+
+    def close(self) -> None:
+        """Ends the stream after a failed write; the handler thread wakes and cleans up."""
+        self.disconnected = True
+        self._ended.set()
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def end(self) -> None:
+        """Wakes the handler thread without touching the connection (server shutdown)."""
+        self._ended.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the stream ends; True if it did."""
+        return self._ended.wait(timeout)
+
+    def _send(self, data: bytes) -> bool:
+        # Called with the lock held; True if output has just started to queue
+        if self._ended.is_set():
+            return False
+        if self._encoder is not None:
+            data = self._encoder.encode(data)
+        self.last_write = time.monotonic()
+        if self._pending:
+            self._queue(data)
+            return False
+        try:
+            sent = self.connection.send(data)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        if sent == len(data):
+            return False
+        self.last_progress = self.last_write
+        self._queue(memoryview(data)[sent:])
+        return not self._ended.is_set()
+
+    def _queue(self, data) -> None:
+        if self._pending_bytes + len(data) > self.max_pending:
+            logger.info("SSE client %s dropped: %d bytes queued that it has not read", self.session_id,
+                        self._pending_bytes + len(data))
+            self._pending.clear()
+            self._pending_bytes = 0
+            self.drop()
+            return
+        self._pending.append(memoryview(data))
+        self._pending_bytes += len(data)
+
+    def _blocked(self) -> None:
+        on_blocked = self._on_blocked
+        if on_blocked is not None:
+            on_blocked(self)
+
+
+class EventBuffer:
+    """Numbers broadcast events and keeps the most recent ones, encoded, for :meth:`since`."""
+
+    def __init__(self, max_events: int = REPLAY_EVENTS, max_bytes: int = REPLAY_BYTES, epoch: Optional[str] = None):
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.epoch = epoch or uuid.uuid4().hex[:8]
+        self.seq = 0  # Last event numbered
+        self._floor = 0  # Newest event no longer held; ids from here on can be resumed
+        self._events: Deque[Tuple[int, bytes]] = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def reset(self, epoch: str, seq: int) -> None:
+        """Continues another process's numbering (pre-fork workers share the writer's)."""
+        with self._lock:
+            self.epoch = epoch
+            self.seq = self._floor = seq
+            self._events.clear()
+            self._bytes = 0
+
+    def last_id(self) -> str:
+        return f"{self.epoch}-{self.seq}"
+
+    def append(self, event_name: str, encoded: bytes, seq: Optional[int] = None) -> bytes:
+        """Numbers the event (``seq``, if it was numbered elsewhere) and returns it encoded for the stream."""
+        with self._lock:
+            self.seq = self.seq + 1 if seq is None else seq
+            message = f"id: {self.epoch}-{self.seq}\nevent: {event_name}\ndata: ".encode('utf-8') + encoded + b"\n\n"
+            self._events.append((self.seq, message))
+            self._bytes += len(message)
+            while len(self._events) > self.max_events or (self._bytes > self.max_bytes and len(self._events) > 1):
+                self._floor, dropped = self._events.popleft()
+                self._bytes -= len(dropped)
+            return message
+
+    def parse(self, event_id: str) -> Optional[int]:
+        """The sequence number of ``event_id`` if it belongs to this run, else None."""
+        epoch, _, seq = event_id.strip().rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def since(self, event_id: str) -> Optional[List[bytes]]:
+        """The events after ``event_id``, or None if some of them are no longer held."""
+        seq = self.parse(event_id)
+        with self._lock:
+            if seq is None or seq < self._floor or seq > self.seq:
+                return None
+            skip = len(self._events) - (self.seq - seq)
+            return [message for _, message in itertools.islice(self._events, skip, None)]
+
+    def stats(self) -> Dict[str, int]:
+        return {"events": len(self._events), "bytes": self._bytes, "seq": self.seq}
+
+
+class KeepaliveScheduler:
+    """Sends keepalives and queued output to subscribers and detects disconnects, on a single thread."""
+
+    def __init__(self, interval: float = KEEPALIVE_INTERVAL, tick: float = TICK,
+                 on_sent: Optional[Callable[[int], None]] = None, send_timeout: float = SEND_TIMEOUT):
+        if interval <= 0 or tick <= 0 or send_timeout <= 0:
+            raise ValueError("interval, tick and send_timeout must be positive")
+        self.interval = float(interval)
+        self.tick = float(tick)
+        self.send_timeout = float(send_timeout)
+        self._on_sent = on_sent
+        # One slot per tick over a whole interval, so a deadline never wraps past the current slot
+        self._wheel: List[Set[SseSubscriber]] = [set() for _ in range(int(self.interval / self.tick) + 2)]
+        self._slots: Dict[SseSubscriber, int] = {}
+        self._writing: Set[SseSubscriber] = set()  # Subscribers with queued output
+        self._lock = threading.Lock()
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._wake_r: Optional[socket.socket] = None
+        self._wake_w: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._next_tick = 0
+        self.sent = 0
+        self.skipped = 0
+        self.stalled = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._closed = False
+            self._selector = selectors.DefaultSelector()
+            self._wake_r, self._wake_w = socket.socketpair()
+            self._wake_r.setblocking(False)
+            self._wake_w.setblocking(False)
+            self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+            self._next_tick = self._tick_of(time.monotonic())
+            self._thread = threading.Thread(target=self._run, name="sse-keepalive", daemon=True)
+            self._thread.start()
+
+    def add(self, subscriber: SseSubscriber) -> None:
+        """Watches ``subscriber``; ends it at once if the scheduler is not running."""
+        with self._lock:
+            if self._closed or self._selector is None:
+                subscriber.end()
+                return
+            try:
+                self._selector.register(subscriber.connection, selectors.EVENT_READ, subscriber)
+            except (OSError, ValueError, KeyError):
+                subscriber.close()
+                return
+            self._schedule(subscriber, subscriber.last_write + self.interval)
+            subscriber._on_blocked = self._send_when_writable
+            if subscriber.pending_bytes:  # Output queued before it was watched
+                self._watch_writes(subscriber)
+
+    def remove(self, subscriber: SseSubscriber) -> None:
+        """Stops watching ``subscriber``; called by its handler before the connection is closed."""
+        with self._lock:
+            subscriber._on_blocked = None
+            self._unschedule(subscriber)
+            self._writing.discard(subscriber)
+            if self._selector is not None:
+                try:
+                    self._selector.unregister(subscriber.connection)
+                except (KeyError, ValueError, OSError):
+                    pass
+
+    def subscribers(self) -> int:
+        return len(self._slots)
+
+    def stats(self) -> Dict[str, int]:
+        return {"subscribers": len(self._slots), "keepalives_sent": self.sent, "keepalives_skipped": self.skipped,
+                "writing": len(self._writing), "stalled_dropped": self.stalled}
+
+    def close(self) -> None:
+        """Ends every subscriber's wait and stops the scheduler thread."""
+        with self._lock:
+            self._closed = True
+            for subscriber in list(self._slots):
+                subscriber.end()
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        try:
+            self._wake_w.send(b"x")
+        except OSError:
+            pass
+        thread.join(timeout=5)
+        with self._lock:
+            self._selector.close()
+            self._wake_r.close()
+            self._wake_w.close()
+            self._selector = None
+            self._slots.clear()
+            self._writing.clear()
+            for slot in self._wheel:
+                slot.clear()
+
+    def _send_when_writable(self, subscriber: SseSubscriber) -> None:
+        """Called by a subscriber whose output started to queue."""
+        with self._lock:
+            if subscriber not in self._slots or self._selector is None:
+                return  # Not watched (yet); add() looks for queued output
+            self._watch_writes(subscriber)
+        try:
+            self._wake_w.send(b"w")  # Selectors other than epoll see the new interest on their next call
+        except OSError:
+            pass  # A wakeup is already pending
+
+    def _watch_writes(self, subscriber: SseSubscriber) -> None:
+        # Called with the lock held
+        try:
+            self._selector.modify(subscriber.connection, selectors.EVENT_READ | selectors.EVENT_WRITE, subscriber)
+        except (KeyError, ValueError, OSError):
+            return
+        self._writing.add(subscriber)
+
+    def _flush(self, subscriber: SseSubscriber) -> None:
+        """The subscriber's socket is writable: sends its queued output, then stops watching for writability."""
+        failed: Optional[OSError] = None
+        with self._lock:
+            # Under the lock, so a subscriber that queues more output in between is watched again afterwards
+            if subscriber not in self._writing:
+                return
+            try:
+                drained = subscriber.send_pending()
+            except OSError as e:
+                failed, drained = e, False
+            if drained:
+                self._writing.discard(subscriber)
+                try:
+                    self._selector.modify(subscriber.connection, selectors.EVENT_READ, subscriber)
+                except (KeyError, ValueError, OSError):
+                    pass
+        if failed is not None:
+            logger.info("SSE client %s dropped while sending: %s", subscriber.session_id, type(failed).__name__)
+            self.remove(subscriber)
+            subscriber.close()
+
+    def _tick_of(self, when: float) -> int:
+        return int(when // self.tick)
+
+    def _schedule(self, subscriber: SseSubscriber, deadline: float) -> None:
+        # Deadlines already passed go to the next slot processed; called with the lock held
+        self._unschedule(subscriber)
+        slot = max(self._tick_of(deadline), self._next_tick) % len(self._wheel)
+        self._wheel[slot].add(subscriber)
+        self._slots[subscriber] = slot
+
+    def _unschedule(self, subscriber: SseSubscriber) -> None:
+        slot = self._slots.pop(subscriber, None)
+        if slot is not None:
+            self._wheel[slot].discard(subscriber)
+
+    def _run(self) -> None:
+        while not self._closed:
+            timeout = max(0.0, self._next_tick * self.tick + self.tick - time.monotonic())
+            try:
+                events = self._selector.select(timeout)
+            except OSError as e:
+                logger.error("SSE keepalive selector failed: %s", e)
+                time.sleep(self.tick)
+                continue
+            for key, mask in events:
+                if key.data is None:
+                    self._drain_wakeups()  # Woken up to stop, or to watch a subscriber's writes
+                    continue
+                if mask & selectors.EVENT_READ:
+                    self._check_connection(key.data)
+                if mask & selectors.EVENT_WRITE and not key.data.closed:
+                    self._flush(key.data)
+            if not self._closed:
+                self._run_due(time.monotonic())
+
+    def _drain_wakeups(self) -> None:
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except OSError:
+            pass
+
+    def _check_connection(self, subscriber: SseSubscriber) -> None:
+        """The client sent something on its event stream; EOF or an error means it has gone."""
+        try:
+            data = subscriber.connection.recv(4096)
+        except (BlockingIOError, InterruptedError, socket.timeout):
+            return
+        except OSError:
+            data = b""
+        if data:
+            return  # Anything a client sends on an event stream is ignored
+        self.remove(subscriber)
+        subscriber.disconnected = True
+        subscriber.end()
+
+    def _run_due(self, now: float) -> None:
+        due: List[SseSubscriber] = []
+        with self._lock:
+            stalled = [subscriber for subscriber in self._writing if subscriber.stalled(now, self.send_timeout)]
+            current = self._tick_of(now)
+            while self._next_tick <= current:
+                slot = self._wheel[self._next_tick % len(self._wheel)]
+                self._next_tick += 1
+                for subscriber in list(slot):
+                    deadline = subscriber.last_write + self.interval
+                    if subscriber.closed:
+                        self._unschedule(subscriber)
+                    elif deadline > now + self.tick / 2:
+                        self.skipped += 1  # Written to since it was scheduled
+                        self._schedule(subscriber, deadline)
+                    else:
+                        due.append(subscriber)
+                        self._schedule(subscriber, now + self.interval)
+        for subscriber in stalled:
+            logger.info("SSE client %s dropped: it read nothing for %.0f seconds", subscriber.session_id,
+                        self.send_timeout)
+            self.stalled += 1
+            self.remove(subscriber)
+            subscriber.drop()
+        for subscriber in due:
+            try:
+                if subscriber.try_keepalive():
+                    self.sent += 1
+                    if self._on_sent is not None:
+                        self._on_sent(len(KEEPALIVE))
+                else:
+                    self.skipped += 1
+            except Exception as e:
+                logger.info("SSE client %s dropped during keepalive: %s", subscriber.session_id, type(e).__name__)
+                self.remove(subscriber)
+                subscriber.close()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+结构化日志 - 延迟格式化、载荷截断与脱敏、采样及异步队列输出
+
+Hot paths log events with :func:`log_event`. Nothing is formatted unless
+the level is enabled, and even then the work happens when a handler writes
+the record:
+
+    log_event(logger, logging.INFO, "command_received", sample=True,
+              command=command, request=Redacted(request_data))
+
+:class:`Redacted` renders a payload for the log. Fields that carry document
+bodies or file contents (``REDACTED_KEYS``) are replaced by their length,
+long strings are truncated and long lists are shortened.
+
+Events logged with ``sample=True`` are high-frequency events. Only every
+N-th of them is written (see :func:`set_sample_every`), and each written
+record carries ``sampled_every=N``.
+
+:func:`configure_logging` routes all records through a bounded queue to a
+listener thread that formats and writes them. A request thread never waits
+for the log's I/O: when the queue is full, records are dropped and counted
+(:func:`dropped_records`). Arguments are formatted by the listener, so they
+must not be changed after they are logged.
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Parameters whose values are replaced by their length in logged payloads
+REDACTED_KEYS = frozenset({
+    "file_content_base64", "document_text", "abstract", "content", "password", "token", "secret",
+    "authorization", "api_key",
+})
+MAX_STRING_CHARS = 200
+MAX_LIST_ITEMS = 20
+MAX_DEPTH = 6
+DEFAULT_QUEUE_SIZE = 10000
+STOP_TIMEOUT = 5.0  # seconds to wait for queued records to be written on shutdown
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_sample_every: Dict[str, int] = {}
+_default_sample_every = 1
+_sample_counters: Dict[str, Any] = {}
+_queue_handler: Optional["_NonBlockingQueueHandler"] = None
+_output_handler: Optional[logging.Handler] = None
+_listener: Optional["_Listener"] = None
+_configure_lock = threading.Lock()
+
+
+def redact(value: Any, max_chars: int = MAX_STRING_CHARS, max_items: int = MAX_LIST_ITEMS, _depth: int = 0) -> Any:
+    """A copy of ``value`` that is safe and small enough to log."""
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else f"{value[:max_chars]}...<+{len(value) - max_chars} chars>"
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if _depth >= MAX_DEPTH:
+        return f"<{type(value).__name__}>"
+    if isinstance(value, dict):
+        result = {}
+        for n, (key, item) in enumerate(value.items()):
+            if n >= max_items:
+                result["..."] = f"<+{len(value) - max_items} keys>"
+                break
+            if key in REDACTED_KEYS and item is not None:
+                result[key] = f"<redacted {len(item) if hasattr(item, '__len__') else 1} chars>"
+            else:
+                result[key] = redact(item, max_chars, max_items, _depth + 1)
+        return result
+    if isinstance(value, (list, tuple)):
+        items = [redact(item, max_chars, max_items, _depth + 1) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"<+{len(value) - max_items} items>")
+        return items
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return redact(str(value), max_chars, max_items, _depth + 1)
+
+
+class Redacted:
+    """A payload rendered with :func:`redact` only when the log record is written."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def data(self) -> Any:
+        return redact(self.value)
+
+    def __str__(self) -> str:
+        return json.dumps(self.data(), ensure_ascii=False, default=str)
+
+
+class _Event:
+    """The message of an event record: ``name key=value ...``, built on first use."""
+
+    __slots__ = ("name", "fields", "_text")
+
+    def __init__(self, name: str, fields: Dict[str, Any]):
+        self.name = name
+        self.fields = fields
+        self._text = None
+
+    def __str__(self) -> str:
+        if self._text is None:
+            parts = [self.name]
+            for key, value in self.fields.items():
+                if isinstance(value, Redacted):
+                    rendered = str(value)  # Already JSON
+                else:
+                    rendered = redact(value)
+                    if not isinstance(rendered, str) or " " in rendered or not rendered:
+                        rendered = json.dumps(rendered, ensure_ascii=False, default=str)
+                parts.append(f"{key}={rendered}")
+            self._text = " ".join(parts)
+        return self._text
+
+
+def set_sample_every(every: int, event: Optional[str] = None) -> None:
+    """Writes only every ``every``-th sampled event (for ``event``, or for all sampled events)."""
+    global _default_sample_every
+    every = max(1, int(every))
+    if event is None:
+        _default_sample_every = every
+    else:
+        _sample_every[event] = every
+
+
+def log_event(logger: logging.Logger, level: int, event: str, sample: bool = False, **fields: Any) -> None:
+    """Logs ``event`` with ``fields``; formatting is deferred until a handler writes the record."""
+    if not logger.isEnabledFor(level):
+        return
+    if sample:
+        every = _sample_every.get(event, _default_sample_every)
+        if every > 1:
+            counter = _sample_counters.get(event)
+            if counter is None:
+                counter = _sample_counters.setdefault(event, itertools.count())
+            if next(counter) % every:
+                return
+            fields["sampled_every"] = every
+    logger.log(level, "%s", _Event(event, fields), extra={"event": event, "event_fields": fields}, stacklevel=2)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; the fields of :func:`log_event` records become keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname, "logger": record.name,
+        }
+        event = getattr(record, "event", None)
+        if event is not None:
+            entry["event"] = event
+            for key, value in record.event_fields.items():
+                entry[key] = value.data() if isinstance(value, Redacted) else redact(value)
+        else:
+            entry["message"] = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread without formatting them; drops them when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the traceback is rendered here, since it refers to frames that are about to change
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _Listener(logging.handlers.QueueListener):
+    """Writes queued records on a daemon thread; stopping waits a bounded time, even with a full queue."""
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(self._sentinel, timeout=STOP_TIMEOUT)
+        except queue.Full:
+            return  # The writer is stuck; leave its daemon thread behind
+        self._thread.join(STOP_TIMEOUT)
+        self._thread = None
+
+
+def configure_logging(level: int = logging.INFO, json_format: bool = False, stream=None,
+                      queue_size: int = DEFAULT_QUEUE_SIZE, sample_every: int = 1) -> logging.handlers.QueueListener:
+    """Replaces the root logger's handlers with a queue drained by a background writer thread."""
+    global _queue_handler, _output_handler, _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+        output = _output_handler = logging.StreamHandler(stream if stream is not None else sys.stderr)
+        output.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+        log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        _queue_handler = _NonBlockingQueueHandler(log_queue)
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        set_sample_every(sample_every)
+        _listener = _Listener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        return _listener
+
+
+def shutdown_logging() -> None:
+    """Writes the queued records and stops the writer thread."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _restart_in_child() -> None:
+    """A forked child (pre-fork workers) has no writer thread; give it its own queue and writer."""
+    global _configure_lock, _listener
+    _configure_lock = threading.Lock()
+    if _queue_handler is None or _listener is None:
+        return
+    _queue_handler.queue = queue.Queue(maxsize=_queue_handler.queue.maxsize)
+    _listener = _Listener(_queue_handler.queue, _output_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def dropped_records() -> int:
+    """Records dropped because the log queue was full."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+atexit.register(shutdown_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_in_child)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+工具结果缓存 - 幂等工具回调的记忆化层
+
+Tools registered with ``cacheable=True`` have their results kept in one
+shared, bounded LRU cache. Each entry also holds the result's JSON
+encoding, so a hit can be sent to SSE or stdio clients without serializing
+the result again.
+
+Entries expire after the tool's TTL. The entries of tools that read the
+document store are dropped on every store mutation. A result computed
+while a mutation was committed is not stored, so an invalidation can never
+be overtaken by a stale result.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 1024
+
+
+def default_cache_key(params: dict) -> Hashable:
+    """Keys a call by its parameters, independent of their order."""
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+class CachePolicy:
+    """Per-tool caching metadata given to ``McpServer.register_tool``."""
+
+    __slots__ = ("ttl", "max_entries", "key", "invalidate_on_mutation")
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None,
+                 key: Optional[Callable[[dict], Hashable]] = None, invalidate_on_mutation: bool = True):
+        self.ttl = ttl  # Seconds; None keeps entries until evicted or invalidated
+        self.max_entries = max_entries  # Per-tool bound inside the shared cache
+        self.key = key or default_cache_key
+        self.invalidate_on_mutation = invalidate_on_mutation
+
+
+class CachedResult:
+    """A cached tool result and its UTF-8 JSON encoding. Callers must not modify ``result``."""
+
+    __slots__ = ("result", "encoded", "expires_at")
+
+    def __init__(self, result: Any, encoded: bytes, expires_at: Optional[float]):
+        self.result = result
+        self.encoded = encoded
+        self.expires_at = expires_at
+
+
+class ToolResultCache:
+    """Bounded LRU cache of tool results shared by all cacheable tools."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, Hashable], CachedResult]" = OrderedDict()
+        self._per_tool: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        """Changes on every invalidation; pass the value read before computing to :meth:`put`."""
+        return self._generation
+
+    def get(self, tool_name: str, key: Hashable) -> Optional[CachedResult]:
+        with self._lock:
+            entry = self._entries.get((tool_name, key))
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                self._remove((tool_name, key))
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((tool_name, key))
+            self.hits += 1
+            return entry
+
+    def put(self, tool_name: str, key: Hashable, result: Any, policy: CachePolicy,
+            generation: int) -> Optional[CachedResult]:
+        """Caches ``result`` unless an invalidation happened since ``generation`` was read.
+
+        Returns the entry (even if it was not stored), or None if ``result`` is not JSON-serializable.
+        """
+        try:
+            encoded = json.dumps(result).encode('utf-8')
+        except (TypeError, ValueError):
+            return None
+        entry = CachedResult(result, encoded, time.monotonic() + policy.ttl if policy.ttl is not None else None)
+        with self._lock:
+            if generation != self._generation and policy.invalidate_on_mutation:
+                return entry
+            cache_key = (tool_name, key)
+            if cache_key in self._entries:
+                self._remove(cache_key)
+            self._entries[cache_key] = entry
+            self._per_tool[tool_name] = self._per_tool.get(tool_name, 0) + 1
+            if policy.max_entries is not None and self._per_tool[tool_name] > policy.max_entries:
+                self._evict(lambda k: k[0] == tool_name)
+            if len(self._entries) > self.max_entries:
+                self._evict(lambda k: True)
+        return entry
+
+    def _remove(self, cache_key: Tuple[str, Hashable]) -> None:
+        del self._entries[cache_key]
+        self._per_tool[cache_key[0]] -= 1
+
+    def _evict(self, matches: Callable[[Tuple[str, Hashable]], bool]) -> None:
+        """Drops the least recently used entry whose key ``matches``."""
+        for cache_key in self._entries:
+            if matches(cache_key):
+                self._remove(cache_key)
+                self.evictions += 1
+                return
+
+    def invalidate(self, tool_names: Optional[set] = None) -> None:
+        """Drops the entries of ``tool_names`` (all entries if None)."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for cache_key in [k for k in self._entries if tool_names is None or k[0] in tool_names]:
+                self._remove(cache_key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "invalidations": self.invalidations}
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+工具运行时 - 在共享 asyncio 事件循环上执行工具回调
+
+Tool callbacks may be coroutine functions. They run on one shared event
+loop (in a background thread), so thousands of concurrent I/O-bound calls
+need no threads of their own. Synchronous callbacks are offloaded to a
+small, bounded thread pool.
+
+Every call can have a timeout, and every scheduled call returns a
+:class:`concurrent.futures.Future` whose ``cancel()`` cancels it. A
+coroutine is cancelled where it awaits. A synchronous callback already
+running in the pool cannot be interrupted; it sees the cancellation
+through its :class:`ToolContext` if it accepts one, and its result is
+discarded otherwise.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, List, Optional
+
+DEFAULT_TOOL_THREADS = 16
+# Long-running loops call ToolContext.check() once per this many iterations
+CHECK_INTERVAL = 256
+
+
+class ToolTimeoutError(TimeoutError):
+    """Raised when a tool call exceeds its timeout."""
+
+
+class ToolCancelledError(Exception):
+    """Raised by :meth:`ToolContext.check` once the call has been cancelled."""
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+class ToolContext:
+    """Deadline and cancellation state of one tool call.
+
+    Callbacks that take a ``context`` keyword argument receive it, and
+    long-running ones should call :meth:`check` from time to time.
+    """
+
+    __slots__ = ("request_id", "session_id", "job_id", "timeout", "deadline", "reason", "_cancelled", "_on_cancel",
+                 "_lock")
+
+    def __init__(self, request_id: Optional[str] = None, session_id: Optional[str] = None,
+                 timeout: Optional[float] = None, job_id: Optional[str] = None):
+        self.request_id = request_id
+        self.session_id = session_id  # SSE session whose disconnect cancels the call
+        self.job_id = job_id  # Ingest job the call runs for (see mcp.ingest_queue)
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.reason: Optional[str] = None
+        self._cancelled = threading.Event()
+        self._on_cancel: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self.reason = reason
+            self._cancelled.set()
+            callbacks, self._on_cancel = self._on_cancel, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass  # e.g. the loop of an already finished call was closed
+
+    def add_cancel_callback(self, callback: Callable[[], None]) -> None:
+        """Calls ``callback`` on cancellation (right away if the call is already cancelled)."""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._on_cancel.append(callback)
+                return
+        callback()
+
+    def remove_cancel_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._on_cancel:
+                self._on_cancel.remove(callback)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline (None without one)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self) -> None:
+        """Raises if the call was cancelled or its deadline has passed."""
+        if self._cancelled.is_set():
+            raise ToolCancelledError(self.reason)
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(f"timed out after {self.timeout}s")
+            raise ToolTimeoutError(self.reason)
+
+
+def accepts_context(callback: Callable) -> bool:
+    """True if ``callback`` takes a ``context`` keyword argument; checked once, when a tool is registered."""
+    try:
+        return "context" in inspect.signature(callback).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def is_async_callback(callback: Callable) -> bool:
+    """True for coroutine functions (including ``functools.partial`` of one)."""
+    while hasattr(callback, "func"):
+        callback = callback.func
+    return asyncio.iscoroutinefunction(callback)
+
+
+class ToolRuntime:
+    """A shared event loop for tool calls plus a thread pool for synchronous callbacks."""
+
+    def __init__(self, max_threads: int = DEFAULT_TOOL_THREADS):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="tool-worker")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop, started on first use."""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                ready = threading.Event()
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(self.executor)
+
+                def run() -> None:
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name="tool-event-loop", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    async def call(self, callback: Callable[[dict], Any], params: dict, timeout: Optional[float] = None,
+                   context: Optional[ToolContext] = None) -> Any:
+        """Awaits one callback; synchronous ones run in the thread pool.
+
+        Timeouts and cancellation are passed on to ``context``, if given,
+        and cancelling ``context`` cancels the call.
+        """
+        loop = asyncio.get_running_loop()
+        on_cancel = None
+        if context is not None:
+            task = asyncio.current_task()
+            on_cancel = functools.partial(loop.call_soon_threadsafe, task.cancel)
+            context.add_cancel_callback(on_cancel)
+        if is_async_callback(callback):
+            awaitable: Awaitable = callback(params)
+        else:
+            awaitable = loop.run_in_executor(self.executor, callback, params)
+        try:
+            if timeout is None:
+                return await awaitable
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            reason = f"timed out after {context.timeout if context is not None else timeout}s"
+            if context is not None:
+                context.cancel(reason)
+            raise ToolTimeoutError(reason) from None
+        except asyncio.CancelledError:
+            if context is not None:
+                context.cancel()
+            raise
+        finally:
+            if on_cancel is not None:
+                context.remove_cancel_callback(on_cancel)
+
+    def submit(self, coroutine: Awaitable) -> concurrent.futures.Future:
+        """Schedules ``coroutine`` on the loop; cancelling the returned future cancels it."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def call_blocking(self, callback: Callable[[dict], Any], params: dict, timeout: Optional[float] = None,
+                      context: Optional[ToolContext] = None) -> Any:
+        """Runs a callback from a synchronous context and returns its result.
+
+        Synchronous callbacks without a timeout run directly in the calling thread.
+        """
+        if timeout is None and not is_async_callback(callback):
+            return callback(params)
+        if self._thread is threading.current_thread():
+            raise RuntimeError("call_blocking() would block the tool runtime's own event loop")
+        try:
+            return self.submit(self.call(callback, params, timeout, context)).result()
+        except concurrent.futures.CancelledError:
+            raise ToolCancelledError(context.reason if context is not None else "cancelled") from None
+
+    def queue_depth(self) -> int:
+        """Synchronous callbacks waiting for a pool thread."""
+        return self.executor._work_queue.qsize()
+
+    def close(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            if thread is not None:
+                thread.join(timeout=5)
+            loop.close()
+        self.executor.shutdown(wait=False)
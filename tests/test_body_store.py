@@ -0,0 +1,136 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.body_store import BodyTier, BodyRef
+from mcp.document_store import DocumentStore
+from mcp.server import McpServer
+
+
+class TestBodyTier(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_bodies_round_trip_across_pages(self):
+        tier = BodyTier(self.tmp_dir.name, cache_bytes=4096, page_size=1024)
+        try:
+            bodies = [f"body {i} " + "é" * (300 * i) for i in range(8)]
+            refs = [tier.append(body) for body in bodies]
+            for ref, body in zip(refs, bodies):
+                self.assertEqual(ref.read(), body)
+            self.assertEqual(tier.size_bytes, sum(len(b.encode('utf-8')) for b in bodies))
+        finally:
+            tier.close()
+
+    def test_page_cache_respects_budget(self):
+        tier = BodyTier(self.tmp_dir.name, cache_bytes=2048, page_size=1024)
+        try:
+            refs = [tier.append("x" * 1024) for _ in range(10)]
+            for ref in refs:
+                ref.read()
+            refs[0].read()
+            stats = tier.stats()
+            self.assertLessEqual(stats["resident_bytes"], 2048)
+            self.assertGreater(stats["evictions"], 0)
+            refs[0].read()
+            self.assertGreater(tier.stats()["hits"], stats["hits"])
+        finally:
+            tier.close()
+
+    def test_tail_page_sees_later_appends(self):
+        tier = BodyTier(self.tmp_dir.name, page_size=1024)
+        try:
+            first = tier.append("first")
+            self.assertEqual(first.read(), "first")
+            second = tier.append("second")
+            self.assertEqual(second.read(), "second")
+        finally:
+            tier.close()
+
+    def test_store_keeps_only_metadata_in_memory(self):
+        store = DocumentStore(body_tier=BodyTier(self.tmp_dir.name))
+        try:
+            store.append({"id": "doc1", "title": "T", "abstract": "long body " * 100, "keywords": ["ai"]})
+            doc = store.find_by_id("doc1")
+            self.assertIsInstance(doc._abstract, BodyRef)
+            self.assertEqual(doc["abstract"], "long body " * 100)
+            self.assertEqual(doc["title"], "T")
+        finally:
+            store.close()
+
+    def test_compacting_bodies_reclaims_dead_space(self):
+        store = DocumentStore(body_tier=BodyTier(self.tmp_dir.name, page_size=1024))
+        try:
+            store.extend({"id": f"doc{n}", "title": "T", "abstract": f"body {n} " * 200} for n in range(10))
+            before = store.snapshot()
+            for n in range(6):
+                store.delete(f"doc{n}")
+            store.update("doc9", {"abstract": "short"})
+            old_tier = store.body_tier
+            store.compact()
+            freed = store.compact_bodies()
+            self.assertIsNot(store.body_tier, old_tier)
+            self.assertEqual(freed, old_tier.size_bytes - store.body_tier.size_bytes)
+            self.assertEqual(store.body_tier.size_bytes, sum(len(doc["abstract"]) for doc in store))
+            for n in range(6, 9):
+                doc = store.find_by_id(f"doc{n}")
+                self.assertIs(doc.body_ref.tier, store.body_tier)
+                self.assertEqual(doc["abstract"], f"body {n} " * 200)
+            self.assertEqual(store.find_by_id("doc9")["abstract"], "short")
+            # Readers of an earlier version still see the deleted bodies in the old segment
+            self.assertEqual(before.find_by_id("doc0")["abstract"], "body 0 " * 200)
+            store.append({"id": "doc10", "abstract": "after compaction"})
+            self.assertIs(store.find_by_id("doc10").body_ref.tier, store.body_tier)
+        finally:
+            store.close()
+
+    def test_bodies_are_not_rewritten_while_mostly_live(self):
+        store = DocumentStore(body_tier=BodyTier(self.tmp_dir.name))
+        try:
+            store.extend({"id": f"doc{n}", "abstract": "body " * 100} for n in range(4))
+            store.delete("doc0")
+            tier = store.body_tier
+            self.assertEqual(store.compact_bodies(), 0)
+            self.assertIs(store.body_tier, tier)
+        finally:
+            store.close()
+
+    def test_resource_reads_body_through_tier(self):
+        server = McpServer(name="Tier Test", version="0.0.1",
+                           document_store_file=os.path.join(self.tmp_dir.name, "documents.json"),
+                           body_cache_bytes=64 * 1024)
+        added = server._execute_add_document_to_store_impl({"document_text": "Tiered Title\n" + "content " * 50})
+        resource = server.resolve_resource(f"mcp://resources/documents/{added['document_id']}")
+        self.assertTrue(resource["content"]["abstract"].startswith("Tiered Title\ncontent"))
+        self.assertGreater(server.document_store.body_tier.stats()["segment_bytes"], 0)
+
+    def test_saving_the_store_bypasses_the_page_cache(self):
+        path = os.path.join(self.tmp_dir.name, "documents.json")
+        server = McpServer(name="Tier Test", version="0.0.1", document_store_file=path, body_cache_bytes=64 * 1024)
+        try:
+            for n in range(5):
+                server._execute_add_document_to_store_impl({"document_text": f"Paged {n}\n" + "body " * 2000,
+                                                            "durability": "enqueue"})
+            server.store_writer.drain(timeout=5)
+            cache = server.document_store.body_tier.stats()
+            server.store_writer.flush(timeout=5)
+            self.assertEqual(server.document_store.body_tier.stats(), cache)
+            with open(path, encoding='utf-8') as f:
+                saved = {doc["id"]: doc for doc in json.load(f)}
+            for doc in server.document_store:
+                self.assertEqual(saved[doc["id"]]["abstract"], doc["abstract"])
+        finally:
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.document import Document
+from mcp.document_store import DocumentStore
+
+
+class TestDocument(unittest.TestCase):
+
+    def test_mapping_interface_matches_json_shape(self):
+        source = {"id": "doc1", "title": "T", "abstract": "A", "keywords": ["ai", "nlp"], "year": 2024}
+        doc = Document.from_dict(source)
+        self.assertEqual(dict(doc), source)
+        self.assertEqual(doc, source)
+        self.assertEqual(doc.get("title"), "T")
+        self.assertEqual(doc["keywords"], ["ai", "nlp"])
+        self.assertEqual(doc.get("missing", "default"), "default")
+        self.assertEqual(json.loads(json.dumps(doc.copy())), source)
+
+    def test_missing_fields_stay_missing(self):
+        doc = Document.from_dict({"id": "doc2"})
+        self.assertEqual(dict(doc), {"id": "doc2"})
+        self.assertNotIn("abstract", doc)
+        with self.assertRaises(KeyError):
+            doc["title"]
+
+    def test_keywords_are_interned(self):
+        first = Document.from_dict(json.loads('{"keywords": ["machine learning"]}'))
+        second = Document.from_dict(json.loads('{"keywords": ["machine learning"]}'))
+        self.assertIs(first.keywords[0], second.keywords[0])
+
+    def test_compressed_abstract_round_trips(self):
+        abstract = "deep learning " * 200
+        doc = Document.from_dict({"id": "doc3", "abstract": abstract}, compress_abstract_over=100)
+        self.assertTrue(doc.abstract_is_compressed)
+        self.assertEqual(doc["abstract"], abstract)
+        self.assertFalse(Document.from_dict({"abstract": "short"}, compress_abstract_over=100).abstract_is_compressed)
+
+    def test_store_uses_less_memory_than_dicts(self):
+        corpus = json.dumps([
+            {"id": f"doc{i}", "title": f"Title {i}", "abstract": "x" * 50, "keywords": ["ai", "machine learning", "nlp"]}
+            for i in range(2000)
+        ])
+
+        def measure(build):
+            gc.collect()
+            tracemalloc.start()
+            held = build()
+            gc.collect()
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del held
+            return size
+
+        self.assertLess(measure(lambda: DocumentStore(documents=json.loads(corpus))),
+                        measure(lambda: json.loads(corpus)))
+
+
+if __name__ == '__main__':
+    unittest.main()
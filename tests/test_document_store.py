@@ -0,0 +1,103 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.document_store import DocumentStore, SEGMENT_SIZE
+from mcp.server import McpServer
+from mcp.snapshot import open_snapshot, write_snapshot
+
+
+def make_doc(i):
+    return {"id": f"d{i}", "title": f"Title {i}", "abstract": f"Abstract {i}", "keywords": ["k"]}
+
+
+class TestDocumentStoreVersions(unittest.TestCase):
+
+    def test_snapshot_is_unaffected_by_later_commits(self):
+        store = DocumentStore(documents=[make_doc(i) for i in range(3)])
+        before = store.snapshot()
+        store.append(make_doc(3))
+        self.assertEqual(len(before), 3)
+        self.assertEqual([d["id"] for d in before], ["d0", "d1", "d2"])
+        self.assertIsNone(before.find_by_id("d3"))
+        self.assertEqual(store.find_by_id("d3")["title"], "Title 3")
+        self.assertEqual(store.version, before.version + 1)
+
+    def test_commits_span_segments(self):
+        store = DocumentStore()
+        count = SEGMENT_SIZE * 2 + 5
+        for i in range(count):
+            store.append(make_doc(i))
+        self.assertEqual(len(store), count)
+        self.assertEqual(store[SEGMENT_SIZE]["id"], f"d{SEGMENT_SIZE}")
+        self.assertEqual(store[-1]["id"], f"d{count - 1}")
+        self.assertEqual([d["id"] for d in store], [f"d{i}" for i in range(count)])
+
+    def test_versions_on_top_of_mapped_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "documents.snapshot")
+            write_snapshot(path, [make_doc(0)])
+            store = DocumentStore(snapshot=open_snapshot(path))
+            try:
+                base = store.snapshot()
+                store.append(make_doc(1))
+                self.assertEqual(len(base), 1)
+                self.assertEqual([d["id"] for d in store], ["d0", "d1"])
+                self.assertEqual(base.find_by_id("d0")["title"], "Title 0")
+            finally:
+                store.close()
+
+    def test_concurrent_writers_and_readers(self):
+        store = DocumentStore()
+        errors = []
+
+        def writer(offset):
+            for i in range(200):
+                store.append(make_doc(offset + i))
+
+        def reader():
+            try:
+                for _ in range(50):
+                    view = store.snapshot()
+                    self.assertEqual(sum(1 for _ in view), len(view))
+            except Exception as e:  # Surface assertion failures from the thread
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(n * 1000,)) for n in range(4)]
+        threads += [threading.Thread(target=reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(store), 800)
+        self.assertEqual(len({d["id"] for d in store}), 800)
+
+
+class TestServerIdGeneration(unittest.TestCase):
+
+    def test_concurrent_id_generation_is_unique(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            server = McpServer("Test", "0.1", document_store_file=os.path.join(tmp, "documents.json"))
+            ids = []
+
+            def generate():
+                for _ in range(500):
+                    ids.append(server._generate_next_doc_id())
+
+            threads = [threading.Thread(target=generate) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            server.stop()
+            self.assertEqual(len(set(ids)), 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.federation import FederatedSearch, merge_ranked
+from mcp.server import COMMAND_PATH, McpServer
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def make_docs(prefix, count):
+    return [{"id": f"{prefix}{i}", "title": f"Graph study {prefix}{i}", "abstract": "graph methods", "keywords": ["graph"]}
+            for i in range(count)]
+
+
+class TestMergeRanked(unittest.TestCase):
+
+    def test_interleaves_by_rank_and_drops_duplicates(self):
+        a = [{"id": "a1"}, {"id": "a2"}, {"id": "a3"}]
+        b = [{"id": "b1"}, {"id": "a2"}]
+        c = []
+        self.assertEqual([d["id"] for d in merge_ranked([a, b, c], 10)], ["a1", "b1", "a2", "a3"])
+        self.assertEqual([d["id"] for d in merge_ranked([a, b], 3)], ["a1", "b1", "a2"])
+        self.assertEqual(merge_ranked([], 3), [])
+
+
+class TestFederatedSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.nodes = []
+        self.urls = []
+        for prefix in ("p", "q"):
+            directory = os.path.join(self.tmp_dir.name, prefix)
+            os.makedirs(directory)
+            path = os.path.join(directory, "documents.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(make_docs(prefix, 3), f)
+            node = McpServer(f"Node {prefix}", "0.1", document_store_file=path)
+            port = free_port()
+            node.start(transport_type='sse', port=port)
+            self.nodes.append(node)
+            self.urls.append(f"http://127.0.0.1:{port}")
+
+    def tearDown(self):
+        for node in self.nodes:
+            node.stop()
+        self.tmp_dir.cleanup()
+
+    def coordinator(self, peers, **kwargs):
+        directory = os.path.join(self.tmp_dir.name, f"coordinator{len(self.nodes)}")
+        os.makedirs(directory)
+        path = os.path.join(directory, "documents.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(make_docs("c", 2), f)
+        server = McpServer("Coordinator", "0.1", document_store_file=path, federation_peers=peers, **kwargs)
+        self.nodes.append(server)
+        return server
+
+    def slow_down(self, node, delay):
+        search = node.tools["document_search"]["callback"]
+
+        def slow_search(params):
+            time.sleep(delay)
+            return search(params)
+        node.tools["document_search"]["callback"] = slow_search
+
+    def test_merges_results_from_all_nodes(self):
+        coordinator = self.coordinator(self.urls)
+        response = coordinator._execute_document_search_impl({"query": "graph", "max_results": 6})
+        self.assertEqual([d["id"] for d in response["search_results"]], ["c0", "p0", "q0", "c1", "p1", "q1"])
+        self.assertEqual(response["federation"]["failed"], [])
+        self.assertFalse(response["federation"]["partial"])
+        local = coordinator._execute_document_search_impl({"query": "graph", "max_results": 6, "local_only": True})
+        self.assertEqual([d["id"] for d in local["search_results"]], ["c0", "c1"])
+        self.assertNotIn("federation", local)
+
+    def test_unreachable_and_slow_peers_give_partial_results(self):
+        self.slow_down(self.nodes[1], 2.0)
+        dead = f"http://127.0.0.1:{free_port()}"
+        coordinator = self.coordinator([self.urls[0], self.urls[1], dead], federation_timeout=0.5)
+        started = time.monotonic()
+        response = coordinator._execute_document_search_impl({"query": "graph", "max_results": 10})
+        self.assertLess(time.monotonic() - started, 1.5)
+        federation = response["federation"]
+        self.assertTrue(federation["partial"])
+        self.assertEqual(federation["responded"], [self.urls[0]])
+        self.assertEqual(sorted(f["peer"] for f in federation["failed"]), sorted([self.urls[1], dead]))
+        self.assertEqual([d["id"] for d in response["search_results"]], ["c0", "p0", "c1", "p1", "p2"])
+
+    def test_slow_replica_is_hedged(self):
+        self.slow_down(self.nodes[0], 1.0)
+        # Both nodes serve the "same" partition; the first is slow
+        federation = FederatedSearch([self.urls], COMMAND_PATH, timeout=3.0, hedge_after=0.1)
+        try:
+            started = time.monotonic()
+            gathered = federation.search("graph", 2)
+            self.assertLess(time.monotonic() - started, 0.8)
+            self.assertEqual([d["id"] for d in gathered["results"][0]], ["q0", "q1"])
+            stats = federation.stats()
+            self.assertEqual((stats["hedges"], stats["hedge_wins"]), (1, 1))
+        finally:
+            federation.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import unittest
+import gzip
+import http.client
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+import zlib
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.http_support import CompressingWriter, StaticAssets, compress, decoded_lines, negotiate_encoding
+from mcp.server import COMMAND_PATH, SSE_PATH, McpServer
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class FakeResponse:
+    def __init__(self, body, encoding=None):
+        self.headers = {"Content-Encoding": encoding} if encoding else {}
+        self._stream = io.BytesIO(body)
+
+    def read1(self, size):
+        return self._stream.read(min(size, 7))  # Small chunks split lines and the compressed stream
+
+    def __iter__(self):
+        return iter(self._stream)
+
+
+class TestEncoding(unittest.TestCase):
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(negotiate_encoding("gzip, deflate, br"), "gzip")
+        self.assertEqual(negotiate_encoding("deflate"), "deflate")
+        self.assertEqual(negotiate_encoding("gzip;q=0, deflate;q=0.5"), "deflate")
+        self.assertEqual(negotiate_encoding("*"), "gzip")
+        self.assertIsNone(negotiate_encoding("identity"))
+        self.assertIsNone(negotiate_encoding(None))
+
+    def test_stream_is_decodable_after_every_write(self):
+        for encoding, wbits in (("gzip", 16 + zlib.MAX_WBITS), ("deflate", zlib.MAX_WBITS)):
+            sink = io.BytesIO()
+            writer = CompressingWriter(sink, encoding)
+            decompressor = zlib.decompressobj(wbits)
+            for n in range(3):
+                event = f'event: tool_result\ndata: {{"n": {n}}}\n\n'.encode('utf-8')
+                writer.write(event)
+                # Everything written so far can be decoded without waiting for more data
+                self.assertEqual(decompressor.decompress(sink.getvalue()), event)
+                sink.seek(0); sink.truncate()
+
+    def test_decoded_lines(self):
+        body = b"event: change\ndata: {}\n\n" * 20
+        for encoding in (None, "gzip", "deflate"):
+            data = compress(body, encoding) if encoding else body
+            self.assertEqual(b"".join(decoded_lines(FakeResponse(data, encoding))), body)
+
+
+class TestStaticAssets(unittest.TestCase):
+
+    def test_cached_until_the_file_changes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.html")
+            with open(path, 'w') as f:
+                f.write("<html>" + "x" * 2000 + "</html>")
+            assets = StaticAssets(tmp)
+            first = assets.get("index.html", "text/html")
+            self.assertIs(assets.get("index.html", "text/html"), first)
+            self.assertEqual(gzip.decompress(first.gzip_body), first.body)
+            self.assertTrue(first.matches(first.etag))
+            self.assertTrue(first.matches(f'"other", W/{first.etag}'))
+            self.assertFalse(first.matches('"other"'))
+
+            with open(path, 'w') as f:
+                f.write("<html>changed</html>")
+            os.utime(path, ns=(time.time_ns() + 10 ** 9,) * 2)
+            second = assets.get("index.html", "text/html")
+            self.assertEqual(second.body, b"<html>changed</html>")
+            self.assertNotEqual(second.etag, first.etag)
+            self.assertIsNone(second.gzip_body)  # Too small to be worth compressing
+            self.assertIsNone(assets.get("missing.js", "application/javascript"))
+
+
+class TestServerHttp(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.server = McpServer("HTTP", "0.1", document_store_file=os.path.join(cls.tmp_dir.name, "documents.json"))
+        cls.port = free_port()
+        cls.server.start(transport_type='sse', port=cls.port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.tmp_dir.cleanup()
+
+    def post(self, conn, payload, headers=None):
+        conn.request("POST", COMMAND_PATH, body=json.dumps(payload),
+                     headers={"Content-Type": "application/json", **(headers or {})})
+        response = conn.getresponse()
+        return response, response.read()
+
+    def test_commands_reuse_one_connection(self):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        try:
+            sockets = set()
+            for _ in range(3):
+                response, body = self.post(conn, {"command": "stats"})
+                self.assertEqual(response.status, 200)
+                self.assertEqual(response.version, 11)
+                self.assertEqual(int(response.getheader("Content-Length")), len(body))
+                sockets.add(id(conn.sock))
+            self.assertEqual(len(sockets), 1)
+            response, body = self.post(conn, {"command": "no_such_command"})
+            self.assertEqual(response.status, 400)
+            response, _ = self.post(conn, {"command": "stats"})
+            self.assertEqual(response.status, 200)
+        finally:
+            conn.close()
+
+    def test_large_json_responses_are_compressed(self):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        try:
+            response, body = self.post(conn, {"command": "stats"}, {"Accept-Encoding": "gzip"})
+            self.assertEqual(response.getheader("Content-Encoding"), "gzip")
+            self.assertEqual(json.loads(gzip.decompress(body))["status"], "success")
+            response, body = self.post(conn, {"command": "list_resources", "limit": 1}, {"Accept-Encoding": "gzip"})
+            self.assertIsNone(response.getheader("Content-Encoding"))  # Small responses are sent as they are
+            self.assertEqual(json.loads(body)["status"], "success")
+        finally:
+            conn.close()
+
+    def test_static_files_revalidate_with_etag(self):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        try:
+            conn.request("GET", "/script.js")
+            response = conn.getresponse()
+            body = response.read()
+            etag = response.getheader("ETag")
+            self.assertEqual(response.status, 200)
+            self.assertIn("max-age", response.getheader("Cache-Control"))
+            with open(os.path.join(project_root, "web", "script.js"), 'rb') as f:
+                self.assertEqual(body, f.read())
+            conn.request("GET", "/script.js", headers={"If-None-Match": etag})
+            response = conn.getresponse()
+            self.assertEqual((response.status, response.read()), (304, b""))
+            conn.request("GET", "/", headers={"Accept-Encoding": "gzip"})
+            response = conn.getresponse()
+            self.assertEqual(response.getheader("Content-Encoding"), "gzip")
+            self.assertIn(b"<html", gzip.decompress(response.read()).lower())
+        finally:
+            conn.close()
+
+    def test_event_stream_is_compressed(self):
+        client = socket.create_connection(('127.0.0.1', self.port), timeout=5)
+        try:
+            client.sendall(f"GET {SSE_PATH} HTTP/1.1\r\nHost: localhost\r\nAccept-Encoding: gzip\r\n\r\n".encode('ascii'))
+            received = b""
+            while b"\r\n\r\n" not in received:
+                received += client.recv(65536)
+            head, body = received.split(b"\r\n\r\n", 1)
+            self.assertIn(b"Content-Encoding: gzip", head)
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            text = decompressor.decompress(body)
+            while b"event: session" not in text:  # The subscriber is attached once the greeting is sent
+                text += decompressor.decompress(client.recv(65536))
+            self.server.execute_tool_command("echo", {"message": "compressed"})
+            while b"compressed" not in text:
+                text += decompressor.decompress(client.recv(65536))
+            self.assertIn(b"event: capabilities", text)
+            self.assertIn(b"event: tool_result", text)
+        finally:
+            client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,231 @@
+import unittest
+import json
+import os
+import sys
+import time
+import base64
+import tempfile
+import http.client
+import io
+import socket
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.ingest_queue import IngestJobQueue, JOB_COMPLETED, JOB_FAILED, JOB_QUEUED
+from mcp.server import McpServer, COMMAND_PATH, INGEST_JOB_FIELD
+from mcp.tool_runtime import ToolContext
+
+
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_status(get_job, job_id, statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = get_job(job_id)
+        if job and job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    return get_job(job_id)
+
+
+class TestIngestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "jobs.sqlite3")
+        self.completed = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _handler(self, tool_name, params):
+        if params.get("fail"):
+            return {"error": "bad document"}
+        return {"document_id": params["name"]}
+
+    def test_jobs_run_and_payload_is_dropped(self):
+        queue = IngestJobQueue(self.db_path, self._handler, num_workers=2, on_complete=self.completed.append)
+        queue.start()
+        try:
+            job = queue.submit("add_document_from_file", {"name": "a", "file_content_base64": "QQ=="})
+            self.assertEqual(job["status"], JOB_QUEUED)
+            done = wait_for_status(queue.get, job["job_id"], (JOB_COMPLETED, JOB_FAILED))
+            self.assertEqual(done["status"], JOB_COMPLETED)
+            self.assertEqual(done["result"], {"document_id": "a"})
+            # The callback runs right after the final status is recorded
+            deadline = time.monotonic() + 5.0
+            while not self.completed and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(self.completed[0]["job_id"], job["job_id"])
+            stored_params = queue._connection().execute(
+                "SELECT params FROM ingest_jobs WHERE job_id = ?", (job["job_id"],)).fetchone()[0]
+            self.assertNotIn("file_content_base64", json.loads(stored_params))
+        finally:
+            queue.stop()
+
+    def test_error_result_marks_job_failed(self):
+        queue = IngestJobQueue(self.db_path, self._handler, num_workers=1)
+        queue.start()
+        try:
+            job = queue.submit("add_document_from_file", {"name": "b", "fail": True})
+            done = wait_for_status(queue.get, job["job_id"], (JOB_COMPLETED, JOB_FAILED))
+            self.assertEqual(done["status"], JOB_FAILED)
+            self.assertEqual(done["error"], "bad document")
+        finally:
+            queue.stop()
+
+    def test_queued_jobs_survive_restart(self):
+        queue = IngestJobQueue(self.db_path, self._handler, num_workers=1)
+        first = queue.submit("add_document_from_file", {"name": "first"})
+        second = queue.submit("add_document_from_file", {"name": "second"})
+        self.assertEqual(queue.get(second["job_id"])["queue_position"], 2)
+        listing = queue.list_jobs(status=JOB_QUEUED)
+        self.assertEqual(listing["total"], 2)
+        self.assertEqual([j["job_id"] for j in listing["jobs"]], [second["job_id"], first["job_id"]])
+        queue.stop()
+
+        restarted = IngestJobQueue(self.db_path, self._handler, num_workers=1)
+        restarted.start()
+        try:
+            done = wait_for_status(restarted.get, second["job_id"], (JOB_COMPLETED,))
+            self.assertEqual(done["result"], {"document_id": "second"})
+            self.assertEqual(restarted.list_jobs()["counts"][JOB_COMPLETED], 2)
+        finally:
+            restarted.stop()
+
+    def test_interrupted_jobs_run_again_as_retries(self):
+        attempts = []
+        queue = IngestJobQueue(self.db_path, lambda tool, params: attempts.append(queue.current_job_attempt()) or {})
+        job = queue.submit("add_document_from_file", {"name": "a"})
+        queue._claim_next_job()  # Started, then the server stopped before it finished
+        queue.stop()
+
+        restarted = IngestJobQueue(self.db_path, queue.handler, num_workers=1)
+        queue = restarted
+        restarted.start()
+        try:
+            done = wait_for_status(restarted.get, job["job_id"], (JOB_COMPLETED,))
+            self.assertEqual(done["attempts"], 2)
+            self.assertEqual(attempts, [2])
+        finally:
+            restarted.stop()
+
+    def test_finished_jobs_are_pruned(self):
+        queue = IngestJobQueue(self.db_path, self._handler, num_workers=1, max_finished=2, retention=3600)
+        queue.start()
+        try:
+            jobs = [queue.submit("add_document_from_file", {"name": str(n)}) for n in range(4)]
+            wait_for_status(queue.get, jobs[-1]["job_id"], (JOB_COMPLETED,))
+            pending = queue.submit("add_document_from_file", {"name": "later"})
+            queue.stop()
+            self.assertEqual(queue.prune(), 2)  # Only the newest two finished jobs are kept
+            self.assertEqual([queue.get(j["job_id"]) is not None for j in jobs], [False, False, True, True])
+            with queue._db_lock:
+                queue._connection().execute("UPDATE ingest_jobs SET finished_at = 0 WHERE job_id = ?", (jobs[2]["job_id"],))
+            self.assertEqual(queue.prune(), 1)  # Past the retention period
+            self.assertIsNone(queue.get(jobs[2]["job_id"]))
+            self.assertEqual(queue.get(pending["job_id"])["status"], JOB_QUEUED)  # Unfinished jobs are never pruned
+        finally:
+            queue.stop()
+
+    def test_list_jobs_rejects_unknown_status(self):
+        queue = IngestJobQueue(self.db_path, self._handler)
+        with self.assertRaises(ValueError):
+            queue.list_jobs(status="exploded")
+        queue.stop()
+
+
+class TestServerIngestCommands(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.port = find_free_port()
+        self.server = McpServer(name="Test Ingest Server", version="0.0.1",
+                                document_store_file=os.path.join(self.tmp_dir.name, "documents.json"))
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+    def _post(self, body):
+        payload = json.dumps(body)
+        conn = http.client.HTTPConnection('localhost', self.port, timeout=5)
+        try:
+            conn.request("POST", COMMAND_PATH, body=payload,
+                         headers={"Content-Type": "application/json", "Content-Length": str(len(payload))})
+            response = conn.getresponse()
+            return response.status, json.loads(response.read().decode('utf-8'))
+        finally:
+            conn.close()
+
+    def test_sse_file_upload_is_queued_and_pollable(self):
+        self.server.start(transport_type='sse', port=self.port)
+        content = base64.b64encode(b"Queued Paper Title\nBody text.").decode('ascii')
+        status, body = self._post({"command": "execute_tool", "tool_name": "add_document_from_file",
+                                   "tool_params": {"file_content_base64": content, "filename": "paper.txt"}})
+        self.assertEqual(status, 202)
+        job_id = body["job_id"]
+
+        def poll(job_id):
+            _, response = self._post({"command": "get_ingest_status", "job_id": job_id})
+            return response["job"]
+
+        job = wait_for_status(poll, job_id, (JOB_COMPLETED, JOB_FAILED))
+        self.assertEqual(job["status"], JOB_COMPLETED)
+        self.assertEqual(job["result"]["derived_title"], "Queued Paper Title")
+        self.assertTrue(any(doc["id"] == job["result"]["document_id"] for doc in self.server.document_store))
+
+        status, listing = self._post({"command": "list_ingest_jobs", "status": JOB_COMPLETED})
+        self.assertEqual(status, 200)
+        self.assertEqual(listing["total"], 1)
+
+    def test_sse_unknown_job_returns_404(self):
+        self.server.start(transport_type='sse', port=self.port)
+        status, body = self._post({"command": "get_ingest_status", "job_id": "missing"})
+        self.assertEqual(status, 404)
+        self.assertEqual(body["error"], "Ingest job not found")
+
+    def test_stdio_file_upload_is_queued(self):
+        content = base64.b64encode(b"Stdio Paper\nBody text.").decode('ascii')
+        request = {"command": "execute_tool", "tool_name": "add_document_from_file",
+                   "tool_params": {"file_content_base64": content, "filename": "paper.txt"}}
+        original_stdin, original_stdout = sys.stdin, sys.stdout
+        sys.stdin, sys.stdout = io.StringIO(json.dumps(request) + "\nquit\n"), io.StringIO()
+        try:
+            self.server.start(transport_type='stdio')
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdin, sys.stdout = original_stdin, original_stdout
+        response = json.loads(next(line for line in output.splitlines() if line.startswith("{")))
+        self.assertEqual(response["status"], "accepted")
+        self.server.ingest_queue.start()  # stdio stopped the workers when it quit
+        job = wait_for_status(self.server.ingest_queue.get, response["job_id"], (JOB_COMPLETED, JOB_FAILED))
+        self.assertEqual(job["result"]["derived_title"], "Stdio Paper")
+
+    def test_job_interrupted_after_commit_does_not_add_twice(self):
+        store_file = os.path.join(self.tmp_dir.name, "documents.json")
+        content = base64.b64encode(b"Crashed Paper\nBody text.").decode('ascii')
+        params = {"file_content_base64": content, "filename": "paper.txt"}
+        job = self.server.ingest_queue.submit("add_document_from_file", params)
+        # The document was committed, then the server died before recording the job as finished
+        self.server._execute_add_document_from_file_impl(params, ToolContext(job_id=job["job_id"]))
+        self.server.ingest_queue._claim_next_job()
+        self.server.ingest_queue.stop()
+        self.server.stop()
+
+        self.server = McpServer(name="Test Ingest Server", version="0.0.1", document_store_file=store_file)
+        self.server.ingest_queue.start()
+        done = wait_for_status(self.server.ingest_queue.get, job["job_id"], (JOB_COMPLETED, JOB_FAILED))
+        self.assertEqual(done["status"], JOB_COMPLETED)
+        self.assertTrue(done["result"]["recovered"])
+        added = [doc for doc in self.server.document_store if doc.get(INGEST_JOB_FIELD) == job["job_id"]]
+        self.assertEqual([doc["id"] for doc in added], [done["result"]["document_id"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
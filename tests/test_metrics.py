@@ -0,0 +1,99 @@
+import unittest
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import urllib.request
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.metrics import GAUGE, MetricsRegistry
+from mcp.server import COMMAND_PATH, METRICS_PATH, McpServer
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_concurrent_recording_is_exact(self):
+        registry = MetricsRegistry()
+        hits = registry.counter("hits_total", "Hits.", ("kind",))
+        latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+
+        def record():
+            for i in range(10000):
+                hits.inc(("a",))
+                latency.observe(0.05 if i % 2 else 0.5)
+
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        families = {name: series for name, _, _, _, series in registry.collect()}
+        self.assertEqual(families["hits_total"], {("a",): 80000})
+        self.assertEqual(families["latency_seconds"][()][:3], [40000, 40000, 0])
+        self.assertEqual(families["latency_seconds"][()][-1], 80000)
+        # The shards of the finished threads were folded into one
+        self.assertEqual(registry._shards, [])
+        self.assertEqual(registry.snapshot()["latency_seconds"][0]["p50"], 0.1)
+
+    def test_prometheus_text_format(self):
+        registry = MetricsRegistry()
+        registry.counter("requests_total", "Requests.", ("path",)).inc(('say "hi"',), 2)
+        registry.histogram("wait_seconds", "Wait.", buckets=(0.5,)).observe(0.25)
+        registry.register_collector(lambda: [("queue_depth", GAUGE, "Depth.", (), {(): 3})])
+        text = registry.render_prometheus()
+        self.assertIn('# TYPE requests_total counter\nrequests_total{path="say \\"hi\\""} 2\n', text)
+        self.assertIn('wait_seconds_bucket{le="0.5"} 1\nwait_seconds_bucket{le="+Inf"} 1\n'
+                      'wait_seconds_sum 0.25\nwait_seconds_count 1\n', text)
+        self.assertIn("# TYPE queue_depth gauge\nqueue_depth 3\n", text)
+
+
+class TestServerMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp_dir.name, "documents.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([{"id": "d1", "title": "Graph paper", "abstract": "graphs", "keywords": []}], f)
+        self.server = McpServer("Metrics", "0.1", document_store_file=path)
+        self.port = free_port()
+        self.server.start(transport_type='sse', port=self.port)
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+    def test_metrics_endpoint_and_stats(self):
+        payload = {"command": "execute_tool", "tool_name": "document_search", "tool_params": {"query": "graph"}, "wait": True}
+        request = urllib.request.Request(f"http://127.0.0.1:{self.port}{COMMAND_PATH}", data=json.dumps(payload).encode(),
+                                         headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(request, timeout=5).read()
+        self.server.resolve_resource("mcp://resources/documents/d1")
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{self.port}{METRICS_PATH}", timeout=5) as response:
+            self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+            text = response.read().decode()
+        self.assertIn('mcp_request_duration_seconds_count{transport="sse",command="execute_tool"} 1', text)
+        self.assertIn('mcp_responses_total{transport="sse",command="execute_tool",status="200"} 1', text)
+        self.assertIn('mcp_tool_duration_seconds_count{tool="document_search",status="success"} 1', text)
+        self.assertIn('mcp_resource_duration_seconds_count{outcome="found"} 1', text)
+        self.assertIn('mcp_requests_in_flight{transport="sse"} 0', text)
+        self.assertIn("mcp_sse_subscribers 0", text)
+        self.assertIn("mcp_tool_cache_misses_total 1", text)
+
+        metrics = self.server.stats()["metrics"]
+        self.assertEqual(metrics["mcp_tool_duration_seconds"][0]["count"], 1)
+        self.assertEqual(metrics["mcp_documents"], [{"value": 1}])
+
+
+if __name__ == '__main__':
+    unittest.main()
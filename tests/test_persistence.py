@@ -0,0 +1,106 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.persistence import GroupCommitWriter, atomic_write_json, atomic_write_json_array
+from mcp.server import McpServer
+
+
+class TestGroupCommitWriter(unittest.TestCase):
+
+    def test_concurrent_requests_are_coalesced(self):
+        calls = []
+
+        def commit():
+            calls.append(time.monotonic())
+            time.sleep(0.05)
+
+        writer = GroupCommitWriter(commit, window=0.05)
+        futures = []
+        lock = threading.Lock()
+
+        def request():
+            future = writer.submit()
+            with lock:
+                futures.append(future)
+
+        threads = [threading.Thread(target=request) for _ in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for future in futures:
+            future.result(timeout=5)
+        writer.close()
+        self.assertLess(len(calls), 20)
+        self.assertEqual(writer.stats()["requests"], 20)
+
+    def test_commit_failure_fails_every_future_in_batch(self):
+        def commit():
+            raise OSError("disk full")
+
+        writer = GroupCommitWriter(commit, window=0.01)
+        future = writer.submit()
+        with self.assertRaises(OSError):
+            future.result(timeout=5)
+        writer.close()
+
+    def test_atomic_write_replaces_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "store.json")
+            atomic_write_json(path, [1, 2])
+            atomic_write_json(path, [3])
+            with open(path, encoding='utf-8') as f:
+                self.assertEqual(json.load(f), [3])
+            self.assertEqual(os.listdir(tmp_dir), ["store.json"])
+
+    def test_streamed_array_matches_json_dump(self):
+        documents = [{"id": "d1", "abstract": "line one\nline two", "keywords": ["ü", "x"]}, {}, [1, {"a": None}]]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "store.json")
+            for items, kwargs in ((documents, {"indent": 4, "ensure_ascii": True}), (documents, {}), ([], {"indent": 4})):
+                self.assertEqual(atomic_write_json_array(path, (item for item in items), **kwargs), len(items))
+                with open(path, encoding='utf-8') as f:
+                    self.assertEqual(f.read(), json.dumps(items, **kwargs))
+
+
+class TestServerDurability(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store_file = os.path.join(self.tmp_dir.name, "documents.json")
+        self.server = McpServer(name="Durability Test", version="0.0.1", document_store_file=self.store_file)
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+    def _stored_ids(self):
+        with open(self.store_file, encoding='utf-8') as f:
+            return [doc["id"] for doc in json.load(f)]
+
+    def test_fsync_durability_waits_for_write(self):
+        result = self.server._execute_add_document_to_store_impl({"document_text": "Durable\nbody"})
+        self.assertEqual(result["durability"], "fsync")
+        self.assertIn(result["document_id"], self._stored_ids())
+
+    def test_enqueue_durability_returns_before_write(self):
+        result = self.server._execute_add_document_to_store_impl({"document_text": "Queued\nbody", "durability": "enqueue"})
+        self.assertEqual(result["durability"], "enqueued")
+        self.server.store_writer.drain(timeout=5)
+        self.assertIn(result["document_id"], self._stored_ids())
+
+    def test_invalid_durability_is_rejected(self):
+        result = self.server._execute_add_document_to_store_impl({"document_text": "x", "durability": "eventually"})
+        self.assertIn("Invalid durability", result["error"])
+
+
+if __name__ == '__main__':
+    unittest.main()
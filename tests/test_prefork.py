@@ -0,0 +1,156 @@
+import unittest
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.prefork import WriterError, WriterHub, WriterLink, prefork_supported, run_prefork
+from mcp.server import McpServer
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class TestRunPrefork(unittest.TestCase):
+
+    def test_search_shards_are_refused(self):
+        with self.assertLogs("mcp.prefork", level="ERROR"):
+            self.assertEqual(run_prefork(2, free_port(), {"name": "Test", "version": "0.1", "search_shards": 2}), 1)
+
+
+class TestWriterHubStartup(unittest.TestCase):
+
+    def test_writes_wait_only_for_live_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store_file = os.path.join(tmp, "documents.json")
+            address = os.path.join(tmp, "writer.sock")
+            writer = McpServer("Writer", "0.1", document_store_file=store_file)
+            hub = WriterHub(writer, address, b"test-key", num_workers=2, subscribe_timeout=0.3)
+            hub.start()
+            worker = McpServer("Worker", "0.1", document_store_file=store_file)
+            link = WriterLink(address, b"test-key", worker, worker_id=0)
+            worker.attach_writer(link)
+            try:
+                # Worker 1 never subscribes: the write fails instead of blocking forever
+                started = time.monotonic()
+                with self.assertRaises(WriterError) as raised:
+                    link.call_tool("add_document_to_store", {"document_text": "Early Paper\nBody"})
+                self.assertIn("[1]", str(raised.exception))
+                self.assertLess(time.monotonic() - started, 5)
+
+                hub.worker_exited(1)  # As reported by the supervisor
+                added = link.call_tool("add_document_to_store", {"document_text": "Late Paper\nBody"})
+                self.assertEqual(worker._find_document(added["document_id"])["title"], "Late Paper")
+            finally:
+                link.close()
+                hub.close()
+                worker.stop()
+                writer.stop()
+
+
+class TestWriterHub(unittest.TestCase):
+    """Writer and worker servers in one process, connected through a hub socket."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        store_file = os.path.join(self.tmp_dir.name, "documents.json")
+        self.writer = McpServer("Writer", "0.1", document_store_file=store_file)
+        self.hub = WriterHub(self.writer, os.path.join(self.tmp_dir.name, "writer.sock"), b"test-key", num_workers=1)
+        self.hub.start()
+        self.worker = McpServer("Worker", "0.1", document_store_file=store_file)
+        self.link = WriterLink(os.path.join(self.tmp_dir.name, "writer.sock"), b"test-key", self.worker, worker_id=0)
+        self.worker.attach_writer(self.link)
+
+    def tearDown(self):
+        self.link.close()
+        self.hub.close()
+        self.worker.stop()
+        self.writer.stop()
+        self.tmp_dir.cleanup()
+
+    def test_worker_reads_its_own_writes(self):
+        tools = self.worker.tools
+        added = tools["add_document_to_store"]["callback"]({"document_text": "Forwarded Paper\nBody"})
+        doc_id = added["document_id"]
+        # Applied in the worker before the forwarded call returned
+        self.assertEqual(self.worker._find_document(doc_id)["title"], "Forwarded Paper")
+        self.assertEqual(self.writer._find_document(doc_id)["title"], "Forwarded Paper")
+        with open(self.writer.document_store_file, encoding='utf-8') as f:
+            self.assertIn(doc_id, [d["id"] for d in json.load(f)])
+
+        tools["update_document"]["callback"]({"document_id": doc_id, "title": "Renamed"})
+        self.assertEqual(self.worker._find_document(doc_id)["title"], "Renamed")
+        tools["delete_document"]["callback"]({"document_id": "doc101"})
+        self.assertIsNone(self.worker._find_document("doc101"))
+        self.assertEqual([d["id"] for d in self.worker.document_store], [d["id"] for d in self.writer.document_store])
+
+    def test_events_are_relayed_to_worker_clients(self):
+        client = io.BytesIO()
+        self.worker.running = True
+        self.worker.sse_clients.append(client)
+        self.worker.execute_tool_command("echo", {"message": "hi"})
+        self.worker.tools["delete_document"]["callback"]({"document_id": "doc102"})
+        deadline = time.time() + 5
+        while b"resource_updated" not in client.getvalue() and time.time() < deadline:
+            time.sleep(0.05)
+        output = client.getvalue().decode('utf-8')
+        self.assertIn('"echo_response": "hi"', output)
+        self.assertEqual(output.count("event: resource_updated"), 1)
+
+
+@unittest.skipUnless(prefork_supported(), "pre-fork mode needs fork() and SO_REUSEPORT")
+class TestPreforkServer(unittest.TestCase):
+
+    def post(self, port, payload):
+        request = urllib.request.Request(f"http://127.0.0.1:{port}/mcp_command", data=json.dumps(payload).encode('utf-8'),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.loads(response.read())
+
+    def test_writes_reach_every_worker(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            port = free_port()
+            process = subprocess.Popen(
+                [sys.executable, os.path.join(project_root, "app.py"), "--transport", "sse", "--port", str(port),
+                 "--workers", "3"], cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                deadline = time.time() + 30
+                while True:
+                    try:
+                        self.post(port, {"command": "list_resources"})
+                        break
+                    except OSError:
+                        if time.time() > deadline:
+                            self.fail("pre-fork server did not start")
+                        time.sleep(0.2)
+
+                self.post(port, {"command": "execute_tool", "tool_name": "add_document_to_store",
+                                 "tool_params": {"document_text": "Prefork Paper\nBody"}})
+                # Every connection may land on a different worker; all must converge
+                consecutive = 0
+                deadline = time.time() + 30
+                while consecutive < 20:
+                    names = [r["name"] for r in self.post(port, {"command": "list_resources", "limit": 100})["resources"]]
+                    consecutive = consecutive + 1 if "Document: Prefork Paper" in names else 0
+                    self.assertLess(time.time(), deadline, "a worker never saw the new document")
+                    time.sleep(0.02)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            with open(os.path.join(tmp, "documents.json"), encoding='utf-8') as f:
+                self.assertIn("Prefork Paper", [d["title"] for d in json.load(f)])
+
+
+if __name__ == '__main__':
+    unittest.main()
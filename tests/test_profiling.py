@@ -0,0 +1,172 @@
+import unittest
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.profiling import Profiler
+from mcp.server import COMMAND_PATH, McpServer
+from mcp.tool_runtime import ToolRuntime
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def busy_work(params):
+    return sum(i * i for i in range(params.get("n", 1000)))
+
+
+async def async_busy_work(params):
+    total = 0
+    for _ in range(3):
+        total += busy_work(params)
+        await asyncio.sleep(0.01)
+    return total
+
+
+def function_names(report):
+    return " ".join(entry["function"] for entry in report["functions"])
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_profiles_the_next_n_calls_then_turns_off(self):
+        profiler = Profiler()
+        profiler.start(requests=2)
+        selected = [profiler.select("search") for _ in range(4)]
+        self.assertEqual(selected, [True, True, False, False])
+        self.assertFalse(profiler.active)
+        with self.assertRaises(ValueError):
+            profiler.start()
+        with self.assertRaises(ValueError):
+            profiler.start(sample_rate=1.5)
+
+    def test_profiles_sync_and_coroutine_callbacks(self):
+        profiler = Profiler()
+        self.assertEqual(profiler.wrap(busy_work)({"n": 10}), 285)
+        runtime = ToolRuntime(max_threads=1)
+        try:
+            self.assertEqual(runtime.call_blocking(profiler.wrap(async_busy_work), {"n": 10}), 855)
+        finally:
+            runtime.close()
+        report = profiler.report(sort="tottime", limit=50)
+        self.assertEqual(report["profiled_calls"], 2)
+        self.assertIn("busy_work", function_names(report))
+        self.assertIn("async_busy_work", function_names(report))
+        self.assertIn("function calls", report["text"])
+
+    def test_concurrent_calls_take_turns(self):
+        profiler = Profiler()
+        barrier = threading.Barrier(4)
+
+        def overlapping(params):
+            barrier.wait(timeout=5)  # All four calls are running at once
+            time.sleep(0.05)
+            return busy_work(params)
+
+        wrapped = profiler.wrap(overlapping)
+        results, errors = [], []
+
+        def call():
+            try:
+                results.append(wrapped({"n": 10}))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+        self.assertEqual(errors, [])
+        self.assertEqual(results, [285] * 4)
+        status = profiler.status()
+        self.assertEqual(status["profiled_calls"], 1)
+        self.assertEqual(status["busy_skipped"], 3)
+        self.assertIn("overlapping", function_names(profiler.report(limit=50)))
+
+    def test_memory_snapshot_diff(self):
+        profiler = Profiler()
+        profiler.memory_start()
+        try:
+            retained = [bytearray(1024) for _ in range(1000)]
+            diff = profiler.memory_snapshot(limit=5, match="test_profiling")
+            self.assertTrue(diff["compared_to_previous"])
+            self.assertGreaterEqual(diff["top"][0]["size_diff_bytes"], 1024 * 1000)
+            self.assertIn("test_profiling.py", diff["top"][0]["location"])
+            self.assertEqual(len(retained), 1000)
+        finally:
+            profiler.memory_stop()
+        with self.assertRaises(ValueError):
+            profiler.memory_snapshot()
+
+
+class TestServerProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp_dir.name, "documents.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([], f)
+        self.server = McpServer("Profiling", "0.1", document_store_file=path)
+        self.server.register_tool("busy_work", "Burns CPU", {"type": "object"}, busy_work)
+        self.server.register_tool("async_busy_work", "Burns CPU between awaits", {"type": "object"}, async_busy_work)
+        self.server.broadcast_sse_message = lambda event_name, data, encoded=None: None
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+    def test_disabled_profiler_leaves_callbacks_unwrapped(self):
+        context = self.server._start_call("busy_work", None, None, None)
+        self.assertIs(self.server._prepare_callback("busy_work", busy_work, context), busy_work)
+
+    def test_profile_commands_over_http(self):
+        port = free_port()
+        self.server.start(transport_type='sse', port=port)
+
+        def post(payload):
+            request = urllib.request.Request(f"http://127.0.0.1:{port}{COMMAND_PATH}", data=json.dumps(payload).encode(),
+                                             headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request, timeout=5) as response:
+                    return response.status, json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                return e.code, json.loads(e.read())
+
+        self.assertEqual(post({"command": "profile_start", "requests": 0})[0], 400)
+        status, started = post({"command": "profile_start", "requests": 2, "tools": ["busy_work", "async_busy_work"]})
+        self.assertEqual((status, started["active"], started["remaining"]), (200, True, 2))
+        self.server.execute_tool("echo", {"message": "not selected"})
+        self.server.execute_tool("busy_work", {"n": 100})
+        self.server.submit_tool_command("async_busy_work", {"n": 100}).result(timeout=5)
+        self.server.execute_tool("busy_work", {"n": 100})  # Past the requested two calls
+        status, report = post({"command": "profile_report", "limit": 100})
+        self.assertEqual(status, 200)
+        self.assertEqual(report["profiled_calls"], 2)
+        self.assertFalse(report["profiler"]["active"])
+        self.assertIn("async_busy_work", function_names(report))
+        self.assertNotIn("echo", function_names(report))
+
+        self.assertEqual(post({"command": "memory_snapshot"})[0], 400)  # Not tracing yet
+        self.assertEqual(post({"command": "memory_start"})[0], 200)
+        status, diff = post({"command": "memory_snapshot", "match": "mcp", "limit": 5})
+        self.assertEqual(status, 200)
+        self.assertLessEqual(len(diff["top"]), 5)
+        self.assertEqual(post({"command": "memory_stop"}), (200, {"mcp_protocol_version": "1.0", "status": "success",
+                                                                 "tracing": False}))
+
+
+if __name__ == '__main__':
+    unittest.main()
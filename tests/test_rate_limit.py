@@ -0,0 +1,106 @@
+import unittest
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.rate_limit import RateLimiter
+from mcp.server import COMMAND_PATH, McpServer
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_burst_refill_and_retry_after(self):
+        limiter = RateLimiter(rate=10, burst=2)
+        self.assertIsNone(limiter.acquire("a"))
+        self.assertIsNone(limiter.acquire("a"))
+        retry_after = limiter.acquire("a", command="echo")
+        self.assertAlmostEqual(retry_after, 0.1, delta=0.02)
+        self.assertIsNone(limiter.acquire("b"))  # Buckets are per client
+        time.sleep(0.12)
+        self.assertIsNone(limiter.acquire("a"))
+        stats = limiter.stats()
+        self.assertEqual((stats["allowed"], stats["rejected"]), (4, 1))
+        self.assertEqual(stats["rejected_by_command"], {"echo": 1})
+        self.assertEqual(stats["top_rejected_clients"], [{"client": "a", "rejected": 1}])
+
+    def test_weighted_costs_are_capped_to_the_burst(self):
+        limiter = RateLimiter(rate=1, burst=5)
+        self.assertIsNone(limiter.acquire("a", cost=50))  # Capped, so a heavy command can pass at all
+        self.assertIsNotNone(limiter.acquire("a", cost=1))
+        self.assertIsNone(limiter.acquire("a", cost=0))
+
+    def test_idle_clients_are_evicted(self):
+        limiter = RateLimiter(rate=1, burst=1, max_clients=2)
+        for client in ("a", "b", "c"):
+            limiter.acquire(client)
+        self.assertEqual(limiter.stats()["clients"], 2)
+        self.assertIsNone(limiter.acquire("a"))  # Evicted, so it starts with a full bucket again
+
+
+class TestCommandRateLimit(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp_dir.name, "documents.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([], f)
+        self.server = McpServer("Limited", "0.1", document_store_file=path, rate_limit=0.5, rate_limit_burst=3)
+        self.port = free_port()
+        self.server.start(transport_type='sse', port=self.port)
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+    def post(self, payload):
+        request = urllib.request.Request(f"http://127.0.0.1:{self.port}{COMMAND_PATH}",
+                                         data=json.dumps(payload).encode('utf-8'),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status, dict(response.headers), json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, dict(e.headers), json.loads(e.read())
+
+    def test_over_limit_requests_get_429(self):
+        echo = {"command": "execute_tool", "tool_name": "echo", "tool_params": {"message": "hi"}}
+        self.assertEqual(self.post(echo)[0], 202)
+        # document_search costs 2 tokens, which drains the bucket
+        self.assertEqual(self.post({"command": "execute_tool", "tool_name": "document_search",
+                                    "tool_params": {"query": "x"}, "wait": True})[0], 200)
+        status, headers, body = self.post(echo)
+        self.assertEqual(status, 429)
+        self.assertEqual(headers["Retry-After"], "2")
+        self.assertAlmostEqual(body["retry_after"], 2.0, delta=0.1)
+        # Cancelling is free, so a throttled client can still stop its work
+        self.assertEqual(self.post({"command": "cancel", "request_id": "nope"})[0], 404)
+
+        stats = self.server.rate_limit_status()
+        self.assertTrue(stats["enabled"])
+        self.assertEqual(stats["rejected"], 1)
+        self.assertEqual(stats["rejected_by_command"], {"execute_tool": 1})
+        self.assertEqual(self.server.command_cost({"command": "execute_tool", "tool_name": "add_document_from_file"}), 10.0)
+
+    def test_rejections_are_counted_by_known_command(self):
+        for n in range(6):
+            self.post({"command": f"junk_{n}"})
+        stats = self.server.rate_limit_status()
+        self.assertEqual(stats["rejected_by_command"], {"unknown": 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
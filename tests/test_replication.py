@@ -0,0 +1,142 @@
+import unittest
+import io
+import os
+import socket
+import sys
+import tempfile
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.replication import ChangeLog
+from mcp.server import McpServer
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+class TestChangeLog(unittest.TestCase):
+
+    def test_resume_window(self):
+        log = ChangeLog(capacity=3)
+        for i in range(5):
+            log.append("created", f"d{i}", {"id": f"d{i}"})
+        self.assertEqual(log.seq, 5)
+        self.assertEqual([c["seq"] for c in log.wait_after(2, 0)], [3, 4, 5])
+        self.assertEqual(log.wait_after(5, 0.01), [])
+        self.assertIsNone(log.wait_after(1, 0))  # Change 2 has been dropped
+        self.assertFalse(log.covers(6))
+
+    def test_positions_belong_to_one_run(self):
+        log = ChangeLog(epoch="run1")
+        log.append("created", "d0", {"id": "d0"})
+        self.assertEqual(log.position(), "run1-1")
+        self.assertEqual(log.parse("run1-1"), 1)
+        self.assertIsNone(log.parse("run0-1"))  # An earlier run of the server
+        self.assertIsNone(log.parse("1"))
+        self.assertEqual(log.wait_after(0, 0)[0]["epoch"], "run1")
+
+
+class TestReadReplica(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        for name in ("primary", "replica"):
+            os.makedirs(os.path.join(self.tmp_dir.name, name))
+        self.primary = McpServer("Primary", "0.1", document_store_file=os.path.join(self.tmp_dir.name, "primary", "documents.json"))
+        self.port = port = free_port()
+        self.primary.start(transport_type='sse', port=port)
+        self.primary._execute_add_document_to_store_impl({"document_text": "Before Replica\nBody"})
+        self.replica = McpServer("Replica", "0.1", document_store_file=os.path.join(self.tmp_dir.name, "replica", "documents.json"),
+                                 replicate_from=f"http://127.0.0.1:{port}")
+        self.assertTrue(self.replica.replica.synced.wait(10))
+
+    def tearDown(self):
+        self.replica.stop()
+        self.primary.stop()
+        self.tmp_dir.cleanup()
+
+    def ids(self, server):
+        return [d["id"] for d in server.document_store]
+
+    def test_replica_follows_primary_mutations(self):
+        self.assertEqual(self.ids(self.replica), self.ids(self.primary))
+        added = self.primary._execute_add_document_to_store_impl({"document_text": "Replicated Zyxwv\nBody"})
+        self.primary._execute_update_document_impl({"document_id": "doc102", "title": "Renamed Energy"})
+        self.primary._execute_delete_document_impl({"document_id": "doc103"})
+        self.assertTrue(wait_until(lambda: self.ids(self.replica) == self.ids(self.primary)))
+        self.assertEqual(self.replica._find_document("doc102")["title"], "Renamed Energy")
+
+        response = self.replica._execute_document_search_impl({"query": "zyxwv"})
+        self.assertEqual([d["id"] for d in response["search_results"]], [added["document_id"]])
+        replication = response["replication"]
+        self.assertTrue(replication["connected"])
+        self.assertEqual(replication["applied_seq"], self.primary.change_log.seq)
+        self.assertEqual(replication["lag_changes"], 0)
+        self.assertLess(replication["lag_seconds"], 5)
+        self.assertEqual(self.replica.replication_status()["role"], "replica")
+        self.assertIn("replication", self.replica.list_resources())
+
+    def test_replica_rejects_writes(self):
+        result = self.replica.tools["add_document_to_store"]["callback"]({"document_text": "Nope"})
+        self.assertIn("read-only replica", result["error"])
+        self.assertEqual(self.ids(self.replica), self.ids(self.primary))
+
+    def test_resume_after_reconnect_skips_snapshot(self):
+        follower = self.replica.replica
+        follower._response.close()  # Drop the stream; the follower reconnects with ?since=
+        self.primary._execute_add_document_to_store_impl({"document_text": "While Away\nBody"})
+        self.assertTrue(wait_until(lambda: self.ids(self.replica) == self.ids(self.primary)))
+        self.assertEqual(follower.snapshots, 1)
+
+    def test_stream_starts_with_snapshot(self):
+        output = io.BytesIO()
+        self.primary.running = False  # Returns right after the snapshot
+        try:
+            self.primary.stream_changes(output, None)
+            self.primary.stream_changes(output, self.primary.change_log.position())
+            self.primary.stream_changes(output, f"other-{self.primary.change_log.seq}")
+        finally:
+            self.primary.running = True
+        self.assertTrue(output.getvalue().startswith(b"event: snapshot\ndata: "))
+        self.assertEqual(output.getvalue().count(b"event: snapshot"), 2)  # Not for the position from this run
+
+    def test_primary_restart_forces_a_snapshot(self):
+        follower = self.replica.replica
+        self.primary._execute_add_document_to_store_impl({"document_text": "Second Paper\nBody"})
+        self.assertTrue(wait_until(lambda: follower.applied_seq == 2))
+        old_epoch = follower.epoch
+        self.primary.stop()
+
+        # The new run numbers its changes from 1 again, past the position the replica resumes from
+        path = os.path.join(self.tmp_dir.name, "primary", "documents.json")
+        self.primary = McpServer("Primary", "0.1", document_store_file=path)
+        self.primary._execute_delete_document_impl({"document_id": "doc101"})
+        for n in range(3):
+            self.primary._execute_add_document_to_store_impl({"document_text": f"Restarted {n}\nBody"})
+        self.assertGreater(self.primary.change_log.seq, follower.applied_seq)
+        self.primary.start(transport_type='sse', port=self.port)
+
+        self.assertTrue(wait_until(lambda: follower.snapshots == 2))
+        self.assertTrue(wait_until(lambda: self.ids(self.replica) == self.ids(self.primary)))
+        self.assertNotIn("doc101", self.ids(self.replica))
+        self.assertEqual(follower.epoch, self.primary.change_log.epoch)
+        self.assertNotEqual(follower.epoch, old_epoch)
+        self.assertEqual(follower.applied_seq, self.primary.change_log.seq)
+
+
+if __name__ == '__main__':
+    unittest.main()
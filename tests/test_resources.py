@@ -0,0 +1,75 @@
+import unittest
+import io
+import json
+import os
+import sys
+import tempfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.server import McpServer, DOCUMENT_RESOURCE_PREFIX
+
+
+class TestLazyDocumentResources(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.server = McpServer(name="Test Resource Server", version="0.0.1",
+                                document_store_file=os.path.join(self.tmp_dir.name, "documents.json"))
+        self.original_stdin = sys.stdin
+        self.original_stdout = sys.stdout
+
+    def tearDown(self):
+        sys.stdin = self.original_stdin
+        sys.stdout = self.original_stdout
+        self.tmp_dir.cleanup()
+
+    def _run_stdio(self, *requests):
+        sys.stdin = io.StringIO("".join(json.dumps(r) + "\n" for r in requests) + "quit\n")
+        sys.stdout = io.StringIO()
+        self.server.start(transport_type='stdio')
+        output = sys.stdout.getvalue()
+        sys.stdout = self.original_stdout
+        return [json.loads(line) for line in output.splitlines() if line.startswith("{")]
+
+    def test_documents_are_not_copied_into_registry(self):
+        self.assertEqual(list(self.server.resources), ["mcp://resources/literature/doc123"])
+
+    def test_document_resource_resolved_on_demand(self):
+        added = self.server._execute_add_document_to_store_impl({"document_text": "Lazy Resource Paper\nBody"})
+        uri = f"{DOCUMENT_RESOURCE_PREFIX}{added['document_id']}"
+        response, missing = self._run_stdio({"command": "get_resource", "uri": uri},
+                                            {"command": "get_resource", "uri": f"{DOCUMENT_RESOURCE_PREFIX}nope"})
+        self.assertEqual(response["status"], "success")
+        self.assertEqual(response["resource_data"]["name"], "Document: Lazy Resource Paper")
+        self.assertEqual(response["resource_data"]["content"]["id"], added["document_id"])
+        self.assertEqual(missing["error"], "Resource not found")
+
+    def test_list_resources_pages_through_static_and_documents(self):
+        seen, cursor = [], None
+        while True:
+            page = self.server.list_resources(cursor=cursor, limit=2)
+            self.assertEqual(page["status"], "success")
+            self.assertLessEqual(len(page["resources"]), 2)
+            self.assertTrue(all("content" not in r for r in page["resources"]))
+            seen.extend(r["uri"] for r in page["resources"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), page["total"])
+        self.assertEqual(seen[0], "mcp://resources/literature/doc123")
+        self.assertEqual(seen[1:], [f"{DOCUMENT_RESOURCE_PREFIX}{doc['id']}" for doc in self.server.document_store])
+
+    def test_list_resources_rejects_bad_cursor(self):
+        self.assertEqual(self.server.list_resources(cursor="abc")["status"], "error")
+
+    def test_capabilities_carry_first_page_and_template(self):
+        capabilities = self.server.get_capabilities()
+        self.assertEqual(capabilities["resource_templates"][0]["uri_template"], f"{DOCUMENT_RESOURCE_PREFIX}{{document_id}}")
+        self.assertIsNone(capabilities["resources_next_cursor"])
+        self.assertEqual(len(capabilities["resources"]), 1 + len(self.server.document_store))
+
+
+if __name__ == '__main__':
+    unittest.main()
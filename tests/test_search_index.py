@@ -0,0 +1,81 @@
+import unittest
+import os
+import random
+import sys
+import tempfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.search_index import SearchIndex, tokenize
+from mcp.server import McpServer
+
+WORDS = ["quantum", "learning", "solar", "network", "model", "graph", "energy", "vision"]
+
+
+def make_doc(rng, i):
+    return {
+        "id": f"d{i}",
+        "title": " ".join(rng.choice(WORDS).capitalize() for _ in range(3)),
+        "abstract": " ".join(rng.choice(WORDS) for _ in range(8)),
+        "keywords": rng.sample(WORDS, 2),
+    }
+
+
+def matches(doc, query):
+    return (query in doc["title"].lower() or query in doc["abstract"].lower()
+            or any(query in k.lower() for k in doc["keywords"]))
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Deep-Learning, NLP!"), ["deep", "learning", "nlp"])
+
+    def test_candidates_cover_substring_matches_across_flushes_and_merges(self):
+        rng = random.Random(7)
+        docs = [make_doc(rng, i) for i in range(300)]
+        index = SearchIndex(flush_threshold=16, merge_factor=3)
+        try:
+            index.bulk_load(enumerate(docs[:100]))
+            for ordinal in range(100, 300):
+                index.add(ordinal, docs[ordinal])
+            self.assertTrue(index.wait_idle(timeout=5.0))
+            stats = index.stats()
+            self.assertGreater(stats["flushes"], 0)
+            self.assertGreater(stats["merges"], 0)
+            self.assertEqual(stats["indexed_documents"], 300)
+
+            for query in ("learn", "graph model", "ar", "solar energy", "qubit"):
+                expected = [i for i, doc in enumerate(docs) if matches(doc, query)]
+                candidates = list(index.search(query))
+                self.assertEqual(candidates, sorted(candidates))
+                self.assertTrue(set(expected) <= set(candidates), query)
+        finally:
+            index.close()
+
+    def test_query_without_words_is_not_narrowed(self):
+        index = SearchIndex()
+        self.assertIsNone(index.search("  -- "))
+        index.close()
+
+
+class TestServerSearchUsesIndex(unittest.TestCase):
+
+    def test_search_results_match_linear_scan(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            server = McpServer("Test", "0.1", document_store_file=os.path.join(tmp, "documents.json"))
+            try:
+                self.assertTrue(server._search_index_ready.wait(timeout=5.0))
+                for text in ("Graph Learning Survey\nNetworks of graphs", "Solar Cells\nPerovskite energy"):
+                    server._execute_add_document_to_store_impl({"document_text": text, "durability": "enqueue"})
+                for query in ("learning", "graph", "energy", "ai", "machine learning", "-"):
+                    expected = [dict(d) for d in server.document_store if matches(d, query)][:5]
+                    result = server._execute_document_search_impl({"query": query, "max_results": 5})
+                    self.assertEqual(result["search_results"], expected, query)
+            finally:
+                server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import os
+import random
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.search_index import document_matches
+from mcp.server import McpServer
+from mcp.sharding import ShardedSearch
+from mcp.snapshot import write_snapshot
+from mcp.tool_runtime import ToolCancelledError, ToolContext, ToolTimeoutError
+
+WORDS = ["quantum", "learning", "solar", "network", "model", "graph", "energy", "vision"]
+
+
+def make_doc(rng, i):
+    return {
+        "id": f"d{i}",
+        "title": " ".join(rng.choice(WORDS).capitalize() for _ in range(3)),
+        "abstract": " ".join(rng.choice(WORDS) for _ in range(8)),
+        "keywords": rng.sample(WORDS, 2),
+    }
+
+
+class TestShardedSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        rng = random.Random(3)
+        self.docs = [make_doc(rng, i) for i in range(60)]
+        self.snapshot_path = os.path.join(self.tmp_dir.name, "documents.snapshot")
+        write_snapshot(self.snapshot_path, self.docs)
+        self.sharded = ShardedSearch(self.snapshot_path, num_shards=3)
+
+    def tearDown(self):
+        self.sharded.close()
+        self.tmp_dir.cleanup()
+
+    def expected(self, docs, query, k):
+        return [d for d in docs if d is not None and document_matches(d, query)][:k]
+
+    def test_scatter_gather_matches_single_process_order(self):
+        for query in ("learning", "graph model", "ar", "nothing-here"):
+            self.assertEqual(self.sharded.search(query, 7), self.expected(self.docs, query, 7), query)
+        self.assertEqual(self.sharded.search("solar", 0), self.expected(self.docs, "solar", len(self.docs)))
+
+    def test_adds_go_to_least_loaded_shard_and_deletes_rebalance(self):
+        docs = list(self.docs)
+        rng = random.Random(9)
+        for ordinal in range(len(docs), len(docs) + 5):
+            doc = make_doc(rng, ordinal)
+            docs.append(doc)
+            self.sharded.add(ordinal, doc)
+        loads = [s["documents"] for s in self.sharded.stats()]
+        self.assertLessEqual(max(loads) - min(loads), 1)
+
+        # Empty most of shard 0 so it falls far behind the others
+        for ordinal in range(0, 45, 3):
+            docs[ordinal] = None
+            self.sharded.delete(ordinal)
+        self.assertTrue(self.sharded.wait_for_rebalance(10))
+        loads = [s["documents"] for s in self.sharded.stats()]
+        self.assertGreater(self.sharded.moves, 0)
+        self.assertLessEqual(max(loads) - min(loads), max(1, int(0.1 * sum(loads) / 3)) + 1)
+        for query in ("learning", "vision energy"):
+            self.assertEqual(self.sharded.search(query, 100), self.expected(docs, query, 100), query)
+
+    def test_deletes_do_not_wait_for_a_rebalance(self):
+        docs = list(self.docs)
+        with self.sharded._rebalance_lock:  # As if a move were in flight
+            started = time.monotonic()
+            for ordinal in range(0, 45, 3):
+                docs[ordinal] = None
+                self.sharded.delete(ordinal)
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertFalse(self.sharded.wait_for_rebalance(0))
+            self.assertEqual(self.sharded.search("learning", 100), self.expected(docs, "learning", 100))
+        self.assertTrue(self.sharded.wait_for_rebalance(10))
+        self.assertGreater(self.sharded.moves, 0)
+        for query in ("learning", "vision energy"):
+            self.assertEqual(self.sharded.search(query, 100), self.expected(docs, query, 100), query)
+
+    @unittest.skipUnless(hasattr(signal, "SIGSTOP"), "needs SIGSTOP")
+    def test_search_stops_waiting_when_the_call_ends(self):
+        stuck = self.sharded._clients[0].process
+        os.kill(stuck.pid, signal.SIGSTOP)
+        try:
+            started = time.monotonic()
+            with self.assertRaises(ToolTimeoutError):
+                self.sharded.search("learning", 5, ToolContext(timeout=0.3))
+            self.assertLess(time.monotonic() - started, 2)
+
+            context = ToolContext()
+            threading.Timer(0.2, context.cancel).start()
+            started = time.monotonic()
+            with self.assertRaises(ToolCancelledError):
+                self.sharded.search("learning", 5, context)
+            self.assertLess(time.monotonic() - started, 2)
+        finally:
+            os.kill(stuck.pid, signal.SIGCONT)
+        # Late replies to the abandoned searches are ignored
+        self.assertEqual(self.sharded.search("learning", 7), self.expected(self.docs, "learning", 7))
+
+
+class TestServerShardedSearch(unittest.TestCase):
+
+    def test_server_results_match_in_process_search(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "documents.json")
+            server = McpServer("Test", "0.1", document_store_file=path, search_shards=2)
+            try:
+                self.assertIsNotNone(server.sharded_search)
+                added = server._execute_add_document_to_store_impl({"document_text": "Sharded Graph Paper\nBody"})
+                server._execute_delete_document_impl({"document_id": "doc104"})
+                server._execute_update_document_impl({"document_id": "doc101", "title": "Graph energy"})
+                for query in ("graph", "learning", "energy", "-"):
+                    sharded = server._execute_document_search_impl({"query": query, "max_results": 5})
+                    expected = [dict(d) for d in server.document_store if document_matches(d, query)][:5]
+                    self.assertEqual(sharded["search_results"], expected, query)
+                self.assertIn(added["document_id"], [d["id"] for d in server._execute_document_search_impl(
+                    {"query": "sharded graph"})["search_results"]])
+            finally:
+                server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.document_store import DocumentStore
+from mcp.snapshot import SnapshotError, SnapshotWriter, open_snapshot, write_snapshot
+from mcp.server import McpServer
+
+
+SAMPLE_DOCUMENTS = [
+    {"id": "doc102", "title": "Renewable Energy", "abstract": "Solar and wind.", "keywords": ["solar", "wind"]},
+    {"id": "doc101", "title": "AI in Healthcare", "abstract": "Diagnostics with machine learning.", "keywords": ["ai", "machine learning"]},
+    {"id": "doc103", "title": "Ünïcödé Title", "abstract": "", "keywords": [], "year": 2024},
+    {"title": "No id", "keywords": "not-a-list"},
+]
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.tmp_dir.name, "documents.json")
+        self.snapshot_path = os.path.join(self.tmp_dir.name, "documents.snapshot")
+        with open(self.json_path, 'w', encoding='utf-8') as f:
+            json.dump(SAMPLE_DOCUMENTS, f)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip_and_id_lookup(self):
+        write_snapshot(self.snapshot_path, SAMPLE_DOCUMENTS, source_path=self.json_path)
+        reader = open_snapshot(self.snapshot_path, source_path=self.json_path)
+        try:
+            self.assertEqual(len(reader), len(SAMPLE_DOCUMENTS))
+            self.assertEqual(list(reader), SAMPLE_DOCUMENTS)
+            self.assertEqual(reader.find("doc101"), 1)
+            self.assertEqual(reader.find("doc103"), 2)
+            self.assertIsNone(reader.find("doc999"))
+        finally:
+            reader.close()
+
+    def test_long_strings_round_trip_without_being_remembered(self):
+        abstract = "x" * 5000
+        documents = [{"id": f"d{n}", "title": "Same", "abstract": abstract, "keywords": ["k"]} for n in range(3)]
+        writer = SnapshotWriter(self.snapshot_path)
+        for doc in documents:
+            writer.add(doc)
+        self.assertNotIn(abstract, writer._heap._offsets)  # Spilled to the heap file, not kept in memory
+        self.assertIn("Same", writer._heap._offsets)
+        self.assertEqual(writer.finish(), 3)
+        reader = open_snapshot(self.snapshot_path)
+        try:
+            self.assertEqual(list(reader), documents)
+        finally:
+            reader.close()
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), ["documents.json", "documents.snapshot"])
+
+    def test_concurrent_writers_do_not_share_a_temp_file(self):
+        first, second = SnapshotWriter(self.snapshot_path), SnapshotWriter(self.snapshot_path)
+        first.add(SAMPLE_DOCUMENTS[0])
+        for doc in SAMPLE_DOCUMENTS:
+            second.add(doc)
+        unpatched = os.replace
+        replaced = []
+
+        def replace_after_the_other_writer(src, dst):
+            replaced.append(src)
+            if len(replaced) == 1:
+                self.assertEqual(second.finish(), len(SAMPLE_DOCUMENTS))
+            unpatched(src, dst)
+
+        os.replace = replace_after_the_other_writer
+        try:
+            self.assertEqual(first.finish(), 1)
+        finally:
+            os.replace = unpatched
+        self.assertNotEqual(replaced[0], replaced[1])
+        reader = open_snapshot(self.snapshot_path)
+        try:
+            self.assertEqual(list(reader), SAMPLE_DOCUMENTS[:1])
+        finally:
+            reader.close()
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), ["documents.json", "documents.snapshot"])
+
+    def test_stale_snapshot_is_rejected(self):
+        write_snapshot(self.snapshot_path, SAMPLE_DOCUMENTS, source_path=self.json_path)
+        time.sleep(0.01)
+        with open(self.json_path, 'w', encoding='utf-8') as f:
+            json.dump(SAMPLE_DOCUMENTS[:1], f)
+        with self.assertRaises(SnapshotError):
+            open_snapshot(self.snapshot_path, source_path=self.json_path)
+
+    def test_corrupt_snapshot_is_rejected(self):
+        with open(self.snapshot_path, 'wb') as f:
+            f.write(b"not a snapshot at all, just some bytes padding the header out")
+        with self.assertRaises(SnapshotError):
+            open_snapshot(self.snapshot_path)
+
+    def test_document_store_combines_snapshot_and_appended(self):
+        write_snapshot(self.snapshot_path, SAMPLE_DOCUMENTS[:2])
+        store = DocumentStore(snapshot=open_snapshot(self.snapshot_path))
+        try:
+            store.append({"id": "doc200", "title": "New", "abstract": "x", "keywords": []})
+            self.assertEqual(len(store), 3)
+            self.assertEqual([doc["id"] for doc in store], ["doc102", "doc101", "doc200"])
+            self.assertEqual(store[-1]["title"], "New")
+            self.assertEqual(store.find_by_id("doc101")["title"], "AI in Healthcare")
+            self.assertEqual(store.find_by_id("doc200")["title"], "New")
+        finally:
+            store.close()
+
+    def test_server_maps_snapshot_after_first_load(self):
+        server = McpServer(name="Snapshot Test", version="0.0.1", document_store_file=self.json_path)
+        self.assertTrue(os.path.exists(self.snapshot_path))
+        self.assertEqual(list(server.document_store), SAMPLE_DOCUMENTS)
+
+        server._execute_add_document_to_store_impl({"document_text": "Fresh Paper\nBody"})
+        restarted = McpServer(name="Snapshot Test", version="0.0.1", document_store_file=self.json_path)
+        self.assertIsNotNone(restarted.document_store._base)
+        self.assertEqual(len(restarted.document_store), len(SAMPLE_DOCUMENTS) + 1)
+        self.assertEqual(restarted.document_store[-1]["title"], "Fresh Paper")
+
+
+if __name__ == '__main__':
+    unittest.main()
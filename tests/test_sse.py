@@ -0,0 +1,246 @@
+import unittest
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.server import DOCUMENT_RESOURCE_PREFIX, SSE_PATH, McpServer
+from mcp.sse import KEEPALIVE, EventBuffer, KeepaliveScheduler, SseSubscriber
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def read_available(sock, wait=0.0):
+    time.sleep(wait)
+    sock.setblocking(False)
+    data = b""
+    try:
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    except BlockingIOError:
+        pass
+    sock.setblocking(True)
+    return data
+
+
+def parse_events(data):
+    events = []
+    for block in data.decode('utf-8').split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            events.append(fields)
+    return events
+
+
+class TestEventBuffer(unittest.TestCase):
+
+    def test_numbers_and_replays_recent_events(self):
+        buffer = EventBuffer(max_events=3, epoch="run1")
+        first = buffer.append("tool_result", b'{"n": 1}')
+        self.assertEqual(first, b'id: run1-1\nevent: tool_result\ndata: {"n": 1}\n\n')
+        for n in range(2, 5):
+            buffer.append("tool_result", f'{{"n": {n}}}'.encode('utf-8'))
+        self.assertEqual([e["data"] for e in parse_events(b"".join(buffer.since("run1-2")))], ['{"n": 3}', '{"n": 4}'])
+        self.assertEqual(buffer.since("run1-4"), [])
+        self.assertEqual(len(buffer.since("run1-1")), 3)
+        self.assertIsNone(buffer.since("run1-0"))  # Event 1 was evicted
+        self.assertIsNone(buffer.since("run0-3"))  # An earlier run
+        self.assertIsNone(buffer.since("run1-9"))
+        self.assertIsNone(buffer.since("garbage"))
+
+    def test_byte_budget_and_external_numbering(self):
+        buffer = EventBuffer(max_bytes=200, epoch="a")
+        buffer.append("big", b"x" * 150)
+        buffer.append("big", b"y" * 150)
+        self.assertEqual(buffer.stats()["events"], 1)
+        self.assertIsNone(buffer.since("a-0"))
+        buffer.reset("b", 41)
+        buffer.append("tool_result", b"{}", seq=42)
+        self.assertEqual(buffer.last_id(), "b-42")
+        self.assertEqual(len(buffer.since("b-41")), 1)
+
+
+class TestKeepaliveScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = KeepaliveScheduler(interval=0.3, tick=0.05, send_timeout=0.5)
+        self.scheduler.start()
+        self.pairs = []
+
+    def tearDown(self):
+        self.scheduler.close()
+        for server_side, client_side in self.pairs:
+            server_side.close()
+            client_side.close()
+
+    def subscriber(self, **kwargs):
+        server_side, client_side = socket.socketpair()
+        self.pairs.append((server_side, client_side))
+        subscriber = SseSubscriber(server_side, **kwargs)
+        self.scheduler.add(subscriber)
+        return subscriber, client_side
+
+    def test_keepalives_only_for_idle_streams(self):
+        idle, idle_client = self.subscriber()
+        busy, busy_client = self.subscriber()
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline:
+            busy.write(b"event: tool_result\ndata: {}\n\n")
+            time.sleep(0.05)
+        idle_data = read_available(idle_client)
+        self.assertEqual(idle_data.count(KEEPALIVE), len(idle_data) // len(KEEPALIVE))
+        self.assertGreaterEqual(idle_data.count(KEEPALIVE), 2)
+        self.assertNotIn(KEEPALIVE, read_available(busy_client))
+        self.assertGreater(self.scheduler.stats()["keepalives_skipped"], 0)
+
+    def test_wait_ends_on_disconnect_and_shutdown(self):
+        first, first_client = self.subscriber()
+        second, _ = self.subscriber()
+        first_client.close()
+        self.assertTrue(first.wait(2))
+        self.assertTrue(first.disconnected)
+        self.assertEqual(self.scheduler.subscribers(), 1)
+
+        self.assertFalse(second.wait(0.2))
+        self.scheduler.close()
+        self.assertTrue(second.wait(2))
+        self.assertFalse(second.disconnected)
+
+
+    def test_a_client_that_stops_reading_delays_only_itself(self):
+        stuck, _ = self.subscriber(max_pending=256 * 1024)
+        reading, reading_client = self.subscriber(max_pending=256 * 1024)
+        event = b"event: tool_result\ndata: " + b"x" * 65536 + b"\n\n"
+        received = b""
+        slowest = 0.0
+        for _ in range(40):
+            for subscriber in (stuck, reading):
+                started = time.monotonic()
+                subscriber.write(event)
+                slowest = max(slowest, time.monotonic() - started)
+            received += read_available(reading_client, 0.01)
+        deadline = time.monotonic() + 3
+        while len(received) < 40 * len(event) and time.monotonic() < deadline:
+            received += read_available(reading_client, 0.02)
+        self.assertEqual(received, event * 40)
+        self.assertLess(slowest, 0.1)
+        self.assertTrue(stuck.closed)
+        self.assertTrue(stuck.too_slow)
+        self.assertFalse(reading.closed)
+        self.assertEqual(reading.pending_bytes, 0)
+
+    def test_a_stalled_client_is_dropped(self):
+        stalled, _ = self.subscriber(max_pending=8 * 1024 * 1024)
+        stalled.write(b"x" * 4 * 1024 * 1024)  # More than the socket buffers hold, less than the queue
+        self.assertGreater(stalled.pending_bytes, 0)
+        self.assertTrue(stalled.wait(3))
+        self.assertTrue(stalled.too_slow)
+        self.assertEqual(self.scheduler.stats()["stalled_dropped"], 1)
+        self.assertEqual(self.scheduler.subscribers(), 0)
+
+
+class TestServerSseStreams(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.server = McpServer("SSE", "0.1", document_store_file=os.path.join(self.tmp_dir.name, "documents.json"))
+        self.port = free_port()
+        self.server.start(transport_type='sse', port=self.port)
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+    def connect(self, last_event_id=None):
+        """Opens a stream; returns the socket and the events of its greeting (and replay)."""
+        client = socket.create_connection(('127.0.0.1', self.port), timeout=5)
+        header = f"Last-Event-ID: {last_event_id}\r\n" if last_event_id else ""
+        client.sendall(f"GET {SSE_PATH} HTTP/1.1\r\nHost: localhost\r\n{header}\r\n".encode('ascii'))
+        received = b""
+        while b"event: session" not in received:
+            received += client.recv(65536)
+        received += read_available(client, 0.1)
+        return client, parse_events(received.split(b"\r\n\r\n", 1)[1])
+
+    def wait_for(self, condition, timeout=3.0):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        return condition()
+
+    def test_disconnect_is_detected_and_session_cancelled(self):
+        clients = [self.connect()[0] for _ in range(3)]
+        self.assertTrue(self.wait_for(lambda: self.server.sse_keepalive.subscribers() == 3))
+        session = next(iter(self.server.sse_sessions))
+        cancelled = []
+        original = self.server.cancel_session
+        self.server.cancel_session = lambda session_id: cancelled.append(session_id) or original(session_id)
+        clients[0].close()
+        self.assertTrue(self.wait_for(lambda: len(self.server.sse_clients) == 2))
+        self.assertEqual(len(cancelled), 1)
+        self.assertEqual(len(self.server.sse_sessions), 2)
+        self.assertIn(session, self.server.sse_sessions | set(cancelled))
+        for client in clients[1:]:
+            client.close()
+
+    def test_stop_wakes_waiting_handlers(self):
+        client, _ = self.connect()
+        self.assertTrue(self.wait_for(lambda: self.server.sse_keepalive.subscribers() == 1))
+        started = time.monotonic()
+        self.server.stop()
+        # The handler returns and the connection is closed, long before a keepalive would be due
+        client.settimeout(3)
+        while client.recv(65536):
+            pass
+        self.assertLess(time.monotonic() - started, 3)
+        client.close()
+
+    def test_reconnect_replays_missed_events(self):
+        client, greeting = self.connect()
+        self.assertEqual([e["event"] for e in greeting], ["capabilities", "session"])
+        self.server.execute_tool_command("echo", {"message": "seen"})
+        events = parse_events(read_available(client, 0.3))
+        last_id = events[-1]["id"]
+        client.close()
+        self.assertTrue(self.wait_for(lambda: not self.server.sse_clients))
+
+        self.server.execute_tool_command("echo", {"message": "missed 1"})
+        self.server.execute_tool_command("echo", {"message": "missed 2"})
+        client, events = self.connect(last_event_id=last_id)
+        self.assertEqual([e["event"] for e in events], ["session", "tool_result", "tool_result"])
+        self.assertEqual(json.loads(events[0]["data"])["replayed"], 2)
+        self.assertIn("missed 1", events[1]["data"])
+        self.assertIn("missed 2", events[2]["data"])
+        last_id = events[-1]["id"]
+        client.close()
+
+        # A document change while disconnected makes the capabilities stale
+        self.assertTrue(self.wait_for(lambda: not self.server.sse_clients))
+        self.server.tools["delete_document"]["callback"]({"document_id": "doc101"})
+        client, events = self.connect(last_event_id=last_id)
+        self.assertEqual([e["event"] for e in events], ["capabilities", "session", "resource_updated"])
+        self.assertNotIn(DOCUMENT_RESOURCE_PREFIX + "doc101", events[0]["data"])
+        client.close()
+
+    def test_unknown_last_event_id_gets_a_fresh_stream(self):
+        client, events = self.connect(last_event_id="earlier-run-17")
+        self.assertEqual([e["event"] for e in events], ["capabilities", "session"])
+        self.assertEqual(json.loads(events[1]["data"])["resumed"], False)
+        self.assertEqual(events[1]["id"], self.server.sse_events.last_id())
+        client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
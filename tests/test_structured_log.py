@@ -0,0 +1,132 @@
+import unittest
+import io
+import json
+import logging
+import os
+import sys
+import threading
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp import structured_log
+from mcp.structured_log import (JsonFormatter, Redacted, configure_logging, dropped_records, log_event, redact,
+                                set_sample_every, shutdown_logging)
+
+
+class CountingPayload:
+    """Counts how often it is rendered."""
+
+    def __init__(self):
+        self.renders = 0
+
+    def __str__(self):
+        self.renders += 1
+        return "payload"
+
+
+class TestRedaction(unittest.TestCase):
+
+    def test_truncates_and_redacts_payloads(self):
+        request = {"command": "execute_tool", "tool_name": "add_document_from_file",
+                   "tool_params": {"file_content_base64": "A" * 100000, "filename": "x" * 500,
+                                   "keywords": ["k"] * 50}}
+        logged = redact(request)
+        params = logged["tool_params"]
+        self.assertEqual(params["file_content_base64"], "<redacted 100000 chars>")
+        self.assertTrue(params["filename"].endswith("...<+300 chars>"))
+        self.assertEqual(len(params["keywords"]), 21)
+        self.assertEqual(params["keywords"][-1], "<+30 items>")
+        self.assertLess(len(str(Redacted(request))), 1000)
+        self.assertEqual(request["tool_params"]["file_content_base64"], "A" * 100000)  # Not modified
+
+
+class TestLogEvent(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("test_structured_log")
+        self.logger.propagate = False
+        self.stream = io.StringIO()
+        self.handler = logging.StreamHandler(self.stream)
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.propagate = True
+        set_sample_every(1)
+        structured_log._sample_every.clear()
+
+    def test_disabled_levels_format_nothing(self):
+        payload = CountingPayload()
+        log_event(self.logger, logging.DEBUG, "stdio_message", request=payload)
+        self.assertEqual((payload.renders, self.stream.getvalue()), (0, ""))
+        log_event(self.logger, logging.INFO, "command_received", command="stats", request=payload)
+        self.assertEqual(self.stream.getvalue(), "command_received command=stats request=payload\n")
+
+    def test_sampling_keeps_every_nth_event(self):
+        set_sample_every(10, "tool_submit")
+        for i in range(100):
+            log_event(self.logger, logging.INFO, "tool_submit", sample=True, n=i)
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 10)
+        self.assertIn("sampled_every=10", lines[0])
+
+    def test_json_formatter(self):
+        self.handler.setFormatter(JsonFormatter())
+        log_event(self.logger, logging.INFO, "tool_execute", tool="echo", params=Redacted({"document_text": "abc"}))
+        self.logger.info("plain %s", "message")
+        event, plain = [json.loads(line) for line in self.stream.getvalue().splitlines()]
+        self.assertEqual((event["event"], event["tool"], event["params"]),
+                         ("tool_execute", "echo", {"document_text": "<redacted 3 chars>"}))
+        self.assertEqual(plain["message"], "plain message")
+
+
+class TestQueueLogging(unittest.TestCase):
+
+    def setUp(self):
+        root = logging.getLogger()
+        self.saved = (root.handlers[:], root.level)
+
+    def tearDown(self):
+        shutdown_logging()
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        for handler in self.saved[0]:
+            root.addHandler(handler)
+        root.setLevel(self.saved[1])
+
+    def test_records_are_written_by_the_listener_thread(self):
+        writer_threads = set()
+
+        class Recording(io.StringIO):
+            def write(self, text):
+                writer_threads.add(threading.current_thread().name)
+                return super().write(text)
+
+        stream = Recording()
+        configure_logging(logging.INFO, stream=stream)
+        logging.getLogger("test_queue_logging").info("hello %s", "world")
+        shutdown_logging()
+        self.assertIn("hello world", stream.getvalue())
+        self.assertNotIn(threading.current_thread().name, writer_threads)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        release = threading.Event()
+
+        class Blocked(io.StringIO):
+            def write(self, text):
+                release.wait(5)
+                return super().write(text)
+
+        configure_logging(logging.INFO, stream=Blocked(), queue_size=2)
+        before = dropped_records()
+        for i in range(20):
+            logging.getLogger("test_queue_logging").info("record %d", i)
+        self.assertGreaterEqual(dropped_records() - before, 15)
+        release.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
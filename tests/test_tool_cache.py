@@ -0,0 +1,94 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.server import McpServer
+from mcp.tool_cache import CachePolicy, ToolResultCache
+
+
+class TestToolResultCache(unittest.TestCase):
+
+    def test_lru_eviction_and_per_tool_bound(self):
+        cache = ToolResultCache(max_entries=3)
+        policy = CachePolicy(max_entries=2)
+        for i in range(3):
+            cache.put("a", i, {"n": i}, policy, cache.generation)
+        self.assertIsNone(cache.get("a", 0))  # Per-tool bound of 2
+        self.assertEqual(cache.get("a", 1).result, {"n": 1})
+        cache.put("b", 0, [0], CachePolicy(), cache.generation)
+        cache.put("b", 1, [1], CachePolicy(), cache.generation)
+        # a/2 was the least recently used entry
+        self.assertIsNone(cache.get("a", 2))
+        self.assertEqual(cache.get("b", 0).encoded, b"[0]")
+        self.assertEqual(cache.stats()["evictions"], 2)
+
+    def test_ttl_and_stale_generation(self):
+        cache = ToolResultCache()
+        cache.put("t", "k", 1, CachePolicy(ttl=0.05), cache.generation)
+        self.assertIsNotNone(cache.get("t", "k"))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("t", "k"))
+
+        generation = cache.generation
+        cache.invalidate({"t"})
+        cache.put("t", "k", "stale", CachePolicy(), generation)
+        self.assertIsNone(cache.get("t", "k"))
+        cache.put("pure", "k", "kept", CachePolicy(invalidate_on_mutation=False), generation)
+        self.assertEqual(cache.get("pure", "k").result, "kept")
+
+
+class TestServerToolCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.server = McpServer("Test", "0.1", document_store_file=os.path.join(self.tmp_dir.name, "documents.json"))
+        self.calls = 0
+
+        def count_documents(params):
+            self.calls += 1
+            return {"count": len(self.server.document_store), "label": params.get("label")}
+        self.server.register_tool("count_documents", "Counts documents", {"type": "object"}, count_documents,
+                                  cacheable=True, cache_ttl=60)
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+    def test_hits_skip_the_callback_until_the_store_changes(self):
+        first = self.server.execute_tool("count_documents", {"label": "x"})
+        self.server.execute_tool("count_documents", {"label": "x"})
+        self.assertEqual(self.calls, 1)
+        self.server.execute_tool("count_documents", {"label": "y"})
+        self.assertEqual(self.calls, 2)
+
+        self.server._execute_add_document_to_store_impl({"document_text": "Cache Buster\nBody"})
+        second = self.server.execute_tool("count_documents", {"label": "x"})
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(second["result"]["count"], first["result"]["count"] + 1)
+
+    def test_encoded_hits_match_a_fresh_encoding(self):
+        params = {"query": "learning", "max_results": 2}
+        miss, miss_bytes = self.server.execute_tool_encoded("document_search", params)
+        hit, hit_bytes = self.server.execute_tool_encoded("document_search", {"max_results": 2, "query": "LEARNING"})
+        self.assertEqual(hit_bytes, json.dumps(hit).encode('utf-8'))
+        self.assertEqual(hit_bytes, miss_bytes)
+        self.assertEqual(self.server.tool_cache.stats()["hits"], 1)
+
+    def test_error_results_are_not_cached(self):
+        def failing(params):
+            self.calls += 1
+            return {"error": "Missing parameter"}
+        self.server.register_tool("failing", "Always fails", {"type": "object"}, failing, cacheable=True)
+        self.server.execute_tool("failing", {})
+        self.server.execute_tool("failing", {})
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
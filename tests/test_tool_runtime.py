@@ -0,0 +1,236 @@
+import unittest
+import asyncio
+import concurrent.futures
+import functools
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.server import COMMAND_PATH, SESSION_HEADER, SSE_PATH, McpServer
+from mcp.tool_runtime import ToolCancelledError, ToolContext, ToolRuntime, ToolTimeoutError, is_async_callback
+
+
+async def slow_echo(params):
+    await asyncio.sleep(params.get("delay", 0))
+    return {"echo": params.get("message")}
+
+
+class TestToolRuntime(unittest.TestCase):
+
+    def setUp(self):
+        self.runtime = ToolRuntime(max_threads=2)
+
+    def tearDown(self):
+        self.runtime.close()
+
+    def test_many_concurrent_coroutines_share_one_loop(self):
+        threads_before = threading.active_count()
+        started = time.monotonic()
+        futures = [self.runtime.submit(self.runtime.call(slow_echo, {"delay": 0.2, "message": i})) for i in range(1000)]
+        results = [f.result(timeout=5) for f in futures]
+        self.assertLess(time.monotonic() - started, 2.0)
+        self.assertEqual([r["echo"] for r in results], list(range(1000)))
+        self.assertLessEqual(threading.active_count() - threads_before, 1)  # Only the loop thread
+
+    def test_sync_callbacks_run_in_the_pool(self):
+        names = self.runtime.call_blocking(lambda p: threading.current_thread().name, {}, timeout=1)
+        self.assertTrue(names.startswith("tool-worker"))
+        self.assertEqual(self.runtime.call_blocking(lambda p: threading.current_thread().name, {}),
+                         threading.current_thread().name)  # No timeout: called inline
+
+    def test_timeout_and_cancellation(self):
+        with self.assertRaises(ToolTimeoutError):
+            self.runtime.call_blocking(slow_echo, {"delay": 1}, timeout=0.05)
+
+        cancelled = threading.Event()
+
+        async def waits(params):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        future = self.runtime.submit(self.runtime.call(waits, {}))
+        time.sleep(0.05)
+        self.assertTrue(future.cancel())
+        self.assertTrue(cancelled.wait(1))
+
+    def test_detects_coroutine_functions(self):
+        self.assertTrue(is_async_callback(slow_echo))
+        self.assertTrue(is_async_callback(functools.partial(slow_echo)))
+        self.assertFalse(is_async_callback(lambda p: p))
+
+
+class TestServerAsyncTools(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp_dir.name, "documents.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([], f)
+        self.server = McpServer("Async", "0.1", document_store_file=path)
+        self.server.register_tool("slow_echo", "Echo after a delay", {"type": "object"}, slow_echo, timeout=0.5)
+        self.events = []
+        self.server.broadcast_sse_message = lambda event_name, data, encoded=None: self.events.append((event_name, data))
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+    def test_execute_async_tool(self):
+        response = self.server.execute_tool("slow_echo", {"message": "hi", "delay": 0.01})
+        self.assertEqual(response["status"], "success")
+        self.assertEqual(response["result"], {"echo": "hi"})
+
+    def test_unhashable_callable_tools(self):
+        class Unhashable:
+            __hash__ = None
+
+            def __init__(self):
+                self.contexts = []
+
+            def __call__(self, params, context=None):
+                self.contexts.append(context)
+                return {"echo": params.get("message")}
+
+        tool = Unhashable()
+        self.server.register_tool("unhashable", "Callable object without a hash", {"type": "object"}, tool)
+        for _ in range(2):
+            self.assertEqual(self.server.execute_tool("unhashable", {"message": "hi"})["result"], {"echo": "hi"})
+        self.assertEqual(len(tool.contexts), 2)
+        self.assertIsInstance(tool.contexts[0], ToolContext)
+
+    def test_registered_and_per_call_timeouts(self):
+        response = self.server.execute_tool("slow_echo", {"delay": 2})
+        self.assertEqual(response["status"], "error")
+        self.assertIn("timed out after 0.5s", response["error"])
+        self.assertEqual(self.server.execute_tool("slow_echo", {"delay": 0.1}, timeout=0.01)["status"], "error")
+        self.assertEqual(self.server.execute_tool("echo", {"message": "x"}, timeout=1)["result"],
+                         {"echo_response": "x"})
+
+    def test_submitted_command_broadcasts_or_is_cancelled(self):
+        future = self.server.submit_tool_command("slow_echo", {"message": "sse"})
+        self.assertEqual(future.result(timeout=2)["result"], {"echo": "sse"})
+        future = self.server.submit_tool_command("slow_echo", {"delay": 0.4})
+        time.sleep(0.05)
+        future.cancel()
+        with self.assertRaises(concurrent.futures.CancelledError):
+            future.result(timeout=1)
+        deadline = time.monotonic() + 2
+        while len(self.events) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.events[0][0], "tool_result")
+        self.assertEqual(self.events[1][0], "tool_error")
+        self.assertIn("cancelled", self.events[1][1]["error"])
+
+    def test_stdio_rejects_invalid_timeouts(self):
+        requests = [{"command": "execute_tool", "tool_name": "echo", "tool_params": {"message": "x"}, "timeout": t}
+                    for t in ("5", -1, True, 1)]
+        original_stdin, original_stdout = sys.stdin, sys.stdout
+        sys.stdin = io.StringIO("".join(json.dumps(r) + "\n" for r in requests) + "quit\n")
+        sys.stdout = io.StringIO()
+        try:
+            self.server.start(transport_type='stdio')
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdin, sys.stdout = original_stdin, original_stdout
+        responses = [json.loads(line) for line in output.splitlines() if line.startswith("{")]
+        self.assertEqual([r["status"] for r in responses], ["error", "error", "error", "success"])
+        self.assertIn("'timeout' must be a positive number", responses[0]["error"])
+
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class TestCancellation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp_dir.name, "documents.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([{"id": f"d{i}", "title": f"Paper {i}", "abstract": "text", "keywords": []} for i in range(600)], f)
+        self.server = McpServer("Cancel", "0.1", document_store_file=path)
+        self.stopped = threading.Event()
+        self.server.register_tool("spin", "Loops until cancelled", {"type": "object"}, self.spin)
+        self.server.broadcast_sse_message = lambda event_name, data, encoded=None: None
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+    def spin(self, params, context=None):
+        try:
+            while True:
+                context.check()
+                time.sleep(0.01)
+        finally:
+            self.stopped.set()
+
+    def test_cancel_by_request_id_stops_a_sync_callback(self):
+        future = self.server.submit_tool_command("spin", {}, request_id="r1")
+        time.sleep(0.05)
+        with self.assertRaises(ValueError):
+            self.server.submit_tool_command("spin", {}, request_id="r1")
+        self.assertEqual(self.server.cancel_request("r1")["status"], "success")
+        with self.assertRaises(concurrent.futures.CancelledError):
+            future.result(timeout=1)
+        self.assertTrue(self.stopped.wait(1))
+        self.assertEqual(self.server.cancel_request("r1")["status"], "error")  # No longer running
+
+    def test_deadline_reaches_the_callback(self):
+        response = self.server.execute_tool("spin", {}, timeout=0.1)
+        self.assertIn("timed out after 0.1s", response["error"])
+        self.assertTrue(self.stopped.wait(1))
+
+    def test_search_checks_for_cancellation(self):
+        context = ToolContext()
+        context.cancel("test")
+        with self.assertRaises(ToolCancelledError):
+            self.server._execute_document_search_impl({"query": "paper", "max_results": 1000}, context)
+        found = self.server._execute_document_search_impl({"query": "paper", "max_results": 1000}, ToolContext())
+        self.assertEqual(len(found["search_results"]), 600)
+
+    def test_cancel_queued_ingest_job(self):
+        job = self.server.submit_ingest_job("add_document_from_file", {"file_content_base64": "", "filename": "a.txt"})
+        self.assertTrue(self.server.cancel_request(job["job_id"])["cancelled"])
+        status = self.server.get_ingest_status(job["job_id"])["job"]
+        self.assertEqual((status["status"], status["error"]), ("failed", "cancelled by client"))
+
+    def test_sse_disconnect_cancels_the_session_calls(self):
+        port = free_port()
+        self.server.start(transport_type='sse', port=port)
+        stream = socket.create_connection(('127.0.0.1', port))
+        stream.sendall(f"GET {SSE_PATH} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        headers = b""
+        while b"\r\n\r\n" not in headers:
+            headers += stream.recv(4096)
+        session_id = [line.split(b":", 1)[1].strip().decode() for line in headers.split(b"\r\n")
+                      if line.lower().startswith(SESSION_HEADER.lower().encode())][0]
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}{COMMAND_PATH}",
+            data=json.dumps({"command": "execute_tool", "tool_name": "spin", "tool_params": {}}).encode(),
+            headers={"Content-Type": "application/json", SESSION_HEADER: session_id})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            self.assertTrue(json.loads(response.read())["request_id"])
+        time.sleep(0.1)
+        self.assertFalse(self.stopped.is_set())
+        stream.close()
+        self.assertTrue(self.stopped.wait(3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from mcp.document_store import TOMBSTONE_CHUNK, DocumentStore
+from mcp.search_index import SearchIndex
+from mcp.server import McpServer, DOCUMENT_RESOURCE_PREFIX
+from mcp.snapshot import open_snapshot, write_snapshot
+
+
+def make_doc(i, title=None):
+    return {"id": f"d{i}", "title": title or f"Title {i}", "abstract": f"Abstract {i}", "keywords": ["k"]}
+
+
+class TestStoreTombstones(unittest.TestCase):
+
+    def test_delete_and_update_keep_ordinals_stable(self):
+        store = DocumentStore(documents=[make_doc(i) for i in range(4)])
+        before = store.snapshot()
+        ordinal, _ = store.delete("d1")
+        self.assertEqual(ordinal, 1)
+        old_ordinal, new_ordinal, version = store.update("d2", {"title": "Renamed"})
+        self.assertEqual((old_ordinal, new_ordinal), (2, 4))
+        self.assertEqual([d["id"] for d in store], ["d0", "d3", "d2"])
+        self.assertEqual(len(store), 3)
+        self.assertIsNone(store.find_by_id("d1"))
+        self.assertEqual(store.find_by_id("d2")["title"], "Renamed")
+        self.assertIsNone(version.document_at(2))
+        # Earlier versions are untouched
+        self.assertEqual(before.find_by_id("d2")["title"], "Title 2")
+        self.assertEqual(len(before), 4)
+        self.assertIsNone(store.delete("missing"))
+        self.assertIsNone(store.update("d1", {"title": "x"}))
+
+    def test_compaction_releases_appended_documents(self):
+        store = DocumentStore(documents=[make_doc(i) for i in range(5)])
+        store.delete("d0")
+        store.update("d3", {"title": "New"})
+        self.assertEqual(store.snapshot().tombstone_count, 2)
+        self.assertEqual(store.compact(), 2)
+        view = store.snapshot()
+        self.assertEqual(view.tombstone_count, 0)
+        self.assertTrue(view.is_deleted(0))
+        self.assertEqual([d["id"] for d in view], ["d1", "d2", "d4", "d3"])
+        self.assertEqual(view.find_by_id("d3")["title"], "New")
+        self.assertEqual(list(view.live_ordinals()), [1, 2, 4, 5])
+
+    def test_base_tombstones_do_not_count_towards_the_next_compaction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "documents.snapshot")
+            write_snapshot(path, [make_doc(i) for i in range(TOMBSTONE_CHUNK + 10)])
+            store = DocumentStore(snapshot=open_snapshot(path))
+            try:
+                store.append(make_doc("new"))
+                for doc_id in ("d1", f"d{TOMBSTONE_CHUNK + 1}", "dnew"):
+                    store.delete(doc_id)
+                before = store.snapshot()
+                self.assertEqual((before.tombstone_count, before.deleted_since_compaction), (3, 3))
+                self.assertEqual(store.compact(), 1)
+                view = store.snapshot()
+                # Base tombstones stay until the next restart, but are not pending anymore
+                self.assertEqual((view.tombstone_count, view.deleted_since_compaction), (2, 0))
+                self.assertIs(view._tombstones[0], before._tombstones[0])  # Untouched chunks are shared
+                store.delete("d2")
+                self.assertEqual(store.snapshot().deleted_since_compaction, 1)
+                self.assertEqual(len(store), TOMBSTONE_CHUNK + 10 - 3)
+                self.assertIsNone(store.find_by_id(f"d{TOMBSTONE_CHUNK + 1}"))
+                self.assertEqual(len(before), TOMBSTONE_CHUNK + 10 - 2)
+            finally:
+                store.close()
+
+
+class TestIndexTombstones(unittest.TestCase):
+
+    def test_deleted_ordinals_are_filtered_and_purged(self):
+        index = SearchIndex(flush_threshold=2)
+        try:
+            index.bulk_load(enumerate([make_doc(i, "graph study") for i in range(6)]))
+            index.delete(1)
+            index.delete(4)
+            self.assertEqual(list(index.search("graph")), [0, 2, 3, 5])
+            index.request_compaction()
+            self.assertTrue(index.wait_idle(timeout=5.0))
+            stats = index.stats()
+            self.assertEqual(stats["tombstones"], 0)
+            self.assertEqual(stats["segments"], 1)
+            self.assertEqual(list(index.search("graph")), [0, 2, 3, 5])
+        finally:
+            index.close()
+
+
+class TestUpdateDeleteTools(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.tmp_dir.name, "documents.json")
+        self.server = McpServer(name="Test", version="0.0.1", document_store_file=self.json_path)
+        self.assertTrue(self.server._search_index_ready.wait(timeout=5.0))
+        self.changes = []
+        self.server.add_mutation_listener(lambda change, doc_id, doc: self.changes.append((change, doc_id)))
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp_dir.cleanup()
+
+    def _search(self, query):
+        result = self.server._execute_document_search_impl({"query": query, "max_results": 10})
+        return [d["id"] for d in result["search_results"]]
+
+    def test_update_document(self):
+        result = self.server._execute_update_document_impl(
+            {"document_id": "doc101", "title": "Photosynthesis Revisited", "keywords": "biology, plants"})
+        self.assertEqual(result["updated_fields"], ["keywords", "title"])
+        self.assertEqual(result["durability"], "fsync")
+        resource = self.server.resolve_resource(f"{DOCUMENT_RESOURCE_PREFIX}doc101")
+        self.assertEqual(resource["content"]["title"], "Photosynthesis Revisited")
+        self.assertEqual(resource["content"]["keywords"], ["biology", "plants"])
+        self.assertIn("doc101", self._search("photosynthesis"))
+        self.assertNotIn("doc101", self._search("renewable"))
+        self.assertEqual(self.changes, [("updated", "doc101")])
+        with open(self.json_path, encoding='utf-8') as f:
+            saved = {d["id"]: d for d in json.load(f)}
+        self.assertEqual(saved["doc101"]["title"], "Photosynthesis Revisited")
+
+    def test_delete_document(self):
+        result = self.server._execute_delete_document_impl({"document_id": "doc104"})
+        self.assertEqual(result["document_id"], "doc104")
+        self.assertIsNone(self.server.resolve_resource(f"{DOCUMENT_RESOURCE_PREFIX}doc104"))
+        self.assertNotIn("doc104", self._search("learning"))
+        uris = [r["uri"] for r in self.server.list_resources(limit=100)["resources"]]
+        self.assertNotIn(f"{DOCUMENT_RESOURCE_PREFIX}doc104", uris)
+        self.assertEqual(self.server.list_resources()["total"], len(uris))
+        with open(self.json_path, encoding='utf-8') as f:
+            self.assertNotIn("doc104", [d["id"] for d in json.load(f)])
+        self.assertIn("error", self.server._execute_delete_document_impl({"document_id": "doc104"}))
+
+    def test_invalid_parameters(self):
+        self.assertIn("error", self.server._execute_update_document_impl({"document_id": "doc101"}))
+        self.assertIn("error", self.server._execute_update_document_impl({"title": "x"}))
+        self.assertIn("error", self.server._execute_update_document_impl({"document_id": "nope", "title": "x"}))
+        self.assertIn("error", self.server._execute_delete_document_impl({"document_id": ""}))
+
+    def test_compaction_after_many_deletes(self):
+        for i in range(3):
+            added = self.server._execute_add_document_to_store_impl({"document_text": f"Zyxwv Paper {i}\nBody", "durability": "enqueue"})
+            self.server._execute_delete_document_impl({"document_id": added["document_id"], "durability": "enqueue"})
+        self.server._compaction_lock.acquire()
+        self.server._compact_store()
+        self.assertTrue(self.server.search_index.wait_idle(timeout=5.0))
+        self.assertEqual(self.server.document_store.snapshot().tombstone_count, 0)
+        self.assertEqual(self.server.search_index.stats()["tombstones"], 0)
+        self.assertEqual(self._search("zyxwv"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()